@@ -1,21 +1,44 @@
 import os
+import io
+import argparse
+import bisect
+import csv
+import json
 import time
+import tracemalloc
 import datetime
+import heapq
+import itertools
+import math
 import threading
-import schedule
 import sqlite3
+import uuid
 import logging
+import queue
+import random
+import re
 import smtplib
+import requests
+import numpy as np
 
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from datetime import timedelta
+from multiprocessing import shared_memory
 from flask import (
-    Flask, request, render_template_string, redirect,
-    url_for, flash, session, get_flashed_messages
+    Flask, Response, request, render_template, render_template_string, redirect, jsonify,
+    url_for, flash, session, get_flashed_messages, stream_with_context, g
 )
-from python_bitvavo_api.bitvavo import Bitvavo
+from jinja2 import DictLoader, FileSystemBytecodeCache
+from python_bitvavo_api.bitvavo import Bitvavo, createSignature
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 
+try:
+    import fcntl
+except ImportError:     # Windows: kein flock -> jeder Prozess ist Scheduler-Leader
+    fcntl = None
+
 ########################################
 # 1) Logging konfigurieren
 #    -> Logging in eine Datei und in die Konsole.
@@ -42,6 +65,30 @@ MASTER_PASSWORD = os.environ.get("MASTER_PASSWORD", "bitmaster")
 # SIMULATION_MODE kann z.B. mit export SIMULATION_MODE=true aktiviert werden
 SIMULATION_MODE = os.environ.get("SIMULATION_MODE", "false").lower() in ["true", "1", "yes"]
 
+# Max. parallele Einzelabfragen, falls die Sammelabfrage der Kurse fehlschlägt
+PRICE_FETCH_WORKERS = int(os.environ.get("PRICE_FETCH_WORKERS", "4"))
+
+# Parallele Orders je Schedule-Lauf (1 = nacheinander wie früher)
+ORDER_WORKERS = int(os.environ.get("ORDER_WORKERS", "4"))
+
+# Mindestabstand (Sekunden) zwischen zwei Order-Requests je Konto -> Rate-Limit der Börse
+ORDER_MIN_INTERVAL = float(os.environ.get("ORDER_MIN_INTERVAL", "0.1"))
+
+# Konto, dem bestehende Daten (aus der Zeit mit nur einem API-Key) zugeordnet werden
+DEFAULT_ACCOUNT_ID = 1
+
+# Worker eines Kontos beenden sich nach so vielen Sekunden ohne Arbeit
+DISPATCHER_IDLE_TIMEOUT = float(os.environ.get("DISPATCHER_IDLE_TIMEOUT", "300"))
+
+# Webserver (gunicorn): Prozesse x Threads je Prozess
+WEB_BIND = os.environ.get("WEB_BIND", "0.0.0.0:5000")
+WEB_WORKERS = int(os.environ.get("WEB_WORKERS", "2"))
+WEB_THREADS = int(os.environ.get("WEB_THREADS", "8"))
+
+# REST-/WebSocket-Endpunkte der Börse (z.B. für einen lokalen Test-Server umstellbar)
+BITVAVO_REST_URL = os.environ.get("BITVAVO_REST_URL", "https://api.bitvavo.com/v2")
+BITVAVO_WS_URL = os.environ.get("BITVAVO_WS_URL", "wss://ws.bitvavo.com/v2/")
+
 DB_NAME = "bitmaster.db"
 print("DB-Pfad:", os.path.abspath(DB_NAME))
 
@@ -49,11 +96,389 @@ print("DB-Pfad:", os.path.abspath(DB_NAME))
 # Beispielhafte Liste an Assets, die man im Dropdown anbieten kann
 ALLOWED_ASSETS = ["BTC", "ETH", "ADA", "XRP", "DOT", "SOL"]
 
+########################################
+# 2a) Metriken (Prometheus-Textformat unter /metrics)
+########################################
+# Bewusst ohne externe Bibliothek: Zähler und Histogramme sind Dicts je
+# Label-Kombination hinter einem Lock, observe() kostet nur ein bisect.
+
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")   # gesetzt: /metrics ohne Login per Bearer-Token
+
+# Sekunden; deckt DB-Abfragen (ms) bis Schedule-Läufe (Minuten) ab
+METRICS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=""):
+    parts = [f'{n}="{_escape_label(v)}"' for (n, v) in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name
+        self.help = help_text
+        self.label_names = label_names
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1.0):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [(self.name, _format_labels(self.label_names, labels), value) for (labels, value) in items]
+
+
+class Gauge(Counter):
+    """
+    Momentanwert. Mit func wird der Wert erst beim Abruf von /metrics
+    berechnet: func() -> Zahl oder {label_tuple: Zahl}.
+    """
+    kind = "gauge"
+
+    def __init__(self, name, help_text, label_names=(), func=None):
+        super().__init__(name, help_text, label_names)
+        self.func = func
+
+    def set(self, value, *label_values):
+        with self._lock:
+            self._values[label_values] = value
+
+    def samples(self):
+        if self.func is None:
+            return super().samples()
+        values = self.func()
+        if not isinstance(values, dict):
+            values = {(): values}
+        return [
+            (self.name, _format_labels(self.label_names, labels), value)
+            for (labels, value) in values.items()
+        ]
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help_text, label_names=(), buckets=METRICS_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._values = {}    # labels -> [anzahl je bucket..., +Inf, summe]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            data = self._values.get(label_values)
+            if data is None:
+                data = self._values[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            data[idx] += 1
+            data[-1] += value
+
+    def time(self, *label_values):
+        return _HistogramTimer(self, label_values)
+
+    def samples(self):
+        with self._lock:
+            items = [(labels, list(data)) for (labels, data) in self._values.items()]
+        rows = []
+        for (labels, data) in items:
+            cumulative = 0
+            for (bound, count) in zip(self.buckets + (float("inf"),), data[:-1]):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                rows.append((f"{self.name}_bucket", _format_labels(self.label_names, labels, f'le="{le}"'), cumulative))
+            rows.append((f"{self.name}_sum", _format_labels(self.label_names, labels), data[-1]))
+            rows.append((f"{self.name}_count", _format_labels(self.label_names, labels), cumulative))
+        return rows
+
+
+class _HistogramTimer:
+    __slots__ = ("histogram", "labels", "start")
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, *self.labels)
+        return False
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_text, label_names=()):
+        return self.register(Counter(name, help_text, label_names))
+
+    def gauge(self, name, help_text, label_names=(), func=None):
+        return self.register(Gauge(name, help_text, label_names, func))
+
+    def histogram(self, name, help_text, label_names=(), buckets=METRICS_BUCKETS):
+        return self.register(Histogram(name, help_text, label_names, buckets))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            try:
+                samples = metric.samples()
+            except Exception as e:
+                logging.warning(f"Metrik {metric.name} nicht verfügbar: {str(e)}")
+                continue
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for (name, labels, value) in samples:
+                lines.append(f"{name}{labels} {float(value):.17g}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+metric_order_seconds = metrics.histogram(
+    "bitmaster_order_seconds", "Dauer einer Order-Zeile (Kurs + placeOrder) je Asset", ("asset",))
+metric_orders = metrics.counter(
+    "bitmaster_orders_total", "Orders je Asset und Ergebnis (filled/rejected/error)", ("asset", "result"))
+metric_bitvavo_seconds = metrics.histogram(
+    "bitmaster_bitvavo_request_seconds", "Dauer von Bitvavo-Aufrufen inkl. Wiederholungen", ("method",))
+metric_bitvavo_retries = metrics.counter(
+    "bitmaster_bitvavo_retries_total", "Fehlgeschlagene Bitvavo-Versuche je Methode und Fehlerklasse",
+    ("method", "error_class"))
+metric_scheduler_lag = metrics.histogram(
+    "bitmaster_scheduler_lag_seconds", "Verspätung des Job-Starts gegenüber der geplanten Zeit", ("job",))
+metric_job_seconds = metrics.histogram(
+    "bitmaster_job_seconds", "Laufzeit der Scheduler-Jobs", ("job",))
+metric_dispatch_wait = metrics.histogram(
+    "bitmaster_dispatch_wait_seconds", "Wartezeit eines Jobs in der Spur seines Kontos")
+metric_db_seconds = metrics.histogram(
+    "bitmaster_db_query_seconds", "Dauer von SQLite-Statements (execute/executemany)", ("statement",))
+metric_email_seconds = metrics.histogram(
+    "bitmaster_email_send_seconds", "Dauer eines SMTP-Versands")
+metric_emails = metrics.counter(
+    "bitmaster_emails_total", "Versandversuche aus der Outbox je Ergebnis", ("result",))
+metric_http_seconds = metrics.histogram(
+    "bitmaster_http_request_seconds", "Antwortzeit je Route", ("endpoint", "method", "status"))
+
+
+# Statement-Label: Operation + Tabelle ("select trades", "insert order_journal"),
+# damit die Zahl der Zeitreihen klein bleibt. DDL, PRAGMA, BEGIN/COMMIT usw.
+# werden nicht gemessen (Label "").
+_statement_labels = {}
+_STATEMENT_LABEL_CACHE = 1000
+_STATEMENT_TABLE = {
+    "select": re.compile(r"\bfrom\s+([a-z_][a-z0-9_]*)"),
+    "with": re.compile(r"\bfrom\s+([a-z_][a-z0-9_]*)"),
+    "insert": re.compile(r"\binto\s+([a-z_][a-z0-9_]*)"),
+    "update": re.compile(r"^update\s+(?:or\s+[a-z]+\s+)?([a-z_][a-z0-9_]*)"),
+    "delete": re.compile(r"\bfrom\s+([a-z_][a-z0-9_]*)"),
+}
+
+
+def _statement_label(sql):
+    label = _statement_labels.get(sql)
+    if label is None:
+        text = sql.strip().lower()
+        operation = text.split(None, 1)[0] if text else ""
+        pattern = _STATEMENT_TABLE.get(operation)
+        if pattern is None:
+            label = ""
+        else:
+            match = pattern.search(text)
+            operation = "select" if operation == "with" else operation
+            label = f"{operation} {match.group(1)}" if match else operation
+        if len(_statement_labels) < _STATEMENT_LABEL_CACHE:
+            _statement_labels[sql] = label
+    return label
+
+
+class MetricsCursor(sqlite3.Cursor):
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            label = _statement_label(sql)
+            if label:
+                metric_db_seconds.observe(time.perf_counter() - start, label)
+
+    def executemany(self, sql, seq_of_parameters):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            label = _statement_label(sql)
+            if label:
+                metric_db_seconds.observe(time.perf_counter() - start, label)
+
+
+class MetricsConnection(sqlite3.Connection):
+    """
+    Connection-Factory: alle Statements laufen über MetricsCursor.
+    """
+
+    def cursor(self, factory=MetricsCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def _email_queue_depth():
+    with get_connection() as conn:
+        rows = conn.execute("""
+            SELECT status, COUNT(*) FROM notification_outbox GROUP BY status
+        """).fetchall()
+    return {(status,): count for (status, count) in rows}
+
+
+# Vorhandene Kennzahlen (Client-Cache, Einstellungs-Cache, Kurs-Cache) mit einbinden
+metrics.gauge("bitmaster_email_queue", "Mails in der Outbox je Status", ("status",), _email_queue_depth)
+metrics.gauge(
+    "bitmaster_bitvavo_client", "Kennzahlen des Bitvavo-Client-Caches", ("stat",),
+    lambda: {(k,): v for (k, v) in get_bitvavo_client_stats().items()}
+)
+metrics.gauge(
+    "bitmaster_settings_cache", "Kennzahlen des Einstellungs-Caches", ("stat",),
+    lambda: {(k,): v for (k, v) in settings_cache.stats().items() if isinstance(v, (int, float))}
+)
+metrics.gauge(
+    "bitmaster_price_cache", "Kennzahlen des Live-Kurs-Caches", ("stat",),
+    lambda: {(k,): v for (k, v) in price_cache.stats().items() if isinstance(v, (int, float))}
+)
+metrics.gauge(
+    "bitmaster_price_age_seconds", "Alter des letzten Kurses je Asset", ("asset",),
+    lambda: {(a,): e["age_seconds"] for (a, e) in price_cache.stats()["assets"].items()}
+)
+metrics.gauge(
+    "bitmaster_order_journal", "Einträge im Order-Journal je Status", ("status",),
+    lambda: {(status,): count for (status, count) in get_connection().execute(
+        "SELECT status, COUNT(*) FROM order_journal GROUP BY status").fetchall()}
+)
+metrics.gauge(
+    "bitmaster_dispatcher", "Kennzahlen des Konto-Dispatchers", ("stat",),
+    lambda: {(k,): v for (k, v) in dispatcher.stats().items()}
+)
+metrics.gauge(
+    "bitmaster_price_stream_connected", "Ticker-WebSocket verbunden (1/0)",
+    func=lambda: 1 if ticker_stream.stats()["connected"] else 0
+)
+
+
+@app.before_request
+def _metrics_request_start():
+    g.metrics_start = time.perf_counter()
+
+
+@app.after_request
+def _metrics_request_end(response):
+    start = g.get("metrics_start")
+    if start is not None:
+        metric_http_seconds.observe(
+            time.perf_counter() - start,
+            request.endpoint or "unknown", request.method, response.status_code
+        )
+    return response
+
+
+@app.route("/metrics")
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+def benchmark_metrics(n=200000):
+    """
+    Kosten je Messung (µs): Histogram.observe, Counter.inc und ein SQLite-
+    Statement mit vs. ohne MetricsConnection (In-Memory-DB).
+    """
+    hist = Histogram("bench_seconds", "Benchmark", ("label",))
+    counter = Counter("bench_total", "Benchmark", ("label",))
+    result = {}
+
+    start = time.perf_counter()
+    for i in range(n):
+        hist.observe(0.003, "x")
+    result["observe_us"] = (time.perf_counter() - start) / n * 1e6
+
+    start = time.perf_counter()
+    for i in range(n):
+        counter.inc("x")
+    result["inc_us"] = (time.perf_counter() - start) / n * 1e6
+
+    for (name, factory) in (("sqlite_plain_us", sqlite3.Connection), ("sqlite_metrics_us", MetricsConnection)):
+        conn = sqlite3.connect(":memory:", factory=factory)
+        conn.execute("CREATE TABLE t (id INTEGER PRIMARY KEY, v REAL)")
+        conn.executemany("INSERT INTO t (v) VALUES (?)", [(float(i),) for i in range(1000)])
+        start = time.perf_counter()
+        for i in range(n // 10):
+            conn.execute("SELECT v FROM t WHERE id = ?", (i % 1000 + 1,)).fetchone()
+        result[name] = (time.perf_counter() - start) / (n // 10) * 1e6
+        conn.close()
+    result["sqlite_overhead_us"] = result["sqlite_metrics_us"] - result["sqlite_plain_us"]
+    return result
+
+
 ########################################
 # 3) DB-Funktionen mit Context Manager
+#    -> Eine Verbindung pro Thread (wiederverwendet), WAL-Modus und
+#       abgestimmte PRAGMAs, damit Scheduler und Flask sich nicht blockieren.
 ########################################
+# Wartezeit (Sekunden), bis "database is locked" gemeldet wird
+DB_BUSY_TIMEOUT = float(os.environ.get("DB_BUSY_TIMEOUT", "10"))
+
+# Größe des Prepared-Statement-Caches je Verbindung
+DB_STATEMENT_CACHE_SIZE = 256
+
+# WAL: Leser blockieren Schreiber nicht (und umgekehrt).
+# synchronous=NORMAL ist im WAL-Modus crash-sicher, spart aber das fsync je Commit.
+DB_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-16000",      # ~16 MB Page-Cache
+    "PRAGMA mmap_size=268435456",    # 256 MB Memory-Mapped I/O
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA foreign_keys=ON",
+)
+
+_db_local = threading.local()
+
+
+def _open_connection(path=None):
+    conn = sqlite3.connect(
+        path or DB_NAME,
+        timeout=DB_BUSY_TIMEOUT,
+        cached_statements=DB_STATEMENT_CACHE_SIZE,
+        factory=MetricsConnection
+    )
+    for pragma in DB_PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
 def init_db():
-    with sqlite3.connect(DB_NAME) as conn:
+    with get_connection() as conn:
         c = conn.cursor()
 
         # Tabelle credentials (API-Keys)
@@ -97,7 +522,7 @@ def init_db():
         )
         """)
 
-        # balances (Kontostands-Snapshots)
+        # balances (alte Kontostands-Snapshots, seit Migration 11 in balance_snapshots/balance_deltas)
         c.execute("""
         CREATE TABLE IF NOT EXISTS balances (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -133,9 +558,590 @@ def init_db():
         )
         """)
 
+        # Schema-Upgrades (Indizes, Constraints, ...) auf bestehende DBs anwenden
+        migrate_db(conn)
+
 
 def get_connection():
-    return sqlite3.connect(DB_NAME)
+    """
+    Liefert die Verbindung des aktuellen Threads (wird beim ersten Aufruf geöffnet
+    und danach wiederverwendet). Scheduler-Thread und Flask-Worker haben so jeweils
+    eine eigene, langlebige Verbindung statt connect-pro-Aufruf.
+
+    Nutzung wie bisher mit `with get_connection() as conn:` -> der Context Manager
+    von sqlite3 committet bzw. macht Rollback, schließt die Verbindung aber NICHT.
+    """
+    conn = getattr(_db_local, "conn", None)
+    if conn is None:
+        conn = _open_connection()
+        _db_local.conn = conn
+    return conn
+
+
+def close_connection():
+    """
+    Schließt die Verbindung des aktuellen Threads (z.B. beim Beenden eines Threads).
+    """
+    conn = getattr(_db_local, "conn", None)
+    if conn is not None:
+        _db_local.conn = None
+        conn.close()
+
+
+def _bench_db_prepare(path, wal, rows):
+    """
+    Legt path neu an (Tabelle bench mit `rows` Zeilen); wal=False lässt das
+    Rollback-Journal wie bei einer Verbindung ohne DB_PRAGMAS.
+    """
+    for suffix in ("", "-wal", "-shm", "-journal"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    conn = _open_connection(path) if wal else sqlite3.connect(path)
+    conn.execute("CREATE TABLE bench (id INTEGER PRIMARY KEY AUTOINCREMENT, k INTEGER, v TEXT)")
+    conn.execute("CREATE INDEX ix_bench_k ON bench (k)")
+    conn.executemany("INSERT INTO bench (k, v) VALUES (?, ?)", ((i, f"wert {i}") for i in range(rows)))
+    conn.commit()
+    conn.close()
+
+
+def benchmark_db(path, threads=8, operations=20000, write_pct=20, rows=10000):
+    """
+    Gleichzeitige Lese-/Schreiblast aus `threads` Threads (`operations` Zugriffe
+    gesamt, davon write_pct % INSERTs) in zwei Varianten auf je eigener Datei:
+      connect_per_call  - sqlite3.connect() je Zugriff, Rollback-Journal (wie früher)
+      per_thread        - eine Verbindung je Thread mit DB_PRAGMAS (WAL), wiederverwendet
+    Liefert je Variante {"seconds", "ops_per_second", "reads", "writes", "errors"};
+    errors zählt u.a. "database is locked".
+    """
+    def connect_per_call(db_path):
+        def op(sql, params, write):
+            conn = sqlite3.connect(db_path)
+            try:
+                result = conn.execute(sql, params).fetchall()
+                if write:
+                    conn.commit()
+                return result
+            finally:
+                conn.close()
+        return op, lambda: None
+
+    def per_thread(db_path):
+        conn = _open_connection(db_path)
+
+        def op(sql, params, write):
+            result = conn.execute(sql, params).fetchall()
+            if write:
+                conn.commit()
+            return result
+        return op, conn.close
+
+    per_worker = max(1, operations // threads)
+    result = {}
+    for (name, factory, wal) in (("connect_per_call", connect_per_call, False), ("per_thread", per_thread, True)):
+        db_path = f"{path}.{name}"
+        _bench_db_prepare(db_path, wal, rows)
+        counts = {"reads": 0, "writes": 0, "errors": 0}
+        counts_lock = threading.Lock()
+
+        def worker(n):
+            op, close = factory(db_path)
+            local = {"reads": 0, "writes": 0, "errors": 0}
+            try:
+                for i in range(per_worker):
+                    write = (n * per_worker + i) % 100 < write_pct
+                    try:
+                        if write:
+                            op("INSERT INTO bench (k, v) VALUES (?, ?)", (rows + i, f"thread {n}"), True)
+                        else:
+                            op("SELECT v FROM bench WHERE k = ?", ((n * 7919 + i) % rows,), False)
+                        local["writes" if write else "reads"] += 1
+                    except sqlite3.Error:
+                        local["errors"] += 1
+            finally:
+                close()
+            with counts_lock:
+                for key in counts:
+                    counts[key] += local[key]
+
+        started = time.perf_counter()
+        pool = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+        for t in pool:
+            t.start()
+        for t in pool:
+            t.join()
+        seconds = time.perf_counter() - started
+        done = counts["reads"] + counts["writes"]
+        result[name] = dict(counts, seconds=seconds, ops_per_second=done / seconds if seconds else 0.0)
+    return result
+
+
+########################################
+# 3a) Schema-Migrationen
+#     -> Versioniert über die Tabelle schema_version. Jede Migration läuft
+#        genau einmal, in eigener Transaktion, auch auf bestehenden bitmaster.db.
+########################################
+def _migration_indexes(c):
+    # historical_rates: Duplikate (gleiches Datum + Asset) entfernen, neuester gewinnt
+    c.execute("""
+        DELETE FROM historical_rates
+        WHERE id NOT IN (
+            SELECT MAX(id) FROM historical_rates GROUP BY date, asset
+        )
+    """)
+    c.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS ux_historical_rates_date_asset
+        ON historical_rates (date, asset)
+    """)
+    c.execute("""
+        CREATE INDEX IF NOT EXISTS ix_historical_rates_asset_date
+        ON historical_rates (asset, date)
+    """)
+    c.execute("CREATE INDEX IF NOT EXISTS ix_balances_timestamp ON balances (timestamp)")
+    c.execute("CREATE INDEX IF NOT EXISTS ix_trades_asset_timestamp ON trades (asset, timestamp)")
+    c.execute("CREATE INDEX IF NOT EXISTS ix_trades_timestamp ON trades (timestamp)")
+
+
+def _migration_schedule_lines_fk(c):
+    # SQLite kann Fremdschlüssel nicht per ALTER TABLE ergänzen -> Tabelle neu aufbauen.
+    # Verwaiste Zeilen (Schedule existiert nicht mehr) werden dabei verworfen.
+    c.execute("""
+        CREATE TABLE schedule_lines_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            schedule_id INTEGER NOT NULL REFERENCES schedules (id) ON DELETE CASCADE,
+            asset TEXT,
+            amount_eur REAL
+        )
+    """)
+    c.execute("""
+        INSERT INTO schedule_lines_new (id, schedule_id, asset, amount_eur)
+        SELECT id, schedule_id, asset, amount_eur
+        FROM schedule_lines
+        WHERE schedule_id IN (SELECT id FROM schedules)
+    """)
+    c.execute("DROP TABLE schedule_lines")
+    c.execute("ALTER TABLE schedule_lines_new RENAME TO schedule_lines")
+    c.execute("""
+        CREATE INDEX IF NOT EXISTS ix_schedule_lines_schedule_id
+        ON schedule_lines (schedule_id)
+    """)
+
+
+def _migration_notification_outbox(c):
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS notification_outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            created_at DATETIME NOT NULL,
+            subject TEXT NOT NULL,
+            body TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at DATETIME NOT NULL,
+            last_error TEXT,
+            sent_at DATETIME
+        )
+    """)
+    c.execute("""
+        CREATE INDEX IF NOT EXISTS ix_notification_outbox_due
+        ON notification_outbox (status, next_attempt_at)
+    """)
+
+
+def _migration_scheduler_state(c):
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS scheduler_state (
+            job_key TEXT PRIMARY KEY,
+            next_run_at DATETIME,
+            last_run_at DATETIME
+        )
+    """)
+
+
+def _migration_trades_asset_id(c):
+    # Keyset-Pagination mit Asset-Filter: (asset, id) statt Sortierung im Speicher
+    c.execute("CREATE INDEX IF NOT EXISTS ix_trades_asset_id ON trades (asset, id)")
+
+
+def _migration_portfolio_snapshots(c):
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS portfolio_snapshots (
+            date DATE NOT NULL,
+            asset TEXT NOT NULL,
+            units REAL NOT NULL,
+            invested_eur REAL NOT NULL,
+            price_eur REAL,
+            value_eur REAL,
+            PRIMARY KEY (date, asset)
+        )
+    """)
+    c.execute("""
+        CREATE INDEX IF NOT EXISTS ix_portfolio_snapshots_asset_date
+        ON portfolio_snapshots (asset, date)
+    """)
+    # Befüllt wird die Tabelle in Migration 13 (je Konto, nach trades.account_id)
+
+
+def _migration_price_candles(c):
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS price_candles (
+            asset TEXT NOT NULL,
+            interval TEXT NOT NULL,
+            timestamp INTEGER NOT NULL,
+            open REAL NOT NULL,
+            high REAL NOT NULL,
+            low REAL NOT NULL,
+            close REAL NOT NULL,
+            volume REAL NOT NULL,
+            PRIMARY KEY (asset, interval, timestamp)
+        ) WITHOUT ROWID
+    """)
+
+
+def _migration_accounts(c):
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS accounts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            api_key TEXT,
+            api_secret TEXT,
+            created_at DATETIME
+        )
+    """)
+    # Bisheriger (einziger) Credential-Satz wird Konto 1
+    row = c.execute("SELECT api_key, api_secret FROM credentials ORDER BY id DESC LIMIT 1").fetchone()
+    c.execute("""
+        INSERT INTO accounts (id, name, api_key, api_secret, created_at)
+        VALUES (?, ?, ?, ?, ?)
+    """, (DEFAULT_ACCOUNT_ID, "Standard", row[0] if row else None, row[1] if row else None,
+          datetime.datetime.now()))
+    # Bestehende Schedules, Trades und Kontostände gehören zu Konto 1
+    for table in ("schedules", "trades", "balances"):
+        c.execute(f"ALTER TABLE {table} ADD COLUMN account_id INTEGER NOT NULL DEFAULT {DEFAULT_ACCOUNT_ID}")
+    c.execute("CREATE INDEX IF NOT EXISTS ix_schedules_account_id ON schedules (account_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS ix_trades_account_id ON trades (account_id, id)")
+    c.execute("CREATE INDEX IF NOT EXISTS ix_trades_account_asset_id ON trades (account_id, asset, id)")
+    c.execute("CREATE INDEX IF NOT EXISTS ix_balances_account_id ON balances (account_id, id)")
+
+
+def _migration_change_counters(c):
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS change_counters (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL
+        )
+    """)
+
+
+def _migration_order_journal(c):
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS order_journal (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            client_order_id TEXT NOT NULL UNIQUE,
+            account_id INTEGER NOT NULL,
+            schedule_id INTEGER,
+            run_at DATETIME NOT NULL,
+            asset TEXT NOT NULL,
+            amount_eur REAL NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            order_id TEXT,
+            error TEXT,
+            created_at DATETIME NOT NULL,
+            updated_at DATETIME
+        )
+    """)
+    c.execute("CREATE INDEX IF NOT EXISTS ix_order_journal_status ON order_journal (status, created_at)")
+    c.execute("ALTER TABLE trades ADD COLUMN client_order_id TEXT")
+    c.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS ux_trades_client_order_id
+        ON trades (client_order_id) WHERE client_order_id IS NOT NULL
+    """)
+
+
+def _migration_balance_history(c):
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS balance_snapshots (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            account_id INTEGER NOT NULL,
+            taken_at TEXT NOT NULL,
+            checked_at TEXT NOT NULL,
+            is_full INTEGER NOT NULL DEFAULT 0,
+            source TEXT
+        )
+    """)
+    c.execute("CREATE INDEX IF NOT EXISTS ix_balance_snapshots_account_taken ON balance_snapshots (account_id, taken_at)")
+    c.execute("CREATE INDEX IF NOT EXISTS ix_balance_snapshots_account_id ON balance_snapshots (account_id, id)")
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS balance_deltas (
+            snapshot_id INTEGER NOT NULL REFERENCES balance_snapshots (id) ON DELETE CASCADE,
+            currency TEXT NOT NULL,
+            amount REAL NOT NULL,
+            PRIMARY KEY (snapshot_id, currency)
+        ) WITHOUT ROWID
+    """)
+    # Bisherige Vollabzüge (eine Zeile je Währung und Abruf) delta-kodiert übernehmen
+    rows = c.execute("""
+        SELECT account_id, timestamp, currency, amount FROM balances
+        ORDER BY account_id, timestamp, id
+    """).fetchall()
+    groups = {}
+    for (account_id, timestamp, currency, amount) in rows:
+        groups.setdefault((account_id, str(timestamp)), {})[currency] = amount
+    state = {}
+    for ((account_id, timestamp), balances) in groups.items():
+        state[account_id] = write_balance_snapshot(
+            c, account_id, state.get(account_id), balances, timestamp, "import"
+        )
+    c.execute("DELETE FROM balances")
+
+
+def _migration_price_rollup_state(c):
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS price_rollup_state (
+            asset TEXT NOT NULL,
+            interval TEXT NOT NULL,
+            rolled_until INTEGER NOT NULL,
+            PRIMARY KEY (asset, interval)
+        ) WITHOUT ROWID
+    """)
+
+
+def _migration_portfolio_snapshots_account(c):
+    # Snapshots je Konto: account_id gehört zum Schlüssel, Tabelle neu anlegen und befüllen
+    c.execute("DROP TABLE IF EXISTS portfolio_snapshots")
+    c.execute("""
+        CREATE TABLE portfolio_snapshots (
+            account_id INTEGER NOT NULL,
+            date DATE NOT NULL,
+            asset TEXT NOT NULL,
+            units REAL NOT NULL,
+            invested_eur REAL NOT NULL,
+            price_eur REAL,
+            value_eur REAL,
+            PRIMARY KEY (account_id, date, asset)
+        )
+    """)
+    c.execute("""
+        CREATE INDEX IF NOT EXISTS ix_portfolio_snapshots_account_asset_date
+        ON portfolio_snapshots (account_id, asset, date)
+    """)
+    rebuild_portfolio_snapshots(c.connection, verify=False)
+
+
+def _migration_optimizer_runs(c):
+    # Optimierer-Läufe in der DB statt im Prozess: jeder Web-Worker sieht Stand und Ergebnisse
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS optimizer_runs (
+            id TEXT PRIMARY KEY,
+            account_id INTEGER NOT NULL,
+            status TEXT NOT NULL,
+            error TEXT,
+            done INTEGER NOT NULL DEFAULT 0,
+            total INTEGER NOT NULL,
+            params TEXT NOT NULL,
+            assets TEXT NOT NULL,
+            cancel_requested INTEGER NOT NULL DEFAULT 0,
+            started_at REAL NOT NULL,
+            updated_at REAL NOT NULL,
+            finished_at REAL
+        )
+    """)
+    c.execute("CREATE INDEX IF NOT EXISTS ix_optimizer_runs_account ON optimizer_runs (account_id, started_at)")
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS optimizer_results (
+            run_id TEXT NOT NULL,
+            weekday TEXT NOT NULL,
+            weights TEXT NOT NULL,
+            every_weeks INTEGER NOT NULL,
+            invested_eur REAL,
+            value_eur REAL,
+            fees_eur REAL,
+            pnl_pct REAL,
+            twr REAL,
+            mwr REAL,
+            max_drawdown REAL
+        )
+    """)
+    c.execute("CREATE INDEX IF NOT EXISTS ix_optimizer_results_run ON optimizer_results (run_id)")
+
+
+# (Version, Beschreibung, Funktion) - nur anhängen, nie umsortieren!
+MIGRATIONS = [
+    (1, "Indizes + UNIQUE(date, asset) für historical_rates", _migration_indexes),
+    (2, "Fremdschlüssel schedule_lines -> schedules", _migration_schedule_lines_fk),
+    (3, "Tabelle notification_outbox", _migration_notification_outbox),
+    (4, "Tabelle scheduler_state", _migration_scheduler_state),
+    (5, "Index trades(asset, id) für Pagination", _migration_trades_asset_id),
+    (6, "Tabelle portfolio_snapshots (Tageswerte je Asset)", _migration_portfolio_snapshots),
+    (7, "Tabelle price_candles (OHLCV)", _migration_price_candles),
+    (8, "Tabelle accounts, account_id für schedules/trades/balances", _migration_accounts),
+    (9, "Tabelle change_counters (Cache-Abgleich zwischen Prozessen)", _migration_change_counters),
+    (10, "Tabelle order_journal, trades.client_order_id", _migration_order_journal),
+    (11, "Kontostands-Historie balance_snapshots + balance_deltas", _migration_balance_history),
+    (12, "Tabelle price_rollup_state (Verdichtung price_candles)", _migration_price_rollup_state),
+    (13, "portfolio_snapshots je Konto (account_id im Schlüssel)", _migration_portfolio_snapshots_account),
+    (14, "Tabellen optimizer_runs + optimizer_results", _migration_optimizer_runs),
+]
+
+
+def get_schema_version(conn):
+    row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    return row[0] or 0
+
+
+def migrate_db(conn):
+    """
+    Wendet alle noch fehlenden Migrationen der Reihe nach an.
+    BEGIN IMMEDIATE sorgt dafür, dass parallel startende Prozesse
+    dieselbe Migration nicht doppelt ausführen.
+    """
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at DATETIME
+        )
+    """)
+    conn.commit()
+
+    for (version, description, step) in MIGRATIONS:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if get_schema_version(conn) >= version:
+                conn.rollback()
+                continue
+            step(conn.cursor())
+            conn.execute(
+                "INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)",
+                (version, description, datetime.datetime.now())
+            )
+            conn.commit()
+            logging.info(f"DB-Migration {version} angewendet: {description}")
+        except Exception:
+            conn.rollback()
+            logging.exception(f"DB-Migration {version} fehlgeschlagen: {description}")
+            raise
+
+
+def bump_change_counter(c, name):
+    """
+    Zählt den Änderungszähler `name` im Rahmen der laufenden Transaktion hoch.
+    Andere Prozesse (gunicorn-Worker, Scheduler-Leader) erkennen daran, dass
+    ihre Caches veraltet sind.
+    """
+    c.execute("""
+        INSERT INTO change_counters (name, version) VALUES (?, 1)
+        ON CONFLICT (name) DO UPDATE SET version = version + 1
+    """, (name,))
+
+
+def read_change_counter(name):
+    row = get_connection().execute(
+        "SELECT version FROM change_counters WHERE name = ?", (name,)
+    ).fetchone()
+    return row[0] if row else 0
+
+
+# (Name, SQL, Parameter(i)) - typische Abfragen auf die indizierten Tabellen
+INDEX_BENCH_QUERIES = [
+    ("historical_rates asset+Zeitraum",
+     "SELECT date, price_eur FROM historical_rates WHERE asset = ? AND date >= ? ORDER BY date",
+     lambda i, days: (ALLOWED_ASSETS[i % len(ALLOWED_ASSETS)], _bench_day(days - 30))),
+    ("historical_rates date+asset",
+     "SELECT price_eur FROM historical_rates WHERE date = ? AND asset = ?",
+     lambda i, days: (_bench_day(i * 7919 % days), ALLOWED_ASSETS[i % len(ALLOWED_ASSETS)])),
+    ("trades asset+timestamp",
+     "SELECT SUM(amount_eur), SUM(filled_asset) FROM trades WHERE asset = ? AND timestamp >= ?",
+     lambda i, days: (ALLOWED_ASSETS[i % len(ALLOWED_ASSETS)], _bench_day(days - 30))),
+    ("trades neueste",
+     "SELECT * FROM trades WHERE timestamp >= ? ORDER BY timestamp DESC LIMIT 50",
+     lambda i, days: (_bench_day(days - 1),)),
+    ("balances letzter Stand",
+     "SELECT currency, amount FROM balances WHERE timestamp = (SELECT MAX(timestamp) FROM balances)",
+     lambda i, days: ()),
+    ("schedule_lines schedule_id",
+     "SELECT asset, amount_eur FROM schedule_lines WHERE schedule_id = ?",
+     lambda i, days: (i * 7919 % 1000 + 1,)),
+]
+
+
+def _bench_day(day):
+    return (datetime.date(2000, 1, 1) + datetime.timedelta(days=day)).isoformat()
+
+
+def benchmark_indexes(path, rows=1000000, repeat=10):
+    """
+    Synthetische DB mit `rows` Trades und Kursen im Schema vor Migration 1/2
+    (keine Indizes): Abfrageplan und Laufzeit (ms, Median) der INDEX_BENCH_QUERIES
+    vor und nach _migration_indexes/_migration_schedule_lines_fk.
+    """
+    if os.path.exists(path):
+        os.remove(path)
+    conn = sqlite3.connect(path)
+    c = conn.cursor()
+    c.execute("CREATE TABLE schedules (id INTEGER PRIMARY KEY AUTOINCREMENT, weekday TEXT, time_of_day TEXT)")
+    c.execute("""
+        CREATE TABLE schedule_lines (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, schedule_id INTEGER, asset TEXT, amount_eur REAL
+        )
+    """)
+    c.execute("""
+        CREATE TABLE trades (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, timestamp DATETIME, asset TEXT,
+            amount_eur REAL, filled_asset REAL, avg_price REAL, order_id TEXT
+        )
+    """)
+    c.execute("CREATE TABLE balances (id INTEGER PRIMARY KEY AUTOINCREMENT, timestamp DATETIME, currency TEXT, amount REAL)")
+    c.execute("CREATE TABLE historical_rates (id INTEGER PRIMARY KEY AUTOINCREMENT, date DATE, asset TEXT, price_eur REAL)")
+
+    n_assets = len(ALLOWED_ASSETS)
+    days = max(rows // n_assets, 1)
+    c.executemany(
+        "INSERT INTO historical_rates (date, asset, price_eur) VALUES (?, ?, ?)",
+        ((_bench_day(i // n_assets), ALLOWED_ASSETS[i % n_assets], 100.0 + i % 997) for i in range(rows))
+    )
+    c.executemany(
+        "INSERT INTO trades (timestamp, asset, amount_eur, filled_asset, avg_price, order_id) VALUES (?, ?, 10, 0.1, 100, ?)",
+        ((f"{_bench_day(i * days // rows)} 08:00:{i % 60:02d}", ALLOWED_ASSETS[i % n_assets], str(i)) for i in range(rows))
+    )
+    c.executemany(
+        "INSERT INTO balances (timestamp, currency, amount) VALUES (?, ?, 1)",
+        ((f"{_bench_day(i // n_assets % days)} 09:00:00", ALLOWED_ASSETS[i % n_assets]) for i in range(rows // 10))
+    )
+    c.executemany("INSERT INTO schedules (weekday, time_of_day) VALUES (?, '08:00')", ((WEEKDAYS[i % 7],) for i in range(1000)))
+    c.executemany(
+        "INSERT INTO schedule_lines (schedule_id, asset, amount_eur) VALUES (?, ?, 10)",
+        ((i % 1000 + 1, ALLOWED_ASSETS[i % n_assets]) for i in range(rows // 10))
+    )
+    conn.commit()
+
+    def measure():
+        result = {}
+        for (name, sql, params) in INDEX_BENCH_QUERIES:
+            plan = "; ".join(row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params(0, days)))
+            timings = []
+            for i in range(repeat):
+                started = time.perf_counter()
+                conn.execute(sql, params(i, days)).fetchall()
+                timings.append((time.perf_counter() - started) * 1000)
+            result[name] = (plan, sorted(timings)[len(timings) // 2])
+        return result
+
+    before = measure()
+    started = time.perf_counter()
+    _migration_indexes(c)
+    _migration_schedule_lines_fk(c)
+    conn.commit()
+    migration_seconds = time.perf_counter() - started
+    after = measure()
+    conn.close()
+    return {
+        "days": days,
+        "migration_seconds": migration_seconds,
+        "queries": [
+            {"name": name, "plan_before": before[name][0], "ms_before": before[name][1],
+             "plan_after": after[name][0], "ms_after": after[name][1]}
+            for (name, _, _) in INDEX_BENCH_QUERIES
+        ],
+    }
 
 
 ########################################
@@ -147,25 +1153,16 @@ def require_login():
     Blockt alle Seiten bis auf /login und /do_login, falls nicht eingeloggt.
     """
     allowed_paths = ["/login", "/do_login", "/static"]
+    if (request.path == "/metrics" and METRICS_TOKEN
+            and request.headers.get("Authorization") == f"Bearer {METRICS_TOKEN}"):
+        return None
     if not session.get("logged_in") and not request.path.startswith(tuple(allowed_paths)):
         return redirect(url_for("login"))
 
 
 @app.route("/login", methods=["GET"])
 def login():
-    html = """
-    <html>
-    <body>
-      <h1>Login</h1>
-      <form method="POST" action="{{ url_for('do_login') }}">
-        <label>Passwort:</label>
-        <input type="password" name="password">
-        <button type="submit">Login</button>
-      </form>
-    </body>
-    </html>
-    """
-    return render_template_string(html)
+    return render_template("login.html")
 
 
 @app.route("/do_login", methods=["POST"])
@@ -182,12 +1179,90 @@ def do_login():
 
 ########################################
 # 5) E-Mail-Einstellungen
+#    -> E-Mail-Einstellungen und Konten (API-Credentials) liegen typisiert (namedtuple)
+#       im SettingsCache. Geladen wird nur beim ersten Zugriff bzw. nach
+#       invalidate() durch /settings; Änderungen anderer Prozesse werden über
+#       den Änderungszähler "settings" erkannt (höchstens alle
+#       SETTINGS_SYNC_INTERVAL Sekunden geprüft), spätestens nach
+#       SETTINGS_CACHE_TTL Sekunden wird ohnehin neu gelesen.
 ########################################
-def load_email_settings():
+SETTINGS_CACHE_TTL = float(os.environ.get("SETTINGS_CACHE_TTL", "300"))
+SETTINGS_SYNC_INTERVAL = 2.0
+
+EmailSettings = namedtuple("EmailSettings", [
+    "smtp_server", "smtp_port", "smtp_user", "smtp_pass", "from_email", "to_email",
+    "send_on_success", "send_on_error", "use_tls",
+])
+
+ApiCredentials = namedtuple("ApiCredentials", ["api_key", "api_secret"])
+
+Account = namedtuple("Account", ["id", "name", "api_key", "api_secret"])
+
+
+class SettingsCache:
     """
-    Lädt die E-Mail-Einstellungen aus der DB (letzter Eintrag).
-    Gibt ein Dict oder None zurück, wenn nichts gespeichert.
+    Threadsicherer Cache für Einstellungen (Scheduler-Thread + Flask-Worker).
+    Jede Invalidierung erhöht `version`; ein Ladevorgang, der während einer
+    Invalidierung lief, legt sein (evtl. veraltetes) Ergebnis nicht ab.
     """
+
+    def __init__(self, ttl, counter=None):
+        self.ttl = ttl
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self._values = {}     # name -> (wert, geladen_um)
+        self._lock = threading.Lock()
+        self._counter = counter          # counter() -> Änderungszähler in der DB
+        self._counter_value = None
+        self._counter_checked = 0.0
+
+    def _sync(self):
+        """
+        Verwirft den Cache, wenn ein anderer Prozess die Einstellungen geändert hat.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if self._counter is None or now - self._counter_checked < SETTINGS_SYNC_INTERVAL:
+                return
+            self._counter_checked = now
+        value = self._counter()
+        with self._lock:
+            if self._counter_value is not None and value != self._counter_value:
+                self._values.clear()
+                self.version += 1
+            self._counter_value = value
+
+    def get(self, name, loader):
+        self._sync()
+        with self._lock:
+            entry = self._values.get(name)
+            if entry is not None and time.monotonic() - entry[1] < self.ttl:
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+            version = self.version
+
+        value = loader()
+        with self._lock:
+            if version == self.version:
+                self._values[name] = (value, time.monotonic())
+        return value
+
+    def invalidate(self):
+        with self._lock:
+            self._values.clear()
+            self.version += 1
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "version": self.version}
+
+
+settings_cache = SettingsCache(SETTINGS_CACHE_TTL, lambda: read_change_counter("settings"))
+
+
+def _read_email_settings():
     with get_connection() as conn:
         c = conn.cursor()
         c.execute("""
@@ -200,25 +1275,83 @@ def load_email_settings():
         row = c.fetchone()
 
     if row:
-        return {
-            "smtp_server":     row[0],
-            "smtp_port":       row[1],
-            "smtp_user":       row[2],
-            "smtp_pass":       row[3],
-            "from_email":      row[4],
-            "to_email":        row[5],
-            "send_on_success": bool(row[6]),
-            "send_on_error":   bool(row[7]),
-            "use_tls":         bool(row[8]),
-        }
+        return EmailSettings(
+            smtp_server=row[0],
+            smtp_port=row[1],
+            smtp_user=row[2],
+            smtp_pass=row[3],
+            from_email=row[4],
+            to_email=row[5],
+            send_on_success=bool(row[6]),
+            send_on_error=bool(row[7]),
+            use_tls=bool(row[8]),
+        )
     else:
         return None
 
 
+def _read_accounts():
+    with get_connection() as conn:
+        rows = conn.execute("SELECT id, name, api_key, api_secret FROM accounts ORDER BY id").fetchall()
+    return {row[0]: Account(*row) for row in rows}
+
+
+def load_email_settings():
+    """
+    E-Mail-Einstellungen (letzter Eintrag) als EmailSettings oder None,
+    wenn nichts gespeichert.
+    """
+    return settings_cache.get("email", _read_email_settings)
+
+
+def load_accounts():
+    """
+    Alle Konten als {id: Account} (eine Abfrage, danach aus dem Cache).
+    """
+    return settings_cache.get("accounts", _read_accounts)
+
+
+def load_api_credentials(account_id=DEFAULT_ACCOUNT_ID):
+    """
+    API-Credentials des Kontos als ApiCredentials oder None, wenn nichts gespeichert.
+    """
+    account = load_accounts().get(account_id)
+    if account is None or not account.api_key:
+        return None
+    return ApiCredentials(account.api_key, account.api_secret)
+
+
+def _build_email(settings, subject, body):
+    msg = MIMEMultipart()
+    msg["From"] = settings.from_email
+    msg["To"]   = settings.to_email
+    msg["Subject"] = subject
+
+    msg.attach(MIMEText(body, "plain"))
+    return msg
+
+
+def _smtp_connect(settings):
+    # SMTP verbinden
+    server = smtplib.SMTP(settings.smtp_server, settings.smtp_port, timeout=10)
+
+    # Wenn TLS gewünscht (z.B. Port 587) -> STARTTLS
+    if settings.use_tls:
+        server.starttls()
+
+    # Falls SMTP-Login nötig
+    if settings.smtp_user and settings.smtp_pass:
+        server.login(settings.smtp_user, settings.smtp_pass)
+
+    return server
+
+
 def send_email(subject, body):
     """
-    Sendet eine E-Mail mit den in der DB gespeicherten SMTP-Einstellungen.
+    Sendet eine E-Mail SOFORT (synchron) mit den in der DB gespeicherten SMTP-Einstellungen.
     Nutzt ggf. STARTTLS (Port 587), wenn 'use_tls' konfiguriert ist.
+    Nur für den Test-Versand gedacht - Trade-Benachrichtigungen laufen über
+    queue_notification(), damit kein Trade auf den Mailserver warten muss.
     """
     settings = load_email_settings()
     if not settings:
@@ -226,31 +1359,178 @@ def send_email(subject, body):
         return
 
     try:
-        msg = MIMEMultipart()
-        msg["From"] = settings["from_email"]
-        msg["To"]   = settings["to_email"]
-        msg["Subject"] = subject
+        server = _smtp_connect(settings)
+        server.send_message(_build_email(settings, subject, body))
+        server.quit()
 
-        msg.attach(MIMEText(body, "plain"))
+        logging.info(f"E-Mail verschickt: Betreff='{subject}' an {settings.to_email}")
 
-        # SMTP verbinden
-        server = smtplib.SMTP(settings["smtp_server"], settings["smtp_port"], timeout=10)
+    except Exception as e:
+        logging.error(f"Fehler beim E-Mail-Versand: {str(e)}")
 
-        # Wenn TLS gewünscht (z.B. Port 587) -> STARTTLS
-        if settings["use_tls"]:
-            server.starttls()
 
-        # Falls SMTP-Login nötig
-        if settings["smtp_user"] and settings["smtp_pass"]:
-            server.login(settings["smtp_user"], settings["smtp_pass"])
+########################################
+# 5a) Benachrichtigungs-Outbox
+#     -> Mails werden nur in notification_outbox gespeichert; ein Hintergrund-
+#        Thread verschickt sie über EINE wiederverwendete SMTP-Session und
+#        wiederholt Fehlversuche mit exponentiellem Backoff.
+########################################
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get("OUTBOX_MAX_ATTEMPTS", "8"))
+OUTBOX_RETRY_BASE = 30        # Sekunden bis zum 1. Wiederholversuch, danach verdoppelt
+OUTBOX_RETRY_MAX = 3600       # max. Wartezeit zwischen zwei Versuchen
+OUTBOX_BATCH_SIZE = 50
+SMTP_IDLE_TIMEOUT = 60        # SMTP-Session nach so vielen Sekunden ohne Mail schließen
 
-        server.send_message(msg)
-        server.quit()
+_outbox_wakeup = threading.Event()
 
-        logging.info(f"E-Mail verschickt: Betreff='{subject}' an {settings['to_email']}")
 
-    except Exception as e:
-        logging.error(f"Fehler beim E-Mail-Versand: {str(e)}")
+def queue_notification(subject, body):
+    """
+    Legt eine Benachrichtigung in der Outbox ab und weckt den Sender-Thread.
+    Kehrt sofort zurück (kein SMTP im Aufrufer).
+    """
+    now = datetime.datetime.now()
+    with get_connection() as conn:
+        conn.execute("""
+            INSERT INTO notification_outbox (created_at, subject, body, next_attempt_at)
+            VALUES (?, ?, ?, ?)
+        """, (now, subject, body, now))
+    _outbox_wakeup.set()
+
+
+class NotificationSender:
+    """
+    Arbeitet die Outbox ab. Die SMTP-Verbindung bleibt offen, solange Mails
+    anstehen, und wird erst nach SMTP_IDLE_TIMEOUT Sekunden Leerlauf geschlossen.
+    """
+
+    def __init__(self):
+        self.server = None
+        self.last_used = 0.0
+        self.connect_failures = 0
+        self.connect_retry_at = 0.0
+
+    def run(self):
+        while True:
+            # VOR dem Abarbeiten zurücksetzen: ein set() aus queue_notification()
+            # während process_due() bleibt so für das wait() unten erhalten
+            _outbox_wakeup.clear()
+            try:
+                wait = self.process_due()
+            except Exception as e:
+                logging.error(f"Outbox-Verarbeitung fehlgeschlagen: {str(e)}")
+                self.close()
+                wait = OUTBOX_RETRY_BASE
+
+            if self.server and time.monotonic() - self.last_used > SMTP_IDLE_TIMEOUT:
+                self.close()
+            if self.server:
+                wait = min(wait, SMTP_IDLE_TIMEOUT)
+
+            _outbox_wakeup.wait(wait)
+
+    def process_due(self):
+        """
+        Verschickt alle fälligen Mails. Gibt die Wartezeit (Sekunden) bis zur
+        nächsten fälligen Mail zurück. Ist der SMTP-Server nicht erreichbar, bricht
+        der Durchlauf nach dem ersten Verbindungsfehler ab (die Mails bleiben
+        unverändert offen) und der nächste Verbindungsversuch folgt mit Backoff.
+        """
+        backoff = self.connect_retry_at - time.monotonic()
+        if backoff > 0:
+            return backoff
+
+        while True:
+            now = datetime.datetime.now()
+            with get_connection() as conn:
+                rows = conn.execute("""
+                    SELECT id, subject, body, attempts
+                    FROM notification_outbox
+                    WHERE status = 'pending' AND next_attempt_at <= ?
+                    ORDER BY id
+                    LIMIT ?
+                """, (now, OUTBOX_BATCH_SIZE)).fetchall()
+            if not rows:
+                break
+
+            settings = load_email_settings()
+            for (msg_id, subject, body, attempts) in rows:
+                if self.server is None:
+                    try:
+                        if not settings:
+                            raise Exception("Keine E-Mail-Einstellungen konfiguriert.")
+                        self.server = _smtp_connect(settings)
+                    except Exception as e:
+                        return self.connect_failed(e)
+                    self.connect_failures = 0
+                try:
+                    with metric_email_seconds.time():
+                        self.server.send_message(_build_email(settings, subject, body))
+                    self.last_used = time.monotonic()
+                    metric_emails.inc("sent")
+                    self.mark_sent(msg_id)
+                    logging.info(f"E-Mail verschickt: Betreff='{subject}' an {settings.to_email}")
+                except Exception as e:
+                    # Session ist evtl. kaputt -> beim nächsten Versuch neu verbinden
+                    metric_emails.inc("failed")
+                    self.close()
+                    self.mark_failed(msg_id, attempts + 1, str(e))
+
+        with get_connection() as conn:
+            row = conn.execute("""
+                SELECT MIN(next_attempt_at) FROM notification_outbox WHERE status = 'pending'
+            """).fetchone()
+        if not row or row[0] is None:
+            return OUTBOX_RETRY_MAX
+        next_due = datetime.datetime.fromisoformat(str(row[0]))
+        return max(0.0, (next_due - datetime.datetime.now()).total_seconds())
+
+    def connect_failed(self, error):
+        """
+        Verbindungsfehler: keine Mail wird als Fehlversuch gezählt, der nächste
+        Versuch folgt nach exponentiellem Backoff. Gibt die Wartezeit zurück.
+        """
+        self.connect_failures += 1
+        metric_emails.inc("connect_failed")
+        delay = min(OUTBOX_RETRY_BASE * 2 ** (self.connect_failures - 1), OUTBOX_RETRY_MAX)
+        self.connect_retry_at = time.monotonic() + delay
+        logging.error(f"SMTP-Verbindung fehlgeschlagen ({self.connect_failures}. Mal): {error} - neuer Versuch in {delay}s")
+        return delay
+
+    def mark_sent(self, msg_id):
+        with get_connection() as conn:
+            conn.execute("""
+                UPDATE notification_outbox SET status = 'sent', sent_at = ? WHERE id = ?
+            """, (datetime.datetime.now(), msg_id))
+
+    def mark_failed(self, msg_id, attempts, error):
+        if attempts >= OUTBOX_MAX_ATTEMPTS:
+            status = "failed"
+            logging.error(f"E-Mail {msg_id} endgültig fehlgeschlagen nach {attempts} Versuchen: {error}")
+        else:
+            status = "pending"
+            logging.warning(f"E-Mail {msg_id} fehlgeschlagen (Versuch {attempts}/{OUTBOX_MAX_ATTEMPTS}): {error}")
+
+        delay = min(OUTBOX_RETRY_BASE * 2 ** (attempts - 1), OUTBOX_RETRY_MAX)
+        next_attempt = datetime.datetime.now() + timedelta(seconds=delay)
+        with get_connection() as conn:
+            conn.execute("""
+                UPDATE notification_outbox
+                SET status = ?, attempts = ?, next_attempt_at = ?, last_error = ?
+                WHERE id = ?
+            """, (status, attempts, next_attempt, error, msg_id))
+
+    def close(self):
+        if self.server is not None:
+            try:
+                self.server.quit()
+            except Exception:
+                pass
+            self.server = None
+
+
+def run_notification_sender():
+    NotificationSender().run()
 
 
 ########################################
@@ -260,32 +1540,43 @@ def send_email(subject, body):
 def settings():
     """
     Gemeinsame Seite für:
-      1) API-Key-Einstellungen
+      1) API-Key-Einstellungen (des aktuell gewählten Kontos)
       2) E-Mail-Einstellungen
       3) Test-E-Mail-Versand
     """
+    account_id = current_account_id()
     if request.method == "POST":
         action = request.form.get("action")
         with get_connection() as conn:
             c = conn.cursor()
 
-            # 1) API-Key speichern
+            # 1) API-Key des aktuellen Kontos speichern
             if action == "save_api":
                 new_key = request.form.get("api_key", "").strip()
                 new_secret = request.form.get("api_secret", "").strip()
-                c.execute("DELETE FROM credentials")  # Nur 1 Datensatz halten
-                c.execute("INSERT INTO credentials (api_key, api_secret) VALUES (?, ?)",
-                          (new_key, new_secret))
+                old_creds = load_api_credentials(account_id)
+                c.execute("UPDATE accounts SET api_key = ?, api_secret = ? WHERE id = ?",
+                          (new_key, new_secret, account_id))
+                bump_change_counter(c, "settings")
                 conn.commit()
+                settings_cache.invalidate()
+                if old_creds:
+                    invalidate_bitvavo_clients(old_creds)
                 flash("API-Credentials wurden gespeichert.")
-                logging.info("API-Credentials gespeichert/aktualisiert.")
+                logging.info(f"API-Credentials für Konto {account_id} gespeichert/aktualisiert.")
 
-            # 2) API-Key löschen
+            # 2) API-Key des aktuellen Kontos löschen
             elif action == "delete_api":
-                c.execute("DELETE FROM credentials")
+                old_creds = load_api_credentials(account_id)
+                c.execute("UPDATE accounts SET api_key = NULL, api_secret = NULL WHERE id = ?",
+                          (account_id,))
+                bump_change_counter(c, "settings")
                 conn.commit()
+                settings_cache.invalidate()
+                if old_creds:
+                    invalidate_bitvavo_clients(old_creds)
                 flash("API-Credentials wurden gelöscht.")
-                logging.info("API-Credentials gelöscht.")
+                logging.info(f"API-Credentials für Konto {account_id} gelöscht.")
 
             # 3) E-Mail-Einstellungen speichern
             elif action == "save_email":
@@ -313,7 +1604,9 @@ def settings():
                     from_email, to_email,
                     send_on_success, send_on_error, use_tls
                 ))
+                bump_change_counter(c, "settings")
                 conn.commit()
+                settings_cache.invalidate()
 
                 flash("E-Mail-Einstellungen wurden aktualisiert.")
                 logging.info("E-Mail-Einstellungen wurden aktualisiert.")
@@ -333,13 +1626,10 @@ def settings():
         return redirect(url_for("settings"))
 
     # GET: Aktuelle Werte laden
-    with get_connection() as conn:
-        c = conn.cursor()
-        c.execute("SELECT api_key, api_secret FROM credentials ORDER BY id DESC LIMIT 1")
-        api_row = c.fetchone()
+    creds = load_api_credentials(account_id)
 
-    if api_row:
-        saved_api_key, saved_api_secret = api_row
+    if creds:
+        saved_api_key, saved_api_secret = creds
         mask_key = saved_api_key[:5] + "..." if saved_api_key else ""
         mask_secret = saved_api_secret[:5] + "..." if saved_api_secret else ""
     else:
@@ -347,792 +1637,6063 @@ def settings():
         mask_secret = ""
 
     mail_settings = load_email_settings()
+    client_stats = get_bitvavo_client_stats()
 
-    html = """
-    <html>
-    <body>
-      <h1>Einstellungen</h1>
-      <hr>
-
-      <h2>API-Key-Einstellungen</h2>
-      <form method="POST">
-        <p>Aktueller API-Key (maskiert): {{ mask_key }}</p>
-        <p>Aktueller Secret (maskiert): {{ mask_secret }}</p>
-        <label>API Key:</label>
-        <input type="text" name="api_key" value=""><br><br>
-        <label>API Secret:</label>
-        <input type="text" name="api_secret" value=""><br><br>
-
-        <button type="submit" name="action" value="save_api">Speichern</button>
-        <button type="submit" name="action" value="delete_api"
-                onclick="return confirm('API-Keys wirklich löschen?');">
-          Löschen
-        </button>
-      </form>
-      <hr>
-
-      <h2>E-Mail-Einstellungen</h2>
-      <form method="POST">
-        SMTP-Server:<br>
-        <input type="text" name="smtp_server"
-               value="{{ mail_settings.smtp_server if mail_settings else 'smtp.gmail.com' }}"><br><br>
-
-        SMTP-Port (587 für STARTTLS, 465 für SSL):<br>
-        <input type="number" name="smtp_port"
-               value="{{ mail_settings.smtp_port if mail_settings else '587' }}"><br><br>
-
-        SMTP-User:<br>
-        <input type="text" name="smtp_user"
-               value="{{ mail_settings.smtp_user if mail_settings else '' }}"><br><br>
-
-        SMTP-Passwort:<br>
-        <input type="password" name="smtp_pass" value="">
-        <small>(Leer lassen, wenn nicht ändern)</small><br><br>
-
-        Absender (From):<br>
-        <input type="text" name="from_email"
-               value="{{ mail_settings.from_email if mail_settings else '' }}"><br><br>
-
-        Empfänger (To):<br>
-        <input type="text" name="to_email"
-               value="{{ mail_settings.to_email if mail_settings else '' }}"><br><br>
-
-        <label>
-          <input type="checkbox" name="send_on_success"
-                 {% if mail_settings and mail_settings.send_on_success %}checked{% endif %}>
-          E-Mail bei erfolgreichem Trade
-        </label><br>
-
-        <label>
-          <input type="checkbox" name="send_on_error"
-                 {% if mail_settings and mail_settings.send_on_error %}checked{% endif %}>
-          E-Mail bei Fehler
-        </label><br>
-
-        <label>
-          <input type="checkbox" name="use_tls"
-                 {% if mail_settings and mail_settings.use_tls %}checked{% endif %}>
-          STARTTLS aktivieren
-        </label><br><br>
-
-        <button type="submit" name="action" value="save_email">Speichern</button>
-        <button type="submit" name="action" value="test_email">Test-E-Mail senden</button>
-      </form>
-      <hr>
-
-      <p><a href="{{ url_for('index') }}">Zurück zum Hauptmenü</a></p>
-    </body>
-    </html>
-    """
-    return render_template_string(html,
+    return render_template("settings.html",
+        account=load_accounts()[account_id],
         mask_key=mask_key, mask_secret=mask_secret,
-        mail_settings=mail_settings
+        mail_settings=mail_settings, client_stats=client_stats,
+        settings_stats=settings_cache.stats()
     )
 
 
 ########################################
-# 7) Bitvavo-Client (optional) + Mock-Order
+# 6a) Konten (mehrere Bitvavo-Accounts)
+#     -> Schedules, Trades und Kontostände gehören jeweils zu einem Konto.
+#        Die Weboberfläche arbeitet mit dem in der Session gewählten Konto.
 ########################################
-def get_bitvavo_client():
-    with get_connection() as conn:
-        c = conn.cursor()
-        c.execute("SELECT api_key, api_secret FROM credentials ORDER BY id DESC LIMIT 1")
-        row = c.fetchone()
+def current_account_id():
+    """
+    In der Session gewähltes Konto (Standard: DEFAULT_ACCOUNT_ID).
+    """
+    account_id = session.get("account_id", DEFAULT_ACCOUNT_ID)
+    if account_id not in load_accounts():
+        account_id = DEFAULT_ACCOUNT_ID
+    return account_id
 
-    if not row:
-        raise Exception("Keine API-Credentials hinterlegt. Bitte in den Einstellungen hinzufügen.")
 
-    api_key, api_secret = row
-    return Bitvavo({
-        'APIKEY': api_key,
-        'APISECRET': api_secret,
-        'RESTURL': 'https://api.bitvavo.com/v2',
-        'WSURL': 'wss://ws.bitvavo.com/v2/',
-        'ACCESSWINDOW': 30000
-    })
+@app.context_processor
+def _inject_current_account():
+    if not session.get("logged_in"):
+        return {}
+    return {"current_account": load_accounts().get(current_account_id())}
 
 
-def place_mock_order(asset, amount_eur):
+@app.route("/accounts", methods=["GET", "POST"])
+def accounts():
     """
-    Simuliert einen Kauf und gibt eine Fake-Response zurück.
+    Konten anlegen, auswählen und löschen.
     """
-    logging.info(f"SIMULATION: Würde jetzt {amount_eur} EUR in {asset} investieren.")
-    fake_price = 25000.0
-    fake_filled_amount = float(amount_eur) / fake_price
-
-    return {
-        "orderId": "SIM-ORDER-12345",
-        "fills": [
-            {
-                "amount": str(fake_filled_amount),
-                "price": str(fake_price)
-            }
-        ]
-    }
+    if request.method == "POST":
+        action = request.form.get("action")
+        account_id = request.form.get("account_id", type=int)
+
+        if action == "add":
+            name = request.form.get("name", "").strip()
+            if not name:
+                flash("Bitte einen Namen für das Konto angeben.")
+                return redirect(url_for("accounts"))
+            with get_connection() as conn:
+                c = conn.cursor()
+                c.execute("""
+                    INSERT INTO accounts (name, api_key, api_secret, created_at)
+                    VALUES (?, ?, ?, ?)
+                """, (
+                    name,
+                    request.form.get("api_key", "").strip() or None,
+                    request.form.get("api_secret", "").strip() or None,
+                    datetime.datetime.now()
+                ))
+                account_id = c.lastrowid
+                bump_change_counter(c, "settings")
+                conn.commit()
+            settings_cache.invalidate()
+            session["account_id"] = account_id
+            flash(f"Konto {name} angelegt.")
+            logging.info(f"Konto {account_id} ({name}) angelegt.")
+
+        elif action == "select" and account_id in load_accounts():
+            session["account_id"] = account_id
+            flash(f"Konto {load_accounts()[account_id].name} ausgewählt.")
+
+        elif action == "delete":
+            if account_id == DEFAULT_ACCOUNT_ID:
+                flash("Das Standard-Konto kann nicht gelöscht werden.")
+                return redirect(url_for("accounts"))
+            with get_connection() as conn:
+                c = conn.cursor()
+                c.execute("SELECT COUNT(*) FROM schedules WHERE account_id = ?", (account_id,))
+                if c.fetchone()[0]:
+                    flash("Konto hat noch Zeitpläne und kann nicht gelöscht werden.")
+                    return redirect(url_for("accounts"))
+                old_creds = load_api_credentials(account_id)
+                c.execute("DELETE FROM accounts WHERE id = ?", (account_id,))
+                bump_change_counter(c, "settings")
+                conn.commit()
+            settings_cache.invalidate()
+            if old_creds:
+                invalidate_bitvavo_clients(old_creds)
+            flash(f"Konto {account_id} gelöscht.")
+            logging.info(f"Konto {account_id} gelöscht (Trades/Kontostände bleiben erhalten).")
 
+        return redirect(url_for("accounts"))
 
-########################################
-# 8) RETRY-Logik für Bitvavo-Aufrufe
-########################################
-def bitvavo_request_with_retry(func, *args, max_retries=3, **kwargs):
-    attempt = 0
-    while attempt < max_retries:
-        try:
-            return func(*args, **kwargs)
-        except Exception as e:
-            logging.warning(f"Bitvavo-Aufruf fehlgeschlagen (Versuch {attempt+1}/{max_retries}): {str(e)}")
-            attempt += 1
-            time.sleep(2)
-    raise Exception(f"Bitvavo-Aufruf fehlgeschlagen nach {max_retries} Versuchen")
+    with get_connection() as conn:
+        counts = dict(conn.execute(
+            "SELECT account_id, COUNT(*) FROM schedules GROUP BY account_id"
+        ).fetchall())
+
+    return render_template(
+        "accounts.html",
+        accounts=list(load_accounts().values()),
+        schedule_counts=counts,
+        selected_id=current_account_id(),
+        dispatcher_stats=dispatcher.stats()
+    )
 
 
 ########################################
-# 9) Scheduler-Logik
+# 7) Bitvavo-Client (optional)
 ########################################
-def load_schedules_into_scheduler():
-    schedule.clear()
-    # Täglicher Job um 00:00 Uhr -> update_prices_for_assets
-    schedule.every().day.at("00:00").do(update_prices_for_assets)
+# Gemeinsame Clients je Credential-Satz: (api_key, api_secret) -> PooledBitvavo
+_bitvavo_clients = {}
+_bitvavo_clients_lock = threading.Lock()
 
-    with get_connection() as conn:
-        c = conn.cursor()
-        c.execute("SELECT id, weekday, time_of_day FROM schedules ORDER BY id")
-        schedules_rows = c.fetchall()
-
-    weekday_mapping = {
-        "Monday": schedule.every().monday,
-        "Tuesday": schedule.every().tuesday,
-        "Wednesday": schedule.every().wednesday,
-        "Thursday": schedule.every().thursday,
-        "Friday": schedule.every().friday,
-        "Saturday": schedule.every().saturday,
-        "Sunday": schedule.every().sunday
-    }
+_bitvavo_client_stats = {
+    "cache_hits": 0,
+    "cache_misses": 0,
+    "cold_build_seconds": 0.0,
+    "requests": 0,
+    "request_seconds": 0.0,
+}
+_bitvavo_client_stats_lock = threading.Lock()
 
-    for (sched_id, wd, tod) in schedules_rows:
-        if wd not in weekday_mapping:
-            logging.warning(f"Ungültiger Wochentag in DB: {wd}")
-            continue
 
-        def job_func(schedule_id=sched_id):
-            execute_investment(schedule_id)
+def _count_client_stat(key, value=1):
+    with _bitvavo_client_stats_lock:
+        _bitvavo_client_stats[key] += value
 
-        weekday_mapping[wd].at(tod).do(job_func).tag(f"schedule_{sched_id}")
+
+class PooledBitvavo(Bitvavo):
+    """
+    Bitvavo-Client mit eigener requests.Session (Keep-Alive + Connection-Pool).
+    Die Bibliothek ruft sonst requests.get/requests.request auf und baut damit
+    für jeden Aufruf eine neue TCP/TLS-Verbindung auf.
+    publicRequest/privateRequest entsprechen python_bitvavo_api 1.4.2,
+    nur eben über self.session.
+    """
+
+    def __init__(self, options):
+        super().__init__(options)
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=2,
+            pool_maxsize=max(ORDER_WORKERS, PRICE_FETCH_WORKERS, 1)
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def _timed(self, method, url, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self.session.request(method, url, timeout=self.timeout, **kwargs)
+        finally:
+            _count_client_stat("requests")
+            _count_client_stat("request_seconds", time.perf_counter() - start)
+
+    def _handle_response(self, r):
+        data = r.json()
+        if isinstance(data, dict) and 'error' in data:
+            self.updateRateLimit(data)
+        else:
+            self.updateRateLimit(r.headers)
+        return data
+
+    def publicRequest(self, url):
+        headers = {}
+        if self.APIKEY != '':
+            now = int(time.time() * 1000)
+            sig = createSignature(now, 'GET', url.replace(self.base, ''), None, self.APISECRET)
+            headers = {
+                'bitvavo-access-key': self.APIKEY,
+                'bitvavo-access-signature': sig,
+                'bitvavo-access-timestamp': str(now),
+                'bitvavo-access-window': str(self.ACCESSWINDOW)
+            }
+        return self._handle_response(self._timed('GET', url, headers=headers))
+
+    def privateRequest(self, endpoint, postfix, body=None, method='GET'):
+        now = int(time.time() * 1000)
+        sig = createSignature(now, method, (endpoint + postfix), body, self.APISECRET)
+        url = self.base + endpoint + postfix
+        headers = {
+            'bitvavo-access-key': self.APIKEY,
+            'bitvavo-access-signature': sig,
+            'bitvavo-access-timestamp': str(now),
+            'bitvavo-access-window': str(self.ACCESSWINDOW),
+        }
+        return self._handle_response(self._timed(method, url, headers=headers, json=body))
+
+    def new_connection_count(self):
+        """
+        Anzahl der bisher aufgebauten TCP-Verbindungen (aus den urllib3-Pools).
+        """
+        total = 0
+        for adapter in set(self.session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                total += getattr(pool, "num_connections", 0)
+        return total
+
+    def close(self):
+        self.session.close()
+
+
+def get_bitvavo_client(account_id=DEFAULT_ACCOUNT_ID):
+    """
+    Liefert den Client des Kontos. Jeder Credential-Satz hat seinen eigenen
+    Client (eigener Connection-Pool, eigenes Rate-Limit-Gewicht der Börse);
+    er wird nur beim ersten Aufruf (bzw. nach invalidate_bitvavo_clients())
+    neu gebaut und danach samt offenen HTTP-Verbindungen wiederverwendet.
+    Im SIMULATION_MODE die Mock-Börse des Kontos (keine Credentials nötig).
+    """
+    if SIMULATION_MODE:
+        return get_mock_exchange(account_id)
+    creds = load_api_credentials(account_id)
+    if not creds:
+        raise Exception(
+            f"Keine API-Credentials für Konto {account_id} hinterlegt. Bitte in den Einstellungen hinzufügen."
+        )
+
+    return _cached_bitvavo_client(*creds)
+
+
+def get_public_bitvavo_client():
+    """
+    Client ohne Credentials für öffentliche Endpunkte (Kurse, Kerzen).
+    """
+    if SIMULATION_MODE:
+        return get_mock_exchange()
+    return _cached_bitvavo_client("", "")
+
+
+def _cached_bitvavo_client(api_key, api_secret):
+    key = (api_key, api_secret)
+    with _bitvavo_clients_lock:
+        client = _bitvavo_clients.get(key)
+        if client is not None:
+            _count_client_stat("cache_hits")
+            return client
+
+        start = time.perf_counter()
+        client = PooledBitvavo({
+            'APIKEY': api_key,
+            'APISECRET': api_secret,
+            'RESTURL': BITVAVO_REST_URL,
+            'WSURL': BITVAVO_WS_URL,
+            'ACCESSWINDOW': 30000
+        })
+        _bitvavo_clients[key] = client
+        _count_client_stat("cache_misses")
+        _count_client_stat("cold_build_seconds", time.perf_counter() - start)
+        return client
+
+
+def invalidate_bitvavo_clients(credentials=None):
+    """
+    Verwirft den Client eines Credential-Satzes (z.B. nach Speichern/Löschen
+    der API-Keys eines Kontos) bzw. ohne Angabe alle gecachten Clients.
+    """
+    with _bitvavo_clients_lock:
+        if credentials is None:
+            clients = list(_bitvavo_clients.values())
+            _bitvavo_clients.clear()
+        else:
+            client = _bitvavo_clients.pop(tuple(credentials), None)
+            clients = [client] if client is not None else []
+    for client in clients:
+        client.close()
+    logging.info(f"Bitvavo-Client-Cache geleert ({len(clients)} Clients).")
+
+
+def get_bitvavo_client_stats():
+    """
+    Kennzahlen zum Client-Cache:
+      connection_reuse_rate -> Anteil der Requests ohne neuen Verbindungsaufbau
+      saved_seconds         -> geschätzt eingesparte Zeit für Client-Neuaufbau
+    """
+    with _bitvavo_client_stats_lock:
+        stats = dict(_bitvavo_client_stats)
+    with _bitvavo_clients_lock:
+        new_connections = sum(c.new_connection_count() for c in _bitvavo_clients.values())
+
+    avg_cold_build = stats["cold_build_seconds"] / stats["cache_misses"] if stats["cache_misses"] else 0.0
+    stats["clients"] = len(_bitvavo_clients)
+    stats["new_connections"] = new_connections
+    stats["connection_reuse_rate"] = (
+        1.0 - min(new_connections, stats["requests"]) / stats["requests"] if stats["requests"] else 0.0
+    )
+    stats["avg_request_seconds"] = stats["request_seconds"] / stats["requests"] if stats["requests"] else 0.0
+    stats["avg_cold_build_seconds"] = avg_cold_build
+    stats["saved_seconds"] = stats["cache_hits"] * avg_cold_build
+    return stats
 
 
-def execute_investment(schedule_id):
+########################################
+# 7a) Mock-Börse für SIMULATION_MODE
+########################################
+# In-Process-Ersatz für den Bitvavo-Client mit denselben Methoden, die das Tool
+# nutzt (tickerPrice, placeOrder, getOrders, balance, candles, book). Kurse werden
+# aus historical_rates abgespielt, Market-Orders laufen durch ein synthetisches
+# Orderbuch. Latenz, Fehler und Rate-Limit lassen sich per ENV einstellen, damit
+# Retry-Logik und Last ohne Netzwerk getestet werden können.
+
+# Abspielen ab diesem Datum (YYYY-MM-DD); leer = jeweils letzter gespeicherter Kurs
+MOCK_REPLAY_START = os.environ.get("MOCK_REPLAY_START", "")
+# Simulierte Sekunden je echter Sekunde beim Abspielen
+MOCK_REPLAY_SPEED = float(os.environ.get("MOCK_REPLAY_SPEED", "1"))
+MOCK_LATENCY_MS = float(os.environ.get("MOCK_LATENCY_MS", "50"))       # mittlere Antwortzeit
+MOCK_ERROR_RATE = float(os.environ.get("MOCK_ERROR_RATE", "0"))        # Anteil gestörter Aufrufe (0..1)
+MOCK_RATE_LIMIT = int(os.environ.get("MOCK_RATE_LIMIT", "1000"))       # Gewicht je Minute
+MOCK_START_EUR = float(os.environ.get("MOCK_START_EUR", "10000"))
+MOCK_FEE_PCT = float(os.environ.get("MOCK_FEE_PCT", "0.25"))
+# Assets ohne Kurse in historical_rates: dieser Kurs bzw. (nur wenn eingeschaltet,
+# braucht Netzwerk) einmalig der Live-Kurs der echten Börse
+MOCK_LIVE_FALLBACK = os.environ.get("MOCK_LIVE_FALLBACK", "false").lower() in ["true", "1", "yes"]
+MOCK_DEFAULT_PRICE = float(os.environ.get("MOCK_DEFAULT_PRICE", "100"))
+MOCK_SPREAD_PCT = 0.05            # Abstand bestes Ask zum Mittelkurs (in %)
+MOCK_BOOK_LEVELS = 20
+MOCK_LEVEL_STEP_PCT = 0.02        # Preisabstand zwischen zwei Levels (in %)
+MOCK_LEVEL_DEPTH_EUR = 250.0      # Volumen je Level (in EUR)
+
+
+def load_mock_prices():
     """
-    Führt für schedule_id alle definierten Käufe durch.
+    Lädt die abzuspielenden Tageskurse: {ASSET: (tage_seit_1970, preise)}.
     """
     with get_connection() as conn:
-        c = conn.cursor()
-        c.execute("SELECT asset, amount_eur FROM schedule_lines WHERE schedule_id = ?", (schedule_id,))
-        lines = c.fetchall()
+        rows = conn.execute("""
+            SELECT asset, date, price_eur FROM historical_rates ORDER BY asset, date
+        """).fetchall()
+    prices = {}
+    for (asset, group) in itertools.groupby(rows, key=lambda r: r[0]):
+        group = list(group)
+        prices[asset.upper()] = (
+            np.array([r[1] for r in group], dtype="datetime64[D]").astype(np.float64),
+            np.array([r[2] for r in group], dtype=np.float64),
+        )
+    return prices
 
-    if not lines:
-        logging.info(f"Schedule {schedule_id} hat keine lines definiert.")
-        return
 
-    email_config = load_email_settings()
+class MockExchange:
+    """
+    Verhält sich für das Tool wie PooledBitvavo, hält Konto und Orders aber im Speicher.
+    """
+
+    def __init__(self, prices=None, latency_ms=MOCK_LATENCY_MS):
+        self.APIKEY = ''
+        self.latency_ms = latency_ms
+        self.rateLimitRemaining = MOCK_RATE_LIMIT
+        self.rateLimitReset = 0
+        self._lock = threading.Lock()
+        self._random = random.Random()
+        self._orders = {}          # market -> [order, ...] (neueste zuletzt)
+        self._client_ids = {}      # clientOrderId -> order
+        self._balances = {"EUR": MOCK_START_EUR}
+        self._stats = {"calls": 0, "orders": 0, "fills": 0, "injected_errors": 0, "rate_limited": 0}
+        self._started = time.time()
+        self._replay_start = (
+            datetime.datetime.strptime(MOCK_REPLAY_START, '%Y-%m-%d').timestamp()
+            if MOCK_REPLAY_START else None
+        )
+        self._prices = prices if prices is not None else load_mock_prices()
+        self._fallback_prices = {}
+
+    def reload_prices(self, prices=None):
+        self._prices = prices if prices is not None else load_mock_prices()
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, balances=dict(self._balances))
+
+    # --- Hilfsfunktionen -------------------------------------------------
+
+    def _sim_day(self):
+        """
+        Simulierter Zeitpunkt in (gebrochenen) Tagen seit 1970-01-01, oder None (= letzter Kurs).
+        """
+        if self._replay_start is None:
+            return None
+        elapsed = (time.time() - self._started) * MOCK_REPLAY_SPEED
+        return (self._replay_start + elapsed) / 86400.0
+
+    def _fallback_price(self, asset):
+        """
+        Kurs für ALLOWED_ASSETS ohne Kursreihe (z.B. bei leerer historical_rates):
+        Live-Cache, sonst MOCK_DEFAULT_PRICE. Nur mit MOCK_LIVE_FALLBACK wird
+        einmalig per REST die echte Börse gefragt. Andere Märkte bleiben ungültig.
+        """
+        if asset not in ALLOWED_ASSETS:
+            return None
+        price = price_cache.get(asset)
+        if price is not None:
+            return price
+        with self._lock:
+            price = self._fallback_prices.get(asset)
+        if price is None:
+            price = MOCK_DEFAULT_PRICE
+            if MOCK_LIVE_FALLBACK:
+                try:
+                    ticker = _cached_bitvavo_client("", "").tickerPrice({"market": f"{asset}-EUR"})
+                    price = float(ticker["price"])
+                except Exception as e:
+                    logging.warning(f"Mock-Börse: kein Live-Kurs für {asset} ({str(e)}), nutze {price} EUR.")
+            with self._lock:
+                self._fallback_prices[asset] = price
+        return price
+
+    def _mid_price(self, asset):
+        series = self._prices.get(asset)
+        if series is None:
+            return self._fallback_price(asset)
+        days, prices = series
+        now = self._sim_day()
+        if now is None:
+            return float(prices[-1])
+        return float(np.interp(now, days, prices))
+
+    def _call(self, weight=1):
+        """
+        Latenz, Rate-Limit und Fehler-Injektion für jeden Aufruf.
+        Liefert eine Fehler-Antwort oder None.
+        """
+        if self.latency_ms > 0:
+            time.sleep(self._random.expovariate(1000.0 / self.latency_ms))
+        now_ms = int(time.time() * 1000)
+        with self._lock:
+            self._stats["calls"] += 1
+            if now_ms >= self.rateLimitReset:
+                self.rateLimitRemaining = MOCK_RATE_LIMIT
+                self.rateLimitReset = now_ms + 60000
+            self.rateLimitRemaining -= weight
+            if self.rateLimitRemaining < 0:
+                self._stats["rate_limited"] += 1
+                return {"errorCode": 105, "error": "Rate limit exceeded (mock)."}
+            if MOCK_ERROR_RATE and self._random.random() < MOCK_ERROR_RATE:
+                self._stats["injected_errors"] += 1
+                kind = self._random.choice(["timeout", "overloaded"])
+            else:
+                kind = None
+        if kind == "timeout":
+            raise requests.exceptions.ConnectionError("Mock: Verbindung abgebrochen")
+        if kind == "overloaded":
+            return {"errorCode": 107, "error": "Bitvavo is overloaded (mock)."}
+        return None
+
+    @staticmethod
+    def _market_asset(market):
+        return market.split("-")[0].upper()
+
+    def _asks(self, mid):
+        best = mid * (1 + MOCK_SPREAD_PCT / 100)
+        return [
+            (best * (1 + i * MOCK_LEVEL_STEP_PCT / 100), MOCK_LEVEL_DEPTH_EUR / mid)
+            for i in range(MOCK_BOOK_LEVELS)
+        ]
+
+    # --- API wie python_bitvavo_api --------------------------------------
+
+    def tickerPrice(self, options):
+        error = self._call()
+        if error:
+            return error
+        market = options.get("market")
+        if market:
+            price = self._mid_price(self._market_asset(market))
+            if price is None:
+                return {"errorCode": 205, "error": f"market parameter is invalid: {market}"}
+            return {"market": market, "price": f"{price:.8g}"}
+        return [
+            {"market": f"{asset}-EUR", "price": f"{price:.8g}"}
+            for (asset, price) in ((a, self._mid_price(a)) for a in sorted(set(self._prices) | set(ALLOWED_ASSETS)))
+            if price is not None
+        ]
+
+    def book(self, market, options=None):
+        error = self._call()
+        if error:
+            return error
+        price = self._mid_price(self._market_asset(market))
+        if price is None:
+            return {"errorCode": 205, "error": f"market parameter is invalid: {market}"}
+        bid = price * (1 - MOCK_SPREAD_PCT / 100)
+        return {
+            "market": market,
+            "asks": [[f"{p:.8g}", f"{a:.8g}"] for (p, a) in self._asks(price)],
+            "bids": [
+                [f"{bid * (1 - i * MOCK_LEVEL_STEP_PCT / 100):.8g}", f"{MOCK_LEVEL_DEPTH_EUR / price:.8g}"]
+                for i in range(MOCK_BOOK_LEVELS)
+            ],
+        }
 
-    # Bitvavo-Client nur laden, wenn wir nicht simulieren
-    if not SIMULATION_MODE:
+    def placeOrder(self, market, side, orderType, body):
+        error = self._call()
+        if error:
+            return error
+        if side != "buy" or orderType != "market" or "amountQuote" not in body:
+            return {"errorCode": 203, "error": "Mock unterstützt nur Market-Buy mit amountQuote."}
+        asset = self._market_asset(market)
+        price = self._mid_price(asset)
+        if price is None:
+            return {"errorCode": 205, "error": f"market parameter is invalid: {market}"}
+
+        amount_quote = float(body["amountQuote"])
+        client_order_id = body.get("clientOrderId") or str(uuid.uuid4())
+        with self._lock:
+            if client_order_id in self._client_ids:
+                return {"errorCode": 217, "error": f"Duplicate clientOrderId {client_order_id}."}
+            if self._balances.get("EUR", 0.0) < amount_quote:
+                return {"errorCode": 216, "error": "You do not have sufficient balance to complete this operation."}
+
+            # Market-Buy: Levels aufsteigend abarbeiten, Gebühr ist im amountQuote enthalten
+            fee_paid = amount_quote * MOCK_FEE_PCT / 100
+            remaining = amount_quote - fee_paid
+            now_ms = int(time.time() * 1000)
+            fills = []
+            for (level_price, level_amount) in self._asks(price):
+                if remaining <= 1e-9:
+                    break
+                amount = min(level_amount, remaining / level_price)
+                remaining -= amount * level_price
+                fills.append({
+                    "id": str(uuid.uuid4()),
+                    "timestamp": now_ms,
+                    "amount": f"{amount:.10f}",
+                    "price": f"{level_price:.8g}",
+                    "taker": True,
+                    "fee": f"{fee_paid * amount * level_price / (amount_quote - fee_paid):.8f}",
+                    "feeCurrency": "EUR",
+                    "settled": True,
+                })
+
+            filled_amount = sum(float(f["amount"]) for f in fills)
+            filled_quote = amount_quote - fee_paid - remaining
+            self._balances["EUR"] -= filled_quote + fee_paid
+            self._balances[asset] = self._balances.get(asset, 0.0) + filled_amount
+            order = {
+                "orderId": str(uuid.uuid4()),
+                "clientOrderId": client_order_id,
+                "market": market,
+                "created": now_ms,
+                "updated": now_ms,
+                "status": "filled" if remaining <= 1e-9 else "cancelled",
+                "side": side,
+                "orderType": orderType,
+                "amountQuote": body["amountQuote"],
+                "filledAmount": f"{filled_amount:.10f}",
+                "filledAmountQuote": f"{filled_quote:.8f}",
+                "feePaid": f"{fee_paid:.8f}",
+                "feeCurrency": "EUR",
+                "fills": fills,
+            }
+            self._orders.setdefault(market, []).append(order)
+            self._client_ids[client_order_id] = order
+            self._stats["orders"] += 1
+            self._stats["fills"] += len(fills)
+
+        # Antwort geht verloren, obwohl die Order ausgeführt wurde
+        if MOCK_ERROR_RATE and self._random.random() < MOCK_ERROR_RATE / 2:
+            with self._lock:
+                self._stats["injected_errors"] += 1
+            raise requests.exceptions.ReadTimeout("Mock: Antwort auf placeOrder verloren")
+        return order
+
+    def getOrders(self, market, options=None):
+        error = self._call(weight=5)
+        if error:
+            return error
+        options = options or {}
+        limit = int(options.get("limit", 500))
+        start = int(options.get("start", 0))
+        with self._lock:
+            orders = [o for o in self._orders.get(market, []) if o["created"] >= start]
+        return list(reversed(orders[-limit:]))
+
+    def balance(self, options=None):
+        error = self._call(weight=5)
+        if error:
+            return error
+        with self._lock:
+            return [
+                {"symbol": symbol, "available": f"{amount:.10f}", "inOrder": "0"}
+                for (symbol, amount) in self._balances.items()
+            ]
+
+    def candles(self, symbol, interval, options=None, limit=None, start=None, end=None):
+        """
+        Tageskerzen aus den abgespielten Kursen (open = high = low = close).
+        """
+        error = self._call()
+        if error:
+            return error
+        if interval != "1d":
+            return {"errorCode": 205, "error": "Mock liefert nur interval=1d."}
+        series = self._prices.get(self._market_asset(symbol))
+        if series is None:
+            return []
+        days, prices = series
+        ts = (days * 86400000).astype(np.int64)
+        mask = np.ones(len(ts), dtype=bool)
+        if start is not None:
+            mask &= ts >= int(start.timestamp() * 1000)
+        if end is not None:
+            mask &= ts <= int(end.timestamp() * 1000)
+        rows = [
+            [int(t), f"{p:.8g}", f"{p:.8g}", f"{p:.8g}", f"{p:.8g}", "0"]
+            for (t, p) in zip(ts[mask][::-1], prices[mask][::-1])
+        ]
+        return rows[:limit] if limit else rows
+
+    def close(self):
+        pass
+
+
+_mock_exchanges = {}      # account_id (None = öffentlich) -> MockExchange
+_mock_prices = None
+_mock_exchange_lock = threading.Lock()
+
+
+def get_mock_exchange(account_id=None):
+    """
+    Mock-Börse je Konto (eigenes Guthaben, eigene Orders, eigenes Rate-Limit);
+    account_id=None ist der Client für öffentliche Endpunkte. Die Kurse werden
+    nur einmal geladen und von allen Instanzen geteilt.
+    """
+    global _mock_prices
+    with _mock_exchange_lock:
+        exchange = _mock_exchanges.get(account_id)
+        if exchange is None:
+            if _mock_prices is None:
+                _mock_prices = load_mock_prices()
+                logging.info(f"SIMULATION_MODE: Mock-Börse mit Kursen für {len(_mock_prices)} Assets.")
+            exchange = MockExchange(_mock_prices)
+            _mock_exchanges[account_id] = exchange
+        return exchange
+
+
+def reload_mock_prices():
+    """
+    Nach neuen Zeilen in historical_rates: Kurse einmal neu laden und an alle
+    bestehenden Mock-Börsen verteilen (ohne Mock-Börse: nichts zu tun).
+    """
+    global _mock_prices
+    with _mock_exchange_lock:
+        if not _mock_exchanges:
+            _mock_prices = None
+            return
+        _mock_prices = load_mock_prices()
+        for exchange in _mock_exchanges.values():
+            exchange.reload_prices(_mock_prices)
+
+
+def mock_exchange_stats():
+    """
+    Summierte Kennzahlen aller Mock-Börsen (ohne Guthaben).
+    """
+    with _mock_exchange_lock:
+        exchanges = list(_mock_exchanges.values())
+    totals = {"exchanges": len(exchanges), "calls": 0, "orders": 0, "fills": 0,
+              "injected_errors": 0, "rate_limited": 0}
+    for exchange in exchanges:
+        for (key, value) in exchange.stats().items():
+            if key in totals:
+                totals[key] += value
+    return totals
+
+
+########################################
+# 8) RETRY-Logik für Bitvavo-Aufrufe
+########################################
+class RateLimiter:
+    """
+    Threadsicherer Taktgeber: gibt höchstens einen Aufruf pro `min_interval`
+    Sekunden frei, egal wie viele Worker-Threads gleichzeitig fragen.
+    """
+
+    def __init__(self, min_interval):
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.min_interval
+        delay = slot - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+
+# Eigener Order-Takt je Konto -> viele Orders eines Kontos bremsen die anderen nicht
+_account_rate_limiters = {}
+_account_rate_limiters_lock = threading.Lock()
+
+
+def get_account_rate_limiter(account_id):
+    with _account_rate_limiters_lock:
+        limiter = _account_rate_limiters.get(account_id)
+        if limiter is None:
+            limiter = _account_rate_limiters[account_id] = RateLimiter(ORDER_MIN_INTERVAL)
+        return limiter
+
+
+# Fehlerklassen für Bitvavo-Aufrufe
+ERROR_TRANSIENT = "transient"      # Netzwerk, Überlast, Timeout -> wiederholen
+ERROR_RATE_LIMIT = "rate_limit"    # Rate-Limit/Ban -> bis zum Reset warten, dann wiederholen
+ERROR_FATAL = "fatal"              # z.B. zu wenig Guthaben, ungültige Parameter -> nicht wiederholen
+
+# Bitvavo-Fehlercodes (https://docs.bitvavo.com/#section/Error-messages)
+BITVAVO_TRANSIENT_CODES = {101, 107, 108, 109}
+BITVAVO_RATE_LIMIT_CODES = {104, 105}
+
+RETRY_BASE_DELAY = float(os.environ.get("RETRY_BASE_DELAY", "1.0"))
+RETRY_MAX_DELAY = float(os.environ.get("RETRY_MAX_DELAY", "30"))
+RATE_LIMIT_MIN_REMAINING = 10     # darunter vor dem nächsten Aufruf auf den Reset warten
+RATE_LIMIT_MAX_WAIT = 60          # max. Wartezeit (Sekunden) auf einen Rate-Limit-Reset
+
+
+def classify_bitvavo_error(error=None, response=None):
+    """
+    Ordnet eine Exception bzw. eine Fehler-Antwort ({"errorCode": ...}) einer
+    Fehlerklasse zu. Antworten ohne errorCode sind kein Fehler (None).
+    """
+    if error is not None:
+        # Verbindungsprobleme, Timeouts, kaputtes JSON -> vorübergehend
+        return ERROR_TRANSIENT
+    if isinstance(response, dict) and "errorCode" in response:
+        code = response.get("errorCode")
+        if code in BITVAVO_RATE_LIMIT_CODES:
+            return ERROR_RATE_LIMIT
+        if code in BITVAVO_TRANSIENT_CODES:
+            return ERROR_TRANSIENT
+        return ERROR_FATAL
+    return None
+
+
+def _backoff_delay(attempt):
+    # Exponentiell mit "Full Jitter": zufällig zwischen 0 und base * 2^attempt
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+
+
+def _wait_for_rate_limit(client, force=False):
+    """
+    Wartet bis zum Rate-Limit-Reset der Börse, wenn das Restgewicht knapp ist
+    (bzw. immer bei force=True). Nutzt die vom Client aus den Headern
+    bitvavo-ratelimit-remaining/-resetat übernommenen Werte.
+    """
+    if client is None:
+        return False
+    remaining = getattr(client, "rateLimitRemaining", None)
+    reset_ms = getattr(client, "rateLimitReset", 0) or 0
+    if not force and (remaining is None or remaining >= RATE_LIMIT_MIN_REMAINING):
+        return False
+    wait = reset_ms / 1000 - time.time()
+    if wait <= 0:
+        return False
+    wait = min(wait + 0.1, RATE_LIMIT_MAX_WAIT)
+    logging.warning(f"Bitvavo-Rate-Limit (Rest {remaining}): warte {wait:.1f}s bis zum Reset.")
+    time.sleep(wait)
+    return True
+
+
+def bitvavo_request_with_retry(func, *args, max_retries=3, **kwargs):
+    """
+    Ruft func(*args, **kwargs) auf und wiederholt nur sinnvolle Fälle:
+      - vorübergehende Fehler -> exponentieller Backoff mit Jitter
+      - Rate-Limit            -> Warten bis zum Reset-Zeitpunkt der Börse
+      - fachliche Fehler (z.B. zu wenig Guthaben) -> Antwort sofort zurückgeben
+    Nach max_retries Versuchen: Exception (bei Exceptions) bzw. letzte Fehler-Antwort.
+    Für placeOrder bitte place_order_idempotent() verwenden.
+    """
+    client = getattr(func, "__self__", None)
+    method = getattr(func, "__name__", "unknown")
+    with metric_bitvavo_seconds.time(method):
+        return _request_with_retry(client, method, func, args, kwargs, max_retries)
+
+
+def _request_with_retry(client, method, func, args, kwargs, max_retries):
+    response = None
+    for attempt in range(max_retries):
+        _wait_for_rate_limit(client)
+        error = None
         try:
-            bv = get_bitvavo_client()
+            response = func(*args, **kwargs)
         except Exception as e:
-            logging.error(f"execute_investment: Kein Bitvavo-Client verfügbar: {str(e)}")
-            # E-Mail bei Fehler?
-            if email_config and email_config["send_on_error"]:
-                subject = f"Fehler bei Schedule {schedule_id}"
-                body = f"Konnte keinen Bitvavo-Client erstellen: {str(e)}"
-                send_email(subject, body)
-            return
+            error = e
 
-    for (asset, amount_eur) in lines:
+        error_class = classify_bitvavo_error(error, response)
+        if error_class is None or error_class == ERROR_FATAL:
+            return response
+
+        metric_bitvavo_retries.inc(method, error_class)
+        detail = str(error) if error is not None else str(response)
+        logging.warning(
+            f"Bitvavo-Aufruf fehlgeschlagen (Versuch {attempt+1}/{max_retries}, {error_class}): {detail}"
+        )
+        if attempt + 1 >= max_retries:
+            break
+        if error_class == ERROR_RATE_LIMIT and _wait_for_rate_limit(client, force=True):
+            continue
+        time.sleep(_backoff_delay(attempt))
+
+    if error is not None:
+        raise Exception(f"Bitvavo-Aufruf fehlgeschlagen nach {max_retries} Versuchen: {str(error)}")
+    return response
+
+
+def find_order_by_client_id(bv, market, client_order_id, start_ms=None):
+    """
+    Sucht eine Order anhand ihrer clientOrderId unter den letzten Orders des
+    Marktes bzw. (mit start_ms) unter den Orders ab diesem Zeitpunkt.
+    None = sicher nicht vorhanden; kann die Börse nicht antworten -> Exception.
+    """
+    options = {"limit": 50} if start_ms is None else {"start": start_ms, "limit": 1000}
+    orders = bitvavo_request_with_retry(bv.getOrders, market, options)
+    if not isinstance(orders, list):
+        raise Exception(f"getOrders {market} fehlgeschlagen: {orders}")
+    for order in orders:
+        if order.get("clientOrderId") == client_order_id:
+            return order
+    return None
+
+
+def place_order_idempotent(bv, market, order_body, client_order_id=None, max_retries=3, start_ms=None):
+    """
+    Platziert eine Market-Buy-Order mit clientOrderId. Schlägt ein Versuch so
+    fehl, dass unklar ist, ob die Order angekommen ist (Timeout, Verbindungsabbruch,
+    doppelte clientOrderId), wird vor einer Wiederholung bei der Börse nachgesehen
+    (mit start_ms ab diesem Zeitpunkt, siehe find_order_by_client_id).
+    So wird eine bereits ausgeführte Order nie ein zweites Mal gekauft. Ist die
+    Börse für diesen Abgleich nicht erreichbar, wird NICHT erneut gesendet,
+    sondern eine Exception geworfen - der Ausgang bleibt offen für den Journal-Abgleich.
+    """
+    client_order_id = client_order_id or str(uuid.uuid4())
+    response = None
+    for attempt in range(max_retries):
+        _wait_for_rate_limit(bv)
+        error = None
         try:
-            market_symbol = f"{asset.upper()}-EUR"
+            body = dict(order_body, clientOrderId=client_order_id)
+            with metric_bitvavo_seconds.time("placeOrder"):
+                response = bv.placeOrder(market, "buy", "market", body)
+        except Exception as e:
+            error = e
+
+        error_class = classify_bitvavo_error(error, response)
+        if error_class is None:
+            return response
+
+        # Unklar, ob die Order angekommen ist: vorübergehende Fehler (Timeout,
+        # Verbindungsabbruch, Überlast) und die Meldung "doppelte clientOrderId"
+        duplicate = error is None and "clientOrderId" in str(response.get("error", ""))
+        if error_class == ERROR_FATAL and not duplicate:
+            return response
+        if error_class == ERROR_TRANSIENT or duplicate:
+            try:
+                existing = find_order_by_client_id(bv, market, client_order_id, start_ms)
+            except Exception as e2:
+                # Ob die Order angekommen ist, bleibt unklar -> nicht blind erneut
+                # senden, Ausgang offen lassen (Journal-Abgleich klärt ihn später).
+                logging.warning(f"Order-Abgleich für {client_order_id} fehlgeschlagen: {str(e2)}")
+                raise Exception(
+                    f"placeOrder {market}: Ausgang von {client_order_id} unklar, "
+                    f"Order-Abgleich fehlgeschlagen: {str(e2)}"
+                )
+            if existing is not None:
+                logging.info(f"Order {client_order_id} war bereits angekommen, keine Wiederholung.")
+                return existing
+            if duplicate:
+                # Die Börse kennt die ID bereits -> erneutes Senden kann nur wieder
+                # scheitern. Ausgang offen lassen (Journal-Abgleich klärt ihn später).
+                raise Exception(f"placeOrder {market}: clientOrderId {client_order_id} bereits vergeben, Order nicht gefunden")
+
+        metric_bitvavo_retries.inc("placeOrder", error_class)
+        detail = str(error) if error is not None else str(response)
+        logging.warning(
+            f"placeOrder {market} fehlgeschlagen (Versuch {attempt+1}/{max_retries}, {error_class}): {detail}"
+        )
+        if attempt + 1 >= max_retries:
+            break
+        if error_class == ERROR_RATE_LIMIT and _wait_for_rate_limit(bv, force=True):
+            continue
+        time.sleep(_backoff_delay(attempt))
 
-            # Aktuellen Kurs abrufen
-            if SIMULATION_MODE:
-                current_price = 25000.0
-            else:
-                ticker = bitvavo_request_with_retry(bv.tickerPrice, {"market": market_symbol})
-                current_price = float(ticker.get("price", 0.0))
+    if error is not None:
+        raise Exception(f"placeOrder {market} fehlgeschlagen nach {max_retries} Versuchen: {str(error)}")
+    return response
 
-            estimated_coins = float(amount_eur) / current_price if current_price else 0.0
-            logging.info(
-                f"Starte Kauf: {amount_eur} EUR => {asset} (Schedule {schedule_id}), "
-                f"Kurs ~ {current_price:.2f} EUR, erwartet ~ {estimated_coins:.6f} {asset}"
+
+########################################
+# 9) Scheduler-Logik
+#    -> Heap mit (nächster Lauf, Job). Der Scheduler-Thread schläft genau bis
+#       zum nächsten fälligen Job (kein Polling). Einzelne Schedules werden
+#       inkrementell hinzugefügt/geändert/entfernt; die nächsten Laufzeiten
+#       stehen in scheduler_state, damit verpasste Läufe nach einem Neustart
+#       nachgeholt werden können.
+########################################
+WEEKDAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+PRICE_JOB_KEY = "update_prices"
+RECONCILE_JOB_KEY = "reconcile_orders"
+BALANCE_JOB_KEY = "balance_snapshots"
+PRICE_RETENTION_JOB_KEY = "price_retention"
+
+# Dispatcher-Spur für Jobs, die zu keinem Konto gehören (z.B. Kursupdate)
+SYSTEM_LANE = "system"
+PRICE_JOB_TIME = "00:00"
+
+# Verpasste Läufe, die länger als X Stunden zurückliegen, werden nicht nachgeholt
+SCHEDULER_CATCHUP_HOURS = float(os.environ.get("SCHEDULER_CATCHUP_HOURS", "24"))
+
+# Spätestens so oft aufwachen (Sekunden), um Uhr-Sprünge (Sommerzeit, NTP) abzufangen
+SCHEDULER_MAX_SLEEP = 3600
+
+
+def _parse_time_of_day(tod):
+    return datetime.datetime.strptime(tod, "%H:%M").time()
+
+
+def next_daily_run(time_of_day, after):
+    """
+    Nächster Zeitpunkt > after zur Uhrzeit time_of_day ("HH:MM").
+    """
+    run_at = datetime.datetime.combine(after.date(), _parse_time_of_day(time_of_day))
+    if run_at <= after:
+        run_at += timedelta(days=1)
+    return run_at
+
+
+def next_weekly_run(weekday, time_of_day, after):
+    """
+    Nächster Zeitpunkt > after am Wochentag weekday ("Monday", ...) um time_of_day.
+    """
+    run_at = datetime.datetime.combine(after.date(), _parse_time_of_day(time_of_day))
+    run_at += timedelta(days=(WEEKDAYS.index(weekday) - after.weekday()) % 7)
+    if run_at <= after:
+        run_at += timedelta(days=7)
+    return run_at
+
+
+class JobScheduler:
+    """
+    Timer-basierter Scheduler: Jobs liegen in einem Heap nach nächster Laufzeit.
+    Geänderte/entfernte Jobs hinterlassen veraltete Heap-Einträge, die beim
+    Herausnehmen anhand der Sequenznummer übersprungen werden.
+    Fällige Jobs laufen nicht im Scheduler-Thread, sondern werden an die Spur
+    (lane) ihres Kontos im AccountDispatcher übergeben.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._heap = []       # (run_at, seq, job_key)
+        self._jobs = {}       # job_key -> {"func", "next_run", "run_at", "seq"}
+        self._seq = itertools.count()
+
+    def _now(self):
+        return datetime.datetime.now()
+
+    def add_job(self, key, func, next_run, run_at=None, lane=SYSTEM_LANE):
+        """
+        Legt Job `key` an bzw. ersetzt ihn.
+          func(run_at)    -> wird bei Fälligkeit ausgeführt (run_at = geplante Laufzeit)
+          next_run(after) -> nächste Laufzeit nach `after`
+          run_at          -> erste Laufzeit (z.B. persistiert), sonst next_run(jetzt)
+          lane            -> Spur im Dispatcher (Konto-ID bzw. SYSTEM_LANE)
+        """
+        if run_at is None:
+            run_at = next_run(self._now())
+        with self._cond:
+            seq = next(self._seq)
+            self._jobs[key] = {
+                "func": func, "next_run": next_run, "run_at": run_at, "seq": seq, "lane": lane
+            }
+            heapq.heappush(self._heap, (run_at, seq, key))
+            _save_scheduler_state(key, run_at)
+            self._cond.notify()
+
+    def remove_job(self, key):
+        with self._cond:
+            self._jobs.pop(key, None)
+            _delete_scheduler_state(key)
+            self._cond.notify()
+
+    def next_run_times(self):
+        with self._cond:
+            return {key: job["run_at"] for (key, job) in self._jobs.items()}
+
+    def _pop_due(self):
+        """
+        Blockiert bis der nächste Job fällig ist und gibt (key, job, run_at) zurück.
+        Die Folgelaufzeit wird dabei bereits eingeplant. Der Zustand in
+        scheduler_state wird immer unter dem Lock geschrieben, damit sich
+        Scheduler-Thread und Flask-Routen nicht gegenseitig überschreiben.
+        """
+        with self._cond:
+            while True:
+                # veraltete Einträge (geändert/gelöscht) verwerfen
+                while self._heap:
+                    (run_at, seq, key) = self._heap[0]
+                    job = self._jobs.get(key)
+                    if job is not None and job["seq"] == seq:
+                        break
+                    heapq.heappop(self._heap)
+
+                if not self._heap:
+                    self._cond.wait(SCHEDULER_MAX_SLEEP)
+                    continue
+
+                now = self._now()
+                delay = (run_at - now).total_seconds()
+                if delay > 0:
+                    self._cond.wait(min(delay, SCHEDULER_MAX_SLEEP))
+                    continue
+
+                heapq.heappop(self._heap)
+                next_at = job["next_run"](max(now, run_at))
+                seq = next(self._seq)
+                job["run_at"] = next_at
+                job["seq"] = seq
+                heapq.heappush(self._heap, (next_at, seq, key))
+                # Folgelaufzeit VOR der Ausführung speichern -> ein Absturz während
+                # des Jobs führt nach dem Neustart nicht zu einem zweiten Lauf
+                _save_scheduler_state(key, next_at, last_run_at=now)
+                return key, job, run_at
+
+    def run(self):
+        while True:
+            key, job, run_at = self._pop_due()
+            metric_scheduler_lag.observe((datetime.datetime.now() - run_at).total_seconds(), key)
+            logging.info(f"Scheduler: starte Job {key} in Spur {job['lane']} (geplant {run_at:%Y-%m-%d %H:%M})")
+            dispatcher.submit(job["lane"], key, job["func"], run_at)
+
+
+def _save_scheduler_state(key, next_run_at, last_run_at=None):
+    with get_connection() as conn:
+        conn.execute("""
+            INSERT INTO scheduler_state (job_key, next_run_at, last_run_at)
+            VALUES (?, ?, ?)
+            ON CONFLICT (job_key) DO UPDATE SET
+                next_run_at = excluded.next_run_at,
+                last_run_at = COALESCE(excluded.last_run_at, scheduler_state.last_run_at)
+        """, (key, next_run_at, last_run_at))
+
+
+def _delete_scheduler_state(key):
+    with get_connection() as conn:
+        conn.execute("DELETE FROM scheduler_state WHERE job_key = ?", (key,))
+
+
+def _load_scheduler_state():
+    with get_connection() as conn:
+        rows = conn.execute("SELECT job_key, next_run_at FROM scheduler_state").fetchall()
+    return {key: datetime.datetime.fromisoformat(str(ts)) for (key, ts) in rows if ts}
+
+
+def _catch_up_run_at(key, persisted, next_run):
+    """
+    Erste Laufzeit beim Start: ein verpasster Lauf (persistierte Zeit liegt in der
+    Vergangenheit, aber innerhalb von SCHEDULER_CATCHUP_HOURS) wird sofort nachgeholt.
+    """
+    now = datetime.datetime.now()
+    if persisted is None:
+        return next_run(now)
+    if persisted > now:
+        return persisted
+    if now - persisted <= timedelta(hours=SCHEDULER_CATCHUP_HOURS):
+        logging.info(f"Scheduler: verpasster Lauf {key} ({persisted:%Y-%m-%d %H:%M}) wird nachgeholt.")
+        return persisted
+    logging.warning(f"Scheduler: verpasster Lauf {key} ({persisted:%Y-%m-%d %H:%M}) ist zu alt, übersprungen.")
+    return next_run(now)
+
+
+# Im Scheduler eingeplante Schedules: id -> (account_id, weekday, time_of_day)
+_scheduled_defs = {}
+_scheduled_version = None
+_scheduled_lock = threading.Lock()
+
+
+def _schedule_job_key(schedule_id):
+    return f"schedule_{schedule_id}"
+
+
+def _add_schedule_job(sched_id, account_id, wd, tod, persisted=None, catch_up=False):
+    key = _schedule_job_key(sched_id)
+    if wd not in WEEKDAYS:
+        logging.warning(f"Ungültiger Wochentag in DB: {wd}")
+        scheduler.remove_job(key)
+        return
+    try:
+        _parse_time_of_day(tod)
+    except (TypeError, ValueError):
+        logging.warning(f"Ungültige Uhrzeit in DB (Schedule {sched_id}): {tod}")
+        scheduler.remove_job(key)
+        return
+
+    def next_run(after, wd=wd, tod=tod):
+        return next_weekly_run(wd, tod, after)
+
+    def job_func(run_at, schedule_id=sched_id):
+        execute_investment(schedule_id, run_at)
+
+    run_at = _catch_up_run_at(key, persisted, next_run) if catch_up else None
+    scheduler.add_job(key, job_func, next_run, run_at=run_at, lane=account_id)
+
+
+def load_schedules_into_scheduler():
+    """
+    Beim Start: täglichen Preis-Job und alle Schedules einplanen,
+    verpasste Läufe (laut scheduler_state) nachholen.
+    """
+    global _scheduled_version
+    persisted = _load_scheduler_state()
+
+    # Täglicher Job um 00:00 Uhr -> update_prices_for_assets
+    def next_price_run(after):
+        return next_daily_run(PRICE_JOB_TIME, after)
+
+    scheduler.add_job(
+        PRICE_JOB_KEY, lambda run_at: update_prices_for_assets(), next_price_run,
+        run_at=_catch_up_run_at(PRICE_JOB_KEY, persisted.get(PRICE_JOB_KEY), next_price_run)
+    )
+
+    # Offene Journal-Einträge regelmäßig abgleichen (beim Start: siehe _become_scheduler_leader)
+    def next_reconcile_run(after):
+        return after + timedelta(minutes=ORDER_JOURNAL_RECONCILE_MINUTES)
+
+    scheduler.add_job(
+        RECONCILE_JOB_KEY,
+        lambda run_at: reconcile_order_journal(min_age_seconds=ORDER_JOURNAL_MIN_AGE),
+        next_reconcile_run
+    )
+
+    # Kontostände aller Konten regelmäßig festhalten (unabhängig von /balance)
+    if BALANCE_SNAPSHOT_MINUTES > 0:
+        def next_balance_run(after):
+            return after + timedelta(minutes=BALANCE_SNAPSHOT_MINUTES)
+
+        scheduler.add_job(BALANCE_JOB_KEY, lambda run_at: snapshot_all_balances(), next_balance_run)
+
+    # Alte Kerzen verdichten (kleine Transaktionen, Rest beim nächsten Lauf)
+    if PRICE_RETENTION_MINUTES > 0:
+        def next_retention_run(after):
+            return after + timedelta(minutes=PRICE_RETENTION_MINUTES)
+
+        scheduler.add_job(
+            PRICE_RETENTION_JOB_KEY,
+            lambda run_at: run_price_retention(max_batches=PRICE_RETENTION_MAX_BATCHES),
+            next_retention_run
+        )
+
+    with _scheduled_lock:
+        version = read_change_counter("schedules")
+        with get_connection() as conn:
+            c = conn.cursor()
+            c.execute("SELECT id, account_id, weekday, time_of_day FROM schedules ORDER BY id")
+            schedules_rows = c.fetchall()
+
+        for (sched_id, account_id, wd, tod) in schedules_rows:
+            _add_schedule_job(
+                sched_id, account_id, wd, tod, persisted.get(_schedule_job_key(sched_id)), catch_up=True
             )
+        _scheduled_defs.clear()
+        _scheduled_defs.update({r[0]: tuple(r[1:]) for r in schedules_rows})
+        _scheduled_version = version
 
-            # Order platzieren
-            if SIMULATION_MODE:
-                response = place_mock_order(asset, amount_eur)
-            else:
-                order_body = {"amountQuote": str(amount_eur)}
-                response = bitvavo_request_with_retry(
-                    bv.placeOrder, market_symbol, "buy", "market", order_body
-                )
+    # Verwaiste Zustände (Schedule inzwischen gelöscht) aufräumen
+    known = {_schedule_job_key(r[0]) for r in schedules_rows} | {
+        PRICE_JOB_KEY, RECONCILE_JOB_KEY, BALANCE_JOB_KEY, PRICE_RETENTION_JOB_KEY
+    }
+    for key in persisted:
+        if key not in known and key.startswith("schedule_"):
+            _delete_scheduler_state(key)
 
-            # Erfolg?
-            if "orderId" in response:
-                filled_asset = 0.0
-                total_cost = 0.0
-                if "fills" in response:
-                    for f in response["fills"]:
-                        amt = float(f["amount"])
-                        prc = float(f["price"])
-                        filled_asset += amt
-                        total_cost += amt * prc
-                avg_price = total_cost / filled_asset if filled_asset else 0.0
-
-                # In Datenbank speichern
-                with get_connection() as conn2:
-                    c2 = conn2.cursor()
-                    c2.execute("""
-                        INSERT INTO trades (
-                            timestamp, asset, amount_eur,
-                            filled_asset, avg_price, order_id
-                        ) VALUES (?, ?, ?, ?, ?, ?)
-                    """, (
-                        datetime.datetime.now(),
-                        asset.upper(),
-                        amount_eur,
-                        filled_asset,
-                        avg_price,
-                        response["orderId"]
-                    ))
-                    conn2.commit()
-
-                logging.info(
-                    f"Kauf erfolgreich (Schedule {schedule_id}): "
-                    f"{filled_asset:.6f} {asset} @ ~{avg_price:.4f} EUR. "
-                    f"OrderId={response['orderId']}"
-                )
 
-                # E-Mail bei Erfolg
-                if email_config and email_config["send_on_success"]:
-                    subject = f"Erfolgreicher Kauf: {asset}"
-                    body = (
-                        f"Schedule-ID: {schedule_id}\n"
-                        f"Asset: {asset}\n"
-                        f"EUR: {amount_eur}\n"
-                        f"Erhaltene Menge: {filled_asset:.6f}\n"
-                        f"Durchschnittspreis: {avg_price:.4f}\n"
-                        f"OrderId: {response['orderId']}\n"
-                        f"Zeitpunkt: {datetime.datetime.now()}\n"
-                    )
-                    send_email(subject, body)
+def sync_schedules():
+    """
+    Übernimmt angelegte, geänderte und gelöschte Schedules in den Scheduler,
+    ohne die unveränderten Jobs anzufassen. Nur im Scheduler-Leader; Änderungen
+    aus anderen Prozessen kommen über den Änderungszähler "schedules" an
+    (run_schedule_sync prüft ihn alle SCHEDULER_SYNC_SECONDS).
+    """
+    global _scheduled_version
+    if not is_scheduler_leader():
+        return
+    with _scheduled_lock:
+        version = read_change_counter("schedules")
+        if version == _scheduled_version:
+            return
+        with get_connection() as conn:
+            rows = conn.execute("SELECT id, account_id, weekday, time_of_day FROM schedules").fetchall()
 
-            else:
-                logging.error(f"Order fehlgeschlagen: {response}")
-                if email_config and email_config["send_on_error"]:
-                    subject = f"Fehler beim Kauf: {asset}"
-                    body = f"Die Order ist fehlgeschlagen: {str(response)}"
-                    send_email(subject, body)
+        current = {r[0]: tuple(r[1:]) for r in rows}
+        for (sched_id, definition) in current.items():
+            if _scheduled_defs.get(sched_id) != definition:
+                _add_schedule_job(sched_id, *definition)
+        for sched_id in set(_scheduled_defs) - set(current):
+            scheduler.remove_job(_schedule_job_key(sched_id))
+        _scheduled_defs.clear()
+        _scheduled_defs.update(current)
+        _scheduled_version = version
+
+
+scheduler = JobScheduler()
+
+
+class _VirtualClockScheduler(JobScheduler):
+    """
+    JobScheduler mit simulierter Uhr für benchmark_scheduler: wait() schläft
+    nicht, sondern stellt die Uhr um die Wartezeit vor und zählt das Aufwachen.
+    """
+
+    def __init__(self, start):
+        super().__init__()
+        self.clock = start
+        self.wakeups = []
+        self._cond = self
+
+    def _now(self):
+        return self.clock
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def wait(self, timeout):
+        self.clock += timedelta(seconds=timeout)
+        self.wakeups.append(self.clock)
+
+    def notify(self):
+        pass
+
+
+def benchmark_scheduler(schedules=5000, days=1):
+    """
+    Spielt `days` Tage mit `schedules` wöchentlichen Zeitplänen (zufällige
+    Wochentage/Uhrzeiten) auf simulierter Uhr ab. Gemessen werden Aufwachvorgänge,
+    fällige Jobs und CPU-Zeit je Tag - inkl. Schreiben von scheduler_state, ohne
+    die Jobs selbst auszuführen. Zum Vergleich: die frühere Abfrageschleife
+    wachte 86400-mal am Tag auf und prüfte dabei jeden Job.
+    """
+    rnd = random.Random(1)
+    start = datetime.datetime.combine(datetime.date.today(), datetime.time())
+    end = start + timedelta(days=days)
+    sched = _VirtualClockScheduler(start)
+
+    cpu = time.process_time()
+    for i in range(schedules):
+        wd = WEEKDAYS[rnd.randrange(7)]
+        tod = f"{rnd.randrange(24):02d}:{rnd.randrange(60):02d}"
+        sched.add_job(
+            f"bench_{i}", None, lambda after, wd=wd, tod=tod: next_weekly_run(wd, tod, after)
+        )
+    setup_cpu = time.process_time() - cpu
+
+    cpu = time.process_time()
+    fired = 0
+    while True:
+        (key, job, run_at) = sched._pop_due()
+        if run_at >= end:
+            break
+        fired += 1
+    run_cpu = time.process_time() - cpu
+
+    with get_connection() as conn:
+        conn.execute("DELETE FROM scheduler_state WHERE job_key LIKE 'bench_%'")
+    return {
+        "schedules": schedules,
+        "wakeups_per_day": sum(1 for t in sched.wakeups if t <= end) / days,
+        "jobs_per_day": fired / days,
+        "cpu_ms_per_day": run_cpu * 1000 / days,
+        "setup_cpu_ms": setup_cpu * 1000,
+    }
+
+
+def execute_investment(schedule_id, run_at=None):
+    """
+    Führt für schedule_id alle definierten Käufe durch (mit Client und
+    Order-Takt des Kontos, dem der Schedule gehört). run_at ist die geplante
+    Laufzeit (Standard: jetzt); daraus ergeben sich die clientOrderIds.
+    Vor dem Senden steht jede Order im order_journal; ein Lauf, der für
+    dieselbe Laufzeit wiederholt wird, kauft bereits verbuchte Zeilen nicht erneut.
+    Die Orders eines Schedules laufen parallel über einen begrenzten Worker-Pool
+    (ORDER_WORKERS, 1 = nacheinander); die Ergebnisse werden anschließend in
+    EINER Transaktion gespeichert. Fehler einer Zeile betreffen die anderen nicht.
+    """
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.execute("""
+            SELECT s.account_id, l.asset, l.amount_eur
+            FROM schedules s
+            JOIN schedule_lines l ON l.schedule_id = s.id
+            WHERE s.id = ?
+        """, (schedule_id,))
+        rows = c.fetchall()
+
+    if not rows:
+        logging.info(f"Schedule {schedule_id} hat keine lines definiert.")
+        return
+    account_id = rows[0][0]
+    lines = [(r[1], r[2]) for r in rows]
+
+    email_config = load_email_settings()
+
+    # Bitvavo-Client des Kontos (im SIMULATION_MODE die Mock-Börse)
+    try:
+        bv = get_bitvavo_client(account_id)
+    except Exception as e:
+        logging.error(f"execute_investment: Kein Bitvavo-Client verfügbar: {str(e)}")
+        # E-Mail bei Fehler?
+        if email_config and email_config.send_on_error:
+            subject = f"Fehler bei Schedule {schedule_id} (Konto {account_id})"
+            body = f"Konnte keinen Bitvavo-Client erstellen: {str(e)}"
+            queue_notification(subject, body)
+        return
+
+    # Absicht vor dem Senden festhalten (Write-Ahead)
+    intents = journal_order_intents(account_id, schedule_id, run_at or datetime.datetime.now(), lines)
+    open_intents = [i for i in intents if i["status"] == JOURNAL_PENDING]
+    for intent in intents:
+        if intent["status"] != JOURNAL_PENDING:
+            logging.info(
+                f"Schedule {schedule_id}: {intent['asset']} für diese Laufzeit bereits "
+                f"abgeschlossen ({intent['status']}), keine neue Order."
+            )
+    if not open_intents:
+        return
+
+    rate_limiter = get_account_rate_limiter(account_id)
+    workers = max(1, min(ORDER_WORKERS, len(open_intents)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(
+            lambda i: execute_order_line(
+                bv, schedule_id, i["asset"], i["amount_eur"], rate_limiter, i["client_order_id"],
+                i["start_ms"]
+            ),
+            open_intents
+        ))
+
+    # Käufe und Journal-Status in einer Transaktion speichern. Zeilen mit
+    # unklarem Ausgang (Exception) bleiben "pending" für reconcile_order_journal().
+    with get_connection() as conn:
+        c = conn.cursor()
+        for r in results:
+            if r["order_id"]:
+                record_trade(
+                    c, account_id, r["client_order_id"], r["timestamp"], r["asset"].upper(),
+                    r["amount_eur"], r["filled_asset"], r["avg_price"], r["order_id"]
+                )
+                finish_journal_entry(c, r["client_order_id"], JOURNAL_FILLED, order_id=r["order_id"])
+            elif r["response"] is not None:
+                finish_journal_entry(c, r["client_order_id"], JOURNAL_REJECTED, error=str(r["response"]))
+        conn.commit()
+
+    # Ein Digest je Schedule-Lauf statt einer Mail pro Zeile
+    digest = []
+    successes = 0
+    failures = 0
+    for r in results:
+        asset = r["asset"]
+        amount_eur = r["amount_eur"]
+
+        if r["order_id"]:
+            successes += 1
+            logging.info(
+                f"Kauf erfolgreich (Schedule {schedule_id}): "
+                f"{r['filled_asset']:.6f} {asset} @ ~{r['avg_price']:.4f} EUR. "
+                f"OrderId={r['order_id']}"
+            )
+            if email_config and email_config.send_on_success:
+                digest.append(
+                    f"Erfolgreicher Kauf: {asset}\n"
+                    f"  EUR: {amount_eur}\n"
+                    f"  Erhaltene Menge: {r['filled_asset']:.6f}\n"
+                    f"  Durchschnittspreis: {r['avg_price']:.4f}\n"
+                    f"  OrderId: {r['order_id']}\n"
+                    f"  Zeitpunkt: {r['timestamp']}\n"
+                )
+
+        elif r["response"] is not None:
+            failures += 1
+            logging.error(f"Order fehlgeschlagen: {r['response']}")
+            if email_config and email_config.send_on_error:
+                digest.append(
+                    f"Fehler beim Kauf: {asset}\n"
+                    f"  EUR: {amount_eur}\n"
+                    f"  Die Order ist fehlgeschlagen: {str(r['response'])}\n"
+                )
+
+        else:
+            failures += 1
+            logging.error(f"Fehler beim Kauf von {asset}: {r['error']}")
+            if email_config and email_config.send_on_error:
+                digest.append(
+                    f"Exception beim Kauf: {asset}\n"
+                    f"  EUR: {amount_eur}\n"
+                    f"  Fehlermeldung: {r['error']}\n"
+                )
+
+    if digest:
+        subject = (
+            f"Schedule {schedule_id} (Konto {account_id}): "
+            f"{successes} Käufe erfolgreich, {failures} fehlgeschlagen"
+        )
+        body = f"Schedule-ID: {schedule_id}\nKonto: {account_id}\n\n" + "\n".join(digest)
+        queue_notification(subject, body)
+
+
+def execute_order_line(bv, schedule_id, asset, amount_eur, rate_limiter, client_order_id, start_ms=None):
+    """
+    Kauft amount_eur EUR von asset (eine Zeile eines Schedules); rate_limiter
+    ist der Order-Takt des Kontos, client_order_id die ID aus dem order_journal,
+    start_ms der Beginn des Suchfensters für den Order-Abgleich (journal_start_ms).
+    Schreibt NICHT in die DB und verschickt keine Mails, sondern gibt ein
+    Ergebnis-Dict zurück. Exceptions werden abgefangen (Fehler bleiben isoliert):
+      order_id gesetzt -> Kauf erfolgreich
+      response gesetzt -> Börse hat die Order abgelehnt
+      error gesetzt    -> Exception beim Kauf
+    """
+    result = {
+        "asset": asset,
+        "amount_eur": amount_eur,
+        "client_order_id": client_order_id,
+        "order_id": None,
+        "filled_asset": 0.0,
+        "avg_price": 0.0,
+        "timestamp": None,
+        "response": None,
+        "error": None,
+    }
+    start = time.perf_counter()
+    try:
+        market_symbol = f"{asset.upper()}-EUR"
+
+        # Aktuellen Kurs (Live-Cache, sonst REST)
+        current_price = get_eur_price(bv, asset.upper())
+
+        estimated_coins = float(amount_eur) / current_price if current_price else 0.0
+        logging.info(
+            f"Starte Kauf: {amount_eur} EUR => {asset} (Schedule {schedule_id}), "
+            f"Kurs ~ {current_price:.2f} EUR, erwartet ~ {estimated_coins:.6f} {asset}"
+        )
+
+        # Order platzieren
+        rate_limiter.wait()
+        order_body = {"amountQuote": str(amount_eur)}
+        response = place_order_idempotent(bv, market_symbol, order_body, client_order_id, start_ms=start_ms)
+
+        # Erfolg?
+        if "orderId" in response:
+            (filled_asset, avg_price) = order_fill(response)
+            result["order_id"] = response["orderId"]
+            result["filled_asset"] = filled_asset
+            result["avg_price"] = avg_price
+            result["timestamp"] = datetime.datetime.now()
+        else:
+            result["response"] = response
+
+    except Exception as e:
+        result["error"] = str(e)
+
+    metric_order_seconds.observe(time.perf_counter() - start, asset.upper())
+    outcome = "filled" if result["order_id"] else ("error" if result["error"] else "rejected")
+    metric_orders.inc(asset.upper(), outcome)
+    return result
+
+
+def run_scheduler():
+    scheduler.run()
+
+
+########################################
+# 9a) Dispatcher: eine Warteschlange + ein Worker-Thread je Konto
+#     -> Der Scheduler reiht fällige Jobs in die Spur (lane) ihres Kontos ein.
+#        Innerhalb eines Kontos laufen die Jobs nacheinander, Konten
+#        untereinander parallel - ein langsames Konto (Timeouts, Rate-Limit)
+#        hält die anderen nicht auf. Jeder Worker hat eigene DB-Verbindung,
+#        das Konto eigenen Client-Pool und eigenen Order-Takt.
+########################################
+class AccountDispatcher:
+    """
+    Startet den Worker einer Spur beim ersten Job; ohne Arbeit beendet er sich
+    nach idle_timeout Sekunden wieder (500 Konten = nicht dauerhaft 500 Threads).
+    """
+
+    def __init__(self, idle_timeout):
+        self.idle_timeout = idle_timeout
+        self._cond = threading.Condition()
+        self._lanes = {}       # lane -> queue.Queue mit (job_key, func, args, eingereiht_um)
+        self._pending = 0
+        self._stats = {"submitted": 0, "completed": 0, "failed": 0, "workers_started": 0}
+
+    def submit(self, lane, job_key, func, *args):
+        with self._cond:
+            jobs = self._lanes.get(lane)
+            if jobs is None:
+                jobs = self._lanes[lane] = queue.Queue()
+                self._stats["workers_started"] += 1
+                threading.Thread(
+                    target=self._work, args=(lane, jobs), name=f"lane-{lane}", daemon=True
+                ).start()
+            # unter dem Lock einreihen -> ein Worker, der gerade wegen Leerlauf
+            # aufhört, kann den Job nicht verpassen (siehe _work)
+            jobs.put((job_key, func, args, time.perf_counter()))
+            self._pending += 1
+            self._stats["submitted"] += 1
+
+    def _work(self, lane, jobs):
+        try:
+            while True:
+                try:
+                    job_key, func, args, queued_at = jobs.get(timeout=self.idle_timeout)
+                except queue.Empty:
+                    with self._cond:
+                        if jobs.empty():
+                            del self._lanes[lane]
+                            return
+                    continue
+
+                metric_dispatch_wait.observe(time.perf_counter() - queued_at)
+                ok = True
+                try:
+                    with metric_job_seconds.time(job_key):
+                        func(*args)
+                except Exception as e:
+                    ok = False
+                    logging.error(f"Dispatcher: Job {job_key} (Spur {lane}) fehlgeschlagen: {str(e)}")
+                with self._cond:
+                    self._pending -= 1
+                    self._stats["completed" if ok else "failed"] += 1
+                    self._cond.notify_all()
+        finally:
+            close_connection()
+
+    def wait_idle(self, timeout=None):
+        """
+        Wartet, bis alle eingereihten Jobs abgearbeitet sind (True) bzw. bis timeout (False).
+        """
+        with self._cond:
+            return self._cond.wait_for(lambda: self._pending == 0, timeout)
+
+    def stats(self):
+        with self._cond:
+            return dict(self._stats, lanes=len(self._lanes), pending=self._pending)
+
+
+dispatcher = AccountDispatcher(DISPATCHER_IDLE_TIMEOUT)
+
+
+########################################
+# 9b) Hintergrunddienste + Scheduler-Leader
+#     -> Beim Import startet kein Thread mehr. start_background_services()
+#        wird vom Launcher (je Webserver-Prozess) aufgerufen. Scheduler und
+#        Mail-Versand laufen nur im Leader: dem Prozess, der das flock auf
+#        die Lock-Datei hält. So wird jeder Kauf genau einmal ausgeführt, egal
+#        wie viele gunicorn-Worker laufen. Stirbt der Leader, gibt das
+#        Betriebssystem das Lock frei und ein wartender Prozess übernimmt.
+########################################
+# Lock-Datei für die Leader-Wahl (leer = <DB_NAME>.scheduler.lock)
+SCHEDULER_LOCK_FILE = os.environ.get("SCHEDULER_LOCK_FILE", "")
+# Abstand (Sekunden), in dem der Leader Schedule-Änderungen anderer Prozesse übernimmt
+SCHEDULER_SYNC_SECONDS = float(os.environ.get("SCHEDULER_SYNC_SECONDS", "5"))
+
+_scheduler_leader = False
+_leader_lock_file = None
+_background_started = False
+_background_lock = threading.Lock()
+
+
+def is_scheduler_leader():
+    return _scheduler_leader
+
+
+def _acquire_scheduler_lock(blocking):
+    global _leader_lock_file
+    if fcntl is None:
+        return True
+    lock_file = open(SCHEDULER_LOCK_FILE or f"{DB_NAME}.scheduler.lock", "a+")
+    try:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+    except BlockingIOError:
+        lock_file.close()
+        return False
+    lock_file.seek(0)
+    lock_file.truncate()
+    lock_file.write(f"{os.getpid()}\n")
+    lock_file.flush()
+    # Datei bleibt offen: das Lock gilt bis zum Ende des Prozesses
+    _leader_lock_file = lock_file
+    return True
+
+
+def _become_scheduler_leader():
+    global _scheduler_leader
+    _scheduler_leader = True
+    logging.info(f"Prozess {os.getpid()} ist Scheduler-Leader.")
+    # Orders, deren Ausgang ein Absturz offen gelassen hat, vor dem ersten Job klären
+    try:
+        reconcile_order_journal()
+    except Exception as e:
+        logging.error(f"Abgleich des Order-Journals fehlgeschlagen: {str(e)}")
+    load_schedules_into_scheduler()
+    threading.Thread(target=run_scheduler, name="scheduler", daemon=True).start()
+    threading.Thread(target=run_schedule_sync, name="schedule-sync", daemon=True).start()
+    threading.Thread(target=run_notification_sender, name="outbox", daemon=True).start()
+
+
+def _wait_for_scheduler_leadership():
+    _acquire_scheduler_lock(blocking=True)
+    _become_scheduler_leader()
+
+
+def run_schedule_sync():
+    while True:
+        time.sleep(SCHEDULER_SYNC_SECONDS)
+        try:
+            sync_schedules()
+        except Exception as e:
+            logging.error(f"Schedule-Abgleich fehlgeschlagen: {str(e)}")
+
+
+def start_background_services():
+    """
+    Startet die Hintergrunddienste dieses Prozesses (weitere Aufrufe sind wirkungslos).
+    Der Ticker-Stream läuft in jedem Prozess, weil der Kurs-Cache prozesslokal ist.
+    """
+    global _background_started
+    with _background_lock:
+        if _background_started:
+            return
+        _background_started = True
+
+    if PRICE_STREAM_ENABLED and not SIMULATION_MODE:
+        threading.Thread(target=run_ticker_stream, name="ticker", daemon=True).start()
+    if _acquire_scheduler_lock(blocking=False):
+        _become_scheduler_leader()
+    else:
+        logging.info(f"Prozess {os.getpid()}: Scheduler läuft in einem anderen Prozess, warte auf Übernahme.")
+        threading.Thread(target=_wait_for_scheduler_leadership, name="leader-election", daemon=True).start()
+
+
+########################################
+# 9c) Order-Journal (Write-Ahead) + Abgleich nach Absturz
+#     -> Jede Order steht VOR dem Senden mit einer deterministischen
+#        clientOrderId (Schedule, Asset, geplante Laufzeit) im order_journal.
+#        Stirbt der Prozess zwischen placeOrder und dem Speichern des Trades,
+#        fragt reconcile_order_journal() die Börse nach der clientOrderId und
+#        verbucht die Order bzw. schließt den Eintrag ab. trades.client_order_id
+#        ist eindeutig -> ein Trade wird auch doppelt abgeglichen nur einmal gebucht.
+########################################
+ORDER_ID_NAMESPACE = uuid.UUID("5ecba4bd-cf8a-4f2a-ab40-ccb2b93e97ea")
+
+JOURNAL_PENDING = "pending"       # gesendet bzw. Ausgang unbekannt
+JOURNAL_FILLED = "filled"         # Trade gebucht
+JOURNAL_REJECTED = "rejected"     # von der Börse abgelehnt / nichts ausgeführt
+JOURNAL_FAILED = "failed"         # nie bei der Börse angekommen -> zurückgerollt
+
+# Order-Status der Börse, bei denen die Order noch laufen kann
+ORDER_OPEN_STATUSES = {"new", "awaitingTrigger", "partiallyFilled"}
+
+ORDER_JOURNAL_RECONCILE_MINUTES = 15
+# Offene Einträge erst nach so vielen Sekunden abgleichen (laufende Orders nicht stören)
+ORDER_JOURNAL_MIN_AGE = 600
+
+
+def client_order_id_for(schedule_id, asset, run_at, occurrence=0):
+    """
+    Gleiche Eingaben -> gleiche ID. Ein wiederholter Lauf für dieselbe Laufzeit
+    erzeugt also keine zweite Order (die Börse lehnt doppelte IDs ab).
+    """
+    name = f"{schedule_id}:{asset}:{run_at.isoformat()}"
+    if occurrence:
+        name += f":{occurrence}"
+    return str(uuid.uuid5(ORDER_ID_NAMESPACE, name))
+
+
+def journal_start_ms(created_at):
+    """
+    Beginn des Suchfensters (ms) für Orders eines Journal-Eintrags: eine Minute
+    vor dessen Anlage, damit Uhrenabweichungen zur Börse nicht stören.
+    """
+    created_at = datetime.datetime.fromisoformat(str(created_at))
+    return int((created_at - timedelta(minutes=1)).timestamp() * 1000)
+
+
+def journal_order_intents(account_id, schedule_id, run_at, lines):
+    """
+    Trägt die Orders eines Laufs (lines = [(asset, amount_eur), ...]) ins Journal
+    ein, sofern noch nicht vorhanden, und gibt sie samt aktuellem Status und
+    Suchfenster (start_ms, siehe journal_start_ms) zurück.
+    Zurückgerollte Einträge (nie bei der Börse angekommen) werden wieder geöffnet.
+    """
+    occurrences = {}
+    intents = []
+    for (asset, amount_eur) in lines:
+        asset = asset.upper()
+        occurrence = occurrences.get(asset, 0)
+        occurrences[asset] = occurrence + 1
+        intents.append({
+            "asset": asset,
+            "amount_eur": amount_eur,
+            "client_order_id": client_order_id_for(schedule_id, asset, run_at, occurrence),
+        })
+
+    now = datetime.datetime.now()
+    ids = [i["client_order_id"] for i in intents]
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.executemany("""
+            INSERT INTO order_journal (
+                client_order_id, account_id, schedule_id, run_at, asset, amount_eur, status, created_at
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (client_order_id) DO UPDATE SET
+                status = excluded.status, error = NULL, created_at = excluded.created_at
+            WHERE order_journal.status = 'failed'
+        """, [
+            (i["client_order_id"], account_id, schedule_id, run_at, i["asset"], i["amount_eur"],
+             JOURNAL_PENDING, now)
+            for i in intents
+        ])
+        entries = {
+            client_order_id: (status, created_at)
+            for (client_order_id, status, created_at) in c.execute(
+                f"SELECT client_order_id, status, created_at FROM order_journal "
+                f"WHERE client_order_id IN ({','.join('?' * len(ids))})",
+                ids
+            ).fetchall()
+        }
+        conn.commit()
+
+    for intent in intents:
+        (status, created_at) = entries[intent["client_order_id"]]
+        intent["status"] = status
+        intent["start_ms"] = journal_start_ms(created_at)
+    return intents
+
+
+def order_fill(order):
+    """
+    (gekaufte Menge, Durchschnittspreis) einer Order-Antwort - aus den Fills,
+    sonst aus filledAmount/filledAmountQuote (z.B. bei getOrders ohne Fills).
+    """
+    fills = order.get("fills")
+    if fills:
+        filled_asset = sum(float(f["amount"]) for f in fills)
+        total_cost = sum(float(f["amount"]) * float(f["price"]) for f in fills)
+    else:
+        filled_asset = float(order.get("filledAmount") or 0)
+        total_cost = float(order.get("filledAmountQuote") or 0)
+    return filled_asset, (total_cost / filled_asset if filled_asset else 0.0)
+
+
+def record_trade(c, account_id, client_order_id, timestamp, asset, amount_eur, filled_asset, avg_price, order_id):
+    """
+    Bucht einen Trade (idempotent über client_order_id) und schreibt den
+    Portfolio-Snapshot fort. False, wenn der Trade bereits gebucht war.
+    """
+    c.execute("""
+        INSERT INTO trades (
+            account_id, timestamp, asset, amount_eur,
+            filled_asset, avg_price, order_id, client_order_id
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (client_order_id) WHERE client_order_id IS NOT NULL DO NOTHING
+    """, (account_id, timestamp, asset, amount_eur, filled_asset, avg_price, order_id, client_order_id))
+    if c.rowcount == 0:
+        return False
+    snapshot_apply_trade(c, account_id, timestamp.strftime('%Y-%m-%d'), asset, filled_asset, amount_eur, avg_price)
+    return True
+
+
+def finish_journal_entry(c, client_order_id, status, order_id=None, error=None):
+    c.execute("""
+        UPDATE order_journal
+        SET status = ?, order_id = COALESCE(?, order_id), error = ?, updated_at = ?
+        WHERE client_order_id = ?
+    """, (status, order_id, error, datetime.datetime.now(), client_order_id))
+
+
+def reconcile_order_journal(min_age_seconds=0):
+    """
+    Klärt offene Journal-Einträge (älter als min_age_seconds) über die Börse:
+      Order gefunden + ausgeführt -> Trade buchen (filled)
+      Order gefunden, nichts gekauft -> rejected
+      Order nicht gefunden -> nie angekommen, Eintrag zurückrollen (failed)
+      Order läuft noch / Börse nicht erreichbar -> bleibt offen
+    Gibt die Anzahl je Ergebnis zurück.
+    """
+    cutoff = datetime.datetime.now() - timedelta(seconds=min_age_seconds)
+    with get_connection() as conn:
+        rows = conn.execute("""
+            SELECT client_order_id, account_id, asset, amount_eur, created_at
+            FROM order_journal
+            WHERE status = ? AND created_at <= ?
+            ORDER BY id
+        """, (JOURNAL_PENDING, cutoff)).fetchall()
+
+    summary = {"checked": 0, JOURNAL_FILLED: 0, JOURNAL_REJECTED: 0, JOURNAL_FAILED: 0, JOURNAL_PENDING: 0}
+    for (client_order_id, account_id, asset, amount_eur, created_at) in rows:
+        summary["checked"] += 1
+        created_at = datetime.datetime.fromisoformat(str(created_at))
+        try:
+            bv = get_bitvavo_client(account_id)
+            order = find_order_by_client_id(
+                bv, f"{asset}-EUR", client_order_id, start_ms=journal_start_ms(created_at)
+            )
+        except Exception as e:
+            logging.warning(f"Abgleich {client_order_id} ({asset}, Konto {account_id}) nicht möglich: {str(e)}")
+            summary[JOURNAL_PENDING] += 1
+            continue
+
+        if order is not None and order.get("status") in ORDER_OPEN_STATUSES:
+            summary[JOURNAL_PENDING] += 1
+            continue
+
+        with get_connection() as conn:
+            c = conn.cursor()
+            if order is None:
+                outcome = JOURNAL_FAILED
+                finish_journal_entry(c, client_order_id, outcome, error="Order bei der Börse nicht gefunden.")
+            else:
+                (filled_asset, avg_price) = order_fill(order)
+                if filled_asset > 0:
+                    outcome = JOURNAL_FILLED
+                    timestamp = (
+                        datetime.datetime.fromtimestamp(order["created"] / 1000)
+                        if order.get("created") else created_at
+                    )
+                    record_trade(
+                        c, account_id, client_order_id, timestamp, asset,
+                        amount_eur, filled_asset, avg_price, order["orderId"]
+                    )
+                    finish_journal_entry(c, client_order_id, outcome, order_id=order["orderId"])
+                else:
+                    outcome = JOURNAL_REJECTED
+                    finish_journal_entry(
+                        c, client_order_id, outcome, order_id=order.get("orderId"),
+                        error=f"Order-Status {order.get('status')}, nichts ausgeführt."
+                    )
+            conn.commit()
+        summary[outcome] += 1
+        logging.info(f"Order-Journal: {client_order_id} ({asset}, Konto {account_id}) -> {outcome}")
+
+    if summary["checked"]:
+        logging.info(f"Order-Journal abgeglichen: {summary}")
+    return summary
+
+
+########################################
+# 10) Historische Preise aktualisieren
+########################################
+def tracked_assets():
+    """
+    Alle Assets aus schedule_lines und trades. trades wird über den Index
+    (asset, id) von Asset zu Asset durchsprungen statt komplett gelesen.
+    """
+    with get_connection() as conn:
+        rows = conn.execute("""
+            WITH RECURSIVE traded (asset) AS (
+                SELECT MIN(asset) FROM trades
+                UNION ALL
+                SELECT (SELECT MIN(asset) FROM trades WHERE asset > traded.asset)
+                FROM traded
+                WHERE traded.asset IS NOT NULL
+            )
+            SELECT asset FROM schedule_lines
+            UNION
+            SELECT asset FROM traded
+        """).fetchall()
+    return sorted({r[0].upper() for r in rows if r[0]})
+
+
+def update_prices_for_assets():
+    """
+    Sammelt alle Assets aus schedule_lines und trades,
+    ruft den aktuellen Preis ab und speichert ihn in historical_rates.
+    """
+    logging.info("Starte update_prices_for_assets() ...")
+
+    all_assets = tracked_assets()
+    date_str = datetime.datetime.now().strftime('%Y-%m-%d')
+
+    try:
+        bv = get_public_bitvavo_client()
+    except Exception as e:
+        logging.error(f"Konnte Bitvavo-Client nicht erstellen (update_prices_for_assets): {str(e)}")
+        return
+
+    prices = fetch_eur_prices(bv, all_assets)
+    for asset in all_assets:
+        if asset and asset.upper() not in prices:
+            logging.warning(f"Preis für {asset} konnte nicht geholt werden.")
+
+    with get_connection() as conn:
+        store_daily_prices(conn.cursor(), date_str, prices)
+        conn.commit()
+    portfolio_data.invalidate_rates()
+    reload_mock_prices()
+
+    logging.info(f"{len(prices)} Preise gespeichert am {date_str}: {prices}")
+
+
+def store_daily_prices(c, date_str, prices):
+    """
+    Speichert die Tageskurse {ASSET: preis_eur} und schreibt die Portfolio-Snapshots fort.
+    Läuft in der Transaktion des Aufrufers.
+    """
+    # UNIQUE(date, asset): mehrfacher Lauf am selben Tag aktualisiert den Kurs
+    c.executemany("""
+        INSERT INTO historical_rates (date, asset, price_eur)
+        VALUES (?, ?, ?)
+        ON CONFLICT (date, asset) DO UPDATE SET price_eur = excluded.price_eur
+    """, [(date_str, asset, price_eur) for (asset, price_eur) in prices.items()])
+    for (asset, price_eur) in prices.items():
+        snapshot_apply_price(c, date_str, asset, price_eur)
+
+
+def fetch_eur_prices(bv, assets):
+    """
+    Holt die EUR-Kurse für alle übergebenen Assets.
+    Frische Kurse kommen aus dem Live-Cache (WebSocket), nur der Rest per REST:
+    primär mit EINEM tickerPrice-Aufruf über alle Märkte (lokal gefiltert),
+    bei Fehlern als Fallback begrenzt parallele Einzelabfragen je Markt.
+    Gibt ein Dict {ASSET: preis_eur} zurück (fehlende Assets fehlen im Dict).
+    """
+    cached = price_cache.get_many({a.upper() for a in assets if a})
+    wanted = {f"{a.upper()}-EUR": a.upper() for a in assets if a and a.upper() not in cached}
+    if not wanted:
+        return cached
+
+    try:
+        tickers = bitvavo_request_with_retry(bv.tickerPrice, {})
+        if not isinstance(tickers, list):
+            raise Exception(f"Unerwartete Antwort: {tickers}")
+        prices = dict(cached)
+        for t in tickers:
+            asset = wanted.get(t.get("market"))
+            if asset and t.get("price") is not None:
+                prices[asset] = float(t["price"])
+                price_cache.update(asset, last=t["price"], source="rest")
+        return prices
+    except Exception as e:
+        logging.warning(f"Sammelabfrage der Kurse fehlgeschlagen, nutze Einzelabfragen: {str(e)}")
+
+    prices = dict(cached)
+    with ThreadPoolExecutor(max_workers=PRICE_FETCH_WORKERS) as pool:
+        futures = {pool.submit(get_eur_price, bv, asset): asset for asset in wanted.values()}
+        for fut in as_completed(futures):
+            asset = futures[fut]
+            try:
+                prices[asset] = fut.result()
+            except Exception as e2:
+                logging.warning(f"Einzelabfrage für {asset} fehlgeschlagen: {str(e2)}")
+    return prices
+
+
+########################################
+# 10b) Live-Kurse per WebSocket (Ticker-Kanal)
+########################################
+# Ein Hintergrund-Thread abonniert den ticker-Kanal für alle Assets aus
+# Schedules und Trades und hält den letzten Kurs im PriceCache. Order-Größen
+# und Dashboards lesen daraus ohne REST-Roundtrip; ist ein Kurs älter als
+# PRICE_MAX_AGE (oder fehlt), wird per REST nachgeladen.
+
+PRICE_STREAM_ENABLED = os.environ.get("PRICE_STREAM_ENABLED", "true").lower() in ["true", "1", "yes"]
+PRICE_MAX_AGE = float(os.environ.get("PRICE_MAX_AGE", "60"))      # Sekunden bis ein Kurs als veraltet gilt
+PRICE_STREAM_CHECK_INTERVAL = 30  # Sekunden zwischen Prüfungen auf neue Assets / Verbindungsfehler
+PRICE_STREAM_MAX_BACKOFF = 600
+
+PriceEntry = namedtuple("PriceEntry", "price bid ask source updated_at")
+
+
+class PriceCache:
+    """
+    Letzter Kurs je Asset (thread-sicher). Ticker-Events enthalten nur die
+    geänderten Felder, daher werden lastPrice/bestBid/bestAsk zusammengeführt.
+    """
+
+    def __init__(self, max_age=PRICE_MAX_AGE):
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._stats = {"updates": 0, "hits": 0, "stale": 0, "misses": 0}
+
+    def update(self, asset, last=None, bid=None, ask=None, source="ws"):
+        with self._lock:
+            old = self._entries.get(asset)
+            bid = float(bid) if bid is not None else (old.bid if old else None)
+            ask = float(ask) if ask is not None else (old.ask if old else None)
+            if last is not None:
+                price = float(last)
+            elif bid and ask:
+                price = (bid + ask) / 2
+            elif old:
+                price = old.price
+            else:
+                return
+            self._entries[asset] = PriceEntry(price, bid, ask, source, time.time())
+            self._stats["updates"] += 1
+
+    def get(self, asset, max_age=None):
+        """
+        Kurs oder None, wenn keiner vorliegt bzw. er älter als max_age ist.
+        """
+        max_age = self.max_age if max_age is None else max_age
+        with self._lock:
+            entry = self._entries.get(asset)
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            if time.time() - entry.updated_at > max_age:
+                self._stats["stale"] += 1
+                return None
+            self._stats["hits"] += 1
+            return entry.price
+
+    def get_many(self, assets, max_age=None):
+        prices = {}
+        for asset in assets:
+            price = self.get(asset, max_age)
+            if price is not None:
+                prices[asset] = price
+        return prices
+
+    def stats(self):
+        """
+        Zähler plus Alter (Sekunden) und Quelle je Asset.
+        """
+        now = time.time()
+        with self._lock:
+            stats = dict(self._stats)
+            stats["assets"] = {
+                asset: {"price": e.price, "bid": e.bid, "ask": e.ask,
+                        "source": e.source, "age_seconds": now - e.updated_at}
+                for (asset, e) in self._entries.items()
+            }
+        lookups = stats["hits"] + stats["stale"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        stats["max_age_seconds"] = self.max_age
+        stats["fresh_assets"] = sum(1 for a in stats["assets"].values() if a["age_seconds"] <= self.max_age)
+        return stats
+
+
+price_cache = PriceCache()
+
+
+class TickerStream:
+    """
+    Hält die WebSocket-Verbindung (newWebsocket() der Bibliothek, URL aus
+    BITVAVO_WS_URL) und abonniert neue Märkte, sobald sie in Schedules/Trades
+    auftauchen. Wiederverbinden nach Abbrüchen übernimmt die Bibliothek.
+    """
+
+    def __init__(self):
+        self._ws = None
+        self._markets = set()
+        self.errors = 0
+        self.connected_since = None
+
+    def _on_ticker(self, msg):
+        asset = msg.get("market", "").split("-")[0]
+        price_cache.update(asset, msg.get("lastPrice"), msg.get("bestBid"), msg.get("bestAsk"))
+
+    def _on_error(self, error):
+        self.errors += 1
+        logging.warning(f"Ticker-WebSocket Fehler: {error}")
+
+    def _connect(self):
+        ws = get_public_bitvavo_client().newWebsocket()
+        ws.setErrorCallback(self._on_error)
+        self._ws = ws
+        self._markets = set()
+        self.connected_since = time.time()
+        logging.info(f"Ticker-WebSocket verbunden mit {BITVAVO_WS_URL}")
+
+    def subscribe(self, assets):
+        for asset in assets:
+            market = f"{asset}-EUR"
+            if market not in self._markets:
+                # Blockiert, bis der Socket offen ist
+                self._ws.subscriptionTicker(market, self._on_ticker)
+                self._markets.add(market)
+                logging.info(f"Ticker abonniert: {market}")
+
+    def close(self):
+        ws, self._ws = self._ws, None
+        self.connected_since = None
+        if ws is not None:
+            try:
+                ws.closeSocket()
+            except Exception:
+                pass
+
+    def stats(self):
+        return {
+            "connected": self._ws is not None,
+            "connected_seconds": time.time() - self.connected_since if self.connected_since else 0.0,
+            "markets": sorted(self._markets),
+            "errors": self.errors,
+        }
+
+    def run(self):
+        failures = 0
+        while True:
+            try:
+                if self._ws is None:
+                    self._connect()
+                self.subscribe(tracked_assets())
+                failures = 0
+            except (Exception, RecursionError) as e:
+                # RecursionError: waitForSocket() der Bibliothek wartet rekursiv auf den Socket
+                failures += 1
+                self.errors += 1
+                logging.error(f"Ticker-WebSocket nicht verfügbar (Versuch {failures}): {str(e)}")
+                self.close()
+            time.sleep(min(PRICE_STREAM_CHECK_INTERVAL * 2 ** failures, PRICE_STREAM_MAX_BACKOFF))
+
+
+ticker_stream = TickerStream()
+
+
+def run_ticker_stream():
+    ticker_stream.run()
+
+
+def get_eur_price(bv, asset):
+    """
+    Aktueller EUR-Kurs: aus dem Live-Cache, sonst per REST (und dann gecacht).
+    """
+    price = price_cache.get(asset)
+    if price is not None:
+        return price
+    ticker = bitvavo_request_with_retry(bv.tickerPrice, {"market": f"{asset}-EUR"})
+    if not isinstance(ticker, dict) or "price" not in ticker:
+        raise Exception(f"Unerwartete Antwort: {ticker}")
+    price_cache.update(asset, last=ticker["price"], source="rest")
+    return float(ticker["price"])
+
+
+@app.route("/api/prices")
+def api_prices():
+    return jsonify({"cache": price_cache.stats(), "stream": ticker_stream.stats()})
+
+
+########################################
+# 10a) Historische Kerzen (OHLCV) nachladen
+########################################
+# Kerzenlänge -> Millisekunden (Intervalle der Bitvavo-API)
+CANDLE_INTERVALS = {
+    "1m": 60_000, "5m": 300_000, "15m": 900_000, "30m": 1_800_000,
+    "1h": 3_600_000, "2h": 7_200_000, "4h": 14_400_000, "6h": 21_600_000,
+    "8h": 28_800_000, "12h": 43_200_000, "1d": 86_400_000,
+}
+CANDLE_PAGE_LIMIT = 1440          # max. Kerzen je Request (API-Grenze)
+CANDLE_BACKFILL_WORKERS = int(os.environ.get("CANDLE_BACKFILL_WORKERS", "4"))
+# Ohne gespeicherte Kerzen beginnt der Backfill hier
+CANDLE_BACKFILL_START = os.environ.get("CANDLE_BACKFILL_START", "2019-03-01")
+
+
+def _ms_to_datetime(ms):
+    return datetime.datetime.fromtimestamp(ms / 1000, tz=datetime.timezone.utc)
+
+
+def _backfill_start_ms(asset, interval, default_start_ms):
+    """
+    Fortsetzen ab der letzten gespeicherten Kerze (inklusive, da diese beim
+    letzten Lauf evtl. noch nicht abgeschlossen war) bzw. ab dem Ende des
+    bereits verdichteten Bereichs.
+    """
+    with get_connection() as conn:
+        row = conn.execute("""
+            SELECT MAX(timestamp) FROM price_candles WHERE asset = ? AND interval = ?
+        """, (asset, interval)).fetchone()
+        # Bereits verdichtete (gelöschte) Kerzen nicht erneut laden
+        rolled = conn.execute("""
+            SELECT rolled_until FROM price_rollup_state WHERE asset = ? AND interval = ?
+        """, (asset, interval)).fetchone()
+    candidates = [v for v in (row[0], rolled[0] if rolled else None) if v is not None]
+    return max(candidates) if candidates else default_start_ms
+
+
+def store_candles(asset, interval, candles):
+    """
+    Speichert eine Seite Kerzen ([ts, open, high, low, close, volume], wie von
+    der API geliefert) in einer Transaktion. Doppelte Kerzen werden per Upsert
+    überschrieben. Tageskerzen füllen zusätzlich Lücken in historical_rates.
+    Gibt die Anzahl der Zeilen zurück.
+    """
+    rows = [
+        (asset, interval, int(k[0]), float(k[1]), float(k[2]), float(k[3]), float(k[4]), float(k[5]))
+        for k in candles
+    ]
+    if not rows:
+        return 0
+    with get_connection() as conn:
+        conn.executemany("""
+            INSERT INTO price_candles (asset, interval, timestamp, open, high, low, close, volume)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (asset, interval, timestamp) DO UPDATE SET
+                open = excluded.open, high = excluded.high, low = excluded.low,
+                close = excluded.close, volume = excluded.volume
+        """, rows)
+        if interval == "1d":
+            # Vom Scheduler gespeicherte Kurse haben Vorrang
+            conn.executemany("""
+                INSERT INTO historical_rates (date, asset, price_eur)
+                VALUES (?, ?, ?)
+                ON CONFLICT (date, asset) DO NOTHING
+            """, [(_ms_to_datetime(r[2]).strftime('%Y-%m-%d'), asset, r[6]) for r in rows])
+        conn.commit()
+    return len(rows)
+
+
+def backfill_asset(bv, asset, interval, start_ms, end_ms):
+    """
+    Blättert vorwärts durch die Kerzen eines Marktes. Jedes Fenster umfasst
+    höchstens CANDLE_PAGE_LIMIT Kerzen und wird sofort gespeichert,
+    ein Abbruch verliert also höchstens eine Seite.
+    """
+    step = CANDLE_INTERVALS[interval]
+    market = f"{asset}-EUR"
+    total = 0
+    cursor = start_ms
+    while cursor <= end_ms:
+        # [cursor, window_end] inklusive -> höchstens CANDLE_PAGE_LIMIT Kerzen; sonst
+        # schneidet die API (neueste zuerst) die älteste Kerze des Fensters ab
+        window_end = min(cursor + (CANDLE_PAGE_LIMIT - 1) * step, end_ms)
+        candles = bitvavo_request_with_retry(
+            bv.candles, market, interval,
+            limit=CANDLE_PAGE_LIMIT,
+            start=_ms_to_datetime(cursor),
+            end=_ms_to_datetime(window_end)
+        )
+        if not isinstance(candles, list):
+            raise Exception(f"Unerwartete Antwort für {market}: {candles}")
+        total += store_candles(asset, interval, candles)
+        if window_end >= end_ms:
+            break
+        cursor = window_end
+    return total
+
+
+def backfill_candles(interval="1d", start=None, assets=None, workers=None):
+    """
+    Lädt fehlende Kerzen für alle Assets (schedule_lines + trades) mit einem
+    begrenzten Worker-Pool nach. start: 'YYYY-MM-DD' für Assets ohne Kerzen.
+    Liefert {"assets", "rows", "errors", "seconds", "rows_per_second"}.
+    """
+    if interval not in CANDLE_INTERVALS:
+        raise ValueError(f"Unbekanntes Intervall: {interval}")
+    assets = [a.upper() for a in assets] if assets else tracked_assets()
+    start_day = datetime.datetime.strptime(start or CANDLE_BACKFILL_START, '%Y-%m-%d')
+    default_start_ms = int(start_day.replace(tzinfo=datetime.timezone.utc).timestamp() * 1000)
+    end_ms = int(time.time() * 1000)
+    workers = max(1, min(workers or CANDLE_BACKFILL_WORKERS, len(assets) or 1))
+    bv = get_public_bitvavo_client()
+
+    result = {"assets": len(assets), "rows": 0, "errors": {}}
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(
+                backfill_asset, bv, asset, interval,
+                _backfill_start_ms(asset, interval, default_start_ms), end_ms
+            ): asset
+            for asset in assets
+        }
+        for fut in as_completed(futures):
+            asset = futures[fut]
+            try:
+                rows = fut.result()
+                result["rows"] += rows
+                logging.info(f"Kerzen-Backfill {asset} ({interval}): {rows} Zeilen")
+            except Exception as e:
+                result["errors"][asset] = str(e)
+                logging.error(f"Kerzen-Backfill {asset} ({interval}) fehlgeschlagen: {str(e)}")
+    result["seconds"] = time.perf_counter() - started
+    result["rows_per_second"] = result["rows"] / result["seconds"] if result["seconds"] else 0.0
+
+    if interval == "1d" and result["rows"]:
+        # Neue Tageskurse können vor vorhandenen Snapshots liegen
+        with get_connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            rebuild_portfolio_snapshots(conn, verify=False)
+            conn.commit()
+        portfolio_data.invalidate_rates()
+        reload_mock_prices()
+
+    logging.info(
+        f"Kerzen-Backfill fertig: {result['rows']} Zeilen in {result['seconds']:.1f}s "
+        f"({result['rows_per_second']:.0f} Zeilen/s), Fehler: {len(result['errors'])}"
+    )
+    return result
+
+
+########################################
+# 10c) Kontostands-Historie (Delta-Snapshots)
+#     -> balance_snapshots: ein Kopf je Snapshot (Konto, Zeitpunkt).
+#        balance_deltas: nur die Währungen, die sich seit dem vorherigen
+#        Snapshot geändert haben (neue Menge, 0 = nicht mehr vorhanden).
+#        Ab und zu ein Vollstand (is_full) begrenzt, wie viele Deltas für
+#        einen Zeitpunkt gelesen werden müssen. Unveränderte Abrufe legen
+#        keinen neuen Snapshot an, sondern schreiben nur checked_at fort.
+########################################
+# Automatischer Snapshot aller Konten alle X Minuten (0 = aus)
+BALANCE_SNAPSHOT_MINUTES = float(os.environ.get("BALANCE_SNAPSHOT_MINUTES", "60"))
+
+# Neuer Vollstand, sobald seit dem letzten so viele Delta-Zeilen angefallen sind
+BALANCE_KEYFRAME_ROWS = 200
+
+BALANCE_TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+BalanceState = namedtuple("BalanceState", "snapshot_id taken_at checked_at balances delta_rows")
+
+
+def _balance_changes(old, new):
+    changes = {currency: amount for (currency, amount) in new.items() if old.get(currency) != amount}
+    changes.update({currency: 0.0 for currency in old if currency not in new})
+    return changes
+
+
+def write_balance_snapshot(c, account_id, previous, balances, taken_at, source):
+    """
+    Speichert balances ({währung: menge}, nur Bestände > 0) als Snapshot nach
+    previous (BalanceState oder None) und gibt den neuen BalanceState zurück.
+    """
+    if previous is not None:
+        changes = _balance_changes(previous.balances, balances)
+        if not changes:
+            c.execute("UPDATE balance_snapshots SET checked_at = ? WHERE id = ?", (taken_at, previous.snapshot_id))
+            return previous._replace(checked_at=taken_at)
+        full = previous.delta_rows + len(changes) > BALANCE_KEYFRAME_ROWS
+    else:
+        full = True
+
+    rows = balances if full else changes
+    c.execute("""
+        INSERT INTO balance_snapshots (account_id, taken_at, checked_at, is_full, source)
+        VALUES (?, ?, ?, ?, ?)
+    """, (account_id, taken_at, taken_at, int(full), source))
+    snapshot_id = c.lastrowid
+    c.executemany(
+        "INSERT INTO balance_deltas (snapshot_id, currency, amount) VALUES (?, ?, ?)",
+        [(snapshot_id, currency, amount) for (currency, amount) in rows.items()]
+    )
+    return BalanceState(
+        snapshot_id, taken_at, taken_at, dict(balances), 0 if full else previous.delta_rows + len(changes)
+    )
+
+
+def _read_balance_state(c, account_id, snapshot_id):
+    """
+    Stand nach snapshot_id: letzter Vollstand davor + alle Deltas bis snapshot_id.
+    """
+    (taken_at, checked_at) = c.execute(
+        "SELECT taken_at, checked_at FROM balance_snapshots WHERE id = ?", (snapshot_id,)
+    ).fetchone()
+    full_id = c.execute("""
+        SELECT MAX(id) FROM balance_snapshots
+        WHERE account_id = ? AND id <= ? AND is_full = 1
+    """, (account_id, snapshot_id)).fetchone()[0]
+    rows = c.execute("""
+        SELECT d.snapshot_id, d.currency, d.amount
+        FROM balance_snapshots s
+        JOIN balance_deltas d ON d.snapshot_id = s.id
+        WHERE s.account_id = ? AND s.id BETWEEN ? AND ?
+        ORDER BY s.id
+    """, (account_id, full_id, snapshot_id)).fetchall()
+
+    balances = {}
+    delta_rows = 0
+    for (row_snapshot_id, currency, amount) in rows:
+        if row_snapshot_id != full_id:
+            delta_rows += 1
+        if amount:
+            balances[currency] = amount
+        else:
+            balances.pop(currency, None)
+    return BalanceState(snapshot_id, taken_at, checked_at, balances, delta_rows)
+
+
+def _snapshot_id_at(c, account_id, at):
+    row = c.execute("""
+        SELECT id FROM balance_snapshots
+        WHERE account_id = ? AND taken_at <= ?
+        ORDER BY taken_at DESC, id DESC LIMIT 1
+    """, (account_id, at)).fetchone()
+    return row[0] if row else None
+
+
+def _balance_time(value, end_of_day=False):
+    """
+    datetime bzw. "YYYY-MM-DD[ HH:MM:SS]" -> Vergleichswert für taken_at.
+    Ein reines Datum steht für 00:00:00 bzw. (end_of_day) 23:59:59.
+    """
+    if isinstance(value, datetime.datetime):
+        return value.strftime(BALANCE_TIME_FORMAT)
+    value = value.strip().replace("T", " ")
+    if len(value) == 10:
+        day = datetime.datetime.strptime(value, "%Y-%m-%d")
+        return (day.replace(hour=23, minute=59, second=59) if end_of_day else day).strftime(BALANCE_TIME_FORMAT)
+    return datetime.datetime.strptime(value, BALANCE_TIME_FORMAT).strftime(BALANCE_TIME_FORMAT)
+
+
+def latest_balance_state(c, account_id):
+    row = c.execute("SELECT MAX(id) FROM balance_snapshots WHERE account_id = ?", (account_id,)).fetchone()
+    return _read_balance_state(c, account_id, row[0]) if row[0] is not None else None
+
+
+def balance_at(account_id, at):
+    """
+    Kontostand zum Zeitpunkt at als (taken_at, {währung: menge});
+    (None, {}), wenn es bis dahin keinen Snapshot gibt.
+    """
+    with get_connection() as conn:
+        c = conn.cursor()
+        snapshot_id = _snapshot_id_at(c, account_id, _balance_time(at, end_of_day=True))
+        if snapshot_id is None:
+            return None, {}
+        state = _read_balance_state(c, account_id, snapshot_id)
+    return state.taken_at, state.balances
+
+
+def balance_history(account_id, start, end):
+    """
+    Kontostände im Zeitraum [start, end] als [{"taken_at", "balances"}, ...]:
+    zuerst der Stand zu Beginn (falls es ihn gibt), danach einer je Snapshot.
+    Startstand aus Vollstand + Deltas, der Rest in einem Durchlauf über die
+    Deltas des Zeitraums.
+    """
+    start = _balance_time(start)
+    end = _balance_time(end, end_of_day=True)
+    history = []
+    balances = {}
+    with get_connection() as conn:
+        c = conn.cursor()
+        start_id = _snapshot_id_at(c, account_id, start)
+        if start_id is not None:
+            balances = _read_balance_state(c, account_id, start_id).balances
+            history.append({"taken_at": start, "balances": dict(balances)})
+        rows = c.execute("""
+            SELECT s.id, s.taken_at, s.is_full, d.currency, d.amount
+            FROM balance_snapshots s
+            LEFT JOIN balance_deltas d ON d.snapshot_id = s.id
+            WHERE s.account_id = ? AND s.taken_at > ? AND s.taken_at <= ?
+            ORDER BY s.taken_at, s.id
+        """, (account_id, start, end)).fetchall()
+
+    current_id = None
+    for (snapshot_id, taken_at, is_full, currency, amount) in rows:
+        if snapshot_id != current_id:
+            if current_id is not None:
+                history[-1]["balances"] = dict(balances)
+            current_id = snapshot_id
+            history.append({"taken_at": taken_at, "balances": None})
+            if is_full:
+                balances = {}
+        if currency is None:
+            continue
+        if amount:
+            balances[currency] = amount
+        else:
+            balances.pop(currency, None)
+    if current_id is not None:
+        history[-1]["balances"] = dict(balances)
+    return history
+
+
+def fetch_account_balances(bv):
+    """
+    Aktueller Kontostand als {währung: verfügbare menge}, nur Bestände > 0.
+    """
+    res = bitvavo_request_with_retry(bv.balance, {})
+    if isinstance(res, dict) and "errorCode" in res:
+        raise Exception(f"{res['errorCode']} - {res['error']}")
+    return {b["symbol"]: float(b["available"]) for b in res if float(b["available"]) > 0}
+
+
+def record_balance_snapshot(account_id, balances, source):
+    """
+    Speichert einen abgerufenen Kontostand. Gibt den vorherigen Stand
+    (BalanceState oder None) und den Zeitpunkt des neuen zurück.
+    """
+    now_str = datetime.datetime.now().strftime(BALANCE_TIME_FORMAT)
+    with get_connection() as conn:
+        # Lesen + Schreiben unter einem Lock -> parallele Abrufe (Web, Job) verlieren kein Delta
+        conn.execute("BEGIN IMMEDIATE")
+        c = conn.cursor()
+        previous = latest_balance_state(c, account_id)
+        write_balance_snapshot(c, account_id, previous, balances, now_str, source)
+        conn.commit()
+    return previous, now_str
+
+
+def take_balance_snapshot(account_id):
+    balances = fetch_account_balances(get_bitvavo_client(account_id))
+    record_balance_snapshot(account_id, balances, "scheduled")
+
+
+def snapshot_all_balances():
+    """
+    Scheduler-Job: Snapshot je Konto (mit Credentials bzw. alle im SIMULATION_MODE)
+    in der Spur des Kontos -> läuft nie parallel zu dessen Orders.
+    """
+    for account in load_accounts().values():
+        if SIMULATION_MODE or account.api_key:
+            dispatcher.submit(account.id, BALANCE_JOB_KEY, take_balance_snapshot, account.id)
+
+
+@app.route("/api/balances")
+def api_balances():
+    """
+    ?at=<zeitpunkt> -> Stand zu diesem Zeitpunkt,
+    ?from=<zeitpunkt>&to=<zeitpunkt> -> Verlauf im Zeitraum
+    (Zeitpunkt: YYYY-MM-DD oder YYYY-MM-DD HH:MM:SS).
+    """
+    account_id = current_account_id()
+    try:
+        if request.args.get("from"):
+            end = request.args.get("to") or datetime.datetime.now()
+            return jsonify(balance_history(account_id, request.args["from"], end))
+        (taken_at, balances) = balance_at(account_id, request.args.get("at") or datetime.datetime.now())
+    except ValueError:
+        return jsonify({"error": "Ungültiger Zeitpunkt (YYYY-MM-DD oder YYYY-MM-DD HH:MM:SS)"}), 400
+    return jsonify({"taken_at": taken_at, "balances": balances})
+
+
+########################################
+# 10d) Aufbewahrung + Verdichtung der Kurse (price_candles)
+#     -> Intraday-Kerzen (1m..12h) bleiben PRICE_RETENTION_INTRADAY_DAYS Tage,
+#        danach werden sie zu Tageskerzen (1d) verdichtet; Tageskerzen nach
+#        PRICE_RETENTION_DAILY_DAYS zu Wochenkerzen (1w, ab Montag 00:00 UTC).
+#        Gibt es die Zielkerze schon (z.B. von der Börse), gewinnt sie und die
+#        Quellzeilen werden nur gelöscht -> je Zeitraum genau eine Auflösung.
+#        Verarbeitet wird in kleinen Transaktionen (je ROLLUP_BATCH_ROWS Zeilen)
+#        mit Pause dazwischen; price_rollup_state merkt sich den Fortschritt.
+#        historical_rates (ein Kurs je Tag, UNIQUE(date, asset)) bleibt
+#        unangetastet: Portfolio und Backtests rechnen auf Tageskursen.
+########################################
+PRICE_RETENTION_INTRADAY_DAYS = int(os.environ.get("PRICE_RETENTION_INTRADAY_DAYS", "30"))
+PRICE_RETENTION_DAILY_DAYS = int(os.environ.get("PRICE_RETENTION_DAILY_DAYS", "730"))
+
+# Verdichtung alle X Minuten (0 = aus), höchstens so viele Transaktionen je Lauf
+PRICE_RETENTION_MINUTES = float(os.environ.get("PRICE_RETENTION_MINUTES", "60"))
+PRICE_RETENTION_MAX_BATCHES = 500
+
+ROLLUP_BATCH_ROWS = 20000
+ROLLUP_BATCH_PAUSE = 0.05         # Sekunden zwischen zwei Transaktionen
+
+DAY_MS = CANDLE_INTERVALS["1d"]
+WEEK_MS = 7 * DAY_MS
+
+
+def _day_bucket(ms):
+    return ms - ms % DAY_MS
+
+
+def _week_bucket(ms):
+    # 1970-01-01 war ein Donnerstag -> Wochen beginnen 3 Tage früher (Montag)
+    return ms - (ms + 3 * DAY_MS) % WEEK_MS
+
+
+def _rollup_tiers():
+    """
+    (Quell-Intervalle, Ziel-Intervall, Bucket-Funktion, Bucket-Länge, Aufbewahrung in Tagen)
+    in Verarbeitungsreihenfolge: erst zu Tages-, dann zu Wochenkerzen.
+    """
+    intraday = [name for (name, ms) in CANDLE_INTERVALS.items() if ms < DAY_MS]
+    return [
+        (intraday, "1d", _day_bucket, DAY_MS, PRICE_RETENTION_INTRADAY_DAYS),
+        (["1d"], "1w", _week_bucket, WEEK_MS, PRICE_RETENTION_DAILY_DAYS),
+    ]
+
+
+def aggregate_candles(rows, bucket):
+    """
+    rows: [(timestamp, open, high, low, close, volume), ...] aufsteigend sortiert
+    -> {bucket_start: [open, high, low, close, volume]}.
+    """
+    result = {}
+    for (ts, o, h, l, c, v) in rows:
+        key = bucket(ts)
+        candle = result.get(key)
+        if candle is None:
+            result[key] = [o, h, l, c, v]
+        else:
+            candle[1] = max(candle[1], h)
+            candle[2] = min(candle[2], l)
+            candle[3] = c
+            candle[4] += v
+    return result
+
+
+def _rollup_batch(asset, source, target, bucket, bucket_ms, cutoff_ms):
+    """
+    Eine Transaktion: verdichtet die ältesten vollständigen Buckets von
+    (asset, source) vor cutoff_ms. Gibt (gelesene, geschriebene) Zeilen zurück,
+    (0, 0), wenn nichts mehr zu tun ist.
+    """
+    source_ms = CANDLE_INTERVALS[source]
+    with get_connection() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        first = conn.execute("""
+            SELECT MIN(timestamp) FROM price_candles
+            WHERE asset = ? AND interval = ? AND timestamp < ?
+        """, (asset, source, cutoff_ms)).fetchone()[0]
+        if first is None:
+            conn.commit()
+            return 0, 0
+        start = bucket(first)
+        buckets = max(1, ROLLUP_BATCH_ROWS * source_ms // bucket_ms)
+        end = min(cutoff_ms, start + buckets * bucket_ms)
+        rows = conn.execute("""
+            SELECT timestamp, open, high, low, close, volume FROM price_candles
+            WHERE asset = ? AND interval = ? AND timestamp >= ? AND timestamp < ?
+            ORDER BY timestamp
+        """, (asset, source, start, end)).fetchall()
+        candles = aggregate_candles(rows, bucket)
+        c = conn.cursor()
+        c.executemany("""
+            INSERT INTO price_candles (asset, interval, timestamp, open, high, low, close, volume)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (asset, interval, timestamp) DO NOTHING
+        """, [(asset, target, ts, *candle) for (ts, candle) in candles.items()])
+        written = c.rowcount
+        conn.execute("""
+            DELETE FROM price_candles
+            WHERE asset = ? AND interval = ? AND timestamp >= ? AND timestamp < ?
+        """, (asset, source, start, end))
+        conn.execute("""
+            INSERT INTO price_rollup_state (asset, interval, rolled_until) VALUES (?, ?, ?)
+            ON CONFLICT (asset, interval) DO UPDATE SET
+                rolled_until = MAX(rolled_until, excluded.rolled_until)
+        """, (asset, source, end))
+        conn.commit()
+    return len(rows), written
+
+
+def run_price_retention(max_batches=None, pause=ROLLUP_BATCH_PAUSE, now_ms=None):
+    """
+    Verdichtet price_candles schrittweise (siehe oben). Bricht nach max_batches
+    Transaktionen ab, der nächste Lauf macht dort weiter.
+    Liefert {"batches", "rows_read", "rows_written", "max_batch_ms", "seconds"}.
+    """
+    now_ms = now_ms if now_ms is not None else int(time.time() * 1000)
+    result = {"batches": 0, "rows_read": 0, "rows_written": 0, "max_batch_ms": 0.0}
+    started = time.perf_counter()
+    for (sources, target, bucket, bucket_ms, keep_days) in _rollup_tiers():
+        if keep_days <= 0:
+            continue
+        cutoff_ms = bucket(now_ms - keep_days * DAY_MS)
+        with get_connection() as conn:
+            pairs = conn.execute(f"""
+                SELECT DISTINCT asset, interval FROM price_candles
+                WHERE interval IN ({", ".join("?" * len(sources))})
+            """, sources).fetchall()
+        for (asset, source) in pairs:
+            while max_batches is None or result["batches"] < max_batches:
+                batch_started = time.perf_counter()
+                (read, written) = _rollup_batch(asset, source, target, bucket, bucket_ms, cutoff_ms)
+                if not read:
+                    break
+                result["batches"] += 1
+                result["rows_read"] += read
+                result["rows_written"] += written
+                result["max_batch_ms"] = max(result["max_batch_ms"], (time.perf_counter() - batch_started) * 1000)
+                if pause:
+                    time.sleep(pause)
+    result["seconds"] = time.perf_counter() - started
+    if result["batches"]:
+        logging.info(
+            f"Kurs-Verdichtung: {result['rows_read']} Kerzen -> {result['rows_written']} "
+            f"in {result['batches']} Transaktionen ({result['seconds']:.1f}s, "
+            f"längste {result['max_batch_ms']:.0f} ms)"
+        )
+    return result
+
+
+########################################
+# 11) Routen: Startseite & Co.
+########################################
+# Read-Model der Zeitplan-Liste fürs Dashboard (je Konto). add/edit/delete_schedule
+# zählen den Änderungszähler "schedules" hoch; ein Eintrag gilt nur für den
+# Zählerstand, der VOR dem Laden gelesen wurde. So bleibt die Liste auch mit
+# mehreren Webserver-Prozessen aktuell, und ein parallel laufender Ladevorgang
+# kann keinen veralteten Stand als aktuell ablegen.
+_schedule_list_cache = {}    # account_id -> (zählerstand, liste)
+_schedule_list_lock = threading.Lock()
+
+
+def load_schedule_list(account_id=DEFAULT_ACCOUNT_ID):
+    """
+    Alle Zeitpläne des Kontos samt Zeilen als [(id, weekday, time_of_day, [(asset, eur), ...]), ...]
+    mit EINER Abfrage (LEFT JOIN) statt einer Abfrage je Zeitplan.
+    """
+    version = read_change_counter("schedules")
+    with _schedule_list_lock:
+        cached = _schedule_list_cache.get(account_id)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
+    with get_connection() as conn:
+        rows = conn.execute("""
+            SELECT s.id, s.weekday, s.time_of_day, l.asset, l.amount_eur
+            FROM schedules s
+            LEFT JOIN schedule_lines l ON l.schedule_id = s.id
+            WHERE s.account_id = ?
+            ORDER BY s.id, l.id
+        """, (account_id,)).fetchall()
+
+    schedules_list = []
+    for (sid, wd, tod), group in itertools.groupby(rows, key=lambda r: r[:3]):
+        lines_ = [(r[3], r[4]) for r in group if r[3] is not None]
+        schedules_list.append((sid, wd, tod, lines_))
+
+    with _schedule_list_lock:
+        _schedule_list_cache[account_id] = (version, schedules_list)
+    return schedules_list
+
+
+@app.route("/")
+def index():
+    return render_template("index.html", schedules_list=load_schedule_list(current_account_id()))
+
+
+@app.route("/add_schedule", methods=["GET", "POST"])
+def add_schedule():
+    if request.method == "POST":
+        wd = request.form.get("weekday")
+        tod = request.form.get("time_of_day")
+
+        assets = request.form.getlist("asset")
+        amounts = request.form.getlist("amount_eur")
+
+        with get_connection() as conn:
+            c = conn.cursor()
+            c.execute("INSERT INTO schedules (account_id, weekday, time_of_day) VALUES (?, ?, ?)",
+                      (current_account_id(), wd, tod))
+            schedule_id = c.lastrowid
+
+            for (ast, amt_str) in zip(assets, amounts):
+                ast = ast.strip().upper()
+                amt_val = 0.0
+                try:
+                    amt_val = float(amt_str)
+                except:
+                    pass
+                if ast and amt_val > 0:
+                    c.execute("""
+                      INSERT INTO schedule_lines (schedule_id, asset, amount_eur)
+                      VALUES (?, ?, ?)
+                    """, (schedule_id, ast, amt_val))
+
+            bump_change_counter(c, "schedules")
+            conn.commit()
+
+        sync_schedules()
+        logging.info(f"Neuer Zeitplan {schedule_id} angelegt: {wd} {tod}")
+        flash("Neuer Zeitplan angelegt.")
+        return redirect(url_for("index"))
+
+    now_plus_2 = datetime.datetime.now() + timedelta(minutes=2)
+    default_day = now_plus_2.strftime("%A")     # z.B. "Monday"
+    default_time = now_plus_2.strftime("%H:%M") # z.B. "23:59"
+
+    return render_template(
+        "add_schedule.html",
+        allowed_assets=ALLOWED_ASSETS,
+        default_day=default_day,
+        default_time=default_time
+    )
+
+
+@app.route("/edit_schedule/<int:schedule_id>", methods=["GET", "POST"])
+def edit_schedule(schedule_id):
+    if request.method == "POST":
+        wd = request.form.get("weekday")
+        tod = request.form.get("time_of_day")
+
+        assets = request.form.getlist("asset")
+        amounts = request.form.getlist("amount_eur")
+
+        with get_connection() as conn:
+            c = conn.cursor()
+            c.execute("UPDATE schedules SET weekday=?, time_of_day=? WHERE id=? AND account_id=?",
+                      (wd, tod, schedule_id, current_account_id()))
+            if c.rowcount == 0:
+                flash(f"Zeitplan {schedule_id} existiert nicht.")
+                return redirect(url_for("index"))
+            c.execute("DELETE FROM schedule_lines WHERE schedule_id=?", (schedule_id,))
+
+            for (ast, amt_str) in zip(assets, amounts):
+                ast = ast.strip().upper()
+                amt_val = 0.0
+                try:
+                    amt_val = float(amt_str)
+                except:
+                    pass
+                if ast and amt_val > 0:
+                    c.execute("""
+                      INSERT INTO schedule_lines (schedule_id, asset, amount_eur)
+                      VALUES (?, ?, ?)
+                    """, (schedule_id, ast, amt_val))
+            bump_change_counter(c, "schedules")
+            conn.commit()
+
+        sync_schedules()
+        logging.info(f"Zeitplan {schedule_id} aktualisiert: {wd} {tod}")
+        flash(f"Zeitplan {schedule_id} wurde aktualisiert.")
+        return redirect(url_for("index"))
+
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.execute("SELECT weekday, time_of_day FROM schedules WHERE id=? AND account_id=?",
+                  (schedule_id, current_account_id()))
+        row = c.fetchone()
+        if not row:
+            flash(f"Zeitplan {schedule_id} existiert nicht.")
+            return redirect(url_for("index"))
+        wd, tod = row
+
+        c.execute("SELECT asset, amount_eur FROM schedule_lines WHERE schedule_id=?", (schedule_id,))
+        lines = c.fetchall()
+
+    while len(lines) < 3:
+        lines.append(("", 0.0))
+
+    return render_template(
+        "edit_schedule.html",
+        schedule_id=schedule_id,
+        wd=wd,
+        tod=tod,
+        lines=lines,
+        allowed_assets=ALLOWED_ASSETS
+    )
+
+
+@app.route("/delete_schedule/<int:schedule_id>")
+def delete_schedule(schedule_id):
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.execute("DELETE FROM schedules WHERE id = ? AND account_id = ?", (schedule_id, current_account_id()))
+        if c.rowcount == 0:
+            flash(f"Zeitplan {schedule_id} existiert nicht.")
+            return redirect(url_for("index"))
+        c.execute("DELETE FROM schedule_lines WHERE schedule_id = ?", (schedule_id,))
+        bump_change_counter(c, "schedules")
+        conn.commit()
+
+    sync_schedules()
+    flash(f"Zeitplan {schedule_id} gelöscht.")
+    logging.info(f"Zeitplan {schedule_id} gelöscht.")
+    return redirect(url_for("index"))
+
+
+@app.route("/balance")
+def manual_balance():
+    account_id = current_account_id()
+    try:
+        bv = get_bitvavo_client(account_id)
+    except Exception as e:
+        flash(f"Keine Credentials oder Fehler: {str(e)}", "error")
+        logging.error(f"manual_balance: Kein Client. {str(e)}")
+        return redirect(url_for("index"))
+
+    # Aktueller Kontostand (als Delta zum letzten Snapshot gespeichert)
+    try:
+        current_balance = fetch_account_balances(bv)
+        (previous, now_str) = record_balance_snapshot(account_id, current_balance, "manual")
+
+        flash(f"Kontostand abgerufen und gespeichert ({now_str}).")
+        logging.info(f"Kontostand abgerufen: {len(current_balance)} Einträge.")
+
+        return render_template(
+            "balance.html",
+            now_str=now_str,
+            current_balance=current_balance,
+            last_ts=previous.checked_at if previous else None,
+            old_balance=previous.balances if previous else {}
+        )
+
+    except Exception as e:
+        flash(f"Fehler beim Kontostand: {e}", "error")
+        logging.error(f"Fehler in manual_balance(): {str(e)}")
+        return redirect(url_for("index"))
+
+
+TRADES_PAGE_SIZE = 50
+TRADES_MAX_PAGE_SIZE = 500
+TRADES_EXPORT_CHUNK = 1000
+TRADE_COLUMNS = ["id", "timestamp", "asset", "amount_eur", "filled_asset", "avg_price", "order_id"]
+
+
+def _trade_filters(args, account_id):
+    """
+    Liest die Filter (asset, date_from, date_to im Format YYYY-MM-DD) aus den
+    Query-Parametern und baut daraus WHERE-Bedingungen + Parameter
+    (immer eingeschränkt auf das Konto). Ungültige Datumsangaben werden ignoriert.
+    """
+    filters = {
+        "asset": args.get("asset", "").strip().upper(),
+        "date_from": args.get("date_from", "").strip(),
+        "date_to": args.get("date_to", "").strip(),
+    }
+    where = ["account_id = ?"]
+    params = [account_id]
+    if filters["asset"]:
+        where.append("asset = ?")
+        params.append(filters["asset"])
+    for key in ("date_from", "date_to"):
+        try:
+            day = datetime.datetime.strptime(filters[key], "%Y-%m-%d")
+        except ValueError:
+            filters[key] = ""
+            continue
+        if key == "date_from":
+            where.append("timestamp >= ?")
+            params.append(day.strftime("%Y-%m-%d"))
+        else:
+            # bis einschließlich date_to
+            where.append("timestamp < ?")
+            params.append((day + timedelta(days=1)).strftime("%Y-%m-%d"))
+    return filters, where, params
+
+
+@app.route("/trades")
+def trades_list():
+    """
+    Trades seitenweise (Keyset-Pagination über die id, neueste zuerst):
+      ?before=<id> -> ältere Seite, ?after=<id> -> neuere Seite
+    """
+    filters, where, params = _trade_filters(request.args, current_account_id())
+    limit = min(max(request.args.get("limit", TRADES_PAGE_SIZE, type=int) or TRADES_PAGE_SIZE, 1),
+                TRADES_MAX_PAGE_SIZE)
+    before = request.args.get("before", type=int)
+    after = request.args.get("after", type=int)
+
+    if after is not None:
+        where.append("id > ?")
+        params.append(after)
+        order = "ASC"
+    else:
+        if before is not None:
+            where.append("id < ?")
+            params.append(before)
+        order = "DESC"
+
+    where_sql = ("WHERE " + " AND ".join(where)) if where else ""
+    with get_connection() as conn:
+        c = conn.cursor()
+        # Eine Zeile mehr holen, um zu wissen, ob es weitergeht
+        c.execute(f"""
+            SELECT id, timestamp, asset, amount_eur, filled_asset, avg_price, order_id
+            FROM trades
+            {where_sql}
+            ORDER BY id {order}
+            LIMIT ?
+        """, params + [limit + 1])
+        rows = c.fetchall()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if after is not None:
+        rows.reverse()
+        newer_id = rows[0][0] if has_more and rows else None
+        older_id = rows[-1][0] if rows else None
+    else:
+        newer_id = rows[0][0] if before is not None and rows else None
+        older_id = rows[-1][0] if has_more and rows else None
+
+    return render_template(
+        "trades.html",
+        rows=rows,
+        filters=filters,
+        limit=limit,
+        newer_id=newer_id,
+        older_id=older_id
+    )
+
+
+@app.route("/trades/export.<fmt>")
+def trades_export(fmt):
+    """
+    Streamt alle (gefilterten) Trades als CSV oder NDJSON. Die Zeilen werden
+    blockweise aus dem Cursor gelesen -> konstanter Speicherbedarf.
+    """
+    if fmt not in ("csv", "ndjson"):
+        return "Unbekanntes Format (csv oder ndjson)", 400
+
+    filters, where, params = _trade_filters(request.args, current_account_id())
+    where_sql = ("WHERE " + " AND ".join(where)) if where else ""
+    sql = f"""
+        SELECT id, timestamp, asset, amount_eur, filled_asset, avg_price, order_id
+        FROM trades
+        {where_sql}
+        ORDER BY id
+    """
+
+    def generate():
+        c = get_connection().cursor()
+        c.execute(sql, params)
+        if fmt == "csv":
+            buf = io.StringIO()
+            writer = csv.writer(buf)
+            writer.writerow(TRADE_COLUMNS)
+            while True:
+                rows = c.fetchmany(TRADES_EXPORT_CHUNK)
+                if rows:
+                    writer.writerows(rows)
+                yield buf.getvalue()
+                buf.seek(0)
+                buf.truncate()
+                if not rows:
+                    break
+        else:
+            while True:
+                rows = c.fetchmany(TRADES_EXPORT_CHUNK)
+                if not rows:
+                    break
+                yield "".join(
+                    json.dumps(dict(zip(TRADE_COLUMNS, row)), default=str) + "\n"
+                    for row in rows
+                )
+        c.close()
+
+    mimetype = "text/csv" if fmt == "csv" else "application/x-ndjson"
+    return Response(
+        stream_with_context(generate()),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename=trades.{fmt}"}
+    )
+
+
+########################################
+# 12) HTML-Templates
+#     -> Alle Seiten erben von layout.html. Die Templates werden beim Start
+#        einmal kompiliert (compile_templates) und landen zusätzlich im
+#        Bytecode-Cache, statt bei jedem Request per render_template_string
+#        geparst bzw. gehasht zu werden.
+########################################
+TEMPLATES = {
+    "layout.html": """
+<html>
+<head>
+  <meta charset="utf-8">
+  <title>{% block title %}Bitmaster{% endblock %}</title>
+</head>
+<body>
+{% block content %}{% endblock %}
+{% block back %}
+<hr>
+<p><a href="{{ url_for('index') }}">Zurück</a></p>
+{% endblock %}
+</body>
+</html>
+""",
+
+    "login.html": """
+{% extends "layout.html" %}
+{% block title %}Login - Bitmaster{% endblock %}
+{% block content %}
+<h1>Login</h1>
+<form method="POST" action="{{ url_for('do_login') }}">
+  <label>Passwort:</label>
+  <input type="password" name="password">
+  <button type="submit">Login</button>
+</form>
+{% endblock %}
+{% block back %}{% endblock %}
+""",
+
+    "index.html": """
+{% extends "layout.html" %}
+{% block content %}
+<h1>Bitvavo Invest Tool</h1>
+<p>Konto: <b>{{ current_account.name }}</b> (<a href="{{ url_for('accounts') }}">wechseln</a>)</p>
+
+{% with msgs = get_flashed_messages() %}
+{% if msgs %}
+  <ul style="color:green">
+  {% for m in msgs %}
+    <li>{{ m }}</li>
+  {% endfor %}
+  </ul>
+{% endif %}
+{% endwith %}
+
+<p>
+  <a href="{{ url_for('add_schedule') }}">Neuen Zeitplan anlegen</a> |
+  <a href="{{ url_for('manual_balance') }}">Kontostand abrufen</a> |
+  <a href="{{ url_for('trades_list') }}">Trades anzeigen</a> |
+  <a href="{{ url_for('portfolio') }}">Portfolio</a> |
+  <a href="{{ url_for('backtest') }}">Backtest</a> |
+  <a href="{{ url_for('optimizer') }}">Optimierer</a> |
+  <a href="{{ url_for('accounts') }}">Konten</a> |
+  <a href="{{ url_for('settings') }}">Einstellungen</a>
+</p>
+
+<h2>Aktuelle Zeitpläne</h2>
+{% if schedules_list %}
+<table border="1" cellpadding="4">
+  <tr><th>ID</th><th>Wochentag</th><th>Uhrzeit</th><th>Assets</th><th>Aktionen</th></tr>
+  {% for (sid, wd, tod, lines) in schedules_list %}
+  <tr>
+    <td>{{sid}}</td>
+    <td>{{wd}}</td>
+    <td>{{tod}}</td>
+    <td>
+      {% for (ast, amt) in lines %}
+        {{ast}}: {{amt}} EUR<br>
+      {% endfor %}
+    </td>
+    <td>
+      <a href="{{ url_for('edit_schedule', schedule_id=sid) }}">Bearbeiten</a> |
+      <a href="{{ url_for('delete_schedule', schedule_id=sid) }}"
+         onclick="return confirm('Wirklich löschen?');">Löschen</a>
+    </td>
+  </tr>
+  {% endfor %}
+</table>
+{% else %}
+  <p>Keine Zeitpläne angelegt</p>
+{% endif %}
+{% endblock %}
+{% block back %}{% endblock %}
+""",
+
+    "accounts.html": """
+{% extends "layout.html" %}
+{% block title %}Konten - Bitmaster{% endblock %}
+{% block content %}
+<h1>Konten</h1>
+
+{% with msgs = get_flashed_messages() %}
+{% if msgs %}
+  <ul style="color:green">
+  {% for m in msgs %}
+    <li>{{ m }}</li>
+  {% endfor %}
+  </ul>
+{% endif %}
+{% endwith %}
+
+<table border="1" cellpadding="4">
+  <tr><th>ID</th><th>Name</th><th>API-Key</th><th>Zeitpläne</th><th>Aktionen</th></tr>
+  {% for a in accounts %}
+  <tr>
+    <td>{{ a.id }}</td>
+    <td>{% if a.id == selected_id %}<b>{{ a.name }}</b>{% else %}{{ a.name }}{% endif %}</td>
+    <td>{{ a.api_key[:5] + "..." if a.api_key else "-" }}</td>
+    <td>{{ schedule_counts.get(a.id, 0) }}</td>
+    <td>
+      <form method="POST" style="display:inline">
+        <input type="hidden" name="account_id" value="{{ a.id }}">
+        <button type="submit" name="action" value="select">Auswählen</button>
+        <button type="submit" name="action" value="delete"
+                onclick="return confirm('Konto wirklich löschen?');">Löschen</button>
+      </form>
+    </td>
+  </tr>
+  {% endfor %}
+</table>
+
+<h2>Neues Konto</h2>
+<form method="POST">
+  <label>Name:</label>
+  <input type="text" name="name"><br><br>
+  <label>API Key:</label>
+  <input type="text" name="api_key"><br><br>
+  <label>API Secret:</label>
+  <input type="text" name="api_secret"><br><br>
+  <button type="submit" name="action" value="add">Anlegen</button>
+</form>
+<p><small>
+  Dispatcher: {{ dispatcher_stats.lanes }} aktive Spuren, {{ dispatcher_stats.pending }} Jobs offen,
+  {{ dispatcher_stats.completed }} erledigt, {{ dispatcher_stats.failed }} fehlgeschlagen
+</small></p>
+{% endblock %}
+""",
+
+    "settings.html": """
+{% extends "layout.html" %}
+{% block title %}Einstellungen - Bitmaster{% endblock %}
+{% block content %}
+<h1>Einstellungen</h1>
+<hr>
+
+<h2>API-Key-Einstellungen (Konto {{ account.name }})</h2>
+<form method="POST">
+  <p>Aktueller API-Key (maskiert): {{ mask_key }}</p>
+  <p>Aktueller Secret (maskiert): {{ mask_secret }}</p>
+  <label>API Key:</label>
+  <input type="text" name="api_key" value=""><br><br>
+  <label>API Secret:</label>
+  <input type="text" name="api_secret" value=""><br><br>
+
+  <button type="submit" name="action" value="save_api">Speichern</button>
+  <button type="submit" name="action" value="delete_api"
+          onclick="return confirm('API-Keys wirklich löschen?');">
+    Löschen
+  </button>
+</form>
+<p><small>
+  Client-Cache: {{ client_stats.cache_hits }} Treffer / {{ client_stats.cache_misses }} Neuaufbauten,
+  Verbindungs-Wiederverwendung {{ "%.0f"|format(client_stats.connection_reuse_rate * 100) }} %,
+  Ø Request {{ "%.0f"|format(client_stats.avg_request_seconds * 1000) }} ms,
+  eingespart ~{{ "%.2f"|format(client_stats.saved_seconds) }} s<br>
+  Einstellungs-Cache: {{ settings_stats.hits }} Treffer / {{ settings_stats.misses }} Fehlzugriffe
+  (Version {{ settings_stats.version }})
+</small></p>
+<hr>
+
+<h2>E-Mail-Einstellungen</h2>
+<form method="POST">
+  SMTP-Server:<br>
+  <input type="text" name="smtp_server"
+         value="{{ mail_settings.smtp_server if mail_settings else 'smtp.gmail.com' }}"><br><br>
+
+  SMTP-Port (587 für STARTTLS, 465 für SSL):<br>
+  <input type="number" name="smtp_port"
+         value="{{ mail_settings.smtp_port if mail_settings else '587' }}"><br><br>
+
+  SMTP-User:<br>
+  <input type="text" name="smtp_user"
+         value="{{ mail_settings.smtp_user if mail_settings else '' }}"><br><br>
+
+  SMTP-Passwort:<br>
+  <input type="password" name="smtp_pass" value="">
+  <small>(Leer lassen, wenn nicht ändern)</small><br><br>
+
+  Absender (From):<br>
+  <input type="text" name="from_email"
+         value="{{ mail_settings.from_email if mail_settings else '' }}"><br><br>
+
+  Empfänger (To):<br>
+  <input type="text" name="to_email"
+         value="{{ mail_settings.to_email if mail_settings else '' }}"><br><br>
+
+  <label>
+    <input type="checkbox" name="send_on_success"
+           {% if mail_settings and mail_settings.send_on_success %}checked{% endif %}>
+    E-Mail bei erfolgreichem Trade
+  </label><br>
+
+  <label>
+    <input type="checkbox" name="send_on_error"
+           {% if mail_settings and mail_settings.send_on_error %}checked{% endif %}>
+    E-Mail bei Fehler
+  </label><br>
+
+  <label>
+    <input type="checkbox" name="use_tls"
+           {% if mail_settings and mail_settings.use_tls %}checked{% endif %}>
+    STARTTLS aktivieren
+  </label><br><br>
+
+  <button type="submit" name="action" value="save_email">Speichern</button>
+  <button type="submit" name="action" value="test_email">Test-E-Mail senden</button>
+</form>
+{% endblock %}
+{% block back %}
+<hr>
+<p><a href="{{ url_for('index') }}">Zurück zum Hauptmenü</a></p>
+{% endblock %}
+""",
+
+    "add_schedule.html": """
+{% extends "layout.html" %}
+{% block title %}Neuer Zeitplan - Bitmaster{% endblock %}
+{% block content %}
+<h1>Neuen Zeitplan anlegen</h1>
+<form method="POST">
+  <label>Wochentag:</label>
+  <select name="weekday">
+    {% for day in ["Monday","Tuesday","Wednesday","Thursday","Friday","Saturday","Sunday"] %}
+      <option value="{{ day }}" {% if day == default_day %}selected{% endif %}>{{ day }}</option>
+    {% endfor %}
+  </select><br><br>
+
+  <label>Uhrzeit (HH:MM):</label>
+  <input type="text" name="time_of_day" value="{{ default_time }}"><br><br>
+
+  <hr>
+  <p>Bis zu 3 Orders definieren:</p>
+  <table>
+    <tr><th>Asset</th><th>EUR</th></tr>
+    {% for i in range(3) %}
+    <tr>
+      <td>
+        <select name="asset">
+          <option value="">-- bitte wählen --</option>
+          {% for coin in allowed_assets %}
+            <option value="{{ coin }}">{{ coin }}</option>
+          {% endfor %}
+        </select>
+      </td>
+      <td><input type="number" step="0.01" name="amount_eur"></td>
+    </tr>
+    {% endfor %}
+  </table>
+  <br>
+  <button type="submit">Speichern</button>
+</form>
+{% endblock %}
+""",
+
+    "edit_schedule.html": """
+{% extends "layout.html" %}
+{% block title %}Zeitplan bearbeiten - Bitmaster{% endblock %}
+{% block content %}
+<h1>Zeitplan {{ schedule_id }} bearbeiten</h1>
+<form method="POST">
+  <label>Wochentag:</label>
+  <select name="weekday">
+    {% for day in ["Monday","Tuesday","Wednesday","Thursday","Friday","Saturday","Sunday"] %}
+      <option value="{{ day }}" {% if day == wd %}selected{% endif %}>{{ day }}</option>
+    {% endfor %}
+  </select><br><br>
+
+  <label>Uhrzeit (HH:MM):</label>
+  <input type="text" name="time_of_day" value="{{ tod }}"><br><br>
+
+  <hr>
+  <p>Bis zu 3 Orders definieren:</p>
+  <table>
+    <tr><th>Asset</th><th>EUR</th></tr>
+    {% for (ast, amt) in lines %}
+    <tr>
+      <td>
+        <select name="asset">
+          <option value="">-- bitte wählen --</option>
+          {% for coin in allowed_assets %}
+            <option value="{{ coin }}" {% if coin == ast %}selected{% endif %}>{{ coin }}</option>
+          {% endfor %}
+        </select>
+      </td>
+      <td><input type="number" step="0.01" name="amount_eur" value="{{ amt }}"></td>
+    </tr>
+    {% endfor %}
+  </table>
+  <br>
+  <button type="submit">Änderungen speichern</button>
+</form>
+{% endblock %}
+""",
+
+    "portfolio.html": """
+{% extends "layout.html" %}
+{% block title %}Portfolio - Bitmaster{% endblock %}
+{% block content %}
+<h1>Portfolio</h1>
+{% if data.assets %}
+  <p>
+    Investiert: {{ "%.2f"|format(data.totals.invested_eur) }} EUR |
+    Wert: {{ "%.2f"|format(data.totals.value_eur) }} EUR |
+    G/V: {{ "%.2f"|format(data.totals.pnl_eur) }} EUR
+    {% if data.totals.pnl_pct is not none %}({{ "%.2f"|format(data.totals.pnl_pct) }} %){% endif %}
+  </p>
+  <p>
+    Zeitgewichtete Rendite (TWR): {{ "%.2f"|format(data.twr * 100) }} % |
+    Geldgewichtete Rendite (MWR p.a.):
+    {% if data.mwr is not none %}{{ "%.2f"|format(data.mwr * 100) }} %{% else %}-{% endif %}
+  </p>
+  <table border="1" cellpadding="4">
+    <tr>
+      <th>Asset</th><th>Menge</th><th>Investiert</th><th>Ø Einstand</th>
+      <th>Kurs</th><th>Wert</th><th>G/V</th><th>G/V %</th>
+    </tr>
+    {% for a in data.assets %}
+    <tr>
+      <td>{{ a.asset }}</td>
+      <td>{{ "%.6f"|format(a.units) }}</td>
+      <td>{{ "%.2f"|format(a.invested_eur) }}</td>
+      <td>{{ "%.4f"|format(a.avg_cost_eur) }}</td>
+      <td>{{ "%.4f"|format(a.price_eur) }}</td>
+      <td>{{ "%.2f"|format(a.value_eur) }}</td>
+      <td>{{ "%.2f"|format(a.pnl_eur) }}</td>
+      <td>{% if a.pnl_pct is not none %}{{ "%.2f"|format(a.pnl_pct) }}{% endif %}</td>
+    </tr>
+    {% endfor %}
+  </table>
+
+  <h2>Equity-Kurve</h2>
+  <p>
+    {{ data.equity_curve.dates[0] }} bis {{ data.equity_curve.dates[-1] }}
+    (<span style="color:blue">Wert</span>, <span style="color:gray">investiert</span>)
+  </p>
+  <svg width="600" height="150" style="border:1px solid #ccc">
+    <polyline fill="none" stroke="gray" points="{{ invested_points }}"/>
+    <polyline fill="none" stroke="blue" points="{{ value_points }}"/>
+  </svg>
+  <p><small>Berechnet in {{ "%.1f"|format(data.computed_ms) }} ms |
+    <a href="{{ url_for('api_portfolio') }}">JSON</a></small></p>
+{% else %}
+  <p>Noch keine Trades vorhanden.</p>
+{% endif %}
+{% endblock %}
+""",
+
+    "backtest.html": """
+{% extends "layout.html" %}
+{% block title %}Backtest - Bitmaster{% endblock %}
+{% block content %}
+<h1>Backtest der Zeitpläne</h1>
+{% with msgs = get_flashed_messages() %}
+{% if msgs %}
+  <ul style="color:red">{% for m in msgs %}<li>{{ m }}</li>{% endfor %}</ul>
+{% endif %}
+{% endwith %}
+<form method="GET">
+  Zeitpläne:
+  {% for (sid, wd, tod, lines) in schedules_list %}
+    <label><input type="checkbox" name="schedule_id" value="{{ sid }}"
+      {% if params.schedule_ids and sid in params.schedule_ids %}checked{% endif %}>
+      #{{ sid }} {{ wd }}</label>
+  {% endfor %}
+  <br>
+  von: <input type="date" name="start" value="{{ params.start or '' }}">
+  bis: <input type="date" name="end" value="{{ params.end or '' }}">
+  Gebühr %: <input type="text" name="fee_pct" value="{{ params.fee_pct }}" size="5">
+  Slippage %: <input type="text" name="slippage_pct" value="{{ params.slippage_pct }}" size="5">
+  alle <input type="text" name="every_weeks" value="{{ params.every_weeks }}" size="2"> Wochen
+  <button type="submit">Starten</button>
+</form>
+<p><small>Ohne Auswahl werden alle Zeitpläne zusammen gerechnet.
+  Kurse aus historical_rates (ggf. per backfill-candles ergänzen).</small></p>
+
+{% if data %}
+  <p>
+    {{ data.params.start }} bis {{ data.params.end }}: {{ data.buys }} Käufe |
+    Investiert: {{ "%.2f"|format(data.totals.invested_eur) }} EUR |
+    Wert: {{ "%.2f"|format(data.totals.value_eur) }} EUR |
+    G/V: {{ "%.2f"|format(data.totals.pnl_eur) }} EUR
+    {% if data.totals.pnl_pct is not none %}({{ "%.2f"|format(data.totals.pnl_pct) }} %){% endif %}
+  </p>
+  <p>
+    Gebühren: {{ "%.2f"|format(data.totals.fees_eur) }} EUR |
+    ohne Kurs übersprungen: {{ "%.2f"|format(data.totals.skipped_eur) }} EUR |
+    TWR: {{ "%.2f"|format(data.twr * 100) }} % |
+    MWR p.a.: {% if data.mwr is not none %}{{ "%.2f"|format(data.mwr * 100) }} %{% else %}-{% endif %} |
+    Max. Drawdown: {{ "%.2f"|format(data.max_drawdown * 100) }} %
+  </p>
+  <table border="1" cellpadding="4">
+    <tr>
+      <th>Asset</th><th>Menge</th><th>Investiert</th><th>Ø Einstand</th>
+      <th>Kurs</th><th>Wert</th><th>G/V</th><th>G/V %</th>
+    </tr>
+    {% for a in data.assets %}
+    <tr>
+      <td>{{ a.asset }}</td>
+      <td>{{ "%.6f"|format(a.units) }}</td>
+      <td>{{ "%.2f"|format(a.invested_eur) }}</td>
+      <td>{{ "%.4f"|format(a.avg_cost_eur) }}</td>
+      <td>{{ "%.4f"|format(a.price_eur) }}</td>
+      <td>{{ "%.2f"|format(a.value_eur) }}</td>
+      <td>{{ "%.2f"|format(a.pnl_eur) }}</td>
+      <td>{% if a.pnl_pct is not none %}{{ "%.2f"|format(a.pnl_pct) }}{% endif %}</td>
+    </tr>
+    {% endfor %}
+  </table>
+  <svg width="600" height="150" style="border:1px solid #ccc">
+    <polyline fill="none" stroke="gray" points="{{ invested_points }}"/>
+    <polyline fill="none" stroke="blue" points="{{ value_points }}"/>
+  </svg>
+  <p><small>Berechnet in {{ "%.1f"|format(data.computed_ms) }} ms</small></p>
+{% elif request.args %}
+  <p>Keine Zeitpläne oder keine Kurse im gewählten Zeitraum.</p>
+{% endif %}
+{% endblock %}
+""",
+
+    "optimizer.html": """
+{% extends "layout.html" %}
+{% block title %}Optimierer - Bitmaster{% endblock %}
+{% block content %}
+{% if run %}
+  {% if run.status == "running" %}<meta http-equiv="refresh" content="2">{% endif %}
+  <h1>Optimierer-Lauf {{ run.id }}</h1>
+  <p>
+    Status: {{ run.status }}{% if run.error %} ({{ run.error }}){% endif %} |
+    {{ run.done }} / {{ run.total }} Varianten ({{ "%.0f"|format(run.percent) }} %) |
+    {{ "%.1f"|format(run.elapsed_seconds) }} s, {{ "%.0f"|format(run.backtests_per_second) }} Backtests/s
+  </p>
+  {% if run.status == "running" %}
+  <form method="POST" action="{{ url_for('optimizer_cancel', run_id=run.id) }}">
+    <button type="submit">Abbrechen</button>
+  </form>
+  {% endif %}
+  <p>Sortiert nach {{ run.params.metric }}, Wochenbudget {{ "%.2f"|format(run.params.weekly_budget_eur) }} EUR</p>
+  <table border="1" cellpadding="4">
+    <tr>
+      <th>#</th><th>Wochentag</th><th>alle n Wochen</th>
+      {% for a in assets %}<th>{{ a }} %</th>{% endfor %}
+      <th>Investiert</th><th>Wert</th><th>G/V %</th><th>TWR %</th><th>MWR %</th><th>Max. DD %</th>
+    </tr>
+    {% for r in run.results %}
+    <tr>
+      <td>{{ r.rank }}</td><td>{{ r.weekday }}</td><td>{{ r.every_weeks }}</td>
+      {% for a in assets %}<td>{{ r.weights[a] }}</td>{% endfor %}
+      <td>{{ "%.2f"|format(r.invested_eur) }}</td>
+      <td>{{ "%.2f"|format(r.value_eur) }}</td>
+      <td>{% if r.pnl_pct is not none %}{{ "%.2f"|format(r.pnl_pct) }}{% endif %}</td>
+      <td>{{ "%.2f"|format(r.twr * 100) }}</td>
+      <td>{% if r.mwr is not none %}{{ "%.2f"|format(r.mwr * 100) }}{% endif %}</td>
+      <td>{{ "%.2f"|format(r.max_drawdown * 100) }}</td>
+    </tr>
+    {% endfor %}
+  </table>
+  <p><small><a href="{{ url_for('api_optimizer', run_id=run.id) }}">JSON</a> |
+    <a href="{{ url_for('optimizer') }}">Neuer Lauf</a></small></p>
+{% else %}
+  <h1>Optimierer</h1>
+  {% with msgs = get_flashed_messages() %}
+  {% if msgs %}
+    <ul style="color:red">{% for m in msgs %}<li>{{ m }}</li>{% endfor %}</ul>
+  {% endif %}
+  {% endwith %}
+  <form method="POST">
+    Zeitpläne (Assets + Wochenbudget):
+    {% for (sid, wd, tod, lines) in schedules_list %}
+      <label><input type="checkbox" name="schedule_id" value="{{ sid }}"> #{{ sid }} {{ wd }}</label>
+    {% endfor %}
+    <br>
+    Wochentage:
+    {% for wd in weekdays %}
+      <label><input type="checkbox" name="weekday" value="{{ wd }}"> {{ wd }}</label>
+    {% endfor %}
+    <br>
+    von: <input type="date" name="start"> bis: <input type="date" name="end">
+    Raster %: <input type="text" name="split_step" value="10" size="3">
+    Rhythmus (Wochen): <input type="text" name="cadences" value="1,2,4" size="6">
+    Kennzahl:
+    <select name="metric">
+      {% for m in metrics %}<option value="{{ m }}">{{ m }}</option>{% endfor %}
+    </select>
+    <button type="submit">Starten</button>
+  </form>
+  <p><small>Ohne Auswahl: alle Zeitpläne bzw. alle Wochentage.</small></p>
+  {% if runs %}
+  <h2>Letzte Läufe</h2>
+  <ul>
+    {% for r in runs %}
+      <li><a href="{{ url_for('optimizer_status', run_id=r.id) }}">{{ r.id }}</a>:
+        {{ r.status }}, {{ r.done }} / {{ r.total }}</li>
+    {% endfor %}
+  </ul>
+  {% endif %}
+{% endif %}
+{% endblock %}
+""",
+
+    "balance.html": """
+{% extends "layout.html" %}
+{% block title %}Kontostand - Bitmaster{% endblock %}
+{% block content %}
+<h1>Kontostand</h1>
+<h2>Aktuell ({{ now_str }})</h2>
+{% if current_balance %}
+  <ul>
+    {% for sym, amt in current_balance.items() %}
+      <li>{{ sym }}: {{ amt }}</li>
+    {% endfor %}
+  </ul>
+{% else %}
+  <p>Kein Guthaben oder kein Zugriff.</p>
+{% endif %}
+
+<hr>
+<h2>Zuletzt abgerufener Kontostand{% if last_ts %} ({{ last_ts }}){% endif %}</h2>
+{% if old_balance %}
+  <ul>
+    {% for sym, amt in old_balance.items() %}
+      <li>{{ sym }}: {{ amt }}</li>
+    {% endfor %}
+  </ul>
+{% else %}
+  <p>Kein älterer Kontostand vorhanden.</p>
+{% endif %}
+{% endblock %}
+""",
+
+    "trades.html": """
+{% extends "layout.html" %}
+{% block title %}Trades - Bitmaster{% endblock %}
+{% block content %}
+<h1>Liste der Trades</h1>
+<form method="GET">
+  Asset: <input type="text" name="asset" value="{{ filters.asset }}" size="6">
+  von: <input type="date" name="date_from" value="{{ filters.date_from }}">
+  bis: <input type="date" name="date_to" value="{{ filters.date_to }}">
+  <button type="submit">Filtern</button>
+  <a href="{{ url_for('trades_list') }}">Zurücksetzen</a>
+</form>
+<p>
+  Export:
+  <a href="{{ url_for('trades_export', fmt='csv', **filters) }}">CSV</a> |
+  <a href="{{ url_for('trades_export', fmt='ndjson', **filters) }}">NDJSON</a>
+</p>
+{% if rows %}
+  <table border="1">
+    <tr>
+      <th>Datum</th>
+      <th>Asset</th>
+      <th>EUR</th>
+      <th>Menge</th>
+      <th>Preis</th>
+      <th>OrderID</th>
+    </tr>
+    {% for (tid, ts, ast, amt_eur, fill_amt, avg_pr, oid) in rows %}
+    <tr>
+      <td>{{ ts }}</td>
+      <td>{{ ast }}</td>
+      <td>{{ amt_eur }}</td>
+      <td>{{ fill_amt }}</td>
+      <td>{{ avg_pr }}</td>
+      <td>{{ oid }}</td>
+    </tr>
+    {% endfor %}
+  </table>
+  <p>
+    {% if newer_id %}
+      <a href="{{ url_for('trades_list', after=newer_id, limit=limit, **filters) }}">&laquo; Neuere</a>
+    {% endif %}
+    {% if older_id %}
+      <a href="{{ url_for('trades_list', before=older_id, limit=limit, **filters) }}">Ältere &raquo;</a>
+    {% endif %}
+  </p>
+{% else %}
+  <p>Keine Trades in der DB</p>
+{% endif %}
+{% endblock %}
+""",
+}
+
+# Verzeichnis für den Jinja-Bytecode-Cache (Standard: System-Tempverzeichnis)
+TEMPLATE_CACHE_DIR = os.environ.get("TEMPLATE_CACHE_DIR") or None
+
+app.jinja_options = dict(
+    app.jinja_options,
+    loader=DictLoader(TEMPLATES),
+    bytecode_cache=FileSystemBytecodeCache(TEMPLATE_CACHE_DIR)
+)
+
+
+def compile_templates():
+    """
+    Kompiliert alle Templates vorab, damit der erste Request nicht wartet.
+    """
+    for name in TEMPLATES:
+        app.jinja_env.get_template(name)
+    logging.info(f"{len(TEMPLATES)} Templates kompiliert.")
+
+
+# Seiten für benchmark_templates (GET, ohne Börsenzugriff)
+TEMPLATE_BENCH_PATHS = ["/login", "/", "/settings", "/accounts", "/add_schedule", "/edit_schedule/{schedule_id}",
+                        "/trades", "/portfolio", "/backtest"]
+
+
+def _render_template_uncompiled(template_name, **context):
+    # frühere Variante: Quelltext bei jedem Request neu parsen und kompilieren
+    return render_template_string(TEMPLATES[template_name], **context)
+
+
+def benchmark_templates(requests_per_route=200):
+    """
+    Latenz (ms, p50/p95) je Seite, einmal mit den vorkompilierten Templates und
+    einmal mit render_template_string je Request. Erwartet eine Simulations-DB
+    (siehe _use_simulation_copy); legt bei Bedarf einen Zeitplan an.
+    """
+    global render_template
+    with get_connection() as conn:
+        row = conn.execute("SELECT id FROM schedules WHERE account_id = ? LIMIT 1", (DEFAULT_ACCOUNT_ID,)).fetchone()
+        if row is None:
+            c = conn.cursor()
+            c.execute("INSERT INTO schedules (account_id, weekday, time_of_day) VALUES (?, 'Monday', '08:00')",
+                      (DEFAULT_ACCOUNT_ID,))
+            c.execute("INSERT INTO schedule_lines (schedule_id, asset, amount_eur) VALUES (?, 'BTC', 10)", (c.lastrowid,))
+            bump_change_counter(c, "schedules")
+            row = (c.lastrowid,)
+    paths = [path.format(schedule_id=row[0]) for path in TEMPLATE_BENCH_PATHS]
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session["logged_in"] = True
+    compile_templates()
+
+    def measure(path):
+        latencies = []
+        for _ in range(requests_per_route):
+            started = time.perf_counter()
+            response = client.get(path)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code != 200:
+                raise Exception(f"{path}: HTTP {response.status_code}")
+        latencies.sort()
+        return _percentile(latencies, 0.5) * 1000, _percentile(latencies, 0.95) * 1000
+
+    compiled = render_template
+    results = {}
+    try:
+        for path in paths:
+            render_template = _render_template_uncompiled
+            before = measure(path)
+            render_template = compiled
+            results[path] = {"before": before, "after": measure(path)}
+    finally:
+        render_template = compiled
+    return results
+
+
+########################################
+# 13) Portfolio-Analyse
+#     -> Trades und historische Kurse liegen als NumPy-Arrays im Speicher
+#        (neue Trades werden inkrementell nachgeladen). Alle Kennzahlen werden
+#        vektorisiert berechnet, ohne Python-Schleifen über Trades oder Tage.
+########################################
+# Kurs-Cache spätestens nach so vielen Sekunden neu laden
+PORTFOLIO_RATES_TTL = 300
+
+
+class PortfolioData:
+    """
+    Spaltenweiser Speicher der Trades (account, day, asset_idx, eur, units, price)
+    aller Konten und der historischen Kurse. Trades werden über die id inkrementell ergänzt;
+    Kurse werden bei invalidate_rates() bzw. nach PORTFOLIO_RATES_TTL neu gelesen.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.assets = []          # Index -> Asset
+        self._asset_index = {}    # Asset -> Index
+        self.last_trade_id = 0
+        self.trade_account = np.zeros(0, dtype=np.int64)
+        self.trade_day = np.zeros(0, dtype=np.int64)      # Tage seit 1970-01-01
+        self.trade_asset = np.zeros(0, dtype=np.int64)
+        self.trade_eur = np.zeros(0, dtype=np.float64)
+        self.trade_units = np.zeros(0, dtype=np.float64)
+        self.trade_price = np.zeros(0, dtype=np.float64)
+        self._rates = None
+        self._rates_loaded_at = 0.0
+
+    def _asset_ids(self, names):
+        ids = []
+        for name in names:
+            idx = self._asset_index.get(name)
+            if idx is None:
+                idx = len(self.assets)
+                self.assets.append(name)
+                self._asset_index[name] = idx
+            ids.append(idx)
+        return np.array(ids, dtype=np.int64)
+
+    def refresh_trades(self):
+        with get_connection() as conn:
+            rows = conn.execute("""
+                SELECT id, account_id, substr(timestamp, 1, 10), asset, amount_eur, filled_asset, avg_price
+                FROM trades
+                WHERE id > ?
+                ORDER BY id
+            """, (self.last_trade_id,)).fetchall()
+        if not rows:
+            return
+
+        ids, accounts, days, assets, eur, units, price = zip(*rows)
+        self.last_trade_id = ids[-1]
+        self.trade_account = np.concatenate([self.trade_account, np.array(accounts, dtype=np.int64)])
+        self.trade_day = np.concatenate([
+            self.trade_day, np.array(days, dtype="datetime64[D]").astype(np.int64)
+        ])
+        self.trade_asset = np.concatenate([self.trade_asset, self._asset_ids(assets)])
+        self.trade_eur = np.concatenate([self.trade_eur, np.array(eur, dtype=np.float64)])
+        self.trade_units = np.concatenate([self.trade_units, np.array(units, dtype=np.float64)])
+        self.trade_price = np.concatenate([self.trade_price, np.array(price, dtype=np.float64)])
+
+    def refresh_rates(self):
+        if self._rates is not None and time.monotonic() - self._rates_loaded_at < PORTFOLIO_RATES_TTL:
+            return
+        with get_connection() as conn:
+            rows = conn.execute("SELECT date, asset, price_eur FROM historical_rates").fetchall()
+        if rows:
+            days, assets, prices = zip(*rows)
+            self._rates = (
+                np.array(days, dtype="datetime64[D]").astype(np.int64),
+                self._asset_ids(assets),
+                np.array(prices, dtype=np.float64),
+            )
+        else:
+            empty = np.zeros(0, dtype=np.int64)
+            self._rates = (empty, empty, np.zeros(0, dtype=np.float64))
+        self._rates_loaded_at = time.monotonic()
+
+    def invalidate_rates(self):
+        with self._lock:
+            self._rates = None
+
+    def snapshot(self):
+        """
+        Aktueller Stand (Trades + Kurse) als Tupel von Arrays.
+        """
+        with self._lock:
+            self.refresh_trades()
+            self.refresh_rates()
+            return (
+                list(self.assets), self.trade_account,
+                self.trade_day, self.trade_asset, self.trade_eur,
+                self.trade_units, self.trade_price, self._rates
+            )
+
+
+portfolio_data = PortfolioData()
+
+
+def _forward_fill(matrix):
+    """
+    Füllt NaN-Lücken je Spalte mit dem letzten bekannten Wert (vektorisiert).
+    """
+    valid = ~np.isnan(matrix)
+    idx = np.where(valid, np.arange(matrix.shape[0])[:, None], 0)
+    np.maximum.accumulate(idx, axis=0, out=idx)
+    return matrix[idx, np.arange(matrix.shape[1])]
+
+
+def build_price_matrix(start_day, n_days, n_assets, trade_day, trade_asset, trade_price, rates):
+    """
+    Kursmatrix [Tag x Asset] ab start_day: historische Kurse, ergänzt um die
+    Ausführungspreise der Trades (für Tage ohne Kurs), vorwärts aufgefüllt.
+    Vor dem ersten Trade eines Assets ist der Bestand 0, Lücken dort werden 0.
+    """
+    prices = np.full((n_days, n_assets), np.nan)
+    mask = trade_price > 0
+    prices[trade_day[mask] - start_day, trade_asset[mask]] = trade_price[mask]
+
+    rate_day, rate_asset, rate_price = rates
+    in_range = (rate_day >= start_day) & (rate_day < start_day + n_days)
+    prices[rate_day[in_range] - start_day, rate_asset[in_range]] = rate_price[in_range]
+    return np.nan_to_num(_forward_fill(prices), nan=0.0)
+
+
+def _xirr(flow_days, flows, guess=0.1):
+    """
+    Geldgewichtete Rendite p.a. (XIRR) per Newton-Verfahren. Die Summen über
+    alle Cashflows sind vektorisiert, nur die Iterationen laufen in Python.
+    """
+    if len(flows) < 2 or not (flows < 0).any() or not (flows > 0).any():
+        return None
+    years = (flow_days - flow_days[0]) / 365.0
+    rate = guess
+    with np.errstate(over="ignore", divide="ignore", invalid="ignore"):
+        for _ in range(100):
+            base = 1.0 + rate
+            if base <= 0:
+                return None
+            disc = base ** -years
+            npv = np.sum(flows * disc)
+            d_npv = np.sum(-years * flows * disc / base)
+            if d_npv == 0:
+                return None
+            step = npv / d_npv
+            if not np.isfinite(step):
+                return None
+            rate -= step
+            if abs(step) < 1e-10:
+                return float(rate)
+    return None
+
+
+def _curve_returns(daily_flow, value_curve):
+    """
+    TWR und MWR (p.a.) aus täglichen Einzahlungen und Tageswerten.
+    """
+    n_days = len(value_curve)
+
+    # TWR: Tagesrenditen ohne Einzahlungen verketten
+    prev_value = np.concatenate([[0.0], value_curve[:-1]])
+    valid = prev_value > 0
+    daily_ret = np.ones(n_days)
+    daily_ret[valid] = (value_curve[valid] - daily_flow[valid]) / prev_value[valid]
+    twr = float(np.prod(daily_ret) - 1.0)
+
+    # MWR: Einzahlungen negativ, heutiger Wert positiv
+    flow_days = np.flatnonzero(daily_flow)
+    flows = -daily_flow[flow_days]
+    flow_days = np.append(flow_days, n_days - 1).astype(np.float64)
+    flows = np.append(flows, value_curve[-1])
+    mwr = _xirr(flow_days, flows)
+    return twr, mwr
+
+
+def _portfolio_result(assets, units, invested, last_price):
+    """
+    Asset-Tabelle (nach Wert absteigend) und Summen für compute_portfolio*().
+    """
+    value = units * last_price
+    avg_cost = np.divide(invested, units, out=np.zeros(len(assets)), where=units > 0)
+    result = {"assets": [], "twr": None, "mwr": None}
+    for i in np.argsort(-value):
+        result["assets"].append({
+            "asset": assets[i],
+            "units": float(units[i]),
+            "invested_eur": float(invested[i]),
+            "avg_cost_eur": float(avg_cost[i]),
+            "price_eur": float(last_price[i]),
+            "value_eur": float(value[i]),
+            "pnl_eur": float(value[i] - invested[i]),
+            "pnl_pct": float((value[i] - invested[i]) / invested[i] * 100) if invested[i] else None,
+        })
+
+    total_invested = float(invested.sum())
+    total_value = float(value.sum())
+    result["totals"] = {
+        "invested_eur": total_invested,
+        "value_eur": total_value,
+        "pnl_eur": total_value - total_invested,
+        "pnl_pct": (total_value - total_invested) / total_invested * 100 if total_invested else None,
+    }
+    return result
+
+
+def compute_portfolio(account_id, current_prices=None):
+    """
+    Kennzahlen des Portfolios von account_id:
+      - je Asset: Menge, investierte EUR, Ø-Einstandspreis, aktueller Wert, unrealisierter G/V
+      - gesamt: investiert, Wert, G/V, zeitgewichtete (TWR) und geldgewichtete Rendite (MWR, p.a.)
+      - tägliche Equity-Kurve (investiert + Wert)
+    current_prices: optional {ASSET: preis} (sonst letzter bekannter Kurs).
+    """
+    start = time.perf_counter()
+    (assets, trade_account, trade_day, trade_asset, trade_eur,
+     trade_units, trade_price, rates) = portfolio_data.snapshot()
+
+    # Nur die Trades des Kontos; Asset-Indizes auf dessen Assets verdichten
+    mine = trade_account == account_id
+    used, trade_asset = np.unique(trade_asset[mine], return_inverse=True)
+    trade_day, trade_eur = trade_day[mine], trade_eur[mine]
+    trade_units, trade_price = trade_units[mine], trade_price[mine]
+    remap = np.full(len(assets), -1, dtype=np.int64)
+    remap[used] = np.arange(len(used))
+    rate_day, rate_asset, rate_price = rates
+    known = remap[rate_asset] >= 0
+    rates = (rate_day[known], remap[rate_asset[known]], rate_price[known])
+    assets = [assets[i] for i in used]
+
+    n_assets = len(assets)
+    result = {
+        "assets": [],
+        "totals": {"invested_eur": 0.0, "value_eur": 0.0, "pnl_eur": 0.0, "pnl_pct": None},
+        "twr": None,
+        "mwr": None,
+        "equity_curve": {"dates": [], "invested": [], "value": []},
+    }
+    if len(trade_day) == 0:
+        result["computed_ms"] = (time.perf_counter() - start) * 1000
+        return result
+
+    today = int(np.datetime64(datetime.date.today(), "D").astype(np.int64))
+    start_day = int(trade_day.min())
+    n_days = max(today, int(trade_day.max())) - start_day + 1
+
+    # Je Asset
+    units = np.bincount(trade_asset, weights=trade_units, minlength=n_assets)
+    invested = np.bincount(trade_asset, weights=trade_eur, minlength=n_assets)
+    prices = build_price_matrix(start_day, n_days, n_assets, trade_day, trade_asset, trade_price, rates)
+    last_price = prices[-1].copy()
+    if current_prices:
+        for (name, price) in current_prices.items():
+            if name in assets and price:
+                last_price[assets.index(name)] = price
+
+    # Tägliche Bestände: Zuflüsse je (Tag, Asset) per bincount, dann kumulieren
+    flat = (trade_day - start_day) * n_assets + trade_asset
+    holdings = np.bincount(flat, weights=trade_units, minlength=n_days * n_assets)
+    holdings = holdings.reshape(n_days, n_assets).cumsum(axis=0)
+    daily_flow = np.bincount(trade_day - start_day, weights=trade_eur, minlength=n_days)
+    invested_curve = daily_flow.cumsum()
+    prices[-1] = last_price
+    value_curve = (holdings * prices).sum(axis=1)
+
+    twr, mwr = _curve_returns(daily_flow, value_curve)
+
+    result.update(_portfolio_result(assets, units, invested, last_price))
+    result["twr"] = twr
+    result["mwr"] = mwr
+    dates = np.arange(start_day, start_day + n_days).astype("datetime64[D]").astype(str)
+    result["equity_curve"] = {
+        "dates": dates.tolist(),
+        "invested": invested_curve.round(2).tolist(),
+        "value": value_curve.round(2).tolist(),
+    }
+    result["computed_ms"] = (time.perf_counter() - start) * 1000
+    return result
+
+
+def _svg_points(values, width=600, height=150):
+    """
+    Punkte für eine SVG-Polyline (für die Equity-Kurve auf /portfolio).
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if len(values) < 2:
+        return ""
+    top = values.max() or 1.0
+    xs = np.linspace(0, width, len(values))
+    ys = height - values / top * height
+    return " ".join(f"{x:.1f},{y:.1f}" for (x, y) in zip(xs, ys))
+
+
+########################################
+# 13a) Materialisierte Tages-Snapshots
+########################################
+# portfolio_snapshots enthält je Konto und Asset eine Zeile pro Tag, vom ersten
+# Trade des Assets im Konto bis zum jüngsten Ereignis (Trade des Kontos oder Kurs). Neue Trades und
+# Kurse aktualisieren nur die betroffenen Tage/Assets; rebuild_portfolio_snapshots()
+# baut die Tabelle mit der NumPy-Engine neu auf und prüft den Bestand dagegen.
+# Kurs eines Tages = jüngste Beobachtung bis zu diesem Tag (Kurs aus
+# historical_rates, sonst Ausführungspreis eines Trades; am selben Tag gewinnt der Kurs).
+
+SNAPSHOT_END = "9999-12-31"
+
+
+def _day_range(first, last):
+    """
+    Alle Tage first..last (inklusive) als 'YYYY-MM-DD'.
+    """
+    return np.arange(
+        np.datetime64(first, "D"), np.datetime64(last, "D") + 1
+    ).astype(str).tolist()
+
+
+def _next_day(day):
+    return str(np.datetime64(day, "D") + 1)
+
+
+def _snapshot_extend(c, account_id, until_day):
+    """
+    Schreibt die letzte Zeile jedes Assets des Kontos bis until_day fort.
+    """
+    rows = c.execute("""
+        SELECT asset, MAX(date) FROM portfolio_snapshots WHERE account_id = ? GROUP BY asset
+    """, (account_id,)).fetchall()
+    for (asset, last_day) in rows:
+        if last_day >= until_day:
+            continue
+        c.executemany("""
+            INSERT INTO portfolio_snapshots (account_id, date, asset, units, invested_eur, price_eur, value_eur)
+            SELECT account_id, ?, asset, units, invested_eur, price_eur, value_eur
+            FROM portfolio_snapshots
+            WHERE account_id = ? AND asset = ? AND date = ?
+        """, [(day, account_id, asset, last_day) for day in _day_range(_next_day(last_day), until_day)])
+
+
+def _snapshot_horizon(c, account_id, day):
+    """
+    Letzter materialisierter Tag des Kontos nach Berücksichtigung eines Ereignisses
+    am Tag day (wie beim Neuaufbau: bis zum jüngsten Trade bzw. Kurs).
+    """
+    row = c.execute("SELECT MAX(date) FROM portfolio_snapshots WHERE account_id = ?", (account_id,)).fetchone()
+    latest_rate = c.execute("SELECT MAX(date) FROM historical_rates").fetchone()
+    return max(row[0] or day, latest_rate[0] or day, day)
+
+
+def _rate_prices(c, asset, first_day, last_day):
+    """
+    Kurs je Tag first_day..last_day aus historical_rates, der letzte bekannte
+    Kurs wird fortgeschrieben (None vor dem ersten Kurs).
+    """
+    row = c.execute("""
+        SELECT price_eur FROM historical_rates
+        WHERE asset = ? AND date <= ?
+        ORDER BY date DESC LIMIT 1
+    """, (asset, first_day)).fetchone()
+    price = row[0] if row else None
+    rates = dict(c.execute("""
+        SELECT date, price_eur FROM historical_rates
+        WHERE asset = ? AND date > ? AND date <= ?
+    """, (asset, first_day, last_day)).fetchall())
+    result = []
+    for day in _day_range(first_day, last_day):
+        price = rates.get(day, price)
+        result.append((day, price))
+    return result
+
+
+def _next_price_observation(c, account_id, asset, day):
+    """
+    Erster Tag nach day, an dem für asset ein neuer Kurs oder Trade-Preis (des Kontos) vorliegt.
+    """
+    next_rate = c.execute("""
+        SELECT MIN(date) FROM historical_rates WHERE asset = ? AND date > ?
+    """, (asset, day)).fetchone()[0]
+    next_trade = c.execute("""
+        SELECT MIN(timestamp) FROM trades
+        WHERE account_id = ? AND asset = ? AND timestamp >= ? AND avg_price > 0
+    """, (account_id, asset, _next_day(day))).fetchone()[0]
+    candidates = [d[:10] for d in (next_rate, next_trade) if d]
+    return min(candidates) if candidates else SNAPSHOT_END
+
+
+def snapshot_apply_trade(c, account_id, day, asset, units, amount_eur, avg_price):
+    """
+    Bucht einen neuen Trade in portfolio_snapshots ein (nur Tage >= day dieses
+    Assets im Konto). Läuft in der Transaktion des Aufrufers, nach dem INSERT in trades.
+    """
+    horizon = _snapshot_horizon(c, account_id, day)
+    _snapshot_extend(c, account_id, horizon)
+
+    first_day = c.execute("""
+        SELECT MIN(date) FROM portfolio_snapshots WHERE account_id = ? AND asset = ?
+    """, (account_id, asset)).fetchone()[0]
+    if first_day is None or day < first_day:
+        # Neue Zeilen vor dem bisherigen Beginn: leerer Bestand, Kurs je Tag aus historical_rates
+        end_day = horizon if first_day is None else str(np.datetime64(first_day, "D") - 1)
+        c.executemany("""
+            INSERT INTO portfolio_snapshots (account_id, date, asset, units, invested_eur, price_eur, value_eur)
+            VALUES (?, ?, ?, 0, 0, ?, 0)
+        """, [(account_id, d, asset, price) for (d, price) in _rate_prices(c, asset, day, end_day)])
+
+    c.execute("""
+        UPDATE portfolio_snapshots
+        SET units = units + ?, invested_eur = invested_eur + ?
+        WHERE account_id = ? AND asset = ? AND date >= ?
+    """, (units or 0.0, amount_eur or 0.0, account_id, asset, day))
+
+    same_day_rate = c.execute("""
+        SELECT 1 FROM historical_rates WHERE asset = ? AND date = ?
+    """, (asset, day)).fetchone()
+    if avg_price and avg_price > 0 and not same_day_rate:
+        c.execute("""
+            UPDATE portfolio_snapshots SET price_eur = ?
+            WHERE account_id = ? AND asset = ? AND date >= ? AND date < ?
+        """, (avg_price, account_id, asset, day, _next_price_observation(c, account_id, asset, day)))
+
+    c.execute("""
+        UPDATE portfolio_snapshots SET value_eur = units * price_eur
+        WHERE account_id = ? AND asset = ? AND date >= ?
+    """, (account_id, asset, day))
+
+
+def snapshot_apply_price(c, day, asset, price_eur):
+    """
+    Trägt einen neuen Tageskurs ein: je Konto ändern sich nur die Tage bis zur
+    nächsten Beobachtung dieses Assets. Läuft nach dem Upsert in historical_rates.
+    """
+    rows = c.execute("""
+        SELECT account_id, MAX(date) FROM portfolio_snapshots GROUP BY account_id
+    """).fetchall()
+    for (account_id, last_day) in rows:  # keine Zeilen = noch keine Trades
+        _snapshot_extend(c, account_id, max(last_day, day))
+        c.execute("""
+            UPDATE portfolio_snapshots
+            SET price_eur = ?, value_eur = units * ?
+            WHERE account_id = ? AND asset = ? AND date >= ? AND date < ?
+        """, (price_eur, price_eur, account_id, asset, day,
+              _next_price_observation(c, account_id, asset, day)))
+
+
+def compute_snapshot_rows(conn):
+    """
+    Berechnet alle Snapshot-Zeilen von Grund auf (vektorisiert, je Konto) aus trades
+    und historical_rates. Liefert eine Liste von
+    (account_id, date, asset, units, invested_eur, price_eur, value_eur).
+    """
+    rows = conn.execute("""
+        SELECT account_id, substr(timestamp, 1, 10), asset, amount_eur, filled_asset, avg_price
+        FROM trades
+        ORDER BY id
+    """).fetchall()
+    if not rows:
+        return []
+    rates = conn.execute("SELECT date, asset, price_eur FROM historical_rates").fetchall()
+
+    by_account = {}
+    for row in rows:
+        by_account.setdefault(row[0], []).append(row[1:])
+    result = []
+    for (account_id, trades) in sorted(by_account.items()):
+        result.extend(
+            (account_id,) + row for row in _account_snapshot_rows(trades, rates)
+        )
+    return result
+
+
+def _account_snapshot_rows(trades, rates):
+    """
+    Snapshot-Zeilen (date, asset, units, invested_eur, price_eur, value_eur) eines
+    Kontos aus dessen Trades (date, asset, eur, units, price) und allen Kursen.
+    """
+    assets = sorted({t[1] for t in trades} | {r[1] for r in rates})
+    index = {name: i for (i, name) in enumerate(assets)}
+    n_assets = len(assets)
+
+    t_days, t_assets, t_eur, t_units, t_price = zip(*trades)
+    trade_day = np.array(t_days, dtype="datetime64[D]").astype(np.int64)
+    trade_asset = np.array([index[a] for a in t_assets], dtype=np.int64)
+    trade_eur = np.array([v or 0.0 for v in t_eur], dtype=np.float64)
+    trade_units = np.array([v or 0.0 for v in t_units], dtype=np.float64)
+    trade_price = np.array([v or 0.0 for v in t_price], dtype=np.float64)
+    if rates:
+        r_days, r_assets, r_price = zip(*rates)
+        rate_day = np.array(r_days, dtype="datetime64[D]").astype(np.int64)
+        rate_asset = np.array([index[a] for a in r_assets], dtype=np.int64)
+        rate_price = np.array(r_price, dtype=np.float64)
+    else:
+        rate_day = rate_asset = np.zeros(0, dtype=np.int64)
+        rate_price = np.zeros(0, dtype=np.float64)
+
+    start_day = int(trade_day.min())
+    end_day = max(int(trade_day.max()), int(rate_day.max()) if len(rate_day) else 0)
+    n_days = end_day - start_day + 1
+
+    prices = np.full((n_days, n_assets), np.nan)
+    mask = trade_price > 0
+    prices[trade_day[mask] - start_day, trade_asset[mask]] = trade_price[mask]
+    in_range = rate_day >= start_day
+    prices[rate_day[in_range] - start_day, rate_asset[in_range]] = rate_price[in_range]
+    # Startwert: letzter Kurs vor dem ersten Tag
+    before = np.flatnonzero(~in_range)
+    if len(before):
+        order = before[np.lexsort((rate_day[before], rate_asset[before]))]
+        seed = np.full(n_assets, np.nan)
+        seed[rate_asset[order]] = rate_price[order]  # spätester Kurs gewinnt
+        prices[0] = np.where(np.isnan(prices[0]), seed, prices[0])
+    prices = _forward_fill(prices)
+
+    flat = (trade_day - start_day) * n_assets + trade_asset
+    size = n_days * n_assets
+    units = np.bincount(flat, weights=trade_units, minlength=size).reshape(n_days, n_assets).cumsum(axis=0)
+    invested = np.bincount(flat, weights=trade_eur, minlength=size).reshape(n_days, n_assets).cumsum(axis=0)
+    values = units * prices
+
+    first_day = np.full(n_assets, n_days)
+    np.minimum.at(first_day, trade_asset, trade_day - start_day)
+    day_idx, asset_idx = np.nonzero(np.arange(n_days)[:, None] >= first_day[None, :])
+    dates = (day_idx + start_day).astype("datetime64[D]").astype(str)
+
+    def _opt(v):
+        return None if np.isnan(v) else float(v)
+
+    return [
+        (date, assets[a], float(units[d, a]), float(invested[d, a]),
+         _opt(prices[d, a]), _opt(values[d, a]))
+        for (date, d, a) in zip(dates.tolist(), day_idx.tolist(), asset_idx.tolist())
+    ]
+
+
+def _snapshot_row_equal(a, b):
+    for (x, y) in zip(a, b):
+        if x is None or y is None:
+            if x is not y:
+                return False
+        elif not math.isclose(x, y, rel_tol=1e-9, abs_tol=1e-6):
+            return False
+    return True
+
+
+def rebuild_portfolio_snapshots(conn, verify=True):
+    """
+    Baut portfolio_snapshots komplett neu auf. Mit verify=True wird der
+    bisherige (inkrementell gepflegte) Bestand vorher mit der Neuberechnung
+    verglichen. Liefert {"rows", "mismatches", "missing", "extra"}.
+    Läuft in der Transaktion des Aufrufers (kein Commit).
+    """
+    fresh = compute_snapshot_rows(conn)
+    result = {"rows": len(fresh), "mismatches": 0, "missing": 0, "extra": 0}
+
+    if verify:
+        existing = {
+            row[:3]: row[3:]
+            for row in conn.execute("""
+                SELECT account_id, date, asset, units, invested_eur, price_eur, value_eur
+                FROM portfolio_snapshots
+            """)
+        }
+        for row in fresh:
+            old = existing.pop(row[:3], None)
+            if old is None:
+                result["missing"] += 1
+            elif not _snapshot_row_equal(old, row[3:]):
+                result["mismatches"] += 1
+        result["extra"] = len(existing)
+
+    conn.execute("DELETE FROM portfolio_snapshots")
+    conn.executemany("""
+        INSERT INTO portfolio_snapshots (account_id, date, asset, units, invested_eur, price_eur, value_eur)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, fresh)
+    return result
+
+
+def compute_portfolio_from_snapshots(account_id, current_prices=None):
+    """
+    Wie compute_portfolio(), aber aus den materialisierten Tageszeilen des Kontos:
+    Aufwand O(Tage) statt Neuberechnung über alle Trades.
+    current_prices: optional {ASSET: preis} für den letzten Tag (z.B. Live-Kurse).
+    """
+    start = time.perf_counter()
+    with get_connection() as conn:
+        curve = conn.execute("""
+            SELECT date, SUM(invested_eur), SUM(COALESCE(value_eur, 0))
+            FROM portfolio_snapshots
+            WHERE account_id = ?
+            GROUP BY date
+            ORDER BY date
+        """, (account_id,)).fetchall()
+        if not curve:
+            return compute_portfolio(account_id, current_prices)
+        latest = conn.execute("""
+            SELECT asset, units, invested_eur, COALESCE(price_eur, 0), COALESCE(value_eur, 0)
+            FROM portfolio_snapshots
+            WHERE account_id = ? AND date = ?
+        """, (account_id, curve[-1][0])).fetchall()
+
+    dates, invested_curve, value_curve = zip(*curve)
+    invested_curve = np.array(invested_curve, dtype=np.float64)
+    value_curve = np.array(value_curve, dtype=np.float64)
+    names = [row[0] for row in latest]
+    units = np.array([row[1] for row in latest], dtype=np.float64)
+    last_price = np.array([row[3] for row in latest], dtype=np.float64)
+    if current_prices:
+        for (i, name) in enumerate(names):
+            if current_prices.get(name):
+                last_price[i] = current_prices[name]
+        value_curve[-1] = float((units * last_price).sum())
+    daily_flow = np.diff(invested_curve, prepend=0.0)
+    twr, mwr = _curve_returns(daily_flow, value_curve)
+
+    result = _portfolio_result(
+        names, units, np.array([row[2] for row in latest], dtype=np.float64), last_price
+    )
+    result["twr"] = twr
+    result["mwr"] = mwr
+    result["equity_curve"] = {
+        "dates": list(dates),
+        "invested": invested_curve.round(2).tolist(),
+        "value": value_curve.round(2).tolist(),
+    }
+    result["computed_ms"] = (time.perf_counter() - start) * 1000
+    return result
+
+
+@app.route("/portfolio")
+def portfolio():
+    data = compute_portfolio_from_snapshots(current_account_id(), price_cache.get_many(tracked_assets()))
+    curve = data["equity_curve"]
+    return render_template(
+        "portfolio.html",
+        data=data,
+        value_points=_svg_points(curve["value"]),
+        invested_points=_svg_points(curve["invested"])
+    )
+
+
+@app.route("/api/portfolio")
+def api_portfolio():
+    return jsonify(compute_portfolio_from_snapshots(current_account_id(), price_cache.get_many(tracked_assets())))
+
+
+def benchmark_portfolio(trades=1000000, n_assets=50, years=10, repeat=5):
+    """
+    Legt `trades` synthetische Trades über n_assets Assets und `years` Jahre
+    (mit Tageskursen je Asset) an und misst (ms): compute_portfolio beim ersten
+    Aufruf (inkl. Laden aus SQLite) und danach, compute_portfolio_from_snapshots
+    und GET /api/portfolio (jeweils bester von `repeat` Läufen).
+    Erwartet eine Simulations-DB (siehe _use_simulation_copy).
+    """
+    global portfolio_data
+    rng = np.random.default_rng(42)
+    assets = [f"A{i:02d}" for i in range(n_assets)]
+    n_days = years * 365
+    first_day = int(np.datetime64(datetime.date.today(), "D").astype(np.int64)) - n_days + 1
+    prices = 100.0 * np.exp(np.cumsum(rng.normal(0.0003, 0.03, size=(n_days, n_assets)), axis=0))
+    dates = np.arange(first_day, first_day + n_days).astype("datetime64[D]").astype(str).tolist()
+
+    trade_day = np.sort(rng.integers(0, n_days, size=trades))
+    trade_asset = rng.integers(0, n_assets, size=trades)
+    trade_price = prices[trade_day, trade_asset]
+    with get_connection() as conn:
+        conn.executemany(
+            "INSERT INTO historical_rates (date, asset, price_eur) VALUES (?, ?, ?)",
+            ((dates[d], assets[a], float(prices[d, a])) for d in range(n_days) for a in range(n_assets))
+        )
+        conn.executemany("""
+            INSERT INTO trades (account_id, timestamp, asset, amount_eur, filled_asset, avg_price, order_id)
+            VALUES (?, ?, ?, 10, ?, ?, ?)
+        """, (
+            (DEFAULT_ACCOUNT_ID, f"{dates[d]} 08:00:00", assets[a], 10.0 / p, p, str(i))
+            for (i, (d, a, p)) in enumerate(zip(trade_day.tolist(), trade_asset.tolist(), trade_price.tolist()))
+        ))
+        started = time.perf_counter()
+        rebuild_portfolio_snapshots(conn, verify=False)
+        conn.commit()
+    result = {"rebuild_ms": (time.perf_counter() - started) * 1000}
+
+    def best(func):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - started) * 1000)
+        return min(timings)
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session["logged_in"] = True
+
+    portfolio_data = PortfolioData()
+    started = time.perf_counter()
+    compute_portfolio(DEFAULT_ACCOUNT_ID)
+    result["engine_cold_ms"] = (time.perf_counter() - started) * 1000
+    result["engine_ms"] = best(lambda: compute_portfolio(DEFAULT_ACCOUNT_ID))
+    result["snapshots_ms"] = best(lambda: compute_portfolio_from_snapshots(DEFAULT_ACCOUNT_ID))
+    result["api_ms"] = best(lambda: client.get("/api/portfolio"))
+    return result
+
+
+########################################
+# 13b) Backtesting der Sparpläne
+########################################
+# Spielt die gespeicherten Schedules über historische Tageskurse
+# (historical_rates, ggf. per backfill-candles ergänzt) ab. Tagesauflösung:
+# die Uhrzeit eines Schedules spielt keine Rolle, gekauft wird zum Tageskurs.
+# Alle Tage werden gleichzeitig als Matrix [Tag x Asset] gerechnet.
+
+BACKTEST_FEE_PCT = float(os.environ.get("BACKTEST_FEE_PCT", "0.25"))         # Taker-Gebühr in %
+BACKTEST_SLIPPAGE_PCT = float(os.environ.get("BACKTEST_SLIPPAGE_PCT", "0.1"))  # Aufschlag auf den Kurs in %
+
+
+def _epoch_weekday(days):
+    """
+    Wochentag (0 = Montag) für Tage seit 1970-01-01 (ein Donnerstag).
+    """
+    return (days + 3) % 7
+
+
+def load_price_history(assets, start=None, end=None):
+    """
+    Tageskurse als Matrix [Tag x Asset] (vorwärts aufgefüllt, NaN vor dem
+    ersten Kurs eines Assets). start/end: 'YYYY-MM-DD' oder None.
+    Liefert (start_day, prices) mit start_day in Tagen seit 1970-01-01.
+    """
+    index = {name: i for (i, name) in enumerate(assets)}
+    if not assets:
+        return 0, np.zeros((0, 0))
+    sql = f"""
+        SELECT date, asset, price_eur FROM historical_rates
+        WHERE asset IN ({", ".join("?" * len(assets))})
+    """
+    params = list(assets)
+    if start:
+        sql += " AND date >= ?"
+        params.append(start)
+    if end:
+        sql += " AND date <= ?"
+        params.append(end)
+    with get_connection() as conn:
+        rows = conn.execute(sql, params).fetchall()
+    if not rows:
+        return 0, np.zeros((0, len(assets)))
+
+    days, names, price = zip(*rows)
+    day = np.array(days, dtype="datetime64[D]").astype(np.int64)
+    start_day = int(np.datetime64(start, "D").astype(np.int64)) if start else int(day.min())
+    end_day = int(np.datetime64(end, "D").astype(np.int64)) if end else int(day.max())
+    prices = np.full((end_day - start_day + 1, len(assets)), np.nan)
+    prices[day - start_day, [index[n] for n in names]] = price
+    return start_day, _forward_fill(prices)
+
+
+def schedule_buy_matrix(start_day, n_days, n_assets, plan, every_weeks=1):
+    """
+    EUR-Beträge je [Tag x Asset] für einen Plan aus (wochentag, asset_index, eur).
+    every_weeks > 1 kauft nur in jeder n-ten Woche (ab der ersten Woche).
+    """
+    weekly = np.zeros((7, n_assets))
+    for (weekday, asset_idx, amount_eur) in plan:
+        weekly[weekday, asset_idx] += amount_eur
+    days = np.arange(start_day, start_day + n_days)
+    buys = weekly[_epoch_weekday(days)]
+    if every_weeks > 1:
+        week = (days - days[0] + _epoch_weekday(days[0])) // 7
+        buys[week % every_weeks != 0] = 0.0
+    return buys
+
+
+def simulate_dca(prices, buys, fee_pct=BACKTEST_FEE_PCT, slippage_pct=BACKTEST_SLIPPAGE_PCT):
+    """
+    Kern des Backtests: Käufe laut buys [Tag x Asset, EUR] zu prices [Tag x Asset].
+    Ausführungspreis = Kurs * (1 + Slippage), Gebühr wird vom EUR-Betrag abgezogen.
+    Tage ohne Kurs werden übersprungen. Liefert ein Dict mit Arrays.
+    """
+    known = ~np.isnan(prices)
+    skipped = float(buys[~known].sum())
+    buys = np.where(known, buys, 0.0)
+    exec_price = np.where(known, prices, 1.0) * (1.0 + slippage_pct / 100.0)
+    fees = buys * (fee_pct / 100.0)
+    units = (buys - fees) / exec_price
+
+    holdings = units.cumsum(axis=0)
+    marks = np.nan_to_num(prices, nan=0.0)
+    daily_flow = buys.sum(axis=1)
+    value_curve = (holdings * marks).sum(axis=1)
+    return {
+        "units": holdings[-1],
+        "invested": buys.sum(axis=0),
+        "last_price": marks[-1],
+        "fees_eur": float(fees.sum()),
+        "buys": int(np.count_nonzero(buys)),
+        "skipped_eur": skipped,
+        "daily_flow": daily_flow,
+        "invested_curve": daily_flow.cumsum(),
+        "value_curve": value_curve,
+    }
+
+
+def _max_drawdown(value_curve, invested_curve):
+    """
+    Größter Rückgang des Gewinnfaktors (Wert / investiert) gegenüber seinem Hoch.
+    """
+    ratio = np.divide(value_curve, invested_curve, out=np.ones(len(value_curve)), where=invested_curve > 0)
+    peak = np.maximum.accumulate(ratio)
+    return float(((peak - ratio) / peak).max()) if len(ratio) else 0.0
+
+
+def backtest_result(assets, start_day, sim):
+    """
+    Ergebnis-Dict wie compute_portfolio() plus Gebühren, Drawdown und Kaufanzahl.
+    """
+    result = _portfolio_result(assets, sim["units"], sim["invested"], sim["last_price"])
+    result["twr"], result["mwr"] = _curve_returns(sim["daily_flow"], sim["value_curve"])
+    result["totals"]["fees_eur"] = sim["fees_eur"]
+    result["totals"]["skipped_eur"] = sim["skipped_eur"]
+    result["buys"] = sim["buys"]
+    result["max_drawdown"] = _max_drawdown(sim["value_curve"], sim["invested_curve"])
+    n_days = len(sim["value_curve"])
+    dates = np.arange(start_day, start_day + n_days).astype("datetime64[D]").astype(str)
+    result["equity_curve"] = {
+        "dates": dates.tolist(),
+        "invested": sim["invested_curve"].round(2).tolist(),
+        "value": sim["value_curve"].round(2).tolist(),
+    }
+    return result
+
+
+def load_backtest_plan(account_id, schedule_ids=None):
+    """
+    Schedules des Kontos (alle oder schedule_ids) als Plan:
+    (Liste der Assets, [(wochentag, asset_index, eur), ...]).
+    Schedule-IDs, die nicht zum Konto gehören -> ValueError.
+    """
+    sql = """
+        SELECT s.weekday, l.asset, l.amount_eur
+        FROM schedules s
+        JOIN schedule_lines l ON l.schedule_id = s.id
+        WHERE s.account_id = ?
+    """
+    params = [account_id]
+    with get_connection() as conn:
+        if schedule_ids:
+            placeholders = ', '.join('?' * len(schedule_ids))
+            own = {row[0] for row in conn.execute(
+                f"SELECT id FROM schedules WHERE account_id = ? AND id IN ({placeholders})",
+                [account_id] + list(schedule_ids)
+            )}
+            foreign = sorted(set(schedule_ids) - own)
+            if foreign:
+                raise ValueError(f"Schedule {', '.join(map(str, foreign))} nicht gefunden.")
+            sql += f" AND s.id IN ({placeholders})"
+            params += list(schedule_ids)
+        rows = conn.execute(sql, params).fetchall()
+
+    assets = sorted({asset.upper() for (_, asset, _) in rows if asset})
+    index = {name: i for (i, name) in enumerate(assets)}
+    plan = [
+        (WEEKDAYS.index(weekday), index[asset.upper()], float(amount_eur or 0))
+        for (weekday, asset, amount_eur) in rows
+        if asset and weekday in WEEKDAYS
+    ]
+    return assets, plan
+
+
+def run_backtest(account_id, schedule_ids=None, start=None, end=None,
+                 fee_pct=BACKTEST_FEE_PCT, slippage_pct=BACKTEST_SLIPPAGE_PCT, every_weeks=1):
+    """
+    Backtest der gespeicherten Schedules des Kontos (alle oder schedule_ids) über [start, end].
+    """
+    started = time.perf_counter()
+    assets, plan = load_backtest_plan(account_id, schedule_ids)
+    start_day, prices = load_price_history(assets, start, end)
+    if not plan or prices.size == 0:
+        return None
+
+    buys = schedule_buy_matrix(start_day, prices.shape[0], len(assets), plan, every_weeks)
+    result = backtest_result(assets, start_day, simulate_dca(prices, buys, fee_pct, slippage_pct))
+    result["params"] = {
+        "schedule_ids": list(schedule_ids or []),
+        "start": result["equity_curve"]["dates"][0],
+        "end": result["equity_curve"]["dates"][-1],
+        "fee_pct": fee_pct,
+        "slippage_pct": slippage_pct,
+        "every_weeks": every_weeks,
+    }
+    result["computed_ms"] = (time.perf_counter() - started) * 1000
+    return result
+
+
+def benchmark_backtest(years=10, n_assets=50, repeat=5):
+    """
+    Synthetischer Lauf (Zufallskurse, wöchentliche Käufe je Asset) für
+    Laufzeitmessungen ohne Datenbank. Liefert die beste Laufzeit in ms.
+    """
+    rng = np.random.default_rng(42)
+    n_days = years * 365
+    returns = rng.normal(0.0005, 0.03, size=(n_days, n_assets))
+    prices = 100.0 * np.exp(np.cumsum(returns, axis=0))
+    plan = [(i % 7, i, 10.0) for i in range(n_assets)]
+
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        buys = schedule_buy_matrix(0, n_days, n_assets, plan)
+        backtest_result([f"A{i}" for i in range(n_assets)], 0, simulate_dca(prices, buys))
+        timings.append((time.perf_counter() - started) * 1000)
+    return min(timings)
+
+
+def _date_arg(value, label):
+    """
+    'YYYY-MM-DD' oder None; ValueError mit lesbarer Meldung.
+    """
+    if not value:
+        return None
+    try:
+        return datetime.datetime.strptime(value, "%Y-%m-%d").strftime("%Y-%m-%d")
+    except ValueError:
+        raise ValueError(f"{label} muss ein Datum im Format YYYY-MM-DD sein.")
+
+
+def _pct_arg(value, default, label):
+    """
+    Prozentwert zwischen 0 und 100 (leer = default); ValueError sonst.
+    """
+    if value is None or not str(value).strip():
+        return default
+    try:
+        pct = float(value)
+    except ValueError:
+        raise ValueError(f"{label} muss eine Zahl sein.")
+    if not 0 <= pct < 100:
+        raise ValueError(f"{label} muss zwischen 0 und 100 % liegen.")
+    return pct
+
+
+def _backtest_args(args):
+    """
+    Parameter für run_backtest() aus Query-String oder Formular; ValueError bei ungültigen Angaben.
+    """
+    schedule_ids = [int(x) for x in args.getlist("schedule_id") if x.strip().isdigit()]
+    start = _date_arg(args.get("start"), "Startdatum")
+    end = _date_arg(args.get("end"), "Enddatum")
+    if start and end and end < start:
+        raise ValueError("Enddatum liegt vor dem Startdatum.")
+    every_weeks = args.get("every_weeks") or "1"
+    if not every_weeks.strip().isdigit() or not 1 <= int(every_weeks) <= 52:
+        raise ValueError("Rhythmus muss zwischen 1 und 52 Wochen liegen.")
+    return {
+        "schedule_ids": schedule_ids or None,
+        "start": start,
+        "end": end,
+        "fee_pct": _pct_arg(args.get("fee_pct"), BACKTEST_FEE_PCT, "Gebühr"),
+        "slippage_pct": _pct_arg(args.get("slippage_pct"), BACKTEST_SLIPPAGE_PCT, "Slippage"),
+        "every_weeks": int(every_weeks),
+    }
+
+
+@app.route("/backtest")
+def backtest():
+    try:
+        params = _backtest_args(request.args)
+        data = run_backtest(current_account_id(), **params) if request.args else None
+    except ValueError as e:
+        flash(f"Backtest nicht gestartet: {str(e)}")
+        return redirect(url_for("backtest"))
+    curve = data["equity_curve"] if data else {"value": [], "invested": []}
+    return render_template(
+        "backtest.html",
+        data=data,
+        params=params,
+        schedules_list=load_schedule_list(current_account_id()),
+        value_points=_svg_points(curve["value"]),
+        invested_points=_svg_points(curve["invested"])
+    )
+
+
+@app.route("/api/backtest")
+def api_backtest():
+    try:
+        data = run_backtest(current_account_id(), **_backtest_args(request.args))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if data is None:
+        return jsonify({"error": "Keine Schedules oder keine Kurse im Zeitraum"}), 404
+    return jsonify(data)
+
+
+########################################
+# 13c) Optimierer (Parameter-Sweep über Backtests)
+########################################
+# Variiert Wochentag, Aufteilung des Wochenbudgets auf die Assets und den
+# Kaufrhythmus (alle n Wochen) und rechnet jede Variante mit simulate_dca().
+# Die Kursmatrix liegt einmal im Shared Memory; jeder Worker-Prozess bindet
+# sie beim Start ein, die Aufgaben enthalten nur noch die Parameter.
+# Stand und Ergebnisse stehen in SQLite, damit jeder Web-Worker (WEB_WORKERS)
+# Status, Ergebnisliste und Abbruch eines Laufs bedienen kann.
+
+OPTIMIZER_WORKERS = int(os.environ.get("OPTIMIZER_WORKERS", "0")) or os.cpu_count() or 1
+OPTIMIZER_MAX_CANDIDATES = int(os.environ.get("OPTIMIZER_MAX_CANDIDATES", "20000"))
+OPTIMIZER_CHUNK_SIZE = 50         # Varianten je Aufgabe an einen Worker
+OPTIMIZER_MIN_SPLIT_STEP = 5      # feinstes Raster (Prozent) für die Aufteilung im Formular
+OPTIMIZER_MAX_RUNS = 20           # so viele abgeschlossene Läufe (inkl. Ergebnissen) bleiben in der DB
+# Läuft ein Lauf so lange ohne Fortschritt, gilt sein Prozess als beendet
+OPTIMIZER_STALE_SECONDS = int(os.environ.get("OPTIMIZER_STALE_SECONDS", "600"))
+
+# (Kennzahl, absteigend sortieren?)
+OPTIMIZER_METRICS = {
+    "pnl_pct": True,
+    "twr": True,
+    "mwr": True,
+    "max_drawdown": False,
+}
+
+# Zustand je Worker-Prozess (gesetzt durch _optimizer_worker_init)
+_optimizer_worker = {}
+
+
+def _weight_units(step_pct):
+    return max(1, round(100 / step_pct))
+
+
+def _weight_grid(n_assets, step_pct):
+    """
+    Alle Aufteilungen von 100 % auf n_assets in Schritten von (ca.) step_pct.
+    """
+    units = _weight_units(step_pct)
+
+    def compositions(remaining, slots):
+        if slots == 1:
+            yield (remaining,)
+            return
+        for first in range(remaining + 1):
+            for rest in compositions(remaining - first, slots - 1):
+                yield (first,) + rest
+
+    for combo in compositions(units, n_assets):
+        yield tuple(round(c * 100 / units, 2) for c in combo)
+
+
+def optimizer_candidates(n_assets, weekdays=None, split_step=10, cadences=(1, 2, 4)):
+    """
+    Alle Varianten als [(wochentag, gewichte_pct, alle_n_wochen), ...].
+    """
+    weekdays = weekdays if weekdays is not None else range(7)
+    # Anzahl vorab berechnen (Sterne und Striche), bevor das Raster aufgezählt wird
+    n_weights = math.comb(_weight_units(split_step) + n_assets - 1, n_assets - 1)
+    total = n_weights * len(weekdays) * len(cadences)
+    if total > OPTIMIZER_MAX_CANDIDATES:
+        raise ValueError(
+            f"{total} Varianten (max. {OPTIMIZER_MAX_CANDIDATES}) - "
+            f"gröberes Raster oder weniger Wochentage/Rhythmen wählen."
+        )
+    weights = list(_weight_grid(n_assets, split_step))
+    return [
+        (weekday, w, every_weeks)
+        for weekday in weekdays
+        for w in weights
+        for every_weeks in cadences
+    ]
+
+
+def _optimizer_worker_init(shm_name, shape, start_day, weekly_budget, fee_pct, slippage_pct):
+    shm = shared_memory.SharedMemory(name=shm_name)
+    _optimizer_worker.update({
+        "shm": shm,  # Referenz halten, sonst wird der Puffer freigegeben
+        "prices": np.ndarray(shape, dtype=np.float64, buffer=shm.buf),
+        "start_day": start_day,
+        "weekly_budget": weekly_budget,
+        "fee_pct": fee_pct,
+        "slippage_pct": slippage_pct,
+    })
+
+
+def _optimizer_evaluate(candidates):
+    """
+    Rechnet eine Liste von Varianten im Worker-Prozess; gibt Kennzahlen zurück.
+    """
+    w = _optimizer_worker
+    prices = w["prices"]
+    n_days, n_assets = prices.shape
+    rows = []
+    for (weekday, weights, every_weeks) in candidates:
+        per_buy = w["weekly_budget"] * every_weeks / 100.0
+        plan = [(weekday, i, per_buy * pct) for (i, pct) in enumerate(weights) if pct]
+        buys = schedule_buy_matrix(w["start_day"], n_days, n_assets, plan, every_weeks)
+        sim = simulate_dca(prices, buys, w["fee_pct"], w["slippage_pct"])
+        invested = float(sim["invested"].sum())
+        value = float(sim["value_curve"][-1])
+        twr, mwr = _curve_returns(sim["daily_flow"], sim["value_curve"])
+        rows.append({
+            "weekday": WEEKDAYS[weekday],
+            "weights": weights,
+            "every_weeks": every_weeks,
+            "invested_eur": invested,
+            "value_eur": value,
+            "fees_eur": sim["fees_eur"],
+            "pnl_pct": (value - invested) / invested * 100 if invested else None,
+            "twr": twr,
+            "mwr": mwr,
+            "max_drawdown": _max_drawdown(sim["value_curve"], sim["invested_curve"]),
+        })
+    return rows
+
+
+class OptimizerRun:
+    """
+    Ein Sweep im Hintergrund: verteilt die Varianten in Blöcken auf einen
+    ProcessPool und lässt sich abbrechen. Stand und Ergebnisse liegen in
+    optimizer_runs/optimizer_results - Status, Abbruch und Ergebnisliste
+    funktionieren so in jedem Web-Worker, nicht nur im startenden Prozess.
+    """
+
+    def __init__(self, params, assets, candidates):
+        self.id = uuid.uuid4().hex[:12]
+        self.params = params
+        self.assets = assets
+        self.candidates = candidates
+        self.total = len(candidates)
+        self.done = 0
+        self.status = "running"
+        self.error = None
+        self.started_at = time.time()
+        self.finished_at = None
+        self._cancel = threading.Event()
+
+    def save(self):
+        with get_connection() as conn:
+            conn.execute("""
+                INSERT INTO optimizer_runs (
+                    id, account_id, status, total, params, assets, started_at, updated_at
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, (self.id, self.params["account_id"], self.status, self.total,
+                  json.dumps(self.params), json.dumps(self.assets), self.started_at, self.started_at))
+            conn.commit()
+
+    @classmethod
+    def from_row(cls, row):
+        (run_id, status, error, done, total, params, assets, started_at, updated_at, finished_at) = row
+        run = cls(json.loads(params), json.loads(assets), [])
+        run.id = run_id
+        run.total = total
+        run.done = done
+        run.status = status
+        run.error = error
+        run.started_at = started_at
+        run.finished_at = finished_at
+        if status == "running" and time.time() - updated_at > OPTIMIZER_STALE_SECONDS:
+            # Startender Prozess beendet (z.B. Worker-Neustart), ohne den Lauf abzuschließen
+            run.status = "failed"
+            run.error = f"Kein Fortschritt seit {OPTIMIZER_STALE_SECONDS}s, Prozess beendet?"
+            run.finished_at = updated_at
+        return run
+
+    def cancel(self):
+        self._cancel.set()
+        with get_connection() as conn:
+            conn.execute("""
+                UPDATE optimizer_runs SET cancel_requested = 1 WHERE id = ? AND status = 'running'
+            """, (self.id,))
+            conn.commit()
+
+    def _cancel_requested(self):
+        if not self._cancel.is_set():
+            with get_connection() as conn:
+                row = conn.execute(
+                    "SELECT cancel_requested FROM optimizer_runs WHERE id = ?", (self.id,)
+                ).fetchone()
+            if row and row[0]:
+                self._cancel.set()
+        return self._cancel.is_set()
+
+    def _save_rows(self, rows):
+        with get_connection() as conn:
+            conn.executemany("""
+                INSERT INTO optimizer_results (
+                    run_id, weekday, weights, every_weeks, invested_eur, value_eur,
+                    fees_eur, pnl_pct, twr, mwr, max_drawdown
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, [
+                (self.id, r["weekday"], json.dumps(r["weights"]), r["every_weeks"], r["invested_eur"],
+                 r["value_eur"], r["fees_eur"], r["pnl_pct"], r["twr"], r["mwr"], r["max_drawdown"])
+                for r in rows
+            ])
+            conn.execute("""
+                UPDATE optimizer_runs SET done = done + ?, updated_at = ? WHERE id = ?
+            """, (len(rows), time.time(), self.id))
+            conn.commit()
+        self.done += len(rows)
+
+    def _finish(self):
+        self.finished_at = time.time()
+        with get_connection() as conn:
+            conn.execute("""
+                UPDATE optimizer_runs SET status = ?, error = ?, finished_at = ?, updated_at = ?
+                WHERE id = ?
+            """, (self.status, self.error, self.finished_at, self.finished_at, self.id))
+            conn.commit()
+
+    def run(self, start_day, prices, weekly_budget):
+        shm = shared_memory.SharedMemory(create=True, size=max(prices.nbytes, 1))
+        try:
+            np.ndarray(prices.shape, dtype=np.float64, buffer=shm.buf)[:] = prices
+            chunks = [
+                self.candidates[i:i + OPTIMIZER_CHUNK_SIZE]
+                for i in range(0, self.total, OPTIMIZER_CHUNK_SIZE)
+            ]
+            initargs = (
+                shm.name, prices.shape, start_day, weekly_budget,
+                self.params["fee_pct"], self.params["slippage_pct"]
+            )
+            with ProcessPoolExecutor(
+                max_workers=max(1, min(OPTIMIZER_WORKERS, len(chunks))),
+                initializer=_optimizer_worker_init,
+                initargs=initargs
+            ) as pool:
+                futures = [pool.submit(_optimizer_evaluate, chunk) for chunk in chunks]
+                for fut in as_completed(futures):
+                    if self._cancel_requested():
+                        for f in futures:
+                            f.cancel()
+                        break
+                    self._save_rows(fut.result())
+            self.status = "cancelled" if self._cancel.is_set() else "done"
+        except Exception as e:
+            self.status = "failed"
+            self.error = str(e)
+            logging.exception(f"Optimierer-Lauf {self.id} fehlgeschlagen")
+        finally:
+            shm.close()
+            shm.unlink()
+            self._finish()
+        logging.info(f"Optimierer-Lauf {self.id}: {self.status}, {self.done}/{self.total} Varianten")
+
+    def ranked(self, limit=None):
+        """
+        Ergebnisse nach der gewählten Kennzahl sortiert (None zuletzt), mit Rang.
+        """
+        metric = self.params["metric"]
+        if metric not in OPTIMIZER_METRICS:
+            raise ValueError(f"Unbekannte Kennzahl: {metric}")
+        direction = "DESC" if OPTIMIZER_METRICS[metric] else "ASC"
+        sql = f"""
+            SELECT weekday, weights, every_weeks, invested_eur, value_eur,
+                   fees_eur, pnl_pct, twr, mwr, max_drawdown
+            FROM optimizer_results
+            WHERE run_id = ?
+            ORDER BY {metric} IS NULL, {metric} {direction}, rowid
+        """
+        params = [self.id]
+        if limit:
+            sql += " LIMIT ?"
+            params.append(limit)
+        with get_connection() as conn:
+            rows = conn.execute(sql, params).fetchall()
+        columns = (
+            "weekday", "weights", "every_weeks", "invested_eur", "value_eur",
+            "fees_eur", "pnl_pct", "twr", "mwr", "max_drawdown"
+        )
+        table = []
+        for (rank, row) in enumerate(rows, start=1):
+            entry = dict(zip(columns, row), rank=rank)
+            entry["weights"] = dict(zip(self.assets, json.loads(entry["weights"])))
+            table.append(entry)
+        return table
+
+    def progress(self, limit=20):
+        elapsed = (self.finished_at or time.time()) - self.started_at
+        return {
+            "id": self.id,
+            "status": self.status,
+            "error": self.error,
+            "done": self.done,
+            "total": self.total,
+            "percent": self.done / self.total * 100 if self.total else 100.0,
+            "elapsed_seconds": elapsed,
+            "backtests_per_second": self.done / elapsed if elapsed else 0.0,
+            "params": self.params,
+            "results": self.ranked(limit),
+        }
+
+
+_OPTIMIZER_RUN_COLUMNS = """
+    id, status, error, done, total, params, assets, started_at, updated_at, finished_at
+"""
+
+
+def start_optimizer(account_id, schedule_ids=None, start=None, end=None, weekdays=None, split_step=10,
+                    cadences=(1, 2, 4), metric="mwr",
+                    fee_pct=BACKTEST_FEE_PCT, slippage_pct=BACKTEST_SLIPPAGE_PCT, wait=False):
+    """
+    Startet einen Sweep über die Assets und das Wochenbudget der gewählten
+    Schedules des Kontos. Liefert den OptimizerRun (läuft im Hintergrund, außer wait=True).
+    """
+    if metric not in OPTIMIZER_METRICS:
+        raise ValueError(f"Unbekannte Kennzahl: {metric}")
+    assets, plan = load_backtest_plan(account_id, schedule_ids)
+    if not plan:
+        raise ValueError("Keine Schedules mit Zeilen gefunden.")
+    start_day, prices = load_price_history(assets, start, end)
+    if prices.size == 0:
+        raise ValueError("Keine Kurse im gewählten Zeitraum.")
+
+    weekly_budget = sum(amount_eur for (_, _, amount_eur) in plan)
+    candidates = optimizer_candidates(len(assets), weekdays, split_step, cadences)
+    params = {
+        "account_id": account_id,
+        "schedule_ids": list(schedule_ids or []),
+        "start": start, "end": end,
+        "weekdays": [WEEKDAYS[d] for d in (weekdays if weekdays is not None else range(7))],
+        "split_step": split_step, "cadences": list(cadences), "metric": metric,
+        "fee_pct": fee_pct, "slippage_pct": slippage_pct,
+        "weekly_budget_eur": weekly_budget,
+    }
+    run = OptimizerRun(params, assets, candidates)
+    run.save()
+    prune_optimizer_runs()
+
+    logging.info(f"Optimierer-Lauf {run.id}: {run.total} Varianten über {len(assets)} Assets")
+    if wait:
+        run.run(start_day, prices, weekly_budget)
+    else:
+        threading.Thread(target=run.run, args=(start_day, prices, weekly_budget), daemon=True).start()
+    return run
+
+
+def prune_optimizer_runs():
+    """
+    Verwirft die ältesten abgeschlossenen Läufe (samt Ergebnissen) über OPTIMIZER_MAX_RUNS hinaus.
+    """
+    with get_connection() as conn:
+        old = [row[0] for row in conn.execute("""
+            SELECT id FROM optimizer_runs
+            WHERE status != 'running'
+            ORDER BY started_at DESC
+            LIMIT -1 OFFSET ?
+        """, (OPTIMIZER_MAX_RUNS,))]
+        if old:
+            placeholders = ','.join('?' * len(old))
+            conn.execute(f"DELETE FROM optimizer_results WHERE run_id IN ({placeholders})", old)
+            conn.execute(f"DELETE FROM optimizer_runs WHERE id IN ({placeholders})", old)
+        conn.commit()
+
+
+def get_optimizer_run(run_id, account_id):
+    """
+    Lauf run_id, sofern er zum Konto gehört (sonst None).
+    """
+    with get_connection() as conn:
+        row = conn.execute(f"""
+            SELECT {_OPTIMIZER_RUN_COLUMNS} FROM optimizer_runs WHERE id = ? AND account_id = ?
+        """, (run_id, account_id)).fetchone()
+    return OptimizerRun.from_row(row) if row else None
+
+
+def list_optimizer_runs(account_id):
+    """
+    Läufe des Kontos, neueste zuerst.
+    """
+    with get_connection() as conn:
+        rows = conn.execute(f"""
+            SELECT {_OPTIMIZER_RUN_COLUMNS} FROM optimizer_runs
+            WHERE account_id = ?
+            ORDER BY started_at DESC
+        """, (account_id,)).fetchall()
+    return [OptimizerRun.from_row(row) for row in rows]
+
+
+def _optimizer_args(form):
+    """
+    Parameter für start_optimizer() aus dem Formular; ValueError bei ungültigen Angaben.
+    """
+    weekdays = [WEEKDAYS.index(d) for d in form.getlist("weekday") if d in WEEKDAYS]
+    cadences = [int(x) for x in (form.get("cadences") or "1,2,4").split(",") if x.strip().isdigit()]
+    split_step = int(form.get("split_step") or 10)
+    if not OPTIMIZER_MIN_SPLIT_STEP <= split_step <= 100:
+        raise ValueError(f"Raster der Aufteilung muss zwischen {OPTIMIZER_MIN_SPLIT_STEP} und 100 % liegen.")
+    start = _date_arg(form.get("start"), "Startdatum")
+    end = _date_arg(form.get("end"), "Enddatum")
+    if start and end and end < start:
+        raise ValueError("Enddatum liegt vor dem Startdatum.")
+    return {
+        "schedule_ids": [int(x) for x in form.getlist("schedule_id") if x.strip().isdigit()] or None,
+        "start": start,
+        "end": end,
+        "weekdays": weekdays or None,
+        "split_step": split_step,
+        "cadences": [c for c in cadences if c > 0] or [1],
+        "metric": form.get("metric") or "mwr",
+        "fee_pct": _pct_arg(form.get("fee_pct"), BACKTEST_FEE_PCT, "Gebühr"),
+        "slippage_pct": _pct_arg(form.get("slippage_pct"), BACKTEST_SLIPPAGE_PCT, "Slippage"),
+    }
+
+
+@app.route("/optimizer", methods=["GET", "POST"])
+def optimizer():
+    if request.method == "POST":
+        try:
+            run = start_optimizer(current_account_id(), **_optimizer_args(request.form))
+        except ValueError as e:
+            flash(f"Optimierer nicht gestartet: {str(e)}")
+            return redirect(url_for("optimizer"))
+        return redirect(url_for("optimizer_status", run_id=run.id))
+
+    account_id = current_account_id()
+    runs = list_optimizer_runs(account_id)
+    return render_template(
+        "optimizer.html",
+        run=None,
+        runs=runs,
+        schedules_list=load_schedule_list(account_id),
+        weekdays=WEEKDAYS,
+        metrics=list(OPTIMIZER_METRICS)
+    )
+
+
+@app.route("/optimizer/<run_id>")
+def optimizer_status(run_id):
+    run = get_optimizer_run(run_id, current_account_id())
+    if run is None:
+        flash("Optimierer-Lauf nicht gefunden.")
+        return redirect(url_for("optimizer"))
+    return render_template("optimizer.html", run=run.progress(limit=50), assets=run.assets)
+
+
+@app.route("/optimizer/<run_id>/cancel", methods=["POST"])
+def optimizer_cancel(run_id):
+    run = get_optimizer_run(run_id, current_account_id())
+    if run is not None:
+        run.cancel()
+    return redirect(url_for("optimizer_status", run_id=run_id))
+
+
+@app.route("/api/optimizer/<run_id>")
+def api_optimizer(run_id):
+    run = get_optimizer_run(run_id, current_account_id())
+    if run is None:
+        return jsonify({"error": "Lauf nicht gefunden"}), 404
+    return jsonify(run.progress(limit=request.args.get("limit", 20, type=int)))
+
+
+@app.route("/api/optimizer", methods=["POST"])
+def api_optimizer_start():
+    try:
+        run = start_optimizer(current_account_id(), **_optimizer_args(request.form))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(run.progress(limit=0)), 202
+
+
+@app.route("/api/optimizer/<run_id>/cancel", methods=["POST"])
+def api_optimizer_cancel(run_id):
+    run = get_optimizer_run(run_id, current_account_id())
+    if run is None:
+        return jsonify({"error": "Lauf nicht gefunden"}), 404
+    run.cancel()
+    return jsonify(run.progress(limit=0))
+
+
+########################################
+# MAIN
+########################################
+def cli_rebuild_snapshots(args):
+    init_db()
+    with get_connection() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        result = rebuild_portfolio_snapshots(conn, verify=not args.no_verify)
+        conn.commit()
+    print(
+        f"portfolio_snapshots neu aufgebaut: {result['rows']} Zeilen, "
+        f"{result['mismatches']} abweichend, {result['missing']} fehlend, {result['extra']} überzählig"
+    )
+    return 0 if (result["mismatches"] + result["missing"] + result["extra"]) == 0 else 1
+
+
+def cli_reconcile_orders(args):
+    init_db()
+    summary = reconcile_order_journal(min_age_seconds=args.min_age)
+    print(
+        f"{summary['checked']} offene Journal-Einträge: {summary[JOURNAL_FILLED]} verbucht, "
+        f"{summary[JOURNAL_REJECTED]} abgelehnt, {summary[JOURNAL_FAILED]} zurückgerollt, "
+        f"{summary[JOURNAL_PENDING]} weiter offen"
+    )
+    return 0 if summary[JOURNAL_PENDING] == 0 else 1
+
+
+def cli_backfill_candles(args):
+    init_db()
+    assets = args.assets.split(",") if args.assets else None
+    result = backfill_candles(args.interval, args.start, assets, args.workers)
+    print(
+        f"{result['rows']} Kerzen für {result['assets']} Assets in {result['seconds']:.1f}s "
+        f"({result['rows_per_second']:.0f} Zeilen/s)"
+    )
+    for (asset, error) in result["errors"].items():
+        print(f"  Fehler {asset}: {error}")
+    return 1 if result["errors"] else 0
+
+
+def cli_backtest(args):
+    init_db()
+    if args.benchmark:
+        ms = benchmark_backtest(args.benchmark_years, args.benchmark_assets)
+        print(f"Backtest {args.benchmark_years} Jahre x {args.benchmark_assets} Assets (wöchentlich): {ms:.1f} ms")
+        return 0
+    try:
+        data = run_backtest(
+            args.account, args.schedule or None, args.start, args.end,
+            args.fee, args.slippage, args.every_weeks
+        )
+    except ValueError as e:
+        print(str(e))
+        return 1
+    if data is None:
+        print("Keine Schedules oder keine Kurse im Zeitraum.")
+        return 1
+    if args.json:
+        print(json.dumps(data))
+        return 0
+    totals = data["totals"]
+    print(f"{data['params']['start']} bis {data['params']['end']}: {data['buys']} Käufe")
+    for a in data["assets"]:
+        print(f"  {a['asset']:>6}: {a['units']:.6f} | investiert {a['invested_eur']:.2f} | Wert {a['value_eur']:.2f}")
+    print(
+        f"Investiert {totals['invested_eur']:.2f} EUR, Wert {totals['value_eur']:.2f} EUR, "
+        f"Gebühren {totals['fees_eur']:.2f} EUR, TWR {data['twr'] * 100:.2f} %, "
+        f"Max. Drawdown {data['max_drawdown'] * 100:.2f} % ({data['computed_ms']:.1f} ms)"
+    )
+    return 0
+
+
+def cli_optimize(args):
+    init_db()
+    weekdays = [WEEKDAYS.index(d) for d in args.weekday] if args.weekday else None
+    cadences = [int(x) for x in args.cadences.split(",")]
+    try:
+        run = start_optimizer(
+            args.account, args.schedule or None, args.start, args.end, weekdays,
+            args.split_step, cadences, args.metric, args.fee, args.slippage
+        )
+    except ValueError as e:
+        print(str(e))
+        return 1
+    try:
+        while run.status == "running":
+            time.sleep(1)
+            print(f"\r{run.done}/{run.total} Varianten", end="", flush=True)
+    except KeyboardInterrupt:
+        run.cancel()
+        while run.status == "running":
+            time.sleep(0.2)
+    print()
+
+    progress = run.progress(limit=args.top)
+    print(
+        f"Status {progress['status']}: {progress['done']} Backtests in "
+        f"{progress['elapsed_seconds']:.1f}s ({progress['backtests_per_second']:.0f}/s), "
+        f"sortiert nach {args.metric}"
+    )
+    for r in progress["results"]:
+        weights = " ".join(f"{a}={pct}%" for (a, pct) in r["weights"].items() if pct)
+        value = r[args.metric]
+        print(f"{r['rank']:>3}. {r['weekday']:<9} alle {r['every_weeks']} Wo. {weights} -> {value}")
+    return 0 if progress["status"] == "done" else 1
 
-        except Exception as e:
-            logging.error(f"Fehler beim Kauf von {asset}: {str(e)}")
 
-            # E-Mail bei Exception
-            if email_config and email_config["send_on_error"]:
-                subject = f"Exception beim Kauf: {asset}"
-                body = (
-                    f"Schedule-ID: {schedule_id}\n"
-                    f"Asset: {asset}\n"
-                    f"EUR: {amount_eur}\n"
-                    f"Fehlermeldung: {str(e)}\n"
-                )
-                send_email(subject, body)
+def _use_simulation_copy(path):
+    """
+    Kopiert die Datenbank nach path und schaltet auf Kopie + Mock-Börse um.
+    """
+    global SIMULATION_MODE, DB_NAME
+    init_db()
+    source = get_connection()
+    target = sqlite3.connect(path)
+    source.backup(target)
+    target.close()
+    close_connection()
+    DB_NAME = path
+    SIMULATION_MODE = True
+    settings_cache.invalidate()
 
 
-def run_scheduler():
-    while True:
-        schedule.run_pending()
-        time.sleep(1)
+def cli_simulate(args):
+    """
+    Last-/Performance-Test gegen die Mock-Börse auf einer Kopie der Datenbank.
+    """
+    _use_simulation_copy(args.db)
 
-threading.Thread(target=run_scheduler, daemon=True).start()
+    with get_connection() as conn:
+        schedule_ids = args.schedule or [r[0] for r in conn.execute("SELECT id FROM schedules")]
+    if not schedule_ids:
+        print("Keine Schedules vorhanden.")
+        return 1
+
+    started = time.perf_counter()
+    update_prices_for_assets()
+    for _ in range(args.runs):
+        for schedule_id in schedule_ids:
+            execute_investment(schedule_id)
+    elapsed = time.perf_counter() - started
+
+    stats = mock_exchange_stats()
+    print(
+        f"{args.runs} x {len(schedule_ids)} Schedule-Läufe in {elapsed:.2f}s: "
+        f"{stats['orders']} Orders ({stats['orders'] / elapsed:.1f}/s), {stats['fills']} Fills, "
+        f"{stats['calls']} API-Aufrufe, {stats['injected_errors']} injizierte Fehler, "
+        f"{stats['rate_limited']} x Rate-Limit"
+    )
+    print(f"Mock-Konto 1: {get_mock_exchange(DEFAULT_ACCOUNT_ID).stats()['balances']} (DB: {os.path.abspath(args.db)})")
+    return 0
 
 
-########################################
-# 10) Historische Preise aktualisieren
-########################################
-def update_prices_for_assets():
+def cli_bench_scheduler(args):
     """
-    Sammelt alle Assets aus schedule_lines und trades,
-    ruft den aktuellen Preis ab und speichert ihn in historical_rates.
+    Aufwachvorgänge und CPU-Zeit des Schedulers je Tag mit --schedules Zeitplänen
+    (simulierte Uhr, auf einer Kopie der Datenbank).
     """
-    logging.info("Starte update_prices_for_assets() ...")
-    if SIMULATION_MODE:
-        logging.info("SIMULATION_MODE aktiv: Keine echten Preisupdates.")
-        return
-
+    _use_simulation_copy(args.db)
+    r = benchmark_scheduler(args.schedules, args.days)
+    print(f"{r['schedules']} Zeitpläne, {args.days} Tage simuliert (DB: {os.path.abspath(args.db)})")
+    print(f"  Jobs je Tag:           {r['jobs_per_day']:10.0f}")
+    print(f"  Aufwachen je Tag:      {r['wakeups_per_day']:10.0f}   (vorher Abfrageschleife: 86400)")
+    print(f"  CPU je Tag:            {r['cpu_ms_per_day']:10.1f} ms")
+    print(f"  Einplanen (einmalig):  {r['setup_cpu_ms']:10.1f} ms")
+    return 0
+
+
+def benchmark_order_execution(lines=10, latency_ms=200.0, worker_counts=(1, 4, 10), runs=3,
+                              order_interval=ORDER_MIN_INTERVAL):
+    """
+    Ein Schedule mit `lines` Zeilen gegen eine Mock-Börse mit latency_ms Antwortzeit,
+    je Worker-Anzahl `runs` Läufe über execute_investment. Ergebnis je Worker-Anzahl:
+    Dauer eines Laufs und Abstand erste -> letzte Ausführung (ms, Median).
+    Erwartet eine Simulations-DB (siehe _use_simulation_copy).
+    """
+    global ORDER_WORKERS
+    assets = [ALLOWED_ASSETS[i % len(ALLOWED_ASSETS)] for i in range(lines)]
+    today = datetime.date.today().isoformat()
     with get_connection() as conn:
         c = conn.cursor()
-        c.execute("SELECT DISTINCT asset FROM schedule_lines")
-        assets_lines = [r[0] for r in c.fetchall()]
+        for asset in set(assets):
+            if not c.execute("SELECT 1 FROM historical_rates WHERE asset = ? LIMIT 1", (asset,)).fetchone():
+                store_daily_prices(c, today, {asset: 100.0})
+        c.execute(
+            "INSERT INTO schedules (account_id, weekday, time_of_day) VALUES (?, 'Monday', '08:00')",
+            (DEFAULT_ACCOUNT_ID,)
+        )
+        schedule_id = c.lastrowid
+        c.executemany(
+            "INSERT INTO schedule_lines (schedule_id, asset, amount_eur) VALUES (?, ?, 10)",
+            [(schedule_id, asset) for asset in assets]
+        )
+        conn.commit()
 
-        c.execute("SELECT DISTINCT asset FROM trades")
-        assets_trades = [r[0] for r in c.fetchall()]
+    prices = load_mock_prices()
+    saved_workers = ORDER_WORKERS
+    results = {}
+    try:
+        for workers in worker_counts:
+            ORDER_WORKERS = workers
+            with _mock_exchange_lock:
+                _mock_exchanges[DEFAULT_ACCOUNT_ID] = MockExchange(prices, latency_ms=latency_ms)
+            with _account_rate_limiters_lock:
+                _account_rate_limiters[DEFAULT_ACCOUNT_ID] = RateLimiter(order_interval)
+            durations = []
+            spreads = []
+            for run in range(runs):
+                run_at = datetime.datetime(2000, 1, 1) + timedelta(minutes=workers * runs + run)
+                started = time.perf_counter()
+                execute_investment(schedule_id, run_at)
+                durations.append((time.perf_counter() - started) * 1000)
+                with get_connection() as conn:
+                    fills = [
+                        datetime.datetime.fromisoformat(r[0]) for r in conn.execute("""
+                            SELECT t.timestamp FROM trades t
+                            JOIN order_journal j ON j.client_order_id = t.client_order_id
+                            WHERE j.schedule_id = ? AND j.run_at = ?
+                        """, (schedule_id, run_at))
+                    ]
+                spreads.append((max(fills) - min(fills)).total_seconds() * 1000 if fills else 0.0)
+            results[workers] = {
+                "run_ms": sorted(durations)[len(durations) // 2],
+                "spread_ms": sorted(spreads)[len(spreads) // 2],
+                "filled": len(fills),
+            }
+    finally:
+        ORDER_WORKERS = saved_workers
+    return results
 
-        all_assets = set(assets_lines + assets_trades)
-        date_str = datetime.datetime.now().strftime('%Y-%m-%d')
 
-    try:
-        bv = get_bitvavo_client()
-    except Exception as e:
-        logging.error(f"Konnte Bitvavo-Client nicht erstellen (update_prices_for_assets): {str(e)}")
-        return
+def cli_bench_orders(args):
+    """
+    Latenz eines Schedule-Laufs nacheinander (1 Worker) vs. parallel
+    gegen die Mock-Börse auf einer Kopie der Datenbank.
+    """
+    _use_simulation_copy(args.db)
+    worker_counts = [int(w) for w in args.workers.split(",")]
+    results = benchmark_order_execution(args.lines, args.latency_ms, worker_counts, args.runs, args.order_interval)
+    print(
+        f"{args.lines} Orders je Lauf, Mock-Latenz {args.latency_ms:.0f} ms, Order-Takt {args.order_interval}s "
+        f"(DB: {os.path.abspath(args.db)})"
+    )
+    for (workers, r) in results.items():
+        print(
+            f"  {workers:3d} Worker: Lauf {r['run_ms']:8.0f} ms, erste -> letzte Ausführung "
+            f"{r['spread_ms']:8.0f} ms, {r['filled']} ausgeführt"
+        )
+    return 0
+
 
+def benchmark_trades(trades=1000000):
+    """
+    Legt `trades` synthetische Trades für das Standardkonto an und misst Dauer,
+    Time-to-First-Byte und Spitzen-Speicher (tracemalloc) von: allen Zeilen auf
+    einmal (frühere /trades-Abfrage), erster und tiefer Seite von /trades sowie
+    dem CSV-/NDJSON-Export. Erwartet eine Simulations-DB (siehe _use_simulation_copy).
+    """
+    start = datetime.datetime(2015, 1, 1)
     with get_connection() as conn:
-        c = conn.cursor()
-        for asset in all_assets:
-            if not asset:
-                continue
-            symbol = f"{asset.upper()}-EUR"
-            try:
-                ticker = bitvavo_request_with_retry(bv.tickerPrice, {"market": symbol})
-                price_eur = float(ticker.get("price", 0.0))
+        conn.executemany("""
+            INSERT INTO trades (account_id, timestamp, asset, amount_eur, filled_asset, avg_price, order_id)
+            VALUES (?, ?, ?, 10, 0.1, 100, ?)
+        """, (
+            (DEFAULT_ACCOUNT_ID, start + timedelta(minutes=5 * i), ALLOWED_ASSETS[i % len(ALLOWED_ASSETS)], str(i))
+            for i in range(trades)
+        ))
+        conn.commit()
+        middle = conn.execute("SELECT MAX(id) - ? FROM trades", (trades // 2,)).fetchone()[0]
 
-                c.execute("""
-                    INSERT INTO historical_rates (date, asset, price_eur)
-                    VALUES (?, ?, ?)
-                """, (date_str, asset.upper(), price_eur))
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session["logged_in"] = True
 
-                logging.info(f"Preis gespeichert: {asset} = {price_eur} EUR am {date_str}")
-            except Exception as e2:
-                logging.warning(f"Preis für {asset} konnte nicht geholt werden: {str(e2)}")
+    def fetch_all():
+        yield get_connection().execute(
+            "SELECT id, timestamp, asset, amount_eur, filled_asset, avg_price, order_id FROM trades ORDER BY id DESC"
+        ).fetchall()
+
+    def get(path):
+        response = client.get(path, buffered=False)
+        yield from response.response
+        response.close()
+
+    def measure(chunks):
+        started = time.perf_counter()
+        first = None
+        for chunk in chunks():
+            if first is None:
+                first = time.perf_counter() - started
+        return {"ms": (time.perf_counter() - started) * 1000, "ttfb_ms": first * 1000}
+
+    cases = [
+        ("alle Zeilen (vorher)", fetch_all),
+        ("/trades erste Seite", lambda: get("/trades")),
+        ("/trades mittlere Seite", lambda: get(f"/trades?before={middle}")),
+        ("/trades/export.csv", lambda: get("/trades/export.csv")),
+        ("/trades/export.ndjson", lambda: get("/trades/export.ndjson")),
+    ]
+    results = {}
+    for (name, chunks) in cases:
+        results[name] = measure(chunks)
+        tracemalloc.start()
+        measure(chunks)
+        results[name]["peak_mb"] = tracemalloc.get_traced_memory()[1] / 1e6
+        tracemalloc.stop()
+    return results
 
-        conn.commit()
 
+def cli_bench_portfolio(args):
+    """
+    Laufzeit der Portfolio-Analyse mit --trades synthetischen Trades über
+    --assets Assets, auf einer Kopie der Datenbank. Ziel: unter 100 ms.
+    """
+    _use_simulation_copy(args.db)
+    r = benchmark_portfolio(args.trades, args.assets, args.years)
+    print(f"{args.trades} Trades x {args.assets} Assets über {args.years} Jahre (DB: {os.path.abspath(args.db)})")
+    print(f"  Snapshots neu aufbauen:          {r['rebuild_ms']:9.1f} ms")
+    print(f"  compute_portfolio, erster Lauf:  {r['engine_cold_ms']:9.1f} ms (lädt Trades aus SQLite)")
+    print(f"  compute_portfolio:               {r['engine_ms']:9.1f} ms")
+    print(f"  aus portfolio_snapshots:         {r['snapshots_ms']:9.1f} ms")
+    print(f"  GET /api/portfolio:              {r['api_ms']:9.1f} ms")
+    return 0 if max(r["engine_ms"], r["snapshots_ms"]) < 100 else 1
+
+
+def cli_bench_templates(args):
+    """
+    Latenz je Seite: render_template_string je Request vs. vorkompilierte
+    Templates, auf einer Kopie der Datenbank.
+    """
+    _use_simulation_copy(args.db)
+    results = benchmark_templates(args.requests)
+    print(f"{args.requests} Requests je Seite (DB: {os.path.abspath(args.db)})")
+    print(f"  {'':28} {'vorher p50/p95':>18} {'nachher p50/p95':>18}")
+    for (path, r) in results.items():
+        print(
+            f"  {path:28} {r['before'][0]:7.2f} /{r['before'][1]:7.2f} ms "
+            f"{r['after'][0]:7.2f} /{r['after'][1]:7.2f} ms"
+        )
+    return 0
 
-########################################
-# 11) Routen: Startseite & Co.
-########################################
-@app.route("/")
-def index():
-    with get_connection() as conn:
-        c = conn.cursor()
-        c.execute("SELECT id, weekday, time_of_day FROM schedules ORDER BY id")
-        scheds = c.fetchall()
-
-        schedules_list = []
-        for (sid, wd, tod) in scheds:
-            c.execute("SELECT asset, amount_eur FROM schedule_lines WHERE schedule_id=?", (sid,))
-            lines_ = c.fetchall()
-            schedules_list.append((sid, wd, tod, lines_))
-
-    html = """
-    <html>
-    <body>
-    <h1>Bitvavo Invest Tool</h1>
-
-    {% with msgs = get_flashed_messages() %}
-    {% if msgs %}
-      <ul style="color:green">
-      {% for m in msgs %}
-        <li>{{ m }}</li>
-      {% endfor %}
-      </ul>
-    {% endif %}
-    {% endwith %}
-
-    <p>
-      <a href="{{ url_for('add_schedule') }}">Neuen Zeitplan anlegen</a> |
-      <a href="{{ url_for('manual_balance') }}">Kontostand abrufen</a> |
-      <a href="{{ url_for('trades_list') }}">Trades anzeigen</a> |
-      <a href="{{ url_for('settings') }}">Einstellungen</a>
-    </p>
-
-    <h2>Aktuelle Zeitpläne</h2>
-    {% if schedules_list %}
-    <table border="1" cellpadding="4">
-      <tr><th>ID</th><th>Wochentag</th><th>Uhrzeit</th><th>Assets</th><th>Aktionen</th></tr>
-      {% for (sid, wd, tod, lines) in schedules_list %}
-      <tr>
-        <td>{{sid}}</td>
-        <td>{{wd}}</td>
-        <td>{{tod}}</td>
-        <td>
-          {% for (ast, amt) in lines %}
-            {{ast}}: {{amt}} EUR<br>
-          {% endfor %}
-        </td>
-        <td>
-          <a href="{{ url_for('edit_schedule', schedule_id=sid) }}">Bearbeiten</a> |
-          <a href="{{ url_for('delete_schedule', schedule_id=sid) }}"
-             onclick="return confirm('Wirklich löschen?');">Löschen</a>
-        </td>
-      </tr>
-      {% endfor %}
-    </table>
-    {% else %}
-      <p>Keine Zeitpläne angelegt</p>
-    {% endif %}
 
-    </body>
-    </html>
+def cli_bench_trades(args):
     """
-    return render_template_string(html, schedules_list=schedules_list)
+    Speicher und Time-to-First-Byte von /trades und dem Export mit --trades
+    synthetischen Trades auf einer Kopie der Datenbank.
+    """
+    _use_simulation_copy(args.db)
+    results = benchmark_trades(args.trades)
+    print(f"{args.trades} synthetische Trades (DB: {os.path.abspath(args.db)})")
+    print(f"  {'':24} {'gesamt':>10} {'1. Byte':>10} {'Speicher':>10}")
+    for (name, r) in results.items():
+        print(f"  {name:24} {r['ms']:7.0f} ms {r['ttfb_ms']:7.1f} ms {r['peak_mb']:7.1f} MB")
+    return 0
 
 
-@app.route("/add_schedule", methods=["GET", "POST"])
-def add_schedule():
-    if request.method == "POST":
-        wd = request.form.get("weekday")
-        tod = request.form.get("time_of_day")
+def _load_schedule_list_n_plus_1(account_id):
+    """
+    Frühere Variante (eine Abfrage je Zeitplan) - nur als Vergleich für bench-dashboard.
+    """
+    with get_connection() as conn:
+        rows = conn.execute(
+            "SELECT id, weekday, time_of_day FROM schedules WHERE account_id = ? ORDER BY id", (account_id,)
+        ).fetchall()
+        return [
+            (sid, wd, tod, conn.execute(
+                "SELECT asset, amount_eur FROM schedule_lines WHERE schedule_id = ?", (sid,)
+            ).fetchall())
+            for (sid, wd, tod) in rows
+        ]
 
-        assets = request.form.getlist("asset")
-        amounts = request.form.getlist("amount_eur")
 
-        with get_connection() as conn:
-            c = conn.cursor()
-            c.execute("INSERT INTO schedules (weekday, time_of_day) VALUES (?, ?)", (wd, tod))
-            schedule_id = c.lastrowid
+def cli_bench_dashboard(args):
+    """
+    Dashboard mit --schedules Zeitplänen auf einer Kopie der Datenbank:
+    Abfragen und Laufzeit der Zeitplan-Liste (N+1, JOIN, Cache) und der Startseite.
+    """
+    _use_simulation_copy(args.db)
+    with get_connection() as conn:
+        c = conn.cursor()
+        for i in range(args.schedules):
+            c.execute(
+                "INSERT INTO schedules (account_id, weekday, time_of_day) VALUES (?, ?, '08:00')",
+                (DEFAULT_ACCOUNT_ID, WEEKDAYS[i % 7])
+            )
+            c.executemany(
+                "INSERT INTO schedule_lines (schedule_id, asset, amount_eur) VALUES (?, ?, ?)",
+                [(c.lastrowid, asset, 10.0) for asset in ALLOWED_ASSETS[:args.lines]]
+            )
+        bump_change_counter(c, "schedules")
+        conn.commit()
 
-            for (ast, amt_str) in zip(assets, amounts):
-                ast = ast.strip().upper()
-                amt_val = 0.0
-                try:
-                    amt_val = float(amt_str)
-                except:
-                    pass
-                if ast and amt_val > 0:
-                    c.execute("""
-                      INSERT INTO schedule_lines (schedule_id, asset, amount_eur)
-                      VALUES (?, ?, ?)
-                    """, (schedule_id, ast, amt_val))
+    def measure(func):
+        statements = []
+        conn = get_connection()
+        conn.set_trace_callback(statements.append)
+        started = time.perf_counter()
+        try:
+            func()
+        finally:
+            conn.set_trace_callback(None)
+        return (time.perf_counter() - started) * 1000, len(statements)
 
-            conn.commit()
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session["logged_in"] = True
 
-        load_schedules_into_scheduler()
-        logging.info(f"Neuer Zeitplan {schedule_id} angelegt: {wd} {tod}")
-        flash("Neuer Zeitplan angelegt.")
-        return redirect(url_for("index"))
+    results = [
+        ("N+1 (vorher)", measure(lambda: _load_schedule_list_n_plus_1(DEFAULT_ACCOUNT_ID))),
+        ("JOIN, kalt", measure(lambda: load_schedule_list(DEFAULT_ACCOUNT_ID))),
+        ("JOIN, aus dem Cache", measure(lambda: load_schedule_list(DEFAULT_ACCOUNT_ID))),
+        ("GET / (Cache)", measure(lambda: client.get("/"))),
+    ]
+    with get_connection() as conn:
+        total = conn.execute("SELECT COUNT(*) FROM schedules WHERE account_id = ?", (DEFAULT_ACCOUNT_ID,)).fetchone()[0]
+    print(f"{total} Zeitpläne mit je {args.lines} Zeilen (DB: {os.path.abspath(args.db)})")
+    for (name, (ms, queries)) in results:
+        print(f"  {name:22} {ms:9.1f} ms  {queries:6d} Abfragen")
+    return 0
 
-    now_plus_2 = datetime.datetime.now() + timedelta(minutes=2)
-    default_day = now_plus_2.strftime("%A")     # z.B. "Monday"
-    default_time = now_plus_2.strftime("%H:%M") # z.B. "23:59"
 
-    html = """
-    <html>
-    <body>
-      <h1>Neuen Zeitplan anlegen</h1>
-      <form method="POST">
-        <label>Wochentag:</label>
-        <select name="weekday">
-          {% for day in ["Monday","Tuesday","Wednesday","Thursday","Friday","Saturday","Sunday"] %}
-            <option value="{{ day }}" {% if day == default_day %}selected{% endif %}>{{ day }}</option>
-          {% endfor %}
-        </select><br><br>
-
-        <label>Uhrzeit (HH:MM):</label>
-        <input type="text" name="time_of_day" value="{{ default_time }}"><br><br>
-
-        <hr>
-        <p>Bis zu 3 Orders definieren:</p>
-        <table>
-          <tr><th>Asset</th><th>EUR</th></tr>
-          {% for i in range(3) %}
-          <tr>
-            <td>
-              <select name="asset">
-                <option value="">-- bitte wählen --</option>
-                {% for coin in allowed_assets %}
-                  <option value="{{ coin }}">{{ coin }}</option>
-                {% endfor %}
-              </select>
-            </td>
-            <td><input type="number" step="0.01" name="amount_eur"></td>
-          </tr>
-          {% endfor %}
-        </table>
-        <br>
-        <button type="submit">Speichern</button>
-      </form>
-      <hr>
-      <p><a href="{{ url_for('index') }}">Zurück</a></p>
-    </body>
-    </html>
+def cli_bench_db(args):
     """
-    return render_template_string(
-        html,
-        allowed_assets=ALLOWED_ASSETS,
-        default_day=default_day,
-        default_time=default_time
-    )
-
+    Durchsatz gleichzeitiger Lese-/Schreibzugriffe: Verbindung je Thread (WAL)
+    gegen connect-pro-Aufruf (Rollback-Journal).
+    """
+    result = benchmark_db(args.db, args.threads, args.operations, args.write_pct)
+    print(f"{args.threads} Threads, {args.operations} Zugriffe ({args.write_pct} % Schreiben)")
+    for (name, r) in result.items():
+        print(
+            f"  {name:18} {r['ops_per_second']:10.0f} Zugriffe/s  {r['seconds']:6.2f}s  "
+            f"{r['reads']} gelesen, {r['writes']} geschrieben, {r['errors']} Fehler"
+        )
+    base = result["connect_per_call"]["ops_per_second"]
+    if base:
+        print(f"Faktor: {result['per_thread']['ops_per_second'] / base:.1f}x")
+    return 0
 
-@app.route("/edit_schedule/<int:schedule_id>", methods=["GET", "POST"])
-def edit_schedule(schedule_id):
-    if request.method == "POST":
-        wd = request.form.get("weekday")
-        tod = request.form.get("time_of_day")
 
-        assets = request.form.getlist("asset")
-        amounts = request.form.getlist("amount_eur")
+def cli_bench_indexes(args):
+    """
+    Abfragepläne und Laufzeiten ohne/mit den Indizes aus Migration 1/2
+    auf einer synthetischen Datenbank mit --rows Trades und Kursen.
+    """
+    result = benchmark_indexes(args.db, args.rows, args.repeat)
+    print(
+        f"{args.rows} Trades/Kurse ({result['days']} Tage), Migration {result['migration_seconds']:.1f}s "
+        f"(DB: {os.path.abspath(args.db)})"
+    )
+    for query in result["queries"]:
+        print(f"  {query['name']:32} {query['ms_before']:9.2f} ms -> {query['ms_after']:7.3f} ms")
+        print(f"    vorher:  {query['plan_before']}")
+        print(f"    nachher: {query['plan_after']}")
+    return 0
 
-        with get_connection() as conn:
-            c = conn.cursor()
-            c.execute("UPDATE schedules SET weekday=?, time_of_day=? WHERE id=?", (wd, tod, schedule_id))
-            c.execute("DELETE FROM schedule_lines WHERE schedule_id=?", (schedule_id,))
 
-            for (ast, amt_str) in zip(assets, amounts):
-                ast = ast.strip().upper()
-                amt_val = 0.0
-                try:
-                    amt_val = float(amt_str)
-                except:
-                    pass
-                if ast and amt_val > 0:
-                    c.execute("""
-                      INSERT INTO schedule_lines (schedule_id, asset, amount_eur)
-                      VALUES (?, ?, ?)
-                    """, (schedule_id, ast, amt_val))
-            conn.commit()
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
 
-        load_schedules_into_scheduler()
-        logging.info(f"Zeitplan {schedule_id} aktualisiert: {wd} {tod}")
-        flash(f"Zeitplan {schedule_id} wurde aktualisiert.")
-        return redirect(url_for("index"))
 
+def _retention_bench_data(assets, minute_days, hourly_days, daily_days, now_ms):
+    """
+    Synthetische Kerzen (Zufallspfad) je Asset: 1m für minute_days, 1h für
+    hourly_days und 1d für daily_days Tage vor now_ms.
+    """
+    rng = np.random.default_rng(42)
     with get_connection() as conn:
-        c = conn.cursor()
-        c.execute("SELECT weekday, time_of_day FROM schedules WHERE id=?", (schedule_id,))
-        row = c.fetchone()
-        if not row:
-            flash(f"Zeitplan {schedule_id} existiert nicht.")
-            return redirect(url_for("index"))
-        wd, tod = row
-
-        c.execute("SELECT asset, amount_eur FROM schedule_lines WHERE schedule_id=?", (schedule_id,))
-        lines = c.fetchall()
+        conn.execute("DELETE FROM price_candles")
+        conn.execute("DELETE FROM price_rollup_state")
+        for asset in assets:
+            for (interval, days) in (("1m", minute_days), ("1h", hourly_days), ("1d", daily_days)):
+                step = CANDLE_INTERVALS[interval]
+                n = days * DAY_MS // step
+                close = 100.0 * np.exp(np.cumsum(rng.normal(0, 0.001, n)))
+                start = _day_bucket(now_ms) - n * step
+                conn.executemany("""
+                    INSERT INTO price_candles (asset, interval, timestamp, open, high, low, close, volume)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """, [
+                    (asset, interval, start + i * step, float(p), float(p) * 1.001, float(p) * 0.999, float(p), 1.0)
+                    for (i, p) in enumerate(close)
+                ])
+        conn.commit()
 
-    while len(lines) < 3:
-        lines.append(("", 0.0))
 
-    html = """
-    <html>
-    <body>
-      <h1>Zeitplan {{ schedule_id }} bearbeiten</h1>
-      <form method="POST">
-        <label>Wochentag:</label>
-        <select name="weekday">
-          {% for day in ["Monday","Tuesday","Wednesday","Thursday","Friday","Saturday","Sunday"] %}
-            <option value="{{ day }}" {% if day == wd %}selected{% endif %}>{{ day }}</option>
-          {% endfor %}
-        </select><br><br>
-
-        <label>Uhrzeit (HH:MM):</label>
-        <input type="text" name="time_of_day" value="{{ tod }}"><br><br>
-
-        <hr>
-        <p>Bis zu 3 Orders definieren:</p>
-        <table>
-          <tr><th>Asset</th><th>EUR</th></tr>
-          {% for (ast, amt) in lines %}
-          <tr>
-            <td>
-              <select name="asset">
-                <option value="">-- bitte wählen --</option>
-                {% for coin in allowed_assets %}
-                  <option value="{{ coin }}" {% if coin == ast %}selected{% endif %}>{{ coin }}</option>
-                {% endfor %}
-              </select>
-            </td>
-            <td><input type="number" step="0.01" name="amount_eur" value="{{ amt }}"></td>
-          </tr>
-          {% endfor %}
-        </table>
-        <br>
-        <button type="submit">Änderungen speichern</button>
-      </form>
-      <hr>
-      <p><a href="{{ url_for('index') }}">Zurück</a></p>
-    </body>
-    </html>
+def _retention_bench_measure(asset, now_ms, repeat=5):
     """
-    return render_template_string(
-        html,
-        schedule_id=schedule_id,
-        wd=wd,
-        tod=tod,
-        lines=lines,
-        allowed_assets=ALLOWED_ASSETS
+    Datenbankgröße (belegt / nach VACUUM) und Median-Latenz typischer Abfragen in ms.
+    """
+    queries = {
+        "verlauf_gesamt": (
+            "SELECT interval, timestamp, close FROM price_candles WHERE asset = ?", (asset,)
+        ),
+        "tages_ohlc_1_jahr": (
+            """SELECT timestamp, open, high, low, close, volume FROM price_candles
+               WHERE asset = ? AND timestamp >= ? ORDER BY timestamp""",
+            (asset, now_ms - 365 * DAY_MS)
+        ),
+        "letzte_kerze_je_asset": (
+            "SELECT asset, interval, MAX(timestamp) FROM price_candles GROUP BY asset, interval", ()
+        ),
+    }
+    result = {}
+    with get_connection() as conn:
+        result["zeilen"] = conn.execute("SELECT COUNT(*) FROM price_candles").fetchone()[0]
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        used = conn.execute("PRAGMA page_count").fetchone()[0] - conn.execute("PRAGMA freelist_count").fetchone()[0]
+        result["belegt_mb"] = used * page_size / 1e6
+        for (name, (sql, params)) in queries.items():
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                rows = conn.execute(sql, params).fetchall()
+                if name == "tages_ohlc_1_jahr":
+                    aggregate_candles(rows, _day_bucket)
+                timings.append((time.perf_counter() - started) * 1000)
+            result[f"{name}_ms"] = sorted(timings)[len(timings) // 2]
+        conn.execute("VACUUM")
+    result["datei_mb"] = os.path.getsize(DB_NAME) / 1e6
+    return result
+
+
+def cli_price_retention(args):
+    """
+    Verdichtet price_candles (wie der Scheduler-Job, aber bis zum Ende).
+    --benchmark: auf einer Kopie der Datenbank mit synthetischen Kerzen,
+    Größe und Abfragelatenz vorher/nachher.
+    """
+    if not args.benchmark:
+        init_db()
+        result = run_price_retention()
+        print(
+            f"{result['rows_read']} Kerzen -> {result['rows_written']} verdichtet in "
+            f"{result['batches']} Transaktionen ({result['seconds']:.1f}s, längste {result['max_batch_ms']:.0f} ms)"
+        )
+        return 0
+
+    _use_simulation_copy(args.db)
+    now_ms = int(time.time() * 1000)
+    assets = ALLOWED_ASSETS[:args.assets]
+    _retention_bench_data(assets, args.minute_days, args.hourly_days, args.daily_days, now_ms)
+    before = _retention_bench_measure(assets[0], now_ms)
+    result = run_price_retention(pause=0, now_ms=now_ms)
+    after = _retention_bench_measure(assets[0], now_ms)
+
+    print(
+        f"Verdichtung: {result['rows_read']} Kerzen -> {result['rows_written']} in {result['batches']} "
+        f"Transaktionen, {result['seconds']:.1f}s, längste Transaktion {result['max_batch_ms']:.0f} ms"
     )
+    print(f"{'':24} {'vorher':>12} {'nachher':>12}")
+    for key in before:
+        print(f"{key:24} {before[key]:>12.2f} {after[key]:>12.2f}")
+    print(f"(DB: {os.path.abspath(args.db)})")
+    return 0
 
 
-@app.route("/delete_schedule/<int:schedule_id>")
-def delete_schedule(schedule_id):
+def cli_loadtest(args):
+    """
+    Multi-Konto-Lasttest auf einer Kopie der Datenbank: legt --accounts Konten mit
+    je einem Schedule an und stößt alle gleichzeitig über den Dispatcher an.
+    Die ersten --slow Konten bekommen eine langsame Mock-Börse; die Durchlaufzeit
+    der übrigen Konten darf davon nicht abhängen.
+    """
+    _use_simulation_copy(args.db)
+
+    with get_connection() as conn:
+        assets = [r[0].upper() for r in conn.execute("SELECT DISTINCT asset FROM historical_rates")]
+    if not assets:
+        print("Keine Kurse in historical_rates (ggf. zuerst backfill-candles).")
+        return 1
+
+    rnd = random.Random(42)
+    jobs = []
     with get_connection() as conn:
         c = conn.cursor()
-        c.execute("DELETE FROM schedule_lines WHERE schedule_id = ?", (schedule_id,))
-        c.execute("DELETE FROM schedules WHERE id = ?", (schedule_id,))
+        for i in range(args.accounts):
+            c.execute(
+                "INSERT INTO accounts (name, created_at) VALUES (?, ?)",
+                (f"Lasttest {i + 1}", datetime.datetime.now())
+            )
+            account_id = c.lastrowid
+            c.execute(
+                "INSERT INTO schedules (account_id, weekday, time_of_day) VALUES (?, 'Monday', '00:00')",
+                (account_id,)
+            )
+            schedule_id = c.lastrowid
+            c.executemany(
+                "INSERT INTO schedule_lines (schedule_id, asset, amount_eur) VALUES (?, ?, ?)",
+                [(schedule_id, a, args.amount) for a in rnd.sample(assets, min(args.lines, len(assets)))]
+            )
+            jobs.append((account_id, schedule_id))
+        bump_change_counter(c, "schedules")
+        bump_change_counter(c, "settings")
         conn.commit()
+    settings_cache.invalidate()
 
-    load_schedules_into_scheduler()
-    flash(f"Zeitplan {schedule_id} gelöscht.")
-    logging.info(f"Zeitplan {schedule_id} gelöscht.")
-    return redirect(url_for("index"))
+    slow = {account_id for (account_id, _) in jobs[:args.slow]}
+    for account_id in slow:
+        get_mock_exchange(account_id).latency_ms = args.slow_latency_ms
 
+    durations = {}
 
-@app.route("/balance")
-def manual_balance():
-    if SIMULATION_MODE:
-        flash("SIMULATION_MODE aktiv: Kein echter Kontostand.", "info")
-        return redirect(url_for("index"))
+    def run(account_id, schedule_id, queued_at):
+        execute_investment(schedule_id)
+        durations[account_id] = time.perf_counter() - queued_at
 
-    try:
-        bv = get_bitvavo_client()
-    except Exception as e:
-        flash(f"Keine Credentials oder Fehler: {str(e)}", "error")
-        logging.error(f"manual_balance: Kein Client. {str(e)}")
-        return redirect(url_for("index"))
+    started = time.perf_counter()
+    for (account_id, schedule_id) in jobs:
+        dispatcher.submit(account_id, _schedule_job_key(schedule_id), run,
+                          account_id, schedule_id, time.perf_counter())
+    dispatcher.wait_idle()
+    elapsed = time.perf_counter() - started
 
-    # Letzter Snapshot
+    first_id = jobs[0][0] if jobs else 0
     with get_connection() as conn:
-        c = conn.cursor()
-        c.execute("""
-          SELECT timestamp, currency, amount
-          FROM balances
-          ORDER BY id DESC LIMIT 50
-        """)
-        old_rows = c.fetchall()
+        (trades, trade_accounts) = conn.execute(
+            "SELECT COUNT(*), COUNT(DISTINCT account_id) FROM trades WHERE account_id >= ?", (first_id,)
+        ).fetchone()
+    normal = sorted(d for (a, d) in durations.items() if a not in slow)
+    slowed = sorted(d for (a, d) in durations.items() if a in slow)
+    stats = mock_exchange_stats()
+    print(
+        f"{len(jobs)} Konten x {args.lines} Orders in {elapsed:.2f}s: "
+        f"{stats['orders']} Orders ({stats['orders'] / elapsed:.0f}/s), "
+        f"{trades} Trades in {trade_accounts} Konten, {stats['injected_errors']} injizierte Fehler"
+    )
+    print(
+        f"Normale Konten ({len(normal)}): p50 {_percentile(normal, 0.5):.2f}s, "
+        f"p95 {_percentile(normal, 0.95):.2f}s, max {_percentile(normal, 1.0):.2f}s"
+    )
+    if slowed:
+        print(
+            f"Langsame Konten ({len(slowed)}, {args.slow_latency_ms:.0f} ms Latenz): "
+            f"p50 {_percentile(slowed, 0.5):.2f}s, max {_percentile(slowed, 1.0):.2f}s"
+        )
+    print(f"Dispatcher: {dispatcher.stats()} (DB: {os.path.abspath(args.db)})")
+    return 0 if len(durations) == len(jobs) else 1
 
-        old_balance = {}
-        last_ts = None
-        if old_rows:
-            last_ts = old_rows[0][0]
-            old_balance_ts_rows = [r for r in old_rows if r[0] == last_ts]
-            for (_, currency, amount) in old_balance_ts_rows:
-                old_balance[currency] = amount
 
-    # Aktueller Kontostand
-    try:
-        res = bitvavo_request_with_retry(bv.balance, {})
-        if isinstance(res, dict) and "errorCode" in res:
-            flash(f"Fehler: {res['errorCode']} - {res['error']}", "error")
-            logging.error(f"Bitvavo balance error: {res}")
-            return redirect(url_for("index"))
+def cli_metrics(args):
+    if args.benchmark:
+        for (name, value) in benchmark_metrics().items():
+            print(f"{name}: {value:.3f}")
+        return 0
+    init_db()
+    print(metrics.render(), end="")
+    return 0
 
-        now_str = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        filtered = [b for b in res if float(b['available']) > 0]
 
-        with get_connection() as conn:
-            c = conn.cursor()
-            for b in filtered:
-                currency = b["symbol"]
-                amount   = float(b["available"])
-                c.execute("""
-                  INSERT INTO balances (timestamp, currency, amount)
-                  VALUES (?, ?, ?)
-                """, (now_str, currency, amount))
-            conn.commit()
+def _gunicorn_application(options):
+    """
+    gunicorn mit der bereits geladenen App (kein erneuter Import je Worker).
+    Jeder Worker startet nach dem Fork seine Hintergrunddienste; die
+    Leader-Wahl sorgt dafür, dass nur einer davon den Scheduler betreibt.
+    """
+    from gunicorn.app.base import BaseApplication
 
-        current_balance = {b["symbol"]: float(b["available"]) for b in filtered}
+    class BitmasterApplication(BaseApplication):
+        def load_config(self):
+            for (key, value) in options.items():
+                self.cfg.set(key, value)
 
-        flash(f"Kontostand abgerufen und gespeichert ({now_str}).")
-        logging.info(f"Kontostand abgerufen: {len(filtered)} Einträge gespeichert.")
-
-        html = """
-        <html>
-        <body>
-          <h1>Kontostand</h1>
-          <h2>Aktuell ({{ now_str }})</h2>
-          {% if current_balance %}
-            <ul>
-              {% for sym, amt in current_balance.items() %}
-                <li>{{ sym }}: {{ amt }}</li>
-              {% endfor %}
-            </ul>
-          {% else %}
-            <p>Kein Guthaben oder kein Zugriff.</p>
-          {% endif %}
-
-          <hr>
-          <h2>Zuletzt abgerufener Kontostand{% if last_ts %} ({{ last_ts }}){% endif %}</h2>
-          {% if old_balance %}
-            <ul>
-              {% for sym, amt in old_balance.items() %}
-                <li>{{ sym }}: {{ amt }}</li>
-              {% endfor %}
-            </ul>
-          {% else %}
-            <p>Kein älterer Kontostand vorhanden.</p>
-          {% endif %}
-
-          <hr>
-          <p><a href="{{ url_for('index') }}">Zurück</a></p>
-        </body>
-        </html>
-        """
-        return render_template_string(
-            html,
-            now_str=now_str,
-            current_balance=current_balance,
-            last_ts=last_ts,
-            old_balance=old_balance
-        )
+        def load(self):
+            return app
 
-    except Exception as e:
-        flash(f"Fehler beim Kontostand: {e}", "error")
-        logging.error(f"Fehler in manual_balance(): {str(e)}")
-        return redirect(url_for("index"))
+    return BitmasterApplication()
 
 
-@app.route("/trades")
-def trades_list():
-    with get_connection() as conn:
-        c = conn.cursor()
-        c.execute("""
-            SELECT timestamp, asset, amount_eur, filled_asset, avg_price, order_id
-            FROM trades
-            ORDER BY id DESC
-        """)
-        rows = c.fetchall()
+def cli_serve(args):
+    init_db()
+    compile_templates()
+    logging.info(f"Starte Webserver auf {args.bind} (SIMULATION_MODE={SIMULATION_MODE}) ...")
 
-    html = """
-    <html>
-    <body>
-      <h1>Liste der Trades</h1>
-      {% if rows %}
-        <table border="1">
-          <tr>
-            <th>Datum</th>
-            <th>Asset</th>
-            <th>EUR</th>
-            <th>Menge</th>
-            <th>Preis</th>
-            <th>OrderID</th>
-          </tr>
-          {% for (ts, ast, amt_eur, fill_amt, avg_pr, oid) in rows %}
-          <tr>
-            <td>{{ ts }}</td>
-            <td>{{ ast }}</td>
-            <td>{{ amt_eur }}</td>
-            <td>{{ fill_amt }}</td>
-            <td>{{ avg_pr }}</td>
-            <td>{{ oid }}</td>
-          </tr>
-          {% endfor %}
-        </table>
-      {% else %}
-        <p>Keine Trades in der DB</p>
-      {% endif %}
-      <hr>
-      <p><a href="{{ url_for('index') }}">Zurück</a></p>
-    </body>
-    </html>
+    try:
+        server = None if args.dev else _gunicorn_application({
+            "bind": args.bind,
+            "workers": args.workers,
+            "threads": args.threads,
+            "worker_class": "gthread",
+            "timeout": 120,
+            "post_worker_init": lambda worker: start_background_services(),
+        })
+    except ImportError:
+        logging.warning("gunicorn nicht installiert -> Entwicklungsserver (ein Prozess).")
+        server = None
+
+    if server is None:
+        start_background_services()
+        host, port = args.bind.rsplit(":", 1)
+        app.run(host=host, port=int(port), threaded=True, debug=False, use_reloader=False)
+        return 0
+
+    # Die DB-Verbindung des Master-Prozesses darf nicht in die Worker vererbt werden
+    close_connection()
+    server.run()
+    return 0
+
+
+# Standard-Routen für bench-http (alle nur lesend)
+HTTP_BENCH_PATHS = ["/", "/trades", "/portfolio", "/api/portfolio", "/api/prices", "/metrics"]
+
+
+def cli_bench_http(args):
+    """
+    Durchsatz der Routen unter paralleler Last gegen einen laufenden Server:
+    --concurrency Clients rufen --duration Sekunden lang reihum die Pfade ab.
     """
-    return render_template_string(html, rows=rows)
+    base = args.url.rstrip("/")
+    paths = args.path or HTTP_BENCH_PATHS
+    login = requests.Session()
+    login.post(f"{base}/do_login", data={"password": MASTER_PASSWORD}, allow_redirects=False)
+    if "session" not in login.cookies:
+        print("Login fehlgeschlagen (MASTER_PASSWORD?).")
+        return 1
+
+    deadline = time.perf_counter() + args.duration
+
+    def client(offset):
+        http = requests.Session()
+        http.cookies.update(login.cookies)
+        latencies = {path: [] for path in paths}
+        errors = 0
+        i = offset
+        while time.perf_counter() < deadline:
+            path = paths[i % len(paths)]
+            i += 1
+            start = time.perf_counter()
+            try:
+                r = http.get(f"{base}{path}", allow_redirects=False, timeout=30)
+                ok = r.status_code == 200
+            except requests.exceptions.RequestException:
+                ok = False
+            if ok:
+                latencies[path].append(time.perf_counter() - start)
+            else:
+                errors += 1
+        return latencies, errors
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(client, range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+
+    errors = sum(e for (_, e) in results)
+    total = 0
+    print(f"{args.concurrency} Clients, {elapsed:.1f}s gegen {base}")
+    for path in paths:
+        values = sorted(v for (latencies, _) in results for v in latencies[path])
+        total += len(values)
+        print(
+            f"  {path:<16} {len(values) / elapsed:8.1f} req/s  "
+            f"p50 {_percentile(values, 0.5) * 1000:7.1f} ms  p95 {_percentile(values, 0.95) * 1000:7.1f} ms"
+        )
+    print(f"Gesamt: {total / elapsed:.1f} req/s, {errors} Fehler")
+    return 0 if errors == 0 else 1
 
 
-########################################
-# MAIN
-########################################
 if __name__ == "__main__":
-    init_db()
-    load_schedules_into_scheduler()
-    logging.info(f"Starte Flask-Server (SIMULATION_MODE={SIMULATION_MODE}) ...")
-    # Debugmodus NICHT in Produktion verwenden
-    app.run(host="0.0.0.0", port=5000, debug=True, use_reloader=False)
+    parser = argparse.ArgumentParser(description="BitMaster")
+    commands = parser.add_subparsers(dest="command")
+    serve = commands.add_parser("serve", help="Webserver + Scheduler starten (Standard)")
+    serve.add_argument("--bind", default=WEB_BIND, help="host:port")
+    serve.add_argument("--workers", type=int, default=WEB_WORKERS, help="gunicorn-Prozesse")
+    serve.add_argument("--threads", type=int, default=WEB_THREADS, help="Threads je Prozess")
+    serve.add_argument("--dev", action="store_true", help="Flask-Entwicklungsserver statt gunicorn")
+    rebuild = commands.add_parser(
+        "rebuild-snapshots", help="portfolio_snapshots neu aufbauen und Bestand prüfen"
+    )
+    rebuild.add_argument("--no-verify", action="store_true", help="Bestand nicht vergleichen")
+    reconcile = commands.add_parser("reconcile-orders", help="Offene Einträge im Order-Journal abgleichen")
+    reconcile.add_argument("--min-age", type=float, default=0, help="Nur Einträge älter als X Sekunden")
+    backfill = commands.add_parser("backfill-candles", help="Historische Kerzen (OHLCV) nachladen")
+    backfill.add_argument("--interval", default="1d", choices=sorted(CANDLE_INTERVALS))
+    backfill.add_argument("--start", help="Startdatum YYYY-MM-DD für Assets ohne Kerzen")
+    backfill.add_argument("--assets", help="Kommagetrennt, Standard: alle aus Schedules und Trades")
+    backfill.add_argument("--workers", type=int, help="Parallele Märkte")
+    bt = commands.add_parser("backtest", help="Schedules über historische Kurse abspielen")
+    bt.add_argument("--account", type=int, default=DEFAULT_ACCOUNT_ID, help="Konto-ID")
+    bt.add_argument("--schedule", type=int, action="append", help="Schedule-ID (mehrfach möglich)")
+    bt.add_argument("--start", help="YYYY-MM-DD")
+    bt.add_argument("--end", help="YYYY-MM-DD")
+    bt.add_argument("--fee", type=float, default=BACKTEST_FEE_PCT, help="Gebühr in %%")
+    bt.add_argument("--slippage", type=float, default=BACKTEST_SLIPPAGE_PCT, help="Slippage in %%")
+    bt.add_argument("--every-weeks", type=int, default=1)
+    bt.add_argument("--json", action="store_true")
+    bt.add_argument("--benchmark", action="store_true", help="Synthetischen Lauf messen")
+    bt.add_argument("--benchmark-years", type=int, default=10)
+    bt.add_argument("--benchmark-assets", type=int, default=50)
+    sim = commands.add_parser("simulate", help="Schedules gegen die Mock-Börse ausführen (Lasttest)")
+    sim.add_argument("--schedule", type=int, action="append", help="Schedule-ID (mehrfach möglich)")
+    sim.add_argument("--runs", type=int, default=1, help="Läufe je Schedule")
+    sim.add_argument("--db", default="bitmaster-sim.db", help="Kopie der Datenbank für den Lauf")
+    load = commands.add_parser("loadtest", help="Viele Konten gleichzeitig gegen die Mock-Börse (Lasttest)")
+    load.add_argument("--accounts", type=int, default=500)
+    load.add_argument("--lines", type=int, default=3, help="Orders je Konto")
+    load.add_argument("--amount", type=float, default=10.0, help="EUR je Order")
+    load.add_argument("--slow", type=int, default=10, help="Anzahl langsamer Konten")
+    load.add_argument("--slow-latency-ms", type=float, default=2000.0, help="Latenz der langsamen Konten")
+    load.add_argument("--db", default="bitmaster-load.db", help="Kopie der Datenbank für den Lauf")
+    orders = commands.add_parser("bench-orders", help="Schedule-Lauf nacheinander vs. parallel messen")
+    orders.add_argument("--lines", type=int, default=10, help="Orders je Schedule")
+    orders.add_argument("--latency-ms", type=float, default=200.0, help="Antwortzeit der Mock-Börse")
+    orders.add_argument("--workers", default="1,4,10", help="Worker-Anzahlen, kommagetrennt")
+    orders.add_argument("--runs", type=int, default=3, help="Läufe je Worker-Anzahl")
+    orders.add_argument("--order-interval", type=float, default=ORDER_MIN_INTERVAL, help="Order-Takt in Sekunden")
+    orders.add_argument("--db", default="bitmaster-orders.db", help="Kopie der Datenbank für den Lauf")
+    sched = commands.add_parser("bench-scheduler", help="Aufwachen/CPU des Schedulers je Tag messen")
+    sched.add_argument("--schedules", type=int, default=5000)
+    sched.add_argument("--days", type=int, default=7, help="Simulierte Tage")
+    sched.add_argument("--db", default="bitmaster-scheduler.db", help="Kopie der Datenbank für den Lauf")
+    trades = commands.add_parser("bench-trades", help="Speicher/Time-to-First-Byte von /trades und Export messen")
+    trades.add_argument("--trades", type=int, default=1000000)
+    trades.add_argument("--db", default="bitmaster-trades.db", help="Kopie der Datenbank für den Lauf")
+    pf = commands.add_parser("bench-portfolio", help="Laufzeit der Portfolio-Analyse messen (Ziel < 100 ms)")
+    pf.add_argument("--trades", type=int, default=1000000)
+    pf.add_argument("--assets", type=int, default=50)
+    pf.add_argument("--years", type=int, default=10)
+    pf.add_argument("--db", default="bitmaster-portfolio.db", help="Kopie der Datenbank für den Lauf")
+    tpl = commands.add_parser("bench-templates", help="Latenz je Seite: render_template_string vs. vorkompiliert")
+    tpl.add_argument("--requests", type=int, default=200, help="Requests je Seite und Variante")
+    tpl.add_argument("--db", default="bitmaster-templates.db", help="Kopie der Datenbank für den Lauf")
+    dash = commands.add_parser("bench-dashboard", help="Zeitplan-Liste/Startseite mit vielen Zeitplänen messen")
+    dash.add_argument("--schedules", type=int, default=10000)
+    dash.add_argument("--lines", type=int, default=3, help="Zeilen je Zeitplan")
+    dash.add_argument("--db", default="bitmaster-bench.db", help="Kopie der Datenbank für den Benchmark")
+    bdb = commands.add_parser("bench-db", help="Verbindung je Thread (WAL) vs. connect pro Aufruf messen")
+    bdb.add_argument("--threads", type=int, default=8)
+    bdb.add_argument("--operations", type=int, default=20000, help="Zugriffe gesamt")
+    bdb.add_argument("--write-pct", type=int, default=20, help="Anteil Schreibzugriffe in %%")
+    bdb.add_argument("--db", default="bitmaster-bench.db", help="Präfix der Testdateien (werden neu angelegt)")
+    idx = commands.add_parser("bench-indexes", help="Abfragepläne ohne/mit Indizes auf synthetischer DB")
+    idx.add_argument("--rows", type=int, default=1000000, help="Trades und Kurse")
+    idx.add_argument("--repeat", type=int, default=10, help="Messungen je Abfrage")
+    idx.add_argument("--db", default="bitmaster-indexes.db", help="Wird neu angelegt")
+    ret = commands.add_parser("price-retention", help="Alte Kerzen zu Tages-/Wochenkerzen verdichten")
+    ret.add_argument("--benchmark", action="store_true", help="Größe/Latenz vorher-nachher mit synthetischen Kerzen")
+    ret.add_argument("--assets", type=int, default=6)
+    ret.add_argument("--minute-days", type=int, default=60, help="Tage mit 1m-Kerzen")
+    ret.add_argument("--hourly-days", type=int, default=365, help="Tage mit 1h-Kerzen")
+    ret.add_argument("--daily-days", type=int, default=1825, help="Tage mit 1d-Kerzen")
+    ret.add_argument("--db", default="bitmaster-retention.db", help="Kopie der Datenbank für den Benchmark")
+    opt = commands.add_parser("optimize", help="Wochentag/Aufteilung/Rhythmus per Backtest optimieren")
+    opt.add_argument("--account", type=int, default=DEFAULT_ACCOUNT_ID, help="Konto-ID")
+    opt.add_argument("--schedule", type=int, action="append", help="Schedule-ID (mehrfach möglich)")
+    opt.add_argument("--start", help="YYYY-MM-DD")
+    opt.add_argument("--end", help="YYYY-MM-DD")
+    opt.add_argument("--weekday", action="append", choices=WEEKDAYS)
+    opt.add_argument("--split-step", type=int, default=10, help="Raster der Aufteilung in %%")
+    opt.add_argument("--cadences", default="1,2,4", help="Rhythmen in Wochen, kommagetrennt")
+    opt.add_argument("--metric", default="mwr", choices=list(OPTIMIZER_METRICS))
+    opt.add_argument("--fee", type=float, default=BACKTEST_FEE_PCT)
+    opt.add_argument("--slippage", type=float, default=BACKTEST_SLIPPAGE_PCT)
+    opt.add_argument("--top", type=int, default=20)
+    bench = commands.add_parser("bench-http", help="Durchsatz der Routen unter paralleler Last messen")
+    bench.add_argument("--url", default="http://127.0.0.1:5000")
+    bench.add_argument("--path", action="append", help="Pfad (mehrfach möglich), Standard: Lese-Routen")
+    bench.add_argument("--concurrency", type=int, default=16)
+    bench.add_argument("--duration", type=float, default=10.0, help="Sekunden")
+    met = commands.add_parser("metrics", help="Metriken ausgeben bzw. Overhead messen")
+    met.add_argument("--benchmark", action="store_true", help="Kosten je Messung bestimmen")
+    args = parser.parse_args()
+    if args.command is None:
+        args = parser.parse_args(["serve"])
+
+    handlers = {
+        "serve": cli_serve,
+        "rebuild-snapshots": cli_rebuild_snapshots,
+        "reconcile-orders": cli_reconcile_orders,
+        "backfill-candles": cli_backfill_candles,
+        "backtest": cli_backtest,
+        "optimize": cli_optimize,
+        "simulate": cli_simulate,
+        "loadtest": cli_loadtest,
+        "price-retention": cli_price_retention,
+        "bench-dashboard": cli_bench_dashboard,
+        "bench-orders": cli_bench_orders,
+        "bench-scheduler": cli_bench_scheduler,
+        "bench-trades": cli_bench_trades,
+        "bench-templates": cli_bench_templates,
+        "bench-portfolio": cli_bench_portfolio,
+        "bench-indexes": cli_bench_indexes,
+        "bench-db": cli_bench_db,
+        "metrics": cli_metrics,
+        "bench-http": cli_bench_http,
+    }
+    raise SystemExit(handlers[args.command](args))
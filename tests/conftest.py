@@ -0,0 +1,84 @@
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bitmaster  # noqa: E402
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """
+    Frische bitmaster.db (alle Migrationen) im Temp-Verzeichnis; liefert die
+    Verbindung des Test-Threads.
+    """
+    bitmaster.close_connection()
+    monkeypatch.setattr(bitmaster, "DB_NAME", str(tmp_path / "bitmaster.db"))
+    bitmaster.settings_cache.invalidate()
+    bitmaster._schedule_list_cache.clear()
+    bitmaster.init_db()
+    yield bitmaster.get_connection()
+    bitmaster.close_connection()
+    bitmaster.settings_cache.invalidate()
+
+
+class BitvavoStub:
+    """
+    Lokaler HTTP-Stub der Bitvavo-REST-API. routes: (methode, pfad) -> handler(query, body),
+    der die JSON-Antwort liefert. Alle Anfragen landen in requests.
+    """
+
+    def __init__(self):
+        self.routes = {}
+        self.requests = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _handle(self):
+                url = urlsplit(self.path)
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length)) if length else None
+                query = dict(parse_qsl(url.query))
+                path = url.path[len("/v2"):]
+                stub.requests.append((self.command, path, query))
+                handler = stub.routes.get((self.command, path))
+                payload = handler(query, body) if handler else {"errorCode": 110, "error": "not found"}
+                data = json.dumps(payload).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST = do_DELETE = _handle
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/v2"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def count(self, method, path):
+        return sum(1 for r in self.requests if r[0] == method and r[1] == path)
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def bitvavo_stub(monkeypatch):
+    stub = BitvavoStub()
+    monkeypatch.setattr(bitmaster, "BITVAVO_REST_URL", stub.url)
+    monkeypatch.setattr(bitmaster, "price_cache", bitmaster.PriceCache())
+    bitmaster.invalidate_bitvavo_clients()
+    yield stub
+    bitmaster.invalidate_bitvavo_clients()
+    stub.close()
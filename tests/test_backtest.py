@@ -0,0 +1,63 @@
+import pytest
+from werkzeug.datastructures import MultiDict
+
+import bitmaster
+
+
+@pytest.fixture
+def client(db):
+    client = bitmaster.app.test_client()
+    with client.session_transaction() as session:
+        session["logged_in"] = True
+    return client
+
+
+@pytest.mark.parametrize("query", [
+    "fee_pct=abc", "slippage_pct=1,5", "fee_pct=150", "fee_pct=-1", "fee_pct=nan",
+    "every_weeks=x", "every_weeks=0", "every_weeks=-2",
+    "start=2024-13-01", "end=gestern", "start=2024-02-01&end=2024-01-01",
+])
+def test_invalid_backtest_parameters(client, query):
+    response = client.get(f"/api/backtest?{query}")
+    assert response.status_code == 400
+    assert response.get_json()["error"]
+
+    response = client.get(f"/backtest?{query}")
+    assert response.status_code == 302
+    page = client.get(response.headers["Location"]).get_data(as_text=True)
+    assert "Backtest nicht gestartet" in page
+
+
+def test_valid_backtest_parameters(client):
+    params = bitmaster._backtest_args(MultiDict({
+        "start": "2024-01-01", "end": "2024-01-01", "fee_pct": "0.5", "every_weeks": "2",
+    }))
+    assert params["start"] == params["end"] == "2024-01-01"
+    assert (params["fee_pct"], params["every_weeks"]) == (0.5, 2)
+    assert client.get("/api/backtest?start=2024-01-01&end=2024-02-01").status_code == 404
+
+
+def test_optimizer_rejects_reversed_range(client):
+    response = client.post("/api/optimizer", data={"start": "2024-02-01", "end": "2024-01-01"})
+    assert response.status_code == 400
+
+
+def test_backtest_only_uses_own_schedules(client, db):
+    c = db.cursor()
+    c.execute("INSERT INTO accounts (id, name) VALUES (2, 'Zweit')")
+    c.execute("INSERT INTO schedules (account_id, weekday, time_of_day) VALUES (2, 'Monday', '08:00')")
+    foreign = c.lastrowid
+    c.execute("INSERT INTO schedule_lines (schedule_id, asset, amount_eur) VALUES (?, 'BTC', 10)", (foreign,))
+    c.execute("INSERT INTO historical_rates (date, asset, price_eur) VALUES ('2024-01-01', 'BTC', 40000)")
+    db.commit()
+
+    assert bitmaster.load_backtest_plan(1) == ([], [])
+    with pytest.raises(ValueError, match="nicht gefunden"):
+        bitmaster.load_backtest_plan(1, [foreign])
+    assert bitmaster.load_backtest_plan(2, [foreign]) == (["BTC"], [(0, 0, 10.0)])
+
+    response = client.get(f"/api/backtest?schedule_id={foreign}")
+    assert response.status_code == 400
+    response = client.post("/api/optimizer", data={"schedule_id": str(foreign)})
+    assert response.status_code == 400
+    assert client.get("/api/backtest").status_code == 404
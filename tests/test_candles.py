@@ -0,0 +1,183 @@
+import datetime
+
+import pytest
+
+import bitmaster
+
+DAY_MS = 86_400_000
+START = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+START_MS = int(START.timestamp() * 1000)
+
+
+def candles_route(asset):
+    """
+    Tageskerzen wie bei Bitvavo: [start, end] inklusive, neueste zuerst, höchstens limit.
+    """
+    def handler(query, body):
+        first = -(-int(query["start"]) // DAY_MS) * DAY_MS
+        ts = range(first, int(query["end"]) + 1, DAY_MS)
+        rows = [[t, str(100 + t // DAY_MS), "1", "1", str(100 + t // DAY_MS), "5"] for t in reversed(ts)]
+        return rows[:int(query["limit"])]
+    return handler
+
+
+def expected_days():
+    return (int(datetime.datetime.now(datetime.timezone.utc).timestamp() * 1000) - START_MS) // DAY_MS + 1
+
+
+def stored(db, asset):
+    return [r[0] for r in db.execute(
+        "SELECT timestamp FROM price_candles WHERE asset = ? AND interval = '1d' ORDER BY timestamp", (asset,)
+    )]
+
+
+def test_backfill_pages_resumes_and_dedupes(db, bitvavo_stub, monkeypatch):
+    monkeypatch.setattr(bitmaster, "CANDLE_PAGE_LIMIT", 100)
+    for asset in ("BTC", "ETH"):
+        bitvavo_stub.routes[("GET", f"/{asset}-EUR/candles")] = candles_route(asset)
+
+    result = bitmaster.backfill_candles("1d", start="2024-01-01", assets=["BTC", "ETH"], workers=2)
+    days = expected_days()
+    assert result["errors"] == {}
+    assert result["rows_per_second"] > 0
+    print(f"Backfill: {result['rows']} Zeilen, {result['rows_per_second']:.0f} Zeilen/s")
+    for asset in ("BTC", "ETH"):
+        timestamps = stored(db, asset)
+        assert timestamps == list(range(START_MS, START_MS + days * DAY_MS, DAY_MS))
+    assert bitvavo_stub.count("GET", "/BTC-EUR/candles") == -(-(days - 1) // 99)
+    rates = db.execute("SELECT COUNT(*) FROM historical_rates WHERE asset = 'BTC'").fetchone()[0]
+    assert rates == days
+
+    # Zweiter Lauf setzt bei der letzten Kerze an und legt nichts doppelt an
+    bitvavo_stub.requests.clear()
+    again = bitmaster.backfill_candles("1d", start="2024-01-01", assets=["BTC", "ETH"], workers=2)
+    assert bitvavo_stub.count("GET", "/BTC-EUR/candles") == 1
+    resumed = [r[2] for r in bitvavo_stub.requests if r[1] == "/BTC-EUR/candles"][0]
+    assert int(resumed["start"]) == stored(db, "BTC")[-1]
+    assert again["rows"] == 2
+    assert len(stored(db, "BTC")) == days
+
+
+def test_backfill_isolates_failing_market(db, bitvavo_stub):
+    bitvavo_stub.routes[("GET", "/BTC-EUR/candles")] = candles_route("BTC")
+    bitvavo_stub.routes[("GET", "/ETH-EUR/candles")] = lambda query, body: {"errorCode": 205, "error": "bad market"}
+
+    result = bitmaster.backfill_candles("1d", start="2024-01-01", assets=["BTC", "ETH"])
+    assert list(result["errors"]) == ["ETH"]
+    assert len(stored(db, "BTC")) == expected_days()
+    assert stored(db, "ETH") == []
+
+
+HOUR_MS = 3_600_000
+
+
+def hourly_candles(first_ms, hours):
+    """
+    Stündliche Kerzen (timestamp, open, high, low, close, volume) mit
+    unterschiedlichen Hochs/Tiefs, damit falsche Aggregationen auffallen.
+    """
+    rows = []
+    for i in range(hours):
+        o = 1000.0 + i
+        rows.append((first_ms + i * HOUR_MS, o, o + 5 + i % 7, o - 3 - i % 5, o + 1, 1.0 + i % 3))
+    return rows
+
+
+def insert_candles(db, asset, interval, rows):
+    db.executemany(
+        "INSERT INTO price_candles (asset, interval, timestamp, open, high, low, close, volume) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        [(asset, interval) + tuple(r) for r in rows]
+    )
+    db.commit()
+
+
+def candles(db, asset, interval):
+    return db.execute("""
+        SELECT timestamp, open, high, low, close, volume FROM price_candles
+        WHERE asset = ? AND interval = ? ORDER BY timestamp
+    """, (asset, interval)).fetchall()
+
+
+def expected_rollup(rows, bucket):
+    result = {}
+    for (ts, o, h, l, c, v) in rows:
+        result.setdefault(bucket(ts), []).append((o, h, l, c, v))
+    return [
+        (ts, group[0][0], max(g[1] for g in group), min(g[2] for g in group), group[-1][3], sum(g[4] for g in group))
+        for (ts, group) in sorted(result.items())
+    ]
+
+
+def test_retention_rolls_hours_into_days(db, monkeypatch):
+    monkeypatch.setattr(bitmaster, "PRICE_RETENTION_INTRADAY_DAYS", 30)
+    monkeypatch.setattr(bitmaster, "PRICE_RETENTION_DAILY_DAYS", 10000)
+    hours = hourly_candles(START_MS, 12 * 24)
+    insert_candles(db, "BTC", "1h", hours)
+    # Tageskerze der Börse für Tag 2 existiert schon und gewinnt
+    exchange_day = (START_MS + 2 * DAY_MS, 1.0, 2.0, 0.5, 1.5, 99.0)
+    insert_candles(db, "BTC", "1d", [exchange_day])
+
+    now_ms = START_MS + 40 * DAY_MS   # Grenze: Tag 10
+    result = bitmaster.run_price_retention(pause=0, now_ms=now_ms)
+
+    old = [r for r in hours if r[0] < START_MS + 10 * DAY_MS]
+    expected = expected_rollup(old, bitmaster._day_bucket)
+    expected[2] = exchange_day
+    assert candles(db, "BTC", "1d") == expected
+    assert candles(db, "BTC", "1h") == [r for r in hours if r[0] >= START_MS + 10 * DAY_MS]
+    assert (result["rows_read"], result["rows_written"]) == (len(old), 9)
+    assert db.execute("SELECT rolled_until FROM price_rollup_state WHERE asset = 'BTC' AND interval = '1h'").fetchone() \
+        == (START_MS + 10 * DAY_MS,)
+
+    # Zweiter Lauf: nichts mehr zu tun
+    assert bitmaster.run_price_retention(pause=0, now_ms=now_ms)["batches"] == 0
+
+
+def test_retention_weeks_start_on_monday(db, monkeypatch):
+    monkeypatch.setattr(bitmaster, "PRICE_RETENTION_DAILY_DAYS", 20)
+    first = START_MS - 5 * DAY_MS     # Mittwoch, 2023-12-27
+    days = [(first + i * DAY_MS, 10.0 + i, 12.0 + i % 4, 9.0 - i % 3, 11.0 + i, 2.0) for i in range(25)]
+    insert_candles(db, "ETH", "1d", days)
+
+    bitmaster.run_price_retention(pause=0, now_ms=START_MS + 40 * DAY_MS)   # Grenze: Montag 2024-01-15
+
+    weeks = candles(db, "ETH", "1w")
+    mondays = [START_MS - 7 * DAY_MS, START_MS, START_MS + 7 * DAY_MS]
+    assert [w[0] for w in weeks] == mondays
+    assert all(datetime.datetime.fromtimestamp(ts / 1000, datetime.timezone.utc).weekday() == 0 for ts in mondays)
+    old = [d for d in days if d[0] < START_MS + 14 * DAY_MS]
+    assert weeks == expected_rollup(old, bitmaster._week_bucket)
+    assert weeks[0][5] == 5 * 2.0     # angebrochene erste Woche (Mi-So)
+    assert candles(db, "ETH", "1d") == [d for d in days if d[0] >= START_MS + 14 * DAY_MS]
+
+
+def test_retention_resumes_after_interruption(db, monkeypatch):
+    monkeypatch.setattr(bitmaster, "PRICE_RETENTION_DAILY_DAYS", 10000)
+    monkeypatch.setattr(bitmaster, "ROLLUP_BATCH_ROWS", 24)   # ein Tag je Transaktion
+    hours = hourly_candles(START_MS, 10 * 24)
+    insert_candles(db, "BTC", "1h", hours)
+    now_ms = START_MS + 38 * DAY_MS   # Grenze: Tag 8
+
+    assert bitmaster.run_price_retention(max_batches=3, pause=0, now_ms=now_ms)["batches"] == 3
+    state = db.execute("SELECT rolled_until FROM price_rollup_state WHERE asset = 'BTC' AND interval = '1h'").fetchone()
+    assert state == (START_MS + 3 * DAY_MS,)
+    assert candles(db, "BTC", "1h")[0][0] == START_MS + 3 * DAY_MS
+
+    # Abbruch mitten in einer Transaktion: nichts halb geschrieben, Stand unverändert
+    aggregate = bitmaster.aggregate_candles
+
+    def failing(rows, bucket):
+        monkeypatch.setattr(bitmaster, "aggregate_candles", aggregate)
+        raise RuntimeError("Abbruch (Test)")
+    monkeypatch.setattr(bitmaster, "aggregate_candles", failing)
+    with pytest.raises(RuntimeError):
+        bitmaster.run_price_retention(pause=0, now_ms=now_ms)
+    assert db.execute("SELECT rolled_until FROM price_rollup_state").fetchall() == [state]
+    assert len(candles(db, "BTC", "1d")) == 3
+    assert candles(db, "BTC", "1h")[0][0] == START_MS + 3 * DAY_MS
+
+    assert bitmaster.run_price_retention(pause=0, now_ms=now_ms)["batches"] == 5
+    old = [r for r in hours if r[0] < START_MS + 8 * DAY_MS]
+    assert candles(db, "BTC", "1d") == expected_rollup(old, bitmaster._day_bucket)
+    assert candles(db, "BTC", "1h") == [r for r in hours if r[0] >= START_MS + 8 * DAY_MS]
+    assert db.execute("SELECT rolled_until FROM price_rollup_state").fetchall() == [(START_MS + 8 * DAY_MS,)]
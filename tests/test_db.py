@@ -0,0 +1,30 @@
+import sqlite3
+import threading
+
+import bitmaster
+
+
+def test_connection_is_reused_per_thread(db):
+    assert bitmaster.get_connection() is db
+    assert db.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    other = []
+    thread = threading.Thread(target=lambda: (other.append(bitmaster.get_connection()), bitmaster.close_connection()))
+    thread.start()
+    thread.join()
+    assert other[0] is not db
+
+
+def test_bench_db_runs_both_modes(tmp_path):
+    path = str(tmp_path / "bench.db")
+    result = bitmaster.benchmark_db(path, threads=4, operations=400, write_pct=25, rows=100)
+
+    assert set(result) == {"connect_per_call", "per_thread"}
+    assert result["per_thread"]["errors"] == 0
+    for (name, r) in result.items():
+        assert r["reads"] + r["writes"] + r["errors"] == 400
+        conn = sqlite3.connect(f"{path}.{name}")
+        assert conn.execute("SELECT COUNT(*) FROM bench").fetchone()[0] == 100 + r["writes"]
+        mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+        conn.close()
+        assert mode == ("wal" if name == "per_thread" else "delete")
+    assert result["per_thread"]["writes"] == 100
@@ -0,0 +1,211 @@
+"""
+Fault-Injection gegen die Mock-Börse: placeOrder/getOrders scheitern nach
+Drehbuch (vor bzw. nach Annahme der Order, Überlast, Rate-Limit, fachliche
+Fehler). Geprüft wird, dass nie doppelt gekauft und nur Sinnvolles wiederholt wird.
+"""
+import time
+
+import numpy as np
+import pytest
+import requests
+
+import bitmaster
+
+MARKET = "BTC-EUR"
+ERRORS = {
+    "overloaded": {"errorCode": 107, "error": "Bitvavo is overloaded."},
+    "insufficient": {"errorCode": 216, "error": "You do not have sufficient balance to complete this operation."},
+    "rate_limit": {"errorCode": 105, "error": "Rate limit exceeded."},
+}
+
+
+class FaultyExchange(bitmaster.MockExchange):
+    """
+    faults[methode] = Liste von Störungen für die nächsten Aufrufe (None = normal):
+      timeout_before  Exception, bevor die Börse etwas tut
+      timeout_after   Order wird ausgeführt, die Antwort geht verloren
+      overloaded / insufficient / rate_limit  Fehler-Antwort der Börse
+    """
+
+    def __init__(self):
+        day = float(np.datetime64("2024-01-01", "D").astype(np.int64))
+        super().__init__(prices={"BTC": (np.array([day]), np.array([40000.0]))}, latency_ms=0)
+        self.faults = {"placeOrder": [], "getOrders": []}
+        self.calls = {"placeOrder": 0, "getOrders": 0}
+
+    def _fault(self, method):
+        self.calls[method] += 1
+        return self.faults[method].pop(0) if self.faults[method] else None
+
+    def _error(self, fault):
+        if fault == "timeout_before":
+            raise requests.exceptions.ConnectTimeout("Verbindung abgelehnt (Fault-Injection)")
+        if fault == "rate_limit":
+            self.rateLimitRemaining = 0
+            self.rateLimitReset = int(time.time() * 1000) + 50
+        return ERRORS.get(fault)
+
+    def placeOrder(self, market, side, orderType, body):
+        fault = self._fault("placeOrder")
+        error = self._error(fault)
+        if error:
+            return error
+        order = super().placeOrder(market, side, orderType, body)
+        if fault == "timeout_after":
+            raise requests.exceptions.ReadTimeout("Antwort verloren (Fault-Injection)")
+        return order
+
+    def getOrders(self, market, options=None):
+        error = self._error(self._fault("getOrders"))
+        if error:
+            return error
+        return super().getOrders(market, options)
+
+    def order_count(self):
+        return len(self._orders.get(MARKET, []))
+
+
+@pytest.fixture
+def exchange(monkeypatch):
+    monkeypatch.setattr(bitmaster, "RETRY_BASE_DELAY", 0.001)
+    return FaultyExchange()
+
+
+def place(exchange):
+    return bitmaster.place_order_idempotent(exchange, MARKET, {"amountQuote": "10"}, "cid-1")
+
+
+def test_timeout_after_accept_is_not_bought_twice(exchange):
+    exchange.faults["placeOrder"] = ["timeout_after"]
+    order = place(exchange)
+    assert order["clientOrderId"] == "cid-1" and order["status"] == "filled"
+    assert exchange.calls["placeOrder"] == 1
+    assert exchange.order_count() == 1
+
+
+def test_timeout_after_accept_with_flaky_lookup(exchange):
+    exchange.faults["placeOrder"] = ["timeout_after"]
+    exchange.faults["getOrders"] = ["timeout_before", "overloaded"]
+    order = place(exchange)
+    assert order["clientOrderId"] == "cid-1"
+    assert exchange.calls["placeOrder"] == 1
+    assert exchange.calls["getOrders"] == 3
+    assert exchange.order_count() == 1
+
+
+def test_timeout_before_accept_is_retried(exchange):
+    exchange.faults["placeOrder"] = ["timeout_before", "overloaded"]
+    order = place(exchange)
+    assert order["status"] == "filled"
+    assert exchange.calls["placeOrder"] == 3
+    assert exchange.order_count() == 1
+
+
+def test_rate_limit_waits_for_reset(exchange):
+    exchange.faults["placeOrder"] = ["rate_limit"]
+    started = time.monotonic()
+    order = place(exchange)
+    assert order["status"] == "filled"
+    assert time.monotonic() - started >= 0.05
+    assert exchange.calls["getOrders"] == 0
+    assert exchange.order_count() == 1
+
+
+def test_fatal_error_is_not_retried(exchange):
+    exchange.faults["placeOrder"] = ["insufficient"]
+    response = place(exchange)
+    assert response["errorCode"] == 216
+    assert exchange.calls == {"placeOrder": 1, "getOrders": 0}
+
+
+def test_timeout_after_accept_with_failed_lookup_is_not_resent(exchange):
+    exchange.faults["placeOrder"] = ["timeout_after"]
+    exchange.faults["getOrders"] = ["timeout_before"] * 3
+    with pytest.raises(Exception, match="Order-Abgleich fehlgeschlagen"):
+        place(exchange)
+    assert exchange.calls["placeOrder"] == 1
+    assert exchange.calls["getOrders"] == 3
+    assert exchange.order_count() == 1
+
+
+def test_duplicate_id_with_failed_lookup_is_not_resent(exchange):
+    place(exchange)
+    exchange.faults["getOrders"] = ["timeout_before"] * 3
+    with pytest.raises(Exception, match="Order-Abgleich fehlgeschlagen"):
+        place(exchange)
+    assert exchange.calls["placeOrder"] == 2
+    assert exchange.order_count() == 1
+
+
+def test_duplicate_id_outside_window_is_not_resent(exchange):
+    place(exchange)
+    exchange._orders.clear()  # Order liegt außerhalb des Suchfensters
+    with pytest.raises(Exception, match="bereits vergeben"):
+        place(exchange)
+    assert exchange.calls["placeOrder"] == 2
+
+
+def test_lookup_uses_start_ms(exchange, monkeypatch):
+    seen = []
+    get_orders = exchange.getOrders
+    monkeypatch.setattr(exchange, "getOrders", lambda market, options=None: seen.append(options) or get_orders(market, options))
+    exchange.faults["placeOrder"] = ["timeout_after"]
+    order = bitmaster.place_order_idempotent(exchange, MARKET, {"amountQuote": "10"}, "cid-1", start_ms=12345)
+    assert order["clientOrderId"] == "cid-1"
+    assert seen == [{"start": 12345, "limit": 1000}]
+
+
+def test_persistent_timeouts_give_up_without_order(exchange):
+    exchange.faults["placeOrder"] = ["timeout_before"] * 3
+    with pytest.raises(Exception, match="nach 3 Versuchen"):
+        place(exchange)
+    assert exchange.order_count() == 0
+
+
+def test_request_retry_only_for_transient_errors(exchange):
+    exchange.faults["getOrders"] = ["overloaded", "overloaded"]
+    assert bitmaster.bitvavo_request_with_retry(exchange.getOrders, MARKET, {}) == []
+    assert exchange.calls["getOrders"] == 3
+
+    exchange.faults["getOrders"] = ["insufficient"]
+    assert bitmaster.bitvavo_request_with_retry(exchange.getOrders, MARKET, {})["errorCode"] == 216
+    assert exchange.calls["getOrders"] == 4
+
+
+def test_schedule_run_books_lost_response_once(db, exchange, monkeypatch):
+    monkeypatch.setattr(bitmaster, "get_bitvavo_client", lambda account_id=None: exchange)
+    c = db.cursor()
+    c.execute("INSERT INTO schedules (account_id, weekday, time_of_day) VALUES (1, 'Monday', '08:00')")
+    c.execute("INSERT INTO schedule_lines (schedule_id, asset, amount_eur) VALUES (?, 'BTC', 10)", (c.lastrowid,))
+    db.commit()
+    run_at = bitmaster.datetime.datetime(2024, 1, 1, 8, 0)
+
+    exchange.faults["placeOrder"] = ["timeout_after"]
+    bitmaster.execute_investment(1, run_at)
+    bitmaster.execute_investment(1, run_at)  # erneuter Lauf desselben Termins
+
+    assert exchange.order_count() == 1
+    assert db.execute("SELECT COUNT(*) FROM trades").fetchone()[0] == 1
+    assert db.execute("SELECT status FROM order_journal").fetchall() == [("filled",)]
+
+
+def test_schedule_run_with_failed_lookup_stays_pending(db, exchange, monkeypatch):
+    monkeypatch.setattr(bitmaster, "get_bitvavo_client", lambda account_id=None: exchange)
+    c = db.cursor()
+    c.execute("INSERT INTO schedules (account_id, weekday, time_of_day) VALUES (1, 'Monday', '08:00')")
+    c.execute("INSERT INTO schedule_lines (schedule_id, asset, amount_eur) VALUES (?, 'BTC', 10)", (c.lastrowid,))
+    db.commit()
+
+    exchange.faults["placeOrder"] = ["timeout_after"]
+    exchange.faults["getOrders"] = ["timeout_before"] * 3
+    bitmaster.execute_investment(1, bitmaster.datetime.datetime(2024, 1, 1, 8, 0))
+
+    assert exchange.calls["placeOrder"] == 1
+    assert db.execute("SELECT status FROM order_journal").fetchall() == [("pending",)]
+    assert db.execute("SELECT COUNT(*) FROM trades").fetchone()[0] == 0
+
+    # Sobald die Börse wieder antwortet, bucht der Abgleich die Order genau einmal
+    assert bitmaster.reconcile_order_journal()["filled"] == 1
+    assert db.execute("SELECT status FROM order_journal").fetchall() == [("filled",)]
+    assert db.execute("SELECT COUNT(*) FROM trades").fetchone()[0] == 1
+    assert exchange.order_count() == 1
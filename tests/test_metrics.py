@@ -0,0 +1,29 @@
+import bitmaster
+
+
+def test_statement_labels_are_operation_and_table():
+    label = bitmaster._statement_label
+    assert label("SELECT id, asset FROM trades WHERE id > ? ORDER BY id") == "select trades"
+    assert label("""
+        INSERT INTO order_journal (client_order_id) VALUES (?)
+        ON CONFLICT (client_order_id) DO NOTHING
+    """) == "insert order_journal"
+    assert label("UPDATE notification_outbox SET status = ? WHERE id IN (?, ?, ?)") == "update notification_outbox"
+    assert label("DELETE FROM scheduler_state WHERE job_key = ?") == "delete scheduler_state"
+    assert label("WITH RECURSIVE t (a) AS (SELECT MIN(asset) FROM trades) SELECT a FROM t") == "select trades"
+    assert label("SELECT 1") == "select"
+    for sql in ("PRAGMA journal_mode=WAL", "BEGIN IMMEDIATE", "COMMIT", "CREATE INDEX ix ON trades (id)",
+                "DROP TABLE x", "ALTER TABLE trades ADD COLUMN y", "EXPLAIN QUERY PLAN SELECT 1", ""):
+        assert label(sql) == "", sql
+
+
+def test_db_metric_has_bounded_labels(db):
+    for n in range(1, 30):
+        db.execute(f"SELECT id FROM trades WHERE id IN ({','.join('?' * n)})", list(range(n))).fetchall()
+    db.execute("PRAGMA user_version").fetchall()
+    db.execute("BEGIN")
+    db.execute("COMMIT")
+    labels = {key[0] for key in bitmaster.metric_db_seconds._values}
+    assert "select trades" in labels
+    assert all(len(label.split()) <= 2 for label in labels), labels
+    assert not [label for label in labels if label.split()[0] in ("pragma", "begin", "commit", "create")]
@@ -0,0 +1,107 @@
+import bitmaster
+
+
+def test_indexes_turn_scans_into_searches(tmp_path):
+    result = bitmaster.benchmark_indexes(str(tmp_path / "indexes.db"), rows=6000, repeat=1)
+    for query in result["queries"]:
+        assert query["plan_before"].startswith("SCAN"), query
+        assert query["plan_after"].startswith("SEARCH") and "INDEX" in query["plan_after"], query
+
+
+def test_schedule_lines_cascade(db):
+    c = db.cursor()
+    c.execute("INSERT INTO schedules (account_id, weekday, time_of_day) VALUES (1, 'Monday', '08:00')")
+    c.execute("INSERT INTO schedule_lines (schedule_id, asset, amount_eur) VALUES (?, 'BTC', 10)", (c.lastrowid,))
+    c.execute("DELETE FROM schedules")
+    assert c.execute("SELECT COUNT(*) FROM schedule_lines").fetchone()[0] == 0
+    assert bitmaster.get_schema_version(db) == bitmaster.MIGRATIONS[-1][0]
+
+
+def legacy_dumps(n=300):
+    """
+    Vollabzüge im alten balances-Format: (account_id, timestamp, {währung: menge}).
+    BTC ändert sich bei jedem Abruf, ETH gibt es nur zeitweise, Konto 2 läuft dazwischen.
+    """
+    start = bitmaster.datetime.datetime(2024, 1, 1)
+    dumps = []
+    for i in range(n):
+        balances = {"BTC": 0.01 * (i + 1), "EUR": float(1000 - (i // 2) * 3)}
+        if 10 <= i < 50:
+            balances["ETH"] = 0.5 + i / 100
+        timestamp = (start + bitmaster.timedelta(hours=i)).strftime(bitmaster.BALANCE_TIME_FORMAT)
+        dumps.append((1, timestamp, balances))
+        if i % 25 == 0:
+            dumps.append((2, timestamp, {"ADA": float(i + 1)}))
+    return dumps
+
+
+def legacy_at(dumps, account_id, at):
+    # Altes Lesen: letzter Vollabzug bis at
+    matches = [b for (a, t, b) in dumps if a == account_id and t <= at]
+    return dict(matches[-1]) if matches else {}
+
+
+def test_balance_migration_keeps_every_state(db):
+    dumps = legacy_dumps()
+    c = db.cursor()
+    c.executemany(
+        "INSERT INTO balances (account_id, timestamp, currency, amount) VALUES (?, ?, ?, ?)",
+        [(a, t, currency, amount) for (a, t, b) in dumps for (currency, amount) in b.items()]
+    )
+    bitmaster._migration_balance_history(c)
+    db.commit()
+
+    assert c.execute("SELECT COUNT(*) FROM balances").fetchone()[0] == 0
+    # 300 Abrufe mit je mind. einer Änderung -> mehr als ein Vollstand für Konto 1
+    full = c.execute("SELECT COUNT(*) FROM balance_snapshots WHERE account_id = 1 AND is_full = 1").fetchone()[0]
+    assert full >= 300 // bitmaster.BALANCE_KEYFRAME_ROWS + 1
+
+    snapshots = c.execute("SELECT id, account_id, taken_at FROM balance_snapshots ORDER BY id").fetchall()
+    assert len(snapshots) == len(dumps)
+    for (snapshot_id, account_id, taken_at) in snapshots:
+        state = bitmaster._read_balance_state(c, account_id, snapshot_id)
+        assert state.balances == legacy_at(dumps, account_id, taken_at), taken_at
+        assert state.delta_rows <= bitmaster.BALANCE_KEYFRAME_ROWS
+
+    for (account_id, at) in ((1, "2024-01-01 00:00:00"), (1, "2024-01-02 12:30:00"), (1, "2024-01-03 02:00:00"),
+                             (1, "2024-12-31"), (2, "2024-01-05"), (2, "2023-12-31")):
+        (taken_at, balances) = bitmaster.balance_at(account_id, at)
+        assert balances == legacy_at(dumps, account_id, bitmaster._balance_time(at, end_of_day=True))
+
+    # ETH verschwindet nach dem 50. Abruf (2024-01-03 02:00) und taucht im Verlauf nicht mehr auf
+    history = bitmaster.balance_history(1, "2024-01-02 20:00:00", "2024-01-03 06:00:00")
+    expected = [{"taken_at": "2024-01-02 20:00:00", "balances": legacy_at(dumps, 1, "2024-01-02 20:00:00")}]
+    expected += [{"taken_at": t, "balances": b} for (a, t, b) in dumps
+                 if a == 1 and "2024-01-02 20:00:00" < t <= "2024-01-03 06:00:00"]
+    assert history == expected
+    assert "ETH" in history[0]["balances"] and "ETH" not in history[-1]["balances"]
+
+    # Verlauf über eine Vollstand-Grenze hinweg (erster Abruf = Stand zu Beginn)
+    history = bitmaster.balance_history(1, "2024-01-01", "2024-01-13")
+    assert [h["balances"] for h in history] == [b for (a, _, b) in dumps if a == 1]
+
+
+def test_balance_snapshot_continues_after_migration(db):
+    dumps = legacy_dumps(20)
+    c = db.cursor()
+    c.executemany(
+        "INSERT INTO balances (account_id, timestamp, currency, amount) VALUES (?, ?, ?, ?)",
+        [(a, t, currency, amount) for (a, t, b) in dumps for (currency, amount) in b.items()]
+    )
+    bitmaster._migration_balance_history(c)
+
+    previous = bitmaster.latest_balance_state(c, 1)
+    # Unveränderter Abruf: kein neuer Snapshot, nur checked_at
+    same = bitmaster.write_balance_snapshot(c, 1, previous, dict(previous.balances), "2024-02-01 00:00:00", "test")
+    assert same.snapshot_id == previous.snapshot_id
+    assert c.execute("SELECT checked_at FROM balance_snapshots WHERE id = ?", (previous.snapshot_id,)).fetchone()[0] \
+        == "2024-02-01 00:00:00"
+
+    state = bitmaster.write_balance_snapshot(c, 1, same, {"BTC": 1.0}, "2024-02-02 00:00:00", "test")
+    db.commit()
+    assert bitmaster._read_balance_state(c, 1, state.snapshot_id).balances == {"BTC": 1.0}
+    deltas = dict(c.execute(
+        "SELECT currency, amount FROM balance_deltas WHERE snapshot_id = ?", (state.snapshot_id,)
+    ).fetchall())
+    assert deltas == {"BTC": 1.0, "EUR": 0.0, "ETH": 0.0}
+    assert bitmaster.balance_at(1, "2024-02-01") == (previous.taken_at, previous.balances)
@@ -0,0 +1,70 @@
+import datetime
+
+import pytest
+
+import bitmaster
+
+
+@pytest.fixture
+def simulation(db, monkeypatch):
+    monkeypatch.setattr(bitmaster, "SIMULATION_MODE", True)
+    monkeypatch.setattr(bitmaster, "_mock_exchanges", {})
+    monkeypatch.setattr(bitmaster, "_mock_prices", None)
+    monkeypatch.setattr(bitmaster, "_account_rate_limiters", {})
+    monkeypatch.setattr(bitmaster, "price_cache", bitmaster.PriceCache())
+    return db
+
+
+def add_schedule(db, *assets):
+    c = db.cursor()
+    c.execute("INSERT INTO schedules (account_id, weekday, time_of_day) VALUES (1, 'Monday', '08:00')")
+    schedule_id = c.lastrowid
+    c.executemany(
+        "INSERT INTO schedule_lines (schedule_id, asset, amount_eur) VALUES (?, ?, 10)",
+        [(schedule_id, asset) for asset in assets]
+    )
+    db.commit()
+    return schedule_id
+
+
+def test_orders_fill_without_historical_rates(simulation):
+    schedule_id = add_schedule(simulation, "BTC", "ETH")
+    bitmaster.execute_investment(schedule_id, datetime.datetime(2024, 1, 1, 8))
+
+    rows = simulation.execute("SELECT asset, avg_price FROM trades ORDER BY asset").fetchall()
+    assert [r[0] for r in rows] == ["BTC", "ETH"]
+    for (_, avg_price) in rows:
+        assert avg_price == pytest.approx(bitmaster.MOCK_DEFAULT_PRICE, rel=0.01)
+
+
+def test_fallback_needs_no_network_by_default(simulation, monkeypatch):
+    def no_network(*args, **kwargs):
+        raise AssertionError("Mock-Börse darf ohne MOCK_LIVE_FALLBACK nicht ins Netz")
+
+    monkeypatch.setattr(bitmaster, "_cached_bitvavo_client", no_network)
+    exchange = bitmaster.get_mock_exchange(1)
+    assert float(exchange.tickerPrice({"market": "ETH-EUR"})["price"]) == bitmaster.MOCK_DEFAULT_PRICE
+
+
+def test_fallback_uses_live_price_once(simulation, bitvavo_stub, monkeypatch):
+    monkeypatch.setattr(bitmaster, "MOCK_LIVE_FALLBACK", True)
+    bitvavo_stub.routes[("GET", "/ticker/price")] = lambda query, body: {"market": query["market"], "price": "40000"}
+    exchange = bitmaster.get_mock_exchange(1)
+
+    assert exchange.tickerPrice({"market": "BTC-EUR"})["price"] == "40000"
+    assert exchange.placeOrder("BTC-EUR", "buy", "market", {"amountQuote": "10"})["status"] == "filled"
+    assert bitvavo_stub.count("GET", "/ticker/price") == 1
+    assert exchange.tickerPrice({"market": "FOO-EUR"})["errorCode"] == 205
+
+
+def test_update_prices_reloads_mock_exchanges(simulation, monkeypatch):
+    monkeypatch.setattr(bitmaster, "MOCK_DEFAULT_PRICE", 123.0)
+    add_schedule(simulation, "BTC")
+    exchange = bitmaster.get_mock_exchange(1)
+    assert "BTC" not in exchange._prices
+
+    bitmaster.update_prices_for_assets()
+
+    assert simulation.execute("SELECT asset, price_eur FROM historical_rates").fetchall() == [("BTC", 123.0)]
+    assert "BTC" in exchange._prices
+    assert exchange._prices is bitmaster.get_mock_exchange(None)._prices
@@ -0,0 +1,85 @@
+import time
+
+import pytest
+
+import bitmaster
+
+
+def test_candidate_count_matches_grid():
+    candidates = bitmaster.optimizer_candidates(3, weekdays=[0, 3], split_step=10, cadences=(1, 2))
+    assert len(candidates) == bitmaster.math.comb(10 + 2, 2) * 2 * 2
+
+
+def test_too_many_candidates_rejected_before_enumeration():
+    started = time.perf_counter()
+    with pytest.raises(ValueError):
+        bitmaster.optimizer_candidates(6, split_step=1)
+    assert time.perf_counter() - started < 0.5
+
+
+def test_form_rejects_fine_split_step(db):
+    client = bitmaster.app.test_client()
+    with client.session_transaction() as session:
+        session["logged_in"] = True
+    response = client.post("/optimizer", data={"split_step": "1"})
+    assert response.status_code == 302
+    response = client.post("/api/optimizer", data={"split_step": "abc"})
+    assert response.status_code == 400
+
+
+@pytest.fixture
+def plan(db):
+    c = db.cursor()
+    c.execute("INSERT INTO schedules (account_id, weekday, time_of_day) VALUES (1, 'Monday', '08:00')")
+    schedule_id = c.lastrowid
+    c.executemany(
+        "INSERT INTO schedule_lines (schedule_id, asset, amount_eur) VALUES (?, ?, 10)",
+        [(schedule_id, "BTC"), (schedule_id, "ETH")]
+    )
+    c.executemany(
+        "INSERT INTO historical_rates (date, asset, price_eur) VALUES (?, ?, ?)",
+        [(f"2024-01-{d:02d}", asset, price * (1 + d / 100))
+         for d in range(1, 29) for (asset, price) in (("BTC", 40000.0), ("ETH", 2000.0))]
+    )
+    db.commit()
+    return schedule_id
+
+
+def in_other_worker(func):
+    # Eigener Thread = eigene DB-Verbindung, wie ein anderer Web-Worker
+    result = []
+    thread = bitmaster.threading.Thread(target=lambda: result.append(func()))
+    thread.start()
+    thread.join()
+    return result[0]
+
+
+def test_run_is_visible_from_other_workers(plan, monkeypatch):
+    monkeypatch.setattr(bitmaster, "OPTIMIZER_WORKERS", 1)
+    run = bitmaster.start_optimizer(1, weekdays=[0, 3], split_step=50, cadences=(1,), metric="pnl_pct", wait=True)
+    assert run.status == "done"
+
+    other = in_other_worker(lambda: bitmaster.get_optimizer_run(run.id, 1).progress(limit=0))
+    assert (other["status"], other["done"], other["total"]) == ("done", 6, 6)
+    pnl = [r["pnl_pct"] for r in other["results"]]
+    assert pnl == sorted(pnl, reverse=True)
+    assert set(other["results"][0]["weights"]) == {"BTC", "ETH"}
+    assert in_other_worker(lambda: bitmaster.get_optimizer_run(run.id, 2)) is None
+    assert [r.id for r in bitmaster.list_optimizer_runs(1)] == [run.id]
+
+
+def test_cancel_from_other_worker(db):
+    run = bitmaster.OptimizerRun({"account_id": 1, "metric": "mwr"}, ["BTC"], [(0, (100.0,), 1)])
+    run.save()
+    assert not run._cancel_requested()
+    in_other_worker(lambda: bitmaster.get_optimizer_run(run.id, 1).cancel())
+    assert run._cancel_requested()
+
+
+def test_abandoned_run_is_reported_failed(db, monkeypatch):
+    run = bitmaster.OptimizerRun({"account_id": 1, "metric": "mwr"}, ["BTC"], [(0, (100.0,), 1)])
+    run.save()
+    assert bitmaster.get_optimizer_run(run.id, 1).status == "running"
+    monkeypatch.setattr(bitmaster, "OPTIMIZER_STALE_SECONDS", -1)
+    loaded = bitmaster.get_optimizer_run(run.id, 1)
+    assert loaded.status == "failed" and loaded.error
@@ -0,0 +1,131 @@
+"""
+Ausführung eines Schedules über den Worker-Pool: Fehler einer Zeile bleiben
+isoliert, Ergebnisse landen in EINER Transaktion, und je Lauf wird genau
+ein Digest in den Mail-Outbox gestellt.
+"""
+import threading
+
+import numpy as np
+import pytest
+import requests
+
+import bitmaster
+
+RUN_AT = bitmaster.datetime.datetime(2024, 1, 1, 8, 0)
+
+
+class ScriptedExchange(bitmaster.MockExchange):
+    """
+    Mock-Börse mit Drehbuch je Asset: rejected -> Börse lehnt die Order ab,
+    broken -> Kursabfrage wirft eine Exception. barrier (optional) lässt jede
+    Order warten, bis alle parallel angekommen sind.
+    """
+
+    def __init__(self, assets, rejected=(), broken=(), barrier=None):
+        day = float(np.datetime64("2024-01-01", "D").astype(np.int64))
+        super().__init__(
+            prices={a: (np.array([day]), np.array([100.0 * (i + 1)])) for (i, a) in enumerate(assets)},
+            latency_ms=0
+        )
+        self.rejected = set(rejected)
+        self.broken = set(broken)
+        self.barrier = barrier
+        self.placed = []
+
+    def tickerPrice(self, options):
+        if self._market_asset(options.get("market", "")) in self.broken:
+            raise requests.exceptions.ConnectionError("Kursabfrage gestört")
+        return super().tickerPrice(options)
+
+    def placeOrder(self, market, side, orderType, body):
+        self.placed.append(market)
+        if self.barrier is not None:
+            self.barrier.wait()
+        if self._market_asset(market) in self.rejected:
+            return {"errorCode": 216, "error": "You do not have sufficient balance to complete this operation."}
+        return super().placeOrder(market, side, orderType, body)
+
+
+@pytest.fixture
+def run(db, monkeypatch):
+    """
+    Legt einen Schedule mit den Assets an und führt ihn gegen exchange aus.
+    """
+    monkeypatch.setattr(bitmaster, "RETRY_BASE_DELAY", 0.001)
+    monkeypatch.setattr(bitmaster, "ORDER_MIN_INTERVAL", 0)
+    monkeypatch.setattr(bitmaster, "_account_rate_limiters", {})
+    monkeypatch.setattr(bitmaster, "price_cache", bitmaster.PriceCache())
+    db.execute("""
+        INSERT INTO email_settings (
+            smtp_server, smtp_port, smtp_user, smtp_pass, from_email, to_email,
+            send_on_success, send_on_error, use_tls
+        ) VALUES ('localhost', 25, '', '', 'bot@example.org', 'me@example.org', 1, 1, 0)
+    """)
+    db.commit()
+    bitmaster.settings_cache.invalidate()
+
+    def execute(exchange, assets):
+        monkeypatch.setattr(bitmaster, "get_bitvavo_client", lambda account_id=None: exchange)
+        c = db.cursor()
+        c.execute("INSERT INTO schedules (account_id, weekday, time_of_day) VALUES (1, 'Monday', '08:00')")
+        schedule_id = c.lastrowid
+        c.executemany(
+            "INSERT INTO schedule_lines (schedule_id, asset, amount_eur) VALUES (?, ?, 10)",
+            ((schedule_id, a) for a in assets)
+        )
+        db.commit()
+        bitmaster.execute_investment(schedule_id, RUN_AT)
+        return schedule_id
+
+    return execute
+
+
+def journal(db):
+    return dict(db.execute("SELECT asset, status FROM order_journal"))
+
+
+def test_failing_lines_do_not_affect_the_others(db, run):
+    assets = ["BTC", "ETH", "ADA", "SOL"]
+    exchange = ScriptedExchange(assets, rejected={"ADA"}, broken={"SOL"})
+    run(exchange, assets)
+
+    trades = db.execute("SELECT asset, amount_eur, order_id FROM trades ORDER BY asset").fetchall()
+    assert [(t[0], t[1]) for t in trades] == [("BTC", 10), ("ETH", 10)]
+    assert all(t[2] for t in trades)
+    assert journal(db) == {"BTC": "filled", "ETH": "filled", "ADA": "rejected", "SOL": "pending"}
+    assert "SOL-EUR" not in exchange.placed
+
+
+def test_run_queues_one_digest(db, run):
+    assets = ["BTC", "ETH", "ADA", "SOL"]
+    schedule_id = run(ScriptedExchange(assets, rejected={"ADA"}, broken={"SOL"}), assets)
+
+    mails = db.execute("SELECT subject, body FROM notification_outbox").fetchall()
+    assert len(mails) == 1
+    (subject, body) = mails[0]
+    assert subject == f"Schedule {schedule_id} (Konto 1): 2 Käufe erfolgreich, 2 fehlgeschlagen"
+    assert "Erfolgreicher Kauf: BTC" in body and "Erfolgreicher Kauf: ETH" in body
+    assert "Fehler beim Kauf: ADA" in body
+    assert "Exception beim Kauf: SOL" in body
+
+
+def test_rerun_of_same_slot_does_not_buy_again(db, run):
+    assets = ["BTC", "ETH"]
+    exchange = ScriptedExchange(assets)
+    schedule_id = run(exchange, assets)
+    bitmaster.execute_investment(schedule_id, RUN_AT)
+
+    assert sorted(exchange.placed) == ["BTC-EUR", "ETH-EUR"]
+    assert db.execute("SELECT COUNT(*) FROM trades").fetchone()[0] == 2
+    assert db.execute("SELECT COUNT(*) FROM notification_outbox").fetchone()[0] == 1
+
+
+def test_lines_run_in_parallel(db, run, monkeypatch):
+    # Jede Order wartet, bis alle vier gleichzeitig in placeOrder stehen -
+    # nacheinander ausgeführt liefe die Barriere in den Timeout.
+    monkeypatch.setattr(bitmaster, "ORDER_WORKERS", 4)
+    assets = ["BTC", "ETH", "ADA", "SOL"]
+    run(ScriptedExchange(assets, barrier=threading.Barrier(4, timeout=5)), assets)
+
+    assert journal(db) == {a: "filled" for a in assets}
+    assert db.execute("SELECT COUNT(*) FROM trades").fetchone()[0] == 4
@@ -0,0 +1,161 @@
+"""
+Abgleich offener order_journal-Einträge (reconcile_order_journal) gegen die
+Mock-Börse: jeder Ausgang (filled, rejected, failed, offen) und ein Absturz
+zwischen placeOrder und dem Verbuchen.
+"""
+import numpy as np
+import pytest
+import requests
+
+import bitmaster
+
+RUN_AT = bitmaster.datetime.datetime(2024, 1, 1, 8, 0)
+
+
+class Crash(BaseException):
+    """Prozess stirbt - wird von keinem except Exception abgefangen."""
+
+
+class JournalExchange(bitmaster.MockExchange):
+    def __init__(self):
+        day = float(np.datetime64("2024-01-01", "D").astype(np.int64))
+        super().__init__(prices={"BTC": (np.array([day]), np.array([40000.0]))}, latency_ms=0)
+        self.crash_after_place = False
+        self.unreachable = False
+        self.placed = 0
+
+    def placeOrder(self, market, side, orderType, body):
+        self.placed += 1
+        order = super().placeOrder(market, side, orderType, body)
+        if self.crash_after_place:
+            raise Crash()
+        return order
+
+    def getOrders(self, market, options=None):
+        if self.unreachable:
+            raise requests.exceptions.ConnectTimeout("Börse nicht erreichbar")
+        return super().getOrders(market, options)
+
+    def order(self, client_order_id):
+        return self._client_ids[client_order_id]
+
+
+@pytest.fixture
+def exchange(db, monkeypatch):
+    exchange = JournalExchange()
+    monkeypatch.setattr(bitmaster, "get_bitvavo_client", lambda account_id=None: exchange)
+    monkeypatch.setattr(bitmaster, "RETRY_BASE_DELAY", 0.001)
+    monkeypatch.setattr(bitmaster, "_account_rate_limiters", {})
+    monkeypatch.setattr(bitmaster, "price_cache", bitmaster.PriceCache())
+    return exchange
+
+
+@pytest.fixture
+def schedule_id(db):
+    c = db.cursor()
+    c.execute("INSERT INTO schedules (account_id, weekday, time_of_day) VALUES (1, 'Monday', '08:00')")
+    schedule_id = c.lastrowid
+    c.execute("INSERT INTO schedule_lines (schedule_id, asset, amount_eur) VALUES (?, 'BTC', 10)", (schedule_id,))
+    db.commit()
+    return schedule_id
+
+
+def intent(schedule_id):
+    """Journal-Eintrag wie vor dem Senden, ohne Order."""
+    (entry,) = bitmaster.journal_order_intents(1, schedule_id, RUN_AT, [("BTC", 10)])
+    assert entry["status"] == bitmaster.JOURNAL_PENDING
+    return entry["client_order_id"]
+
+
+def send(exchange, client_order_id):
+    """Order kommt bei der Börse an, die Antwort wird nie verbucht."""
+    exchange.placeOrder("BTC-EUR", "buy", "market", {"amountQuote": "10", "clientOrderId": client_order_id})
+
+
+def journal(db):
+    return db.execute("SELECT status, order_id, error FROM order_journal").fetchall()
+
+
+def summary(**counts):
+    result = {"checked": 1, "filled": 0, "rejected": 0, "failed": 0, "pending": 0}
+    result.update(counts)
+    return result
+
+
+def test_pending_to_filled(db, exchange, schedule_id):
+    cid = intent(schedule_id)
+    send(exchange, cid)
+
+    assert bitmaster.reconcile_order_journal() == summary(filled=1)
+    order = exchange.order(cid)
+    assert journal(db) == [("filled", order["orderId"], None)]
+    trade = db.execute("SELECT client_order_id, asset, amount_eur, filled_asset, order_id FROM trades").fetchone()
+    assert trade == (cid, "BTC", 10, pytest.approx(float(order["filledAmount"])), order["orderId"])
+
+
+def test_pending_to_rejected(db, exchange, schedule_id):
+    cid = intent(schedule_id)
+    send(exchange, cid)
+    exchange.order(cid).update(status="cancelled", fills=[], filledAmount="0", filledAmountQuote="0")
+
+    assert bitmaster.reconcile_order_journal() == summary(rejected=1)
+    ((status, order_id, error),) = journal(db)
+    assert (status, order_id) == ("rejected", exchange.order(cid)["orderId"])
+    assert "cancelled" in error
+    assert db.execute("SELECT COUNT(*) FROM trades").fetchone()[0] == 0
+
+
+def test_pending_to_failed(db, exchange, schedule_id):
+    intent(schedule_id)
+
+    assert bitmaster.reconcile_order_journal() == summary(failed=1)
+    assert journal(db) == [("failed", None, "Order bei der Börse nicht gefunden.")]
+    assert db.execute("SELECT COUNT(*) FROM trades").fetchone()[0] == 0
+
+
+def test_open_or_unreachable_stays_pending(db, exchange, schedule_id):
+    cid = intent(schedule_id)
+    send(exchange, cid)
+    exchange.order(cid)["status"] = "new"
+    assert bitmaster.reconcile_order_journal() == summary(pending=1)
+
+    exchange.order(cid)["status"] = "filled"
+    exchange.unreachable = True
+    assert bitmaster.reconcile_order_journal() == summary(pending=1)
+    assert journal(db) == [("pending", None, None)]
+
+    exchange.unreachable = False
+    assert bitmaster.reconcile_order_journal() == summary(filled=1)
+
+
+def test_young_entries_are_left_alone(db, exchange, schedule_id):
+    intent(schedule_id)
+    assert bitmaster.reconcile_order_journal(min_age_seconds=3600)["checked"] == 0
+    assert journal(db) == [("pending", None, None)]
+
+
+def test_failed_entry_is_rearmed_on_rerun(db, exchange, schedule_id):
+    cid = intent(schedule_id)
+    bitmaster.reconcile_order_journal()
+    assert journal(db)[0][0] == "failed"
+
+    bitmaster.execute_investment(schedule_id, RUN_AT)
+    assert exchange.placed == 1
+    assert journal(db) == [("filled", exchange.order(cid)["orderId"], None)]
+    assert db.execute("SELECT client_order_id FROM trades").fetchall() == [(cid,)]
+
+
+def test_crash_after_place_order_is_booked_once(db, exchange, schedule_id):
+    exchange.crash_after_place = True
+    with pytest.raises(Crash):
+        bitmaster.execute_investment(schedule_id, RUN_AT)
+    exchange.crash_after_place = False
+    assert journal(db) == [("pending", None, None)]
+    assert db.execute("SELECT COUNT(*) FROM trades").fetchone()[0] == 0
+
+    assert bitmaster.reconcile_order_journal() == summary(filled=1)
+    bitmaster.execute_investment(schedule_id, RUN_AT)  # Neustart: derselbe Termin läuft erneut
+
+    assert exchange.placed == 1
+    assert db.execute("SELECT COUNT(*) FROM trades").fetchone()[0] == 1
+    assert journal(db)[0][0] == "filled"
@@ -0,0 +1,82 @@
+import pytest
+
+import bitmaster
+
+
+class FakeSMTP:
+    def __init__(self):
+        self.sent = []
+
+    def send_message(self, message):
+        self.sent.append(message["Subject"])
+
+    def quit(self):
+        pass
+
+
+@pytest.fixture
+def email_settings(db):
+    db.execute("""
+        INSERT INTO email_settings (
+            smtp_server, smtp_port, smtp_user, smtp_pass, from_email, to_email,
+            send_on_success, send_on_error, use_tls
+        ) VALUES ('localhost', 25, '', '', 'bot@example.org', 'me@example.org', 1, 1, 0)
+    """)
+    db.commit()
+    bitmaster.settings_cache.invalidate()
+
+
+def pending_attempts(db):
+    return [r[0] for r in db.execute("SELECT attempts FROM notification_outbox WHERE status = 'pending'")]
+
+
+def test_smtp_down_stops_batch_and_backs_off(email_settings, db, monkeypatch):
+    connects = []
+
+    def refuse(settings):
+        connects.append(settings.smtp_server)
+        raise ConnectionRefusedError("SMTP nicht erreichbar")
+
+    monkeypatch.setattr(bitmaster, "_smtp_connect", refuse)
+    for i in range(5):
+        bitmaster.queue_notification(f"Mail {i}", "Text")
+
+    sender = bitmaster.NotificationSender()
+    wait = sender.process_due()
+    assert len(connects) == 1
+    assert wait == bitmaster.OUTBOX_RETRY_BASE
+    assert pending_attempts(db) == [0] * 5
+
+    # Während des Backoffs kein neuer Verbindungsversuch, danach doppelte Wartezeit
+    assert sender.process_due() > 0
+    assert len(connects) == 1
+    sender.connect_retry_at = 0.0
+    assert sender.process_due() == 2 * bitmaster.OUTBOX_RETRY_BASE
+
+    server = FakeSMTP()
+    monkeypatch.setattr(bitmaster, "_smtp_connect", lambda settings: server)
+    sender.connect_retry_at = 0.0
+    sender.process_due()
+    assert server.sent == [f"Mail {i}" for i in range(5)]
+    assert pending_attempts(db) == []
+    assert sender.connect_failures == 0
+
+
+def test_wakeup_during_processing_is_not_lost(monkeypatch):
+    class Stop(Exception):
+        pass
+
+    sender = bitmaster.NotificationSender()
+    # queue_notification() meldet sich, während die Outbox gerade abgearbeitet wird
+    monkeypatch.setattr(sender, "process_due", lambda: bitmaster._outbox_wakeup.set() or 3600)
+    seen = []
+
+    def wait(timeout):
+        seen.append(bitmaster._outbox_wakeup.is_set())
+        raise Stop()
+
+    monkeypatch.setattr(bitmaster._outbox_wakeup, "wait", wait)
+    with pytest.raises(Stop):
+        sender.run()
+    bitmaster._outbox_wakeup.clear()
+    assert seen == [True]
@@ -0,0 +1,51 @@
+import pytest
+
+import bitmaster
+
+
+def test_portfolio_engines_agree(db, monkeypatch):
+    monkeypatch.setattr(bitmaster, "portfolio_data", bitmaster.PortfolioData())
+    bitmaster.benchmark_portfolio(trades=20000, n_assets=10, years=2, repeat=1)
+
+    engine = bitmaster.compute_portfolio(bitmaster.DEFAULT_ACCOUNT_ID)
+    snapshots = bitmaster.compute_portfolio_from_snapshots(bitmaster.DEFAULT_ACCOUNT_ID)
+    for key in ("invested_eur", "value_eur"):
+        assert snapshots["totals"][key] == pytest.approx(engine["totals"][key])
+    assert snapshots["equity_curve"]["value"] == pytest.approx(engine["equity_curve"]["value"])
+    assert snapshots["twr"] == pytest.approx(engine["twr"])
+
+
+def test_tracked_assets_skip_scan_matches_union(db):
+    c = db.cursor()
+    c.executemany(
+        "INSERT INTO trades (account_id, timestamp, asset, amount_eur, filled_asset, avg_price) VALUES (1, ?, ?, 10, 1, 10)",
+        [("2024-01-01", asset) for asset in ("ETH", "BTC", "ETH", "ada", "SOL", "BTC")]
+    )
+    c.execute("INSERT INTO schedules (account_id, weekday, time_of_day) VALUES (1, 'Monday', '08:00')")
+    c.execute("INSERT INTO schedule_lines (schedule_id, asset, amount_eur) VALUES (?, 'XRP', 10)", (c.lastrowid,))
+    db.commit()
+    assert bitmaster.tracked_assets() == ["ADA", "BTC", "ETH", "SOL", "XRP"]
+
+
+def test_portfolio_is_scoped_to_account(db, monkeypatch):
+    monkeypatch.setattr(bitmaster, "portfolio_data", bitmaster.PortfolioData())
+    c = db.cursor()
+    c.execute("INSERT INTO accounts (id, name) VALUES (2, 'Zweit')")
+    day = bitmaster.datetime.datetime(2024, 1, 1, 12)
+    bitmaster.record_trade(c, 1, None, day, "BTC", 100.0, 0.0025, 40000.0, "o1")
+    bitmaster.record_trade(c, 2, None, day, "ETH", 50.0, 0.025, 2000.0, "o2")
+    bitmaster.store_daily_prices(c, "2024-01-02", {"BTC": 44000.0, "ETH": 2200.0})
+    db.commit()
+
+    for account_id, asset, invested in ((1, "BTC", 100.0), (2, "ETH", 50.0)):
+        for data in (bitmaster.compute_portfolio(account_id), bitmaster.compute_portfolio_from_snapshots(account_id)):
+            assert [a["asset"] for a in data["assets"]] == [asset]
+            assert data["totals"]["invested_eur"] == pytest.approx(invested)
+            assert data["totals"]["value_eur"] == pytest.approx(invested * 1.1)
+
+    client = bitmaster.app.test_client()
+    with client.session_transaction() as session:
+        session["logged_in"] = True
+        session["account_id"] = 2
+    data = client.get("/api/portfolio").get_json()
+    assert [a["asset"] for a in data["assets"]] == ["ETH"]
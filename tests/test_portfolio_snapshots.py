@@ -0,0 +1,96 @@
+import datetime
+import random
+
+import pytest
+
+import bitmaster
+
+
+def book_trade(conn, day, asset, units, price, account_id=bitmaster.DEFAULT_ACCOUNT_ID):
+    timestamp = datetime.datetime.strptime(day, "%Y-%m-%d").replace(hour=12)
+    bitmaster.record_trade(
+        conn.cursor(), account_id, None, timestamp,
+        asset, units * price, units, price, "order"
+    )
+    conn.commit()
+
+
+def store_price(conn, day, asset, price):
+    bitmaster.store_daily_prices(conn.cursor(), day, {asset: price})
+    conn.commit()
+
+
+def assert_matches_rebuild(conn):
+    expected = {r[:3]: r[3:] for r in bitmaster.compute_snapshot_rows(conn)}
+    actual = {
+        r[:3]: r[3:]
+        for r in conn.execute("""
+            SELECT account_id, date, asset, units, invested_eur, price_eur, value_eur FROM portfolio_snapshots
+        """)
+    }
+    assert actual.keys() == expected.keys()
+    for key in expected:
+        assert bitmaster._snapshot_row_equal(actual[key], expected[key]), (key, actual[key], expected[key])
+
+
+def test_backdated_trade_of_new_asset_uses_later_rates(db):
+    book_trade(db, "2024-01-01", "ETH", 1.0, 2000.0)
+    store_price(db, "2024-01-02", "BTC", 40000.0)
+    store_price(db, "2024-01-02", "ETH", 2100.0)
+    book_trade(db, "2024-01-01", "BTC", 0.01, 39000.0)
+
+    row = db.execute("""
+        SELECT price_eur, value_eur FROM portfolio_snapshots
+        WHERE account_id = 1 AND date = '2024-01-02' AND asset = 'BTC'
+    """).fetchone()
+    assert row == pytest.approx((40000.0, 400.0))
+    assert_matches_rebuild(db)
+
+
+def test_first_trade_before_existing_rates(db):
+    store_price(db, "2024-01-03", "BTC", 41000.0)
+    book_trade(db, "2024-01-01", "BTC", 0.01, 39000.0)
+    assert_matches_rebuild(db)
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_incremental_matches_rebuild_in_random_order(db, seed):
+    db.execute("INSERT INTO accounts (id, name) VALUES (2, 'Zweit')")
+    rnd = random.Random(seed)
+    days = [f"2024-01-{d:02d}" for d in range(1, 15)]
+    events = []
+    for asset in ("BTC", "ETH", "ADA"):
+        events += [
+            ("trade", rnd.choice(days), asset, rnd.uniform(0.1, 2), rnd.uniform(10, 100), rnd.choice((1, 2)))
+            for _ in range(4)
+        ]
+        events += [("price", day, asset, rnd.uniform(10, 100)) for day in rnd.sample(days, 5)]
+    rnd.shuffle(events)
+
+    for event in events:
+        if event[0] == "trade":
+            book_trade(db, *event[1:])
+        else:
+            store_price(db, *event[1:])
+    assert_matches_rebuild(db)
+    result = bitmaster.rebuild_portfolio_snapshots(db)
+    assert (result["mismatches"], result["missing"], result["extra"]) == (0, 0, 0)
+
+
+def test_trade_prices_do_not_leak_between_accounts(db):
+    db.execute("INSERT INTO accounts (id, name) VALUES (2, 'Zweit')")
+    book_trade(db, "2024-01-01", "BTC", 0.01, 40000.0, account_id=1)
+    book_trade(db, "2024-01-03", "BTC", 0.02, 30000.0, account_id=2)
+    book_trade(db, "2024-01-05", "ETH", 1.0, 2000.0, account_id=2)
+    store_price(db, "2024-01-06", "ETH", 2100.0)
+
+    rows = db.execute("""
+        SELECT account_id, MIN(date), MAX(date), COUNT(DISTINCT asset) FROM portfolio_snapshots GROUP BY account_id
+    """).fetchall()
+    assert rows == [(1, "2024-01-01", "2024-01-06", 1), (2, "2024-01-03", "2024-01-06", 2)]
+    # Der Ausführungspreis von Konto 2 ist kein Kurs für Konto 1
+    price = db.execute("""
+        SELECT price_eur FROM portfolio_snapshots WHERE account_id = 1 AND asset = 'BTC' AND date = '2024-01-04'
+    """).fetchone()[0]
+    assert price == pytest.approx(40000.0)
+    assert_matches_rebuild(db)
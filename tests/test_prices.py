@@ -0,0 +1,45 @@
+import bitmaster
+
+ASSETS = ["BTC", "ETH", "ADA", "SOL", "DOT"]
+PRICES = {"BTC": 40000.0, "ETH": 2000.0, "ADA": 0.5, "SOL": 100.0, "DOT": 6.0, "XRP": 0.6}
+
+
+def ticker_price(query, body):
+    if "market" in query:
+        return {"market": query["market"], "price": str(PRICES[query["market"].split("-")[0]])}
+    return [{"market": f"{asset}-EUR", "price": str(price)} for (asset, price) in PRICES.items()]
+
+
+def test_bulk_fetch_uses_one_request(bitvavo_stub):
+    bitvavo_stub.routes[("GET", "/ticker/price")] = ticker_price
+    prices = bitmaster.fetch_eur_prices(bitmaster.get_public_bitvavo_client(), ASSETS)
+
+    assert prices == {asset: PRICES[asset] for asset in ASSETS}
+    assert bitvavo_stub.requests == [("GET", "/ticker/price", {})]
+
+
+def test_fallback_fetches_each_market_once(bitvavo_stub):
+    def bulk_fails(query, body):
+        if "market" not in query:
+            return {"errorCode": 205, "error": "bulk unavailable"}
+        return ticker_price(query, body)
+
+    bitvavo_stub.routes[("GET", "/ticker/price")] = bulk_fails
+    prices = bitmaster.fetch_eur_prices(bitmaster.get_public_bitvavo_client(), ASSETS)
+
+    assert prices == {asset: PRICES[asset] for asset in ASSETS}
+    assert bitvavo_stub.count("GET", "/ticker/price") == 1 + len(ASSETS)
+    markets = sorted(r[2]["market"] for r in bitvavo_stub.requests if r[2])
+    assert markets == sorted(f"{asset}-EUR" for asset in ASSETS)
+
+
+def test_update_prices_writes_one_row_per_asset(db, bitvavo_stub, monkeypatch):
+    bitvavo_stub.routes[("GET", "/ticker/price")] = ticker_price
+    monkeypatch.setattr(bitmaster, "tracked_assets", lambda: ASSETS)
+    bitmaster.update_prices_for_assets()
+    bitmaster.update_prices_for_assets()
+
+    rows = db.execute("SELECT asset, price_eur FROM historical_rates").fetchall()
+    assert dict(rows) == {asset: PRICES[asset] for asset in ASSETS}
+    # Der zweite Lauf bedient sich aus dem frisch gefüllten Kurs-Cache
+    assert bitvavo_stub.count("GET", "/ticker/price") == 1
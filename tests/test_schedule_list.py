@@ -0,0 +1,58 @@
+import bitmaster
+
+
+def add_schedules(conn, n, lines=3):
+    c = conn.cursor()
+    for i in range(n):
+        c.execute(
+            "INSERT INTO schedules (account_id, weekday, time_of_day) VALUES (?, ?, '08:00')",
+            (bitmaster.DEFAULT_ACCOUNT_ID, bitmaster.WEEKDAYS[i % 7])
+        )
+        c.executemany(
+            "INSERT INTO schedule_lines (schedule_id, asset, amount_eur) VALUES (?, ?, ?)",
+            [(c.lastrowid, asset, 10.0) for asset in bitmaster.ALLOWED_ASSETS[:lines]]
+        )
+    bitmaster.bump_change_counter(c, "schedules")
+    conn.commit()
+
+
+def count_statements(conn, func):
+    statements = []
+    conn.set_trace_callback(statements.append)
+    try:
+        func()
+    finally:
+        conn.set_trace_callback(None)
+    return statements
+
+
+def logged_in_client():
+    client = bitmaster.app.test_client()
+    with client.session_transaction() as session:
+        session["logged_in"] = True
+    return client
+
+
+def test_dashboard_runs_one_schedule_query(db):
+    add_schedules(db, 200)
+    client = logged_in_client()
+
+    statements = count_statements(db, lambda: client.get("/"))
+    schedule_queries = [s for s in statements if "schedule_lines" in s and s.lstrip().upper().startswith("SELECT")]
+    assert len(schedule_queries) == 1
+    assert "JOIN schedule_lines" in schedule_queries[0]
+    assert len(statements) <= 5
+
+
+def test_schedule_list_is_cached_until_changed(db):
+    add_schedules(db, 10)
+    schedules = bitmaster.load_schedule_list()
+    assert len(schedules) == 10 and all(len(s[3]) == 3 for s in schedules)
+
+    statements = count_statements(db, bitmaster.load_schedule_list)
+    assert not [s for s in statements if "schedule_lines" in s]
+
+    add_schedules(db, 1)
+    statements = count_statements(db, lambda: bitmaster.load_schedule_list())
+    assert len([s for s in statements if "schedule_lines" in s]) == 1
+    assert len(bitmaster.load_schedule_list()) == 11
@@ -0,0 +1,20 @@
+import datetime
+
+import bitmaster
+
+
+def test_scheduler_wakes_only_for_due_jobs(db):
+    r = bitmaster.benchmark_scheduler(schedules=700, days=7)
+    assert r["jobs_per_day"] == 100
+    assert r["wakeups_per_day"] <= r["jobs_per_day"] + 24
+    assert db.execute("SELECT COUNT(*) FROM scheduler_state WHERE job_key LIKE 'bench_%'").fetchone()[0] == 0
+
+
+def test_replaced_job_keeps_single_heap_entry(db):
+    start = datetime.datetime(2024, 1, 1)
+    sched = bitmaster._VirtualClockScheduler(start)
+    sched.add_job("a", None, lambda after: after + datetime.timedelta(hours=1))
+    sched.add_job("a", None, lambda after: after + datetime.timedelta(hours=2))
+    (key, job, run_at) = sched._pop_due()
+    assert (key, run_at) == ("a", start + datetime.timedelta(hours=2))
+    assert sched.next_run_times() == {"a": start + datetime.timedelta(hours=4)}
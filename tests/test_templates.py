@@ -0,0 +1,65 @@
+import pytest
+
+import bitmaster
+
+
+@pytest.fixture
+def schedule_id(db):
+    c = db.cursor()
+    c.execute("INSERT INTO schedules (account_id, weekday, time_of_day) VALUES (?, 'Tuesday', '09:30')",
+              (bitmaster.DEFAULT_ACCOUNT_ID,))
+    schedule_id = c.lastrowid
+    c.execute("INSERT INTO schedule_lines (schedule_id, asset, amount_eur) VALUES (?, 'ETH', 25)", (schedule_id,))
+    bitmaster.bump_change_counter(c, "schedules")
+    db.commit()
+    return schedule_id
+
+
+@pytest.fixture
+def client(db):
+    client = bitmaster.app.test_client()
+    with client.session_transaction() as session:
+        session["logged_in"] = True
+    return client
+
+
+def test_every_template_compiles():
+    bitmaster.compile_templates()
+    for name in bitmaster.TEMPLATES:
+        assert bitmaster.app.jinja_env.get_template(name) is bitmaster.app.jinja_env.get_template(name)
+
+
+def fresh_get(client, monkeypatch, path):
+    # /settings zeigt die Trefferzahl des Einstellungs-Caches - je Abruf frisch zählen
+    monkeypatch.setattr(bitmaster, "settings_cache", bitmaster.SettingsCache(
+        bitmaster.SETTINGS_CACHE_TTL, lambda: bitmaster.read_change_counter("settings")
+    ))
+    return client.get(path)
+
+
+@pytest.mark.parametrize("path", bitmaster.TEMPLATE_BENCH_PATHS)
+def test_compiled_pages_match_uncompiled(client, schedule_id, monkeypatch, path):
+    path = path.format(schedule_id=schedule_id)
+    compiled = fresh_get(client, monkeypatch, path)
+    assert compiled.status_code == 200
+
+    monkeypatch.setattr(bitmaster, "render_template", bitmaster._render_template_uncompiled)
+    uncompiled = fresh_get(client, monkeypatch, path)
+    assert compiled.get_data(as_text=True) == uncompiled.get_data(as_text=True)
+
+
+def test_dashboard_lists_schedule(client, schedule_id):
+    page = client.get("/").get_data(as_text=True)
+    assert "<td>Tuesday</td>" in page
+    assert "<td>09:30</td>" in page
+    assert "ETH: 25.0 EUR" in page
+    assert f'href="/edit_schedule/{schedule_id}"' in page
+
+
+def test_edit_schedule_preselects_values(client, schedule_id):
+    page = client.get(f"/edit_schedule/{schedule_id}").get_data(as_text=True)
+    assert f"Zeitplan {schedule_id} bearbeiten" in page
+    assert '<option value="Tuesday" selected>' in page
+    assert 'name="time_of_day" value="09:30"' in page
+    assert '<option value="ETH" selected>' in page
+    assert page.count('name="asset"') == 3
@@ -0,0 +1,173 @@
+"""
+Live-Kurse: TickerStream gegen einen Fake-WebSocket (Schnittstelle wie
+newWebsocket() der Bibliothek), PriceCache mit Teil-Events, Ablauf nach
+PRICE_MAX_AGE und REST-Fallback in get_eur_price.
+"""
+import pytest
+
+import bitmaster
+
+
+class FakeWebsocket:
+    def __init__(self, fail_subscribe=False):
+        self.fail_subscribe = fail_subscribe
+        self.callbacks = {}
+        self.subscriptions = []
+        self.error_callback = None
+        self.closed = False
+
+    def setErrorCallback(self, callback):
+        self.error_callback = callback
+
+    def subscriptionTicker(self, market, callback):
+        if self.fail_subscribe:
+            raise RecursionError("maximum recursion depth exceeded")  # waitForSocket() ohne Verbindung
+        self.subscriptions.append(market)
+        self.callbacks[market] = callback
+
+    def closeSocket(self):
+        self.closed = True
+
+    def push(self, market, **fields):
+        self.callbacks[market](dict(fields, event="ticker", market=market))
+
+
+class FakeClient:
+    def __init__(self, sockets):
+        self.sockets = list(sockets)
+        self.opened = []
+
+    def newWebsocket(self):
+        ws = self.sockets.pop(0)
+        self.opened.append(ws)
+        return ws
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_700_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+class StopLoop(Exception):
+    pass
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(bitmaster.time, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = bitmaster.PriceCache(max_age=60)
+    monkeypatch.setattr(bitmaster, "price_cache", cache)
+    return cache
+
+
+@pytest.fixture
+def connect(monkeypatch, cache):
+    """
+    Liefert einen TickerStream, dessen Client nacheinander die gegebenen Sockets öffnet.
+    """
+    def make(*sockets):
+        client = FakeClient(sockets or [FakeWebsocket()])
+        monkeypatch.setattr(bitmaster, "get_public_bitvavo_client", lambda: client)
+        return bitmaster.TickerStream(), client
+    return make
+
+
+def test_subscribes_each_market_once(connect):
+    stream, client = connect()
+    stream._connect()
+    stream.subscribe(["BTC", "ETH"])
+    stream.subscribe(["ETH", "SOL", "BTC"])
+
+    (ws,) = client.opened
+    assert ws.subscriptions == ["BTC-EUR", "ETH-EUR", "SOL-EUR"]
+    assert ws.error_callback is not None
+    assert stream.stats()["markets"] == ["BTC-EUR", "ETH-EUR", "SOL-EUR"]
+    assert stream.stats()["connected"]
+
+
+def test_ticker_events_merge_partial_fields(connect, cache):
+    stream, client = connect()
+    stream._connect()
+    stream.subscribe(["BTC"])
+    (ws,) = client.opened
+
+    ws.push("BTC-EUR", bestBid="39990", bestAsk="40010")
+    assert cache.get("BTC") == 40000.0
+    ws.push("BTC-EUR", lastPrice="40005")
+    assert cache.get("BTC") == 40005.0
+    ws.push("BTC-EUR", bestAsk="40030")      # kein lastPrice -> Mitte aus altem Bid und neuem Ask
+    assert cache.get("BTC") == 40010.0
+
+    entry = cache.stats()["assets"]["BTC"]
+    assert (entry["bid"], entry["ask"], entry["source"]) == (39990.0, 40030.0, "ws")
+
+
+def test_event_without_price_is_ignored(cache):
+    cache.update("ETH", bid="2000")          # nur eine Seite, noch kein Kurs
+    assert cache.get("ETH") is None
+    assert cache.stats()["updates"] == 0
+
+
+def test_prices_expire_after_max_age(clock, cache):
+    cache.update("BTC", last="40000")
+    clock.now += 60
+    assert cache.get("BTC") == 40000.0
+    clock.now += 1
+    assert cache.get("BTC") is None
+    assert cache.get("BTC", max_age=120) == 40000.0
+    assert cache.get("ETH") is None
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["stale"], stats["misses"]) == (2, 1, 1)
+    assert stats["fresh_assets"] == 0
+
+
+def test_eur_price_falls_back_to_rest(clock, cache):
+    calls = []
+
+    class Rest:
+        def tickerPrice(self, options):
+            calls.append(options["market"])
+            return {"market": options["market"], "price": "41000"}
+
+    cache.update("BTC", last="40000")
+    assert bitmaster.get_eur_price(Rest(), "BTC") == 40000.0
+    assert calls == []
+
+    clock.now += 61                          # Stream-Kurs veraltet
+    assert bitmaster.get_eur_price(Rest(), "BTC") == 41000.0
+    assert bitmaster.get_eur_price(Rest(), "BTC") == 41000.0
+    assert bitmaster.get_eur_price(Rest(), "ETH") == 41000.0
+    assert calls == ["BTC-EUR", "ETH-EUR"]
+    assert cache.stats()["assets"]["BTC"]["source"] == "rest"
+
+
+def test_run_reconnects_after_failed_subscription(connect, monkeypatch):
+    broken, healthy = FakeWebsocket(fail_subscribe=True), FakeWebsocket()
+    stream, client = connect(broken, healthy)
+    monkeypatch.setattr(bitmaster, "tracked_assets", lambda: ["BTC", "ETH"])
+    sleeps = []
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        if len(sleeps) == 2:
+            raise StopLoop()
+
+    monkeypatch.setattr(bitmaster.time, "sleep", sleep)
+    with pytest.raises(StopLoop):
+        stream.run()
+
+    assert client.opened == [broken, healthy]
+    assert broken.closed and not healthy.closed
+    assert healthy.subscriptions == ["BTC-EUR", "ETH-EUR"]
+    assert stream.errors == 1
+    assert sleeps == [bitmaster.PRICE_STREAM_CHECK_INTERVAL * 2, bitmaster.PRICE_STREAM_CHECK_INTERVAL]
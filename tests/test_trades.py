@@ -0,0 +1,108 @@
+import html
+import json
+import re
+
+import pytest
+
+import bitmaster
+
+
+@pytest.fixture
+def client(db):
+    client = bitmaster.app.test_client()
+    with client.session_transaction() as session:
+        session["logged_in"] = True
+    return client
+
+
+def add_trades(conn, trades, account_id=bitmaster.DEFAULT_ACCOUNT_ID):
+    """
+    trades: [(timestamp, asset), ...] -> order_id "o<id>"
+    """
+    c = conn.cursor()
+    for (timestamp, asset) in trades:
+        c.execute("""
+            INSERT INTO trades (account_id, timestamp, asset, amount_eur, filled_asset, avg_price)
+            VALUES (?, ?, ?, 10, 0.001, 10000)
+        """, (account_id, timestamp, asset))
+        c.execute("UPDATE trades SET order_id = 'o' || id WHERE id = ?", (c.lastrowid,))
+    conn.commit()
+
+
+def page(client, url):
+    """
+    Liefert (Trade-IDs der Seite, Link "Neuere", Link "Ältere").
+    """
+    text = client.get(url).get_data(as_text=True)
+    ids = [int(i) for i in re.findall(r"<td>o(\d+)</td>", text)]
+    newer = re.search(r'<a href="([^"]+)">&laquo; Neuere</a>', text)
+    older = re.search(r'<a href="([^"]+)">Ältere &raquo;</a>', text)
+    return ids, newer and html.unescape(newer.group(1)), older and html.unescape(older.group(1))
+
+
+def test_export_streams_every_trade(db, client):
+    bitmaster.benchmark_trades(trades=2500)
+    lines = client.get("/trades/export.csv").get_data(as_text=True).splitlines()
+    assert lines[0].split(",") == bitmaster.TRADE_COLUMNS
+    assert len(lines) == 2501
+    assert len(client.get("/trades/export.ndjson?asset=BTC").get_data(as_text=True).splitlines()) == 2500 // 6 + 1
+
+
+def test_paging_walks_every_trade_once(db, client):
+    add_trades(db, [(f"2024-01-0{d} 08:00:00", "BTC") for d in range(1, 8)])
+
+    ids, newer, older = page(client, "/trades?limit=3")
+    assert (ids, newer) == ([7, 6, 5], None)
+    ids, newer, older = page(client, older)
+    assert ids == [4, 3, 2]
+    ids, newer, last_older = page(client, older)
+    assert (ids, last_older) == ([1], None)
+
+    # und zurück
+    ids, newer, older = page(client, newer)
+    assert ids == [4, 3, 2] and older.startswith("/trades?before=2&limit=3")
+    ids, newer, older = page(client, newer)
+    assert (ids, newer) == ([7, 6, 5], None)
+
+
+def test_full_last_page_has_no_older_link(db, client):
+    add_trades(db, [(f"2024-01-0{d} 08:00:00", "BTC") for d in range(1, 7)])
+    ids, newer, older = page(client, "/trades?limit=3")
+    ids, newer, older = page(client, older)
+    assert (ids, older) == ([3, 2, 1], None)
+    assert newer is not None
+
+
+@pytest.mark.parametrize("limit, expected", [("0", 50), ("-5", 1), ("abc", 50), ("100000", 500)])
+def test_page_size_is_clamped(db, client, limit, expected):
+    add_trades(db, [("2024-01-01 08:00:00", "BTC")] * 600)
+    ids, newer, older = page(client, f"/trades?limit={limit}")
+    assert len(ids) == expected
+
+
+def test_filters_apply_to_pages_and_export(db, client):
+    add_trades(db, [
+        ("2024-01-01 08:00:00", "BTC"),   # 1: vor date_from
+        ("2024-01-02 08:00:00", "BTC"),   # 2
+        ("2024-01-02 09:00:00", "ETH"),   # 3: anderes Asset
+        ("2024-01-03 23:59:59", "BTC"),   # 4: date_to zählt ganz mit
+        ("2024-01-04 00:00:00", "BTC"),   # 5: nach date_to
+    ])
+    add_trades(db, [("2024-01-02 10:00:00", "BTC")], account_id=2)  # 6: anderes Konto
+    query = "asset=btc&date_from=2024-01-02&date_to=2024-01-03"
+
+    assert page(client, f"/trades?{query}")[0] == [4, 2]
+    ids, newer, older = page(client, f"/trades?{query}&limit=1")
+    assert ids == [4]
+    assert "asset=BTC" in older and "date_from=2024-01-02" in older and "date_to=2024-01-03" in older
+    assert page(client, older)[0] == [2]
+
+    lines = client.get(f"/trades/export.ndjson?{query}").get_data(as_text=True).splitlines()
+    assert [json.loads(line)["id"] for line in lines] == [2, 4]
+
+
+def test_invalid_dates_are_ignored(db, client):
+    add_trades(db, [("2024-01-01 08:00:00", "BTC"), ("2024-01-02 08:00:00", "ETH")])
+    assert page(client, "/trades?date_from=gestern&date_to=2024-13-01")[0] == [2, 1]
+    lines = client.get("/trades/export.csv?date_from=01.01.2024").get_data(as_text=True).splitlines()
+    assert len(lines) == 3